@@ -0,0 +1,73 @@
+/**
+ * 无人机状态增量同步测试
+ */
+
+import {
+  applyStatusPatch,
+  checkStatusPatchSeq,
+  statusResyncRequest,
+} from '@/lib/websocket/droneStatusSync';
+
+describe('applyStatusPatch', () => {
+  const state = {
+    connected: true,
+    battery: 90,
+    position: { x: 0, y: 0, z: 0 },
+  };
+
+  it('replaces top-level fields', () => {
+    const next = applyStatusPatch(state, [{ op: 'replace', path: '/battery', value: 89 }]);
+    expect(next.battery).toBe(89);
+    expect(next.connected).toBe(true);
+  });
+
+  it('updates nested fields without mutating the previous state', () => {
+    const next = applyStatusPatch(state, [{ op: 'replace', path: '/position/x', value: 12 }]);
+    expect(next.position).toEqual({ x: 12, y: 0, z: 0 });
+    expect(state.position.x).toBe(0);
+    expect(next.position).not.toBe(state.position);
+  });
+
+  it('adds and removes fields', () => {
+    const added = applyStatusPatch(state, [{ op: 'add', path: '/speed/z', value: 3 }]);
+    expect((added as any).speed).toEqual({ z: 3 });
+
+    const removed = applyStatusPatch(added, [{ op: 'remove', path: '/connected' }]);
+    expect('connected' in removed).toBe(false);
+  });
+
+  it('unescapes JSON Pointer segments', () => {
+    const next = applyStatusPatch({}, [{ op: 'add', path: '/a~1b/c~0d', value: 1 }]);
+    expect(next).toEqual({ 'a/b': { 'c~d': 1 } });
+  });
+
+  it('ignores operations on the root path', () => {
+    expect(applyStatusPatch(state, [{ op: 'replace', path: '', value: {} }])).toEqual(state);
+  });
+});
+
+describe('checkStatusPatchSeq', () => {
+  it('applies the next sequence number', () => {
+    expect(checkStatusPatchSeq(4, 5)).toBe('apply');
+  });
+
+  it('ignores patches already covered by the current state', () => {
+    expect(checkStatusPatchSeq(4, 4)).toBe('stale');
+    expect(checkStatusPatchSeq(4, 2)).toBe('stale');
+  });
+
+  it('reports a gap only when the sequence jumps', () => {
+    expect(checkStatusPatchSeq(4, 6)).toBe('gap');
+    expect(checkStatusPatchSeq(null, 1)).toBe('gap');
+    expect(checkStatusPatchSeq(4, undefined)).toBe('gap');
+  });
+});
+
+describe('statusResyncRequest', () => {
+  it('builds the status_resync message', () => {
+    expect(JSON.parse(statusResyncRequest(7))).toEqual({
+      type: 'status_resync',
+      data: { topic: 'drone_status', last_seq: 7 },
+    });
+  });
+});
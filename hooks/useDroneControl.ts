@@ -1,4 +1,10 @@
 import { useState, useEffect, useCallback, useRef } from 'react';
+import {
+  applyStatusPatch,
+  checkStatusPatchSeq,
+  statusResyncRequest,
+  STATUS_RESYNC_RETRY_MS,
+} from '../lib/websocket/droneStatusSync';
 import { saveDroneState, getDroneState, clearDroneState, hasValidStoredState, onStorageChange } from '../lib/droneStateStorage';
 import toast from 'react-hot-toast';
 
@@ -178,6 +184,8 @@ export const useDroneControl = () => {
 
   const [isConnecting, setIsConnecting] = useState(false);
   const wsRef = useRef<WebSocket | null>(null);
+  const droneStatusSeqRef = useRef<number | null>(null);
+  const statusResyncRequestedAtRef = useRef(0);
 
   const addLog = useCallback((level: 'info' | 'warning' | 'error' | 'success', message: string) => {
     const newLog: LogEntry = {
@@ -226,8 +234,30 @@ export const useDroneControl = () => {
           
           switch (data.type) {
              case 'drone_status':
+               droneStatusSeqRef.current = typeof data.seq === 'number' ? data.seq : null;
                updateDroneStatus(prev => ({ ...prev, ...data.data }));
                break;
+             case 'drone_status_patch': {
+               const lastSeq = droneStatusSeqRef.current;
+               const decision = checkStatusPatchSeq(lastSeq, data.seq);
+               if (decision === 'stale') {
+                 // 已包含在当前状态中的增量（重复或早于快照）
+                 break;
+               }
+               if (decision === 'gap') {
+                 // 序号缺口：丢弃增量，等待快照
+                 droneStatusSeqRef.current = null;
+                 const now = Date.now();
+                 if (now - statusResyncRequestedAtRef.current >= STATUS_RESYNC_RETRY_MS) {
+                   statusResyncRequestedAtRef.current = now;
+                   ws.send(statusResyncRequest(lastSeq));
+                 }
+                 break;
+               }
+               droneStatusSeqRef.current = data.seq;
+               updateDroneStatus(prev => applyStatusPatch(prev, data.data || []));
+               break;
+             }
              case 'drone_connected': {
                const payload = data.data || {};
                if (payload.success) {
@@ -1,4 +1,10 @@
 import { useState, useEffect, useCallback, useRef } from 'react';
+import {
+  applyStatusPatch,
+  checkStatusPatchSeq,
+  statusResyncRequest,
+  STATUS_RESYNC_RETRY_MS,
+} from '../lib/websocket/droneStatusSync';
 
 interface TelloState {
   connected: boolean;
@@ -88,6 +94,10 @@ export const useTelloControl = () => {
   const [isConnecting, setIsConnecting] = useState(false);
   const wsRef = useRef<WebSocket | null>(null);
   const heartbeatIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  // 后端原始状态与序号，drone_status_patch 在此基础上应用
+  const rawStatusRef = useRef<Record<string, any>>({});
+  const statusSeqRef = useRef<number | null>(null);
+  const statusResyncRequestedAtRef = useRef(0);
 
   const addLog = useCallback((level: 'info' | 'warning' | 'error' | 'success', message: string) => {
     const newLog: TelloLogEntry = {
@@ -119,6 +129,19 @@ export const useTelloControl = () => {
     }
   }, []);
 
+  const applyDroneStatus = useCallback((status: Record<string, any>) => {
+    setTelloState(prev => ({ 
+      ...prev, 
+      ...status,
+      // 确保关键状态正确映射
+      connected: status.connected ?? prev.connected,
+      flying: status.flying ?? prev.flying,
+      battery: status.battery ?? prev.battery,
+      altitude: status.altitude ?? prev.altitude,
+      speed: status.speed ?? prev.speed
+    }));
+  }, []);
+
   const connectToTello = useCallback(async () => {
     if (isConnecting || telloState.connected) return;
     
@@ -130,6 +153,7 @@ export const useTelloControl = () => {
       
       ws.onopen = () => {
         wsRef.current = ws;
+        statusSeqRef.current = null;
         addLog('info', 'WebSocket连接成功，发送Tello连接命令...');
         ws.send(JSON.stringify({ type: 'drone_connect' }));
         startHeartbeat();
@@ -142,17 +166,30 @@ export const useTelloControl = () => {
           
           switch (data.type) {
             case 'drone_status':
-              setTelloState(prev => ({ 
-                ...prev, 
-                ...data.data,
-                // 确保关键状态正确映射
-                connected: data.data.connected ?? prev.connected,
-                flying: data.data.flying ?? prev.flying,
-                battery: data.data.battery ?? prev.battery,
-                altitude: data.data.altitude ?? prev.altitude,
-                speed: data.data.speed ?? prev.speed
-              }));
+              statusSeqRef.current = typeof data.seq === 'number' ? data.seq : null;
+              rawStatusRef.current = { ...rawStatusRef.current, ...data.data };
+              applyDroneStatus(rawStatusRef.current);
               break;
+
+            case 'drone_status_patch': {
+              const lastSeq = statusSeqRef.current;
+              const decision = checkStatusPatchSeq(lastSeq, data.seq);
+              if (decision === 'stale') break;
+              if (decision === 'gap') {
+                // 序号缺口：丢弃增量，等待快照
+                statusSeqRef.current = null;
+                const now = Date.now();
+                if (now - statusResyncRequestedAtRef.current >= STATUS_RESYNC_RETRY_MS) {
+                  statusResyncRequestedAtRef.current = now;
+                  ws.send(statusResyncRequest(lastSeq));
+                }
+                break;
+              }
+              statusSeqRef.current = data.seq;
+              rawStatusRef.current = applyStatusPatch(rawStatusRef.current, data.data || []);
+              applyDroneStatus(rawStatusRef.current);
+              break;
+            }
               
             case 'drone_connected': {
               const payload = data.data || {};
@@ -276,7 +313,7 @@ export const useTelloControl = () => {
       addLog('error', '连接错误: ' + (error as Error).message);
       setIsConnecting(false);
     }
-  }, [isConnecting, telloState.connected, addLog, startHeartbeat, stopHeartbeat]);
+  }, [isConnecting, telloState.connected, addLog, startHeartbeat, stopHeartbeat, applyDroneStatus]);
 
   const disconnectFromTello = useCallback(() => {
     if (wsRef.current) {
@@ -0,0 +1,60 @@
+/**
+ * Drone status delta synchronization
+ *
+ * The 3002 backend sends `drone_status` as a sequenced snapshot and
+ * `drone_status_patch` as the changed fields (JSON Patch style operations).
+ * Patches already covered by the current state (seq <= last) are ignored;
+ * only a jump in the sequence (seq > last + 1) requires a resync.
+ */
+
+export interface StatusPatchOperation {
+  op: 'add' | 'replace' | 'remove';
+  path: string; // JSON Pointer, e.g. "/battery"
+  value?: unknown;
+}
+
+export type StatusPatchDecision = 'apply' | 'stale' | 'gap';
+
+export const STATUS_RESYNC_RETRY_MS = 2000;
+
+/**
+ * Decide what to do with a patch given the last applied sequence number
+ */
+export function checkStatusPatchSeq(lastSeq: number | null, seq: unknown): StatusPatchDecision {
+  if (lastSeq === null || typeof seq !== 'number') return 'gap';
+  if (seq <= lastSeq) return 'stale';
+  return seq === lastSeq + 1 ? 'apply' : 'gap';
+}
+
+/**
+ * Apply patch operations immutably (objects along each path are copied)
+ */
+export function applyStatusPatch<T extends object>(state: T, patch: StatusPatchOperation[]): T {
+  const next: Record<string, any> = { ...state };
+  for (const operation of patch) {
+    const keys = operation.path.split('/').slice(1).map(key => key.replace(/~1/g, '/').replace(/~0/g, '~'));
+    if (keys.length === 0) continue;
+
+    let node = next;
+    for (const key of keys.slice(0, -1)) {
+      const child = node[key];
+      node[key] = child && typeof child === 'object' && !Array.isArray(child) ? { ...child } : {};
+      node = node[key];
+    }
+
+    const last = keys[keys.length - 1];
+    if (operation.op === 'remove') {
+      delete node[last];
+    } else {
+      node[last] = operation.value;
+    }
+  }
+  return next as T;
+}
+
+/**
+ * Build the resync request sent after a sequence gap
+ */
+export function statusResyncRequest(lastSeq: number | null): string {
+  return JSON.stringify({ type: 'status_resync', data: { topic: 'drone_status', last_seq: lastSeq } });
+}
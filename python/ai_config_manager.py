@@ -8,7 +8,7 @@ AI配置管理器
 
 import os
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
 
 # 导入错误处理模块
@@ -22,6 +22,49 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+class GeminiClient:
+    """
+    绑定单个API密钥的Gemini客户端
+    
+    genai.configure() 修改的是进程全局配置，主配置和备用配置使用不同的Gemini密钥时会互相覆盖；
+    这里为每个密钥创建独立的异步服务客户端，并交给该客户端创建的模型使用。
+    """
+    
+    def __init__(self, api_key: str):
+        """
+        Args:
+            api_key: Gemini API密钥
+        """
+        import google.generativeai as genai
+        from google.ai import generativelanguage as glm
+        from google.api_core.client_options import ClientOptions
+        
+        self.genai = genai
+        self.types = genai.types
+        self.api_key = api_key
+        self._service = glm.GenerativeServiceAsyncClient(client_options=ClientOptions(api_key=api_key))
+    
+    def model(self, model_name: str):
+        """
+        创建使用本客户端密钥的模型
+        
+        Args:
+            model_name: 模型名称
+        
+        Returns:
+            genai.GenerativeModel
+        """
+        model = self.genai.GenerativeModel(model_name)
+        # GenerativeModel 未提供传入客户端的公开参数：异步客户端为空时才会按全局配置创建，这里预先填入本密钥的客户端。
+        # 该属性为SDK内部实现，不存在时退回全局配置（多个Gemini密钥同时使用时会互相覆盖）
+        if getattr(model, '_async_client', False) is None:
+            model._async_client = self._service
+        else:
+            logger.warning("⚠️ 当前google-generativeai版本不支持按密钥绑定客户端，使用全局配置")
+            self.genai.configure(api_key=self.api_key)
+        return model
+
+
 @dataclass
 class AIConfig:
     """AI配置数据类"""
@@ -96,6 +139,8 @@ class AIConfigManager:
     def __init__(self):
         """初始化AI配置管理器"""
         self.config: Optional[AIConfig] = None
+        # 备用提供商配置（用于多提供商路由与故障转移）
+        self.fallback_configs: List[AIConfig] = []
         self._load_env_config()
     
     def _load_env_config(self):
@@ -132,6 +177,7 @@ class AIConfigManager:
                 - temperature: 温度参数 (可选)
                 - cloud_prompt_service: 云端提示词服务URL (可选)
                 - cloud_api_key: 云端服务API密钥 (可选)
+                - fallback_providers: 备用提供商配置列表 (可选)，格式同上
         
         Returns:
             AIConfig对象
@@ -139,6 +185,35 @@ class AIConfigManager:
         Raises:
             ValueError: 配置无效时抛出
         """
+        self.config = self._build_config(config_data)
+        
+        # 加载备用提供商（无效的备用配置只记录警告，不影响主配置）
+        self.fallback_configs = []
+        for fallback_data in config_data.get('fallback_providers') or []:
+            try:
+                self.fallback_configs.append(self._build_config(fallback_data))
+            except (ValueError, ImportError) as e:
+                logger.warning(f"⚠️ 忽略无效的备用提供商配置 {fallback_data.get('provider')}: {e}")
+        
+        if self.fallback_configs:
+            logger.info(f"✅ 加载备用提供商: {[f'{c.provider}/{c.model}' for c in self.fallback_configs]}")
+        
+        return self.config
+    
+    def _build_config(self, config_data: Dict[str, Any]) -> AIConfig:
+        """
+        验证并构建单个提供商的AI配置
+        
+        Args:
+            config_data: 单个提供商的配置字典
+        
+        Returns:
+            AIConfig对象
+        
+        Raises:
+            ValueError: 配置无效时抛出
+            ImportError: 缺少必需的库时抛出
+        """
         # 使用错误处理器验证配置
         if ERROR_HANDLER_AVAILABLE:
             validation_error = AIConfigErrorHandler.validate_config(config_data)
@@ -179,7 +254,7 @@ class AIConfigManager:
         supports_vision = self._check_vision_support(provider, model)
         
         # 创建配置对象
-        self.config = AIConfig(
+        config = AIConfig(
             provider=provider,
             model=model,
             api_key=api_key,
@@ -193,7 +268,7 @@ class AIConfigManager:
         
         logger.info(f"✅ 加载AI配置: {provider}/{model}, 视觉支持: {supports_vision}")
         
-        return self.config
+        return config
     
     def _check_vision_support(self, provider: str, model: str) -> bool:
         """
@@ -284,24 +359,39 @@ class AIConfigManager:
         if not self.config:
             raise RuntimeError("未配置AI模型，请先调用 load_config_from_frontend()")
         
-        provider = self.config.provider
+        return self.create_client(self.config)
+    
+    def create_client(self, config: AIConfig):
+        """
+        为指定配置创建AI客户端
+        
+        Args:
+            config: AI配置（主配置或备用配置）
+        
+        Returns:
+            AI客户端实例
+        
+        Raises:
+            ImportError: 缺少必需的库时抛出
+        """
+        provider = config.provider
         
         if provider == 'openai':
-            return self._create_openai_client()
+            return self._create_openai_client(config)
         elif provider == 'anthropic':
-            return self._create_anthropic_client()
+            return self._create_anthropic_client(config)
         elif provider == 'google':
-            return self._create_google_client()
+            return self._create_google_client(config)
         elif provider in ['qwen', 'dashscope']:
             # 千问可以使用OpenAI兼容接口或DashScope SDK
             if provider == 'qwen':
-                return self._create_qwen_client()
+                return self._create_qwen_client(config)
             else:
-                return self._create_dashscope_client()
+                return self._create_dashscope_client(config)
         else:
             raise ValueError(f"不支持的AI提供商: {provider}")
     
-    def _create_openai_client(self):
+    def _create_openai_client(self, config: AIConfig):
         """创建OpenAI客户端"""
         try:
             from openai import AsyncOpenAI
@@ -309,14 +399,14 @@ class AIConfigManager:
             raise ImportError("请安装 openai 库: pip install openai")
         
         client = AsyncOpenAI(
-            api_key=self.config.api_key,
-            base_url=self.config.api_base
+            api_key=config.api_key,
+            base_url=config.api_base
         )
         
-        logger.info(f"✅ 创建OpenAI客户端: {self.config.model}")
+        logger.info(f"✅ 创建OpenAI客户端: {config.model}")
         return client
     
-    def _create_anthropic_client(self):
+    def _create_anthropic_client(self, config: AIConfig):
         """创建Anthropic客户端"""
         try:
             from anthropic import AsyncAnthropic
@@ -324,26 +414,26 @@ class AIConfigManager:
             raise ImportError("请安装 anthropic 库: pip install anthropic")
         
         client = AsyncAnthropic(
-            api_key=self.config.api_key,
-            base_url=self.config.api_base if self.config.api_base else None
+            api_key=config.api_key,
+            base_url=config.api_base if config.api_base else None
         )
         
-        logger.info(f"✅ 创建Anthropic客户端: {self.config.model}")
+        logger.info(f"✅ 创建Anthropic客户端: {config.model}")
         return client
     
-    def _create_google_client(self):
-        """创建Google客户端"""
+    def _create_google_client(self, config: AIConfig):
+        """创建Google客户端（绑定该配置的API密钥）"""
         try:
-            import google.generativeai as genai
+            import google.generativeai  # noqa: F401
         except ImportError:
             raise ImportError("请安装 google-generativeai 库: pip install google-generativeai")
         
-        genai.configure(api_key=self.config.api_key)
+        client = GeminiClient(config.api_key)
         
-        logger.info(f"✅ 创建Google客户端: {self.config.model}")
-        return genai
+        logger.info(f"✅ 创建Google客户端: {config.model}")
+        return client
     
-    def _create_qwen_client(self):
+    def _create_qwen_client(self, config: AIConfig):
         """创建千问客户端（使用OpenAI兼容接口）"""
         try:
             from openai import AsyncOpenAI
@@ -352,14 +442,14 @@ class AIConfigManager:
         
         # 千问使用OpenAI兼容的API接口
         client = AsyncOpenAI(
-            api_key=self.config.api_key,
-            base_url=self.config.api_base or self.DEFAULT_API_BASES['qwen']
+            api_key=config.api_key,
+            base_url=config.api_base or self.DEFAULT_API_BASES['qwen']
         )
         
-        logger.info(f"✅ 创建千问客户端: {self.config.model}")
+        logger.info(f"✅ 创建千问客户端: {config.model}")
         return client
     
-    def _create_dashscope_client(self):
+    def _create_dashscope_client(self, config: AIConfig):
         """创建DashScope客户端（阿里云灵积）"""
         try:
             import dashscope
@@ -367,9 +457,9 @@ class AIConfigManager:
             raise ImportError("请安装 dashscope 库: pip install dashscope")
         
         # 配置DashScope API密钥
-        dashscope.api_key = self.config.api_key
+        dashscope.api_key = config.api_key
         
-        logger.info(f"✅ 创建DashScope客户端: {self.config.model}")
+        logger.info(f"✅ 创建DashScope客户端: {config.model}")
         return dashscope
     
     def get_config(self) -> Optional[AIConfig]:
@@ -381,6 +471,18 @@ class AIConfigManager:
         """
         return self.config
     
+    def get_all_configs(self) -> List[AIConfig]:
+        """
+        获取所有可用于诊断的提供商配置（主配置在前）
+        
+        Returns:
+            支持视觉的配置列表
+        """
+        if not self.config:
+            return []
+        
+        return [self.config] + [c for c in self.fallback_configs if c.supports_vision]
+    
     def is_configured(self) -> bool:
         """
         检查是否已配置AI模型
@@ -393,6 +495,7 @@ class AIConfigManager:
     def clear_config(self):
         """清除当前配置"""
         self.config = None
+        self.fallback_configs = []
         logger.info("🧹 清除AI配置")
     
     def get_supported_models(self, provider: str) -> list:
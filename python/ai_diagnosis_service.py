@@ -7,11 +7,22 @@ AI诊断服务
 """
 
 import time
+import asyncio
 import logging
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
-from ai_config_manager import AIConfigManager
+from ai_config_manager import AIConfigManager, AIConfig
+from ai_provider_router import DiagnosisProviderRouter
+from diagnosis_report_parser import (
+    ParsedReport,
+    DIAGNOSIS_JSON_SCHEMA,
+    BATCH_DIAGNOSIS_JSON_SCHEMA,
+    parse_markdown_report,
+    parse_structured_report,
+    extract_json_object,
+    render_markdown_report
+)
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +50,11 @@ class DiagnosisReport:
     ai_model: str
     confidence: float
     processing_time: float
+    
+    # 遮罩量化指标（病斑面积占比、连通域、外接框、颜色统计）
+    lesion_metrics: Optional[Dict[str, Any]] = None
+    # 按病斑面积占比测得的严重程度（面积以整帧为分母，仅供参考，不覆盖AI判断的severity）
+    measured_severity: Optional[str] = None
 
 
 # 提示词模板
@@ -110,18 +126,117 @@ DIAGNOSIS_PROMPT_TEMPLATE = """你是一位专业的植物病理学家。请基
 *注意：本诊断基于图像分析，建议结合实地观察和专业检测确认。*"""
 
 
+STRUCTURED_DIAGNOSIS_PROMPT_TEMPLATE = """你是一位专业的植物病理学家。请基于提供的信息分析这张植株图像并提供诊断结果。
+
+植株ID: {plant_id}
+
+{mask_info}
+
+可用信息：
+- 原始植株图像
+{mask_details}
+
+只返回一个JSON对象（不要包含Markdown代码块或其他文字），格式如下：
+
+{{
+  "summary": "健康状况摘要，2-3句话",
+  "severity": "low/medium/high",
+  "confidence": 0.0-1.0,
+  "diseases": ["病害名称"],
+  "analysis": "病害特征、可能原因和发展趋势的详细分析",
+  "recommendations": ["立即措施和后续处理，按优先级排列"],
+  "prevention": "预防类似问题再次发生的建议"
+}}"""
+
+
+BATCH_DIAGNOSIS_PROMPT_TEMPLATE = """你是一位专业的植物病理学家。下面按顺序提供了 {count} 张植株图像，每张图像对应一个植株：
+
+{plant_list}
+
+请逐张独立分析，不要混淆不同植株的信息。只返回一个JSON对象（不要包含Markdown代码块或其他文字），格式如下：
+
+{{
+  "plants": [
+    {{
+      "plant_id": 植株ID（整数，与上面列表一致）,
+      "summary": "健康状况摘要，2-3句话",
+      "severity": "low/medium/high",
+      "confidence": 0.0-1.0,
+      "diseases": ["病害名称"],
+      "mask_prompt": "用于图像分割的病害部位视觉描述（10-20字），无病害时为空字符串",
+      "analysis": "病害特征、可能原因和发展趋势的详细分析",
+      "recommendations": ["建议措施1", "建议措施2"],
+      "prevention": "预防措施"
+    }}
+  ]
+}}
+
+"plants" 数组必须包含全部 {count} 个植株，顺序与图像顺序一致。"""
+
+# 批量诊断的输出token上限
+BATCH_MAX_TOKENS_CAP = 8192
+
+# 支持结构化输出（JSON模式）的提供商
+STRUCTURED_OUTPUT_PROVIDERS = {'openai', 'google', 'qwen', 'dashscope'}
+
+# 提供商拒绝结构化输出参数时错误信息中的关键字
+STRUCTURED_REJECTION_MARKERS = (
+    'response_format', 'json_schema', 'response_mime_type',
+    'unsupported parameter', 'unrecognized request argument'
+)
+
+
+def is_structured_output_rejection(error: Exception) -> bool:
+    """
+    请求失败是否因为提供商不接受结构化输出参数
+    
+    只有HTTP 400或参数不支持的错误才算；超时、连接错误、5xx等临时故障不算。
+    
+    Args:
+        error: 结构化请求抛出的异常
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None and isinstance(getattr(error, 'code', None), int):
+        status = error.code  # google.api_core 异常的HTTP状态码
+    if status == 400:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in STRUCTURED_REJECTION_MARKERS)
+
+
 class AIDiagnosisService:
     """AI诊断服务"""
     
-    def __init__(self, config_manager: AIConfigManager):
+    def __init__(
+        self,
+        config_manager: AIConfigManager,
+        router: Optional[DiagnosisProviderRouter] = None,
+        structured_output: bool = True
+    ):
         """
         初始化AI诊断服务
         
         Args:
             config_manager: AI配置管理器
+            router: 提供商路由器（可选，默认按配置管理器中的提供商创建）
+            structured_output: 对支持的提供商使用JSON结构化输出
         """
         self.config_manager = config_manager
-        self.client = None
+        self.router = router or DiagnosisProviderRouter(config_manager)
+        self.structured_output = structured_output
+        
+        # 实际不支持结构化输出的提供商（请求失败但Markdown请求成功）
+        self._structured_unsupported: set = set()
+    
+    def _use_structured_output(self, config: AIConfig) -> bool:
+        """该提供商是否使用结构化输出"""
+        return (
+            self.structured_output and
+            config.provider in STRUCTURED_OUTPUT_PROVIDERS and
+            DiagnosisProviderRouter.provider_key(config) not in self._structured_unsupported
+        )
 
     
     async def generate_mask_prompt(self, image_base64: str) -> str:
@@ -147,25 +262,23 @@ class AIDiagnosisService:
         start_time = time.time()
         
         try:
-            # 获取AI客户端
-            if not self.client:
-                self.client = self.config_manager.get_client()
-            
-            config = self.config_manager.get_config()
-            provider = config.provider
-            
-            # 根据不同提供商调用API
-            if provider == 'openai':
-                mask_prompt = await self._generate_mask_prompt_openai(image_base64)
-            elif provider == 'anthropic':
-                mask_prompt = await self._generate_mask_prompt_anthropic(image_base64)
-            elif provider == 'google':
-                mask_prompt = await self._generate_mask_prompt_google(image_base64)
-            elif provider in ['qwen', 'dashscope']:
-                # qwen和dashscope需要特殊的图像格式处理
-                mask_prompt = await self._generate_mask_prompt_qwen(image_base64)
-            else:
-                raise ValueError(f"不支持的提供商: {provider}")
+            async def call(config: AIConfig, client) -> str:
+                # 根据不同提供商调用API
+                provider = config.provider
+                if provider == 'openai':
+                    return await self._generate_mask_prompt_openai(image_base64, config, client)
+                elif provider == 'anthropic':
+                    return await self._generate_mask_prompt_anthropic(image_base64, config, client)
+                elif provider == 'google':
+                    return await self._generate_mask_prompt_google(image_base64, config, client)
+                elif provider in ['qwen', 'dashscope']:
+                    # qwen和dashscope需要特殊的图像格式处理
+                    return await self._generate_mask_prompt_qwen(image_base64, config)
+                else:
+                    raise ValueError(f"不支持的提供商: {provider}")
+            
+            # 通过路由器调用（延迟感知、对冲请求、故障转移）
+            mask_prompt = await self.router.execute('mask_prompt', call)
             
             processing_time = time.time() - start_time
             logger.info(f"✅ 遮罩提示词生成成功 (耗时: {processing_time:.2f}秒)")
@@ -177,16 +290,14 @@ class AIDiagnosisService:
             logger.error(f"❌ 生成遮罩提示词失败: {e}")
             raise
     
-    async def _generate_mask_prompt_openai(self, image_base64: str) -> str:
+    async def _generate_mask_prompt_openai(self, image_base64: str, config: AIConfig, client) -> str:
         """使用OpenAI生成遮罩提示词"""
-        config = self.config_manager.get_config()
-        
         try:
             logger.info(f"📡 调用API: {config.provider}/{config.model}")
             logger.info(f"   端点: {config.api_base}")
             logger.info(f"   API密钥: {'已设置' if config.api_key else '未设置'}")
             
-            response = await self.client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=config.model,
                 messages=[
                     {
@@ -224,12 +335,9 @@ class AIDiagnosisService:
             
             raise
     
-    async def _generate_mask_prompt_qwen(self, image_base64: str) -> str:
+    async def _generate_mask_prompt_qwen(self, image_base64: str, config: AIConfig) -> str:
         """使用Qwen生成遮罩提示词（使用requests直接HTTP调用）"""
         import requests
-        import json
-        
-        config = self.config_manager.get_config()
         
         try:
             logger.info(f"📡 调用Qwen API (HTTP): {config.model}")
@@ -272,8 +380,9 @@ class AIDiagnosisService:
             
             logger.info(f"   发送请求到: {endpoint}")
             
-            # 发送请求 (禁用代理)
-            response = requests.post(
+            # 发送请求 (禁用代理)，在线程中执行以免阻塞事件循环
+            response = await asyncio.to_thread(
+                requests.post,
                 endpoint,
                 headers=headers,
                 json=payload,
@@ -309,10 +418,8 @@ class AIDiagnosisService:
             logger.error(f"❌ Qwen API调用失败: {type(e).__name__}: {str(e)}")
             raise
     
-    async def _generate_mask_prompt_anthropic(self, image_base64: str) -> str:
+    async def _generate_mask_prompt_anthropic(self, image_base64: str, config: AIConfig, client) -> str:
         """使用Anthropic生成遮罩提示词"""
-        config = self.config_manager.get_config()
-        
         # 提取base64数据（移除data:image/...前缀）
         if ',' in image_base64:
             media_type = image_base64.split(';')[0].split(':')[1]
@@ -321,7 +428,7 @@ class AIDiagnosisService:
             media_type = "image/png"
             base64_data = image_base64
         
-        response = await self.client.messages.create(
+        response = await client.messages.create(
             model=config.model,
             max_tokens=100,
             messages=[
@@ -347,15 +454,13 @@ class AIDiagnosisService:
         
         return response.content[0].text
     
-    async def _generate_mask_prompt_google(self, image_base64: str) -> str:
+    async def _generate_mask_prompt_google(self, image_base64: str, config: AIConfig, client) -> str:
         """使用Google生成遮罩提示词"""
-        import google.generativeai as genai
         from PIL import Image
         import io
         import base64
         
-        config = self.config_manager.get_config()
-        model = genai.GenerativeModel(config.model)
+        model = client.model(config.model)
         
         # 解码base64图像
         if ',' in image_base64:
@@ -368,7 +473,7 @@ class AIDiagnosisService:
         
         response = await model.generate_content_async(
             [MASK_PROMPT_GENERATION, image],
-            generation_config=genai.types.GenerationConfig(
+            generation_config=client.types.GenerationConfig(
                 max_output_tokens=100,
                 temperature=0.3
             )
@@ -411,44 +516,21 @@ class AIDiagnosisService:
         start_time = time.time()
         
         try:
-            # 获取AI客户端
-            if not self.client:
-                self.client = self.config_manager.get_client()
-            
-            config = self.config_manager.get_config()
-            provider = config.provider
+            # 原始图像在前，遮罩图（如有）在后
+            images = [image_base64] + ([mask_base64] if mask_base64 else [])
             
-            # 构建提示词
-            prompt = self._build_diagnosis_prompt(
-                plant_id, mask_description, mask_prompt
-            )
-            
-            # 根据不同提供商调用API
-            if provider == 'openai':
-                markdown_report = await self._diagnose_openai(
-                    prompt, image_base64, mask_base64
-                )
-            elif provider == 'anthropic':
-                markdown_report = await self._diagnose_anthropic(
-                    prompt, image_base64, mask_base64
-                )
-            elif provider == 'google':
-                markdown_report = await self._diagnose_google(
-                    prompt, image_base64, mask_base64
+            async def call(config: AIConfig, client):
+                parsed, markdown_report = await self._request_diagnosis(
+                    plant_id, images, mask_description, mask_prompt, config, client
                 )
-            elif provider in ['qwen', 'dashscope']:
-                # qwen和dashscope需要特殊的图像格式处理
-                markdown_report = await self._diagnose_qwen(
-                    prompt, image_base64, mask_base64
-                )
-            else:
-                raise ValueError(f"不支持的提供商: {provider}")
+                return parsed, markdown_report, config
+            
+            # 通过路由器调用（延迟感知、对冲请求、故障转移）
+            parsed, markdown_report, config = await self.router.execute('diagnose', call)
             
             processing_time = time.time() - start_time
             
-            # 解析报告提取关键信息
-            summary, severity, diseases, recommendations, confidence = \
-                self._parse_report(markdown_report)
+            summary, severity, diseases, recommendations, confidence = parsed.as_tuple()
             
             # 确保遮罩图有正确的data URL前缀
             if mask_base64:
@@ -496,13 +578,228 @@ class AIDiagnosisService:
             logger.error(f"❌ 生成诊断报告失败: {e}")
             raise
     
+    async def _request_diagnosis(
+        self,
+        plant_id: int,
+        images: List[str],
+        mask_description: Optional[str],
+        mask_prompt: Optional[str],
+        config: AIConfig,
+        client,
+        timeout: Optional[float] = None
+    ) -> Tuple[ParsedReport, str]:
+        """
+        向单个提供商请求诊断并解析结果
+        
+        支持结构化输出的提供商优先以JSON Schema请求；提供商拒绝结构化参数时改用Markdown格式重试，
+        并在重试成功后记住该提供商不支持结构化输出。返回内容不是JSON时直接按Markdown解析，不再重试。
+        
+        Args:
+            timeout: 结构化请求和Markdown重试的总时间预算（秒），默认为路由器的单次请求超时
+        
+        Returns:
+            (解析结果, Markdown格式报告)
+        """
+        deadline = time.monotonic() + (timeout or self.router.request_timeout)
+        
+        def remaining() -> float:
+            budget = deadline - time.monotonic()
+            if budget <= 0:
+                raise asyncio.TimeoutError(f"{config.provider}/{config.model} 诊断请求超出时间预算")
+            return budget
+        
+        structured_rejected = False
+        if self._use_structured_output(config):
+            prompt = self._build_diagnosis_prompt(
+                plant_id, mask_description, mask_prompt, structured=True
+            )
+            try:
+                response = await asyncio.wait_for(
+                    self._call_diagnosis_provider(
+                        prompt, images, config, client, response_schema=DIAGNOSIS_JSON_SCHEMA
+                    ),
+                    timeout=remaining()
+                )
+            except Exception as e:
+                if not is_structured_output_rejection(e):
+                    # 临时故障交给路由器故障转移，不重试也不标记提供商
+                    raise
+                logger.warning(
+                    f"⚠️ {config.provider}/{config.model} 不接受结构化输出参数，改用Markdown格式: {e}"
+                )
+                structured_rejected = True
+            else:
+                try:
+                    parsed = parse_structured_report(extract_json_object(response))
+                    return parsed, render_markdown_report(parsed)
+                except ValueError as e:
+                    logger.warning(f"⚠️ {config.provider}/{config.model} 未返回JSON，按Markdown解析: {e}")
+                    return parse_markdown_report(response), response
+        
+        prompt = self._build_diagnosis_prompt(plant_id, mask_description, mask_prompt)
+        markdown_report = await asyncio.wait_for(
+            self._call_diagnosis_provider(prompt, images, config, client),
+            timeout=remaining()
+        )
+        
+        if structured_rejected:
+            # Markdown请求成功说明提供商可用，只是不支持结构化输出
+            self._structured_unsupported.add(DiagnosisProviderRouter.provider_key(config))
+        
+        return parse_markdown_report(markdown_report), markdown_report
+    
+    async def diagnose_batch(
+        self,
+        plants: List[Tuple[int, str]]
+    ) -> List[Optional[DiagnosisReport]]:
+        """
+        批量诊断：将多个植株图像放入一次多图VLM请求
+        
+        模型按结构化JSON返回每个植株的结果，再拆分为各自的DiagnosisReport。
+        遮罩图不参与批量请求，由调用方在诊断后按mask_prompt生成。
+        
+        Args:
+            plants: (植株ID, 图像base64) 列表
+        
+        Returns:
+            与输入顺序一致的报告列表；模型未返回的植株为None
+        
+        Raises:
+            RuntimeError: AI未配置或调用失败
+            ValueError: 模型返回内容无法解析为批量结果
+        """
+        if not self.config_manager.is_configured():
+            raise RuntimeError("AI模型未配置")
+        
+        if not self.config_manager.validate_vision_support():
+            raise RuntimeError("当前模型不支持视觉功能")
+        
+        plant_ids = [plant_id for plant_id, _ in plants]
+        images = [image_base64 for _, image_base64 in plants]
+        
+        logger.info(f"🔍 批量诊断 {len(plants)} 个植株: {plant_ids}")
+        start_time = time.time()
+        
+        prompt = BATCH_DIAGNOSIS_PROMPT_TEMPLATE.format(
+            count=len(plants),
+            plant_list="\n".join(
+                f"- 图像{index + 1}: 植株ID {plant_id}"
+                for index, plant_id in enumerate(plant_ids)
+            )
+        )
+        
+        async def call(config: AIConfig, client):
+            max_tokens = min(config.max_tokens * len(plants), BATCH_MAX_TOKENS_CAP)
+            response_schema = (
+                BATCH_DIAGNOSIS_JSON_SCHEMA if self._use_structured_output(config) else None
+            )
+            response = await self._call_diagnosis_provider(
+                prompt, images, config, client,
+                max_tokens=max_tokens, response_schema=response_schema
+            )
+            return response, config
+        
+        response, config = await self.router.execute('diagnose_batch', call)
+        processing_time = time.time() - start_time
+        
+        entries = self._parse_batch_response(response, plant_ids)
+        
+        reports: List[Optional[DiagnosisReport]] = []
+        for plant_id, image_base64, entry in zip(plant_ids, images, entries):
+            if entry is None:
+                logger.warning(f"⚠️ 批量结果中缺少植株 {plant_id}")
+                reports.append(None)
+                continue
+            
+            reports.append(self._build_batch_report(
+                plant_id, image_base64, entry, config.model, processing_time
+            ))
+        
+        logger.info(
+            f"✅ 批量诊断完成: {sum(r is not None for r in reports)}/{len(plants)} "
+            f"(耗时: {processing_time:.2f}秒)"
+        )
+        return reports
+    
+    def _parse_batch_response(
+        self,
+        response: str,
+        plant_ids: List[int]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        将批量诊断返回的JSON拆分为每个植株的结果
+        
+        Args:
+            response: 模型返回文本
+            plant_ids: 请求中的植株ID（图像顺序）
+        
+        Returns:
+            与plant_ids顺序一致的结果字典列表
+        
+        Raises:
+            ValueError: 返回内容不是有效的批量JSON
+        """
+        data = extract_json_object(response)
+        
+        items = data.get('plants')
+        if not isinstance(items, list):
+            raise ValueError("批量诊断JSON缺少plants数组")
+        
+        # 优先按plant_id匹配，缺失ID时按顺序匹配
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                by_id[int(item.get('plant_id'))] = item
+            except (TypeError, ValueError):
+                pass
+        
+        entries: List[Optional[Dict[str, Any]]] = []
+        for index, plant_id in enumerate(plant_ids):
+            entry = by_id.get(plant_id)
+            if entry is None and len(by_id) < len(items) and index < len(items):
+                entry = items[index] if isinstance(items[index], dict) else None
+            entries.append(entry)
+        
+        return entries
+    
+    def _build_batch_report(
+        self,
+        plant_id: int,
+        image_base64: str,
+        entry: Dict[str, Any],
+        ai_model: str,
+        processing_time: float
+    ) -> DiagnosisReport:
+        """根据批量结果中的单个植株条目构建诊断报告"""
+        parsed = parse_structured_report(entry)
+        
+        return DiagnosisReport(
+            id=f"diag_{plant_id}_{int(time.time())}",
+            plant_id=plant_id,
+            timestamp=datetime.now().isoformat(),
+            original_image=image_base64,
+            mask_image=None,
+            mask_prompt=parsed.mask_prompt,
+            markdown_report=render_markdown_report(parsed),
+            summary=parsed.summary,
+            severity=parsed.severity,
+            diseases=parsed.diseases,
+            recommendations=parsed.recommendations,
+            ai_model=ai_model,
+            confidence=parsed.confidence,
+            processing_time=processing_time
+        )
+    
     def _build_diagnosis_prompt(
         self,
         plant_id: int,
         mask_description: Optional[str],
-        mask_prompt: Optional[str]
+        mask_prompt: Optional[str],
+        structured: bool = False
     ) -> str:
-        """构建诊断提示词"""
+        """构建诊断提示词（structured=True时要求返回JSON）"""
         
         # 构建遮罩信息部分
         if mask_description and mask_prompt:
@@ -518,7 +815,8 @@ class AIDiagnosisService:
             mask_details = "- 注意：本次诊断未生成遮罩图，请基于整体图像进行分析。"
         
         # 填充模板
-        prompt = DIAGNOSIS_PROMPT_TEMPLATE.format(
+        template = STRUCTURED_DIAGNOSIS_PROMPT_TEMPLATE if structured else DIAGNOSIS_PROMPT_TEMPLATE
+        prompt = template.format(
             plant_id=plant_id,
             mask_info=mask_info,
             mask_details=mask_details
@@ -526,38 +824,86 @@ class AIDiagnosisService:
         
         return prompt
     
+    async def _call_diagnosis_provider(
+        self,
+        prompt: str,
+        images: List[str],
+        config: AIConfig,
+        client,
+        max_tokens: Optional[int] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        按提供商分发诊断请求
+        
+        Args:
+            prompt: 诊断提示词
+            images: 图像列表（base64，按提示词中描述的顺序）
+            config: 提供商配置
+            client: 提供商客户端
+            max_tokens: 最大输出token数（默认使用配置值）
+            response_schema: 结构化输出的JSON Schema（可选，Anthropic忽略）
+        
+        Returns:
+            模型返回的文本
+        """
+        max_tokens = max_tokens or config.max_tokens
+        provider = config.provider
+        
+        if provider == 'openai':
+            return await self._diagnose_openai(
+                prompt, images, config, client, max_tokens, response_schema
+            )
+        elif provider == 'anthropic':
+            return await self._diagnose_anthropic(prompt, images, config, client, max_tokens)
+        elif provider == 'google':
+            return await self._diagnose_google(prompt, images, config, client, max_tokens, response_schema)
+        elif provider in ['qwen', 'dashscope']:
+            # qwen和dashscope需要特殊的图像格式处理
+            return await self._diagnose_qwen(prompt, images, config, max_tokens, response_schema)
+        else:
+            raise ValueError(f"不支持的提供商: {provider}")
+    
     async def _diagnose_openai(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str]
+        images: List[str],
+        config: AIConfig,
+        client,
+        max_tokens: int,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> str:
         """使用OpenAI生成诊断报告"""
-        config = self.config_manager.get_config()
-        
         try:
             logger.info(f"📡 调用诊断API: {config.provider}/{config.model}")
             logger.info(f"   端点: {config.api_base}")
-            logger.info(f"   包含遮罩图: {'是' if mask_base64 else '否'}")
+            logger.info(f"   图像数量: {len(images)}")
             
             # 构建消息内容
-            content = [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_base64}}
-            ]
-            
-            # 如果有遮罩图，也添加进去
-            if mask_base64:
+            content = [{"type": "text", "text": prompt}]
+            for image in images:
                 content.append({
                     "type": "image_url",
-                    "image_url": {"url": mask_base64}
+                    "image_url": {"url": image}
                 })
             
-            response = await self.client.chat.completions.create(
+            extra_args = {}
+            if response_schema:
+                extra_args['response_format'] = {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "plant_diagnosis",
+                        "schema": response_schema,
+                        "strict": True
+                    }
+                }
+            
+            response = await client.chat.completions.create(
                 model=config.model,
                 messages=[{"role": "user", "content": content}],
-                max_tokens=config.max_tokens,
-                temperature=config.temperature
+                max_tokens=max_tokens,
+                temperature=config.temperature,
+                **extra_args
             )
             
             return response.choices[0].message.content
@@ -567,7 +913,7 @@ class AIDiagnosisService:
             logger.error(f"   提供商: {config.provider}")
             logger.error(f"   模型: {config.model}")
             logger.error(f"   端点: {config.api_base}")
-            logger.error(f"   max_tokens: {config.max_tokens}")
+            logger.error(f"   max_tokens: {max_tokens}")
             
             # 提供更具体的错误信息
             error_str = str(e).lower()
@@ -591,12 +937,12 @@ class AIDiagnosisService:
     async def _diagnose_anthropic(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str]
+        images: List[str],
+        config: AIConfig,
+        client,
+        max_tokens: int
     ) -> str:
         """使用Anthropic生成诊断报告"""
-        config = self.config_manager.get_config()
-        
         # 提取base64数据
         def extract_base64(data_url: str):
             if ',' in data_url:
@@ -607,23 +953,10 @@ class AIDiagnosisService:
                 base64_data = data_url
             return media_type, base64_data
         
-        # 构建消息内容
+        # 构建消息内容（图像在前，提示词在后）
         content = []
-        
-        # 添加原始图像
-        media_type, base64_data = extract_base64(image_base64)
-        content.append({
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": media_type,
-                "data": base64_data
-            }
-        })
-        
-        # 如果有遮罩图，也添加
-        if mask_base64:
-            media_type, base64_data = extract_base64(mask_base64)
+        for image in images:
+            media_type, base64_data = extract_base64(image)
             content.append({
                 "type": "image",
                 "source": {
@@ -636,9 +969,9 @@ class AIDiagnosisService:
         # 添加提示词
         content.append({"type": "text", "text": prompt})
         
-        response = await self.client.messages.create(
+        response = await client.messages.create(
             model=config.model,
-            max_tokens=config.max_tokens,
+            max_tokens=max_tokens,
             messages=[{"role": "user", "content": content}]
         )
         
@@ -647,41 +980,27 @@ class AIDiagnosisService:
     async def _diagnose_qwen(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str]
+        images: List[str],
+        config: AIConfig,
+        max_tokens: int,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> str:
         """使用Qwen生成诊断报告（使用requests直接HTTP调用）"""
         import requests
-        import json
-        
-        config = self.config_manager.get_config()
         
         try:
             logger.info(f"📡 调用Qwen诊断API (HTTP): {config.model}")
             logger.info(f"   端点: {config.api_base}")
-            logger.info(f"   包含遮罩图: {'是' if mask_base64 else '否'}")
-            
-            # 确保图像URL格式正确
-            if not image_base64.startswith('data:image/'):
-                image_base64 = f"data:image/png;base64,{image_base64}"
-            
-            if mask_base64 and not mask_base64.startswith('data:image/'):
-                mask_base64 = f"data:image/png;base64,{mask_base64}"
-            
-            # 构建消息内容
-            content = [
-                {"type": "text", "text": prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": image_base64}
-                }
-            ]
+            logger.info(f"   图像数量: {len(images)}")
             
-            # 如果有遮罩图，也添加进去
-            if mask_base64:
+            # 构建消息内容（确保图像URL格式正确）
+            content = [{"type": "text", "text": prompt}]
+            for image in images:
+                if not image.startswith('data:image/'):
+                    image = f"data:image/png;base64,{image}"
                 content.append({
                     "type": "image_url",
-                    "image_url": {"url": mask_base64}
+                    "image_url": {"url": image}
                 })
             
             # 构建endpoint
@@ -698,14 +1017,19 @@ class AIDiagnosisService:
             payload = {
                 'model': config.model,
                 'messages': [{'role': 'user', 'content': content}],
-                'max_tokens': config.max_tokens,
+                'max_tokens': max_tokens,
                 'temperature': config.temperature
             }
             
+            if response_schema:
+                # DashScope兼容模式仅支持JSON对象模式，字段约束由提示词给出
+                payload['response_format'] = {'type': 'json_object'}
+            
             logger.info(f"   发送请求到: {endpoint}")
             
-            # 发送请求 (禁用代理)
-            response = requests.post(
+            # 发送请求 (禁用代理)，在线程中执行以免阻塞事件循环
+            response = await asyncio.to_thread(
+                requests.post,
                 endpoint,
                 headers=headers,
                 json=payload,
@@ -744,17 +1068,18 @@ class AIDiagnosisService:
     async def _diagnose_google(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str]
+        images: List[str],
+        config: AIConfig,
+        client,
+        max_tokens: int,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> str:
         """使用Google生成诊断报告"""
-        import google.generativeai as genai
         from PIL import Image
         import io
         import base64
         
-        config = self.config_manager.get_config()
-        model = genai.GenerativeModel(config.model)
+        model = client.model(config.model)
         
         # 解码图像
         def decode_image(data_url: str):
@@ -766,17 +1091,15 @@ class AIDiagnosisService:
             return Image.open(io.BytesIO(image_data))
         
         # 构建内容
-        content = [prompt, decode_image(image_base64)]
-        
-        # 如果有遮罩图，也添加
-        if mask_base64:
-            content.append(decode_image(mask_base64))
+        content = [prompt] + [decode_image(image) for image in images]
         
         response = await model.generate_content_async(
             content,
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=config.max_tokens,
-                temperature=config.temperature
+            generation_config=client.types.GenerationConfig(
+                max_output_tokens=max_tokens,
+                temperature=config.temperature,
+                # 字段约束由提示词给出（Gemini的Schema格式不支持additionalProperties）
+                response_mime_type="application/json" if response_schema else None
             )
         )
         
@@ -793,54 +1116,7 @@ class AIDiagnosisService:
         Returns:
             (summary, severity, diseases, recommendations, confidence)
         """
-        import re
-        
-        # 提取诊断摘要
-        summary_match = re.search(r'## 诊断摘要\s*\n(.+?)(?=\n##|\Z)', markdown_report, re.DOTALL)
-        summary = summary_match.group(1).strip() if summary_match else "未提供摘要"
-        
-        # 提取严重程度
-        severity = "medium"  # 默认值
-        severity_match = re.search(r'等级:\s*\[?(低|中|高)\]?', markdown_report)
-        if severity_match:
-            severity_text = severity_match.group(1)
-            severity_map = {"低": "low", "中": "medium", "高": "high"}
-            severity = severity_map.get(severity_text, "medium")
-        
-        # 提取病害列表
-        diseases = []
-        diseases_section = re.search(r'## 病害识别\s*\n(.+?)(?=\n##|\Z)', markdown_report, re.DOTALL)
-        if diseases_section:
-            diseases_text = diseases_section.group(1)
-            # 提取列表项或逗号分隔的病害名称
-            disease_items = re.findall(r'[-*]\s*(.+?)(?=\n|$)', diseases_text)
-            if disease_items:
-                diseases = [d.strip() for d in disease_items]
-            else:
-                # 尝试提取逗号分隔的病害
-                diseases = [d.strip() for d in diseases_text.split(',') if d.strip()]
-        
-        # 提取建议措施
-        recommendations = []
-        recommendations_section = re.search(r'## 建议措施\s*\n(.+?)(?=\n##|\Z)', markdown_report, re.DOTALL)
-        if recommendations_section:
-            rec_text = recommendations_section.group(1)
-            # 提取编号列表项
-            rec_items = re.findall(r'\d+\.\s*(.+?)(?=\n|$)', rec_text)
-            recommendations = [r.strip() for r in rec_items if r.strip()]
-        
-        # 提取置信度
-        confidence = 0.75  # 默认值
-        confidence_match = re.search(r'置信度:\s*\[?(\d+(?:\.\d+)?)\s*%?\]?', markdown_report)
-        if confidence_match:
-            confidence_value = float(confidence_match.group(1))
-            # 如果是百分比形式，转换为小数
-            if confidence_value > 1:
-                confidence = confidence_value / 100
-            else:
-                confidence = confidence_value
-        
-        return summary, severity, diseases, recommendations, confidence
+        return parse_markdown_report(markdown_report).as_tuple()
 
 
 # 使用示例
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AI提供商路由器
+在AIConfigManager配置的多个提供商之间进行延迟感知路由、对冲请求和故障转移
+"""
+
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable, Awaitable, TypeVar, Tuple
+
+from ai_config_manager import AIConfigManager, AIConfig
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ProviderStats:
+    """单个提供商（按操作类型区分）的滚动延迟与错误统计"""
+
+    def __init__(self, window_size: int = 50):
+        """
+        初始化统计
+
+        Args:
+            window_size: 滚动窗口大小（最近N次成功请求的延迟）
+        """
+        self.latencies: deque = deque(maxlen=window_size)
+        self.outcomes: deque = deque(maxlen=window_size)  # True=成功, False=失败
+        self.total_requests: int = 0
+        self.total_failures: int = 0
+        self.consecutive_failures: int = 0
+        self.last_failure_time: float = 0
+
+    def record_success(self, latency: float):
+        """记录一次成功请求"""
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.total_requests += 1
+        self.consecutive_failures = 0
+
+    def record_cancelled(self, elapsed: float):
+        """
+        记录一次被取消的请求（对冲落败）
+
+        取消时的耗时是真实延迟的下界，计入延迟窗口以便慢提供商的p95上升，
+        但不计入成功或失败次数。
+        """
+        self.latencies.append(elapsed)
+
+    def record_failure(self):
+        """记录一次失败请求"""
+        self.outcomes.append(False)
+        self.total_requests += 1
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.last_failure_time = time.time()
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        计算延迟分位数
+
+        Args:
+            q: 分位数 (0-1)
+
+        Returns:
+            分位延迟（秒），没有样本时返回None
+        """
+        if not self.latencies:
+            return None
+
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        """滚动窗口内的错误率"""
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            'samples': len(self.latencies),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'error_rate': self.error_rate,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+
+class DiagnosisProviderRouter:
+    """
+    诊断请求路由器
+
+    - 按滚动p95延迟和错误率对提供商排序
+    - 主请求超过p95延迟仍未返回时，向下一个提供商发送对冲请求
+    - 先返回成功结果的请求胜出，其余请求被取消
+    - 请求失败时立即故障转移到下一个提供商
+    """
+
+    def __init__(
+        self,
+        config_manager: AIConfigManager,
+        hedge_percentile: float = 0.95,
+        default_hedge_delay: float = 8.0,
+        min_hedge_delay: float = 1.0,
+        max_hedge_delay: float = 30.0,
+        min_samples: int = 5,
+        request_timeout: float = 120.0,
+        failure_threshold: int = 3,
+        failure_cooldown: float = 30.0,
+        enable_hedging: bool = True
+    ):
+        """
+        初始化路由器
+
+        Args:
+            config_manager: AI配置管理器
+            hedge_percentile: 用于计算对冲延迟的延迟分位数
+            default_hedge_delay: 样本不足时的对冲延迟（秒）
+            min_hedge_delay: 对冲延迟下限（秒）
+            max_hedge_delay: 对冲延迟上限（秒）
+            min_samples: 使用统计分位数所需的最少样本数
+            request_timeout: 单个提供商请求的超时时间（秒）
+            failure_threshold: 连续失败多少次后降低提供商优先级
+            failure_cooldown: 降级提供商的冷却时间（秒）
+            enable_hedging: 是否启用对冲请求
+        """
+        self.config_manager = config_manager
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.min_samples = min_samples
+        self.request_timeout = request_timeout
+        self.failure_threshold = failure_threshold
+        self.failure_cooldown = failure_cooldown
+        self.enable_hedging = enable_hedging
+
+        # 统计：(provider_key, operation) -> ProviderStats
+        self._stats: Dict[str, ProviderStats] = {}
+        # 客户端缓存：(provider_key, api_key) -> client
+        self._clients: Dict[Tuple[str, str], Any] = {}
+
+        # 路由计数
+        self.hedged_requests: int = 0
+        self.hedge_wins: int = 0
+        self.failovers: int = 0
+
+    @staticmethod
+    def provider_key(config: AIConfig) -> str:
+        """提供商唯一标识"""
+        return f"{config.provider}/{config.model}@{config.api_base}"
+
+    def _get_stats(self, key: str, operation: str) -> ProviderStats:
+        """获取（或创建）统计对象"""
+        stats_key = f"{key}:{operation}"
+        if stats_key not in self._stats:
+            self._stats[stats_key] = ProviderStats()
+        return self._stats[stats_key]
+
+    def _get_client(self, config: AIConfig):
+        """获取（或创建）提供商客户端（同一提供商的不同API密钥使用各自的客户端）"""
+        key = (self.provider_key(config), config.api_key)
+        if key not in self._clients:
+            self._clients[key] = self.config_manager.create_client(config)
+        return self._clients[key]
+
+    def reset_clients(self):
+        """清除客户端缓存（配置变更后调用）"""
+        self._clients.clear()
+
+    def _is_degraded(self, stats: ProviderStats) -> bool:
+        """提供商是否处于降级冷却期"""
+        return (
+            stats.consecutive_failures >= self.failure_threshold and
+            time.time() - stats.last_failure_time < self.failure_cooldown
+        )
+
+    def rank_providers(self, operation: str) -> List[AIConfig]:
+        """
+        按健康状况和延迟对提供商排序
+
+        Args:
+            operation: 操作类型（如 mask_prompt, diagnose）
+
+        Returns:
+            排序后的配置列表（最优在前）
+        """
+        configs = self.config_manager.get_all_configs()
+
+        def sort_key(item):
+            index, config = item
+            stats = self._get_stats(self.provider_key(config), operation)
+            p95 = stats.percentile(self.hedge_percentile)
+            if p95 is None or len(stats.latencies) < self.min_samples:
+                # 样本不足时保持配置顺序（主配置优先）
+                p95 = self.default_hedge_delay
+            return (self._is_degraded(stats), stats.error_rate > 0.5, p95, index)
+
+        return [config for _, config in sorted(enumerate(configs), key=sort_key)]
+
+    def get_hedge_delay(self, config: AIConfig, operation: str) -> float:
+        """
+        计算对冲延迟：主提供商的p95延迟，限制在[min, max]范围内
+
+        Args:
+            config: 主提供商配置
+            operation: 操作类型
+
+        Returns:
+            对冲延迟（秒）
+        """
+        stats = self._get_stats(self.provider_key(config), operation)
+        delay = stats.percentile(self.hedge_percentile)
+        if delay is None or len(stats.latencies) < self.min_samples:
+            delay = self.default_hedge_delay
+        return max(self.min_hedge_delay, min(self.max_hedge_delay, delay))
+
+    async def _timed_call(
+        self,
+        config: AIConfig,
+        operation: str,
+        call: Callable[[AIConfig, Any], Awaitable[T]]
+    ) -> T:
+        """执行单个提供商调用并记录统计"""
+        stats = self._get_stats(self.provider_key(config), operation)
+        start_time = time.time()
+        try:
+            client = self._get_client(config)
+            result = await asyncio.wait_for(call(config, client), timeout=self.request_timeout)
+        except asyncio.CancelledError:
+            # 被对冲请求取代，不计入失败
+            stats.record_cancelled(time.time() - start_time)
+            raise
+        except Exception:
+            stats.record_failure()
+            raise
+        stats.record_success(time.time() - start_time)
+        return result
+
+    async def execute(
+        self,
+        operation: str,
+        call: Callable[[AIConfig, Any], Awaitable[T]]
+    ) -> T:
+        """
+        通过路由执行请求
+
+        Args:
+            operation: 操作类型，用于区分延迟统计
+            call: 异步调用函数，接收 (config, client) 并返回结果
+
+        Returns:
+            第一个成功返回的结果
+
+        Raises:
+            RuntimeError: 未配置AI模型或所有提供商均失败
+        """
+        candidates = self.rank_providers(operation)
+        if not candidates:
+            raise RuntimeError("AI模型未配置")
+
+        pending: Dict[asyncio.Task, AIConfig] = {}
+        hedges: List[AIConfig] = []
+        errors: List[str] = []
+        next_index = 0
+
+        def launch() -> AIConfig:
+            nonlocal next_index
+            config = candidates[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._timed_call(config, operation, call))
+            pending[task] = config
+            return config
+
+        primary = launch()
+        hedge_delay = self.get_hedge_delay(primary, operation)
+
+        try:
+            while pending:
+                can_hedge = self.enable_hedging and next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending.keys(),
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # 超过对冲延迟仍未返回，向下一个提供商发送对冲请求
+                    hedge = launch()
+                    hedges.append(hedge)
+                    self.hedged_requests += 1
+                    logger.info(
+                        f"⏱️ {operation} 超过 {hedge_delay:.2f}秒未返回，"
+                        f"对冲请求: {hedge.provider}/{hedge.model}"
+                    )
+                    continue
+
+                for task in done:
+                    config = pending.pop(task)
+                    if task.exception() is None:
+                        if any(config is hedge for hedge in hedges):
+                            self.hedge_wins += 1
+                        logger.info(f"✅ {operation} 由 {config.provider}/{config.model} 完成")
+                        return task.result()
+
+                    error = task.exception()
+                    errors.append(f"{config.provider}/{config.model}: {type(error).__name__}: {error}")
+                    logger.warning(f"⚠️ {config.provider}/{config.model} {operation} 失败: {error}")
+
+                # 故障转移：立即尝试下一个提供商
+                if next_index < len(candidates):
+                    fallback = launch()
+                    self.failovers += 1
+                    logger.info(f"🔄 故障转移到: {fallback.provider}/{fallback.model}")
+
+            raise RuntimeError(f"所有AI提供商均失败: {'; '.join(errors)}")
+        finally:
+            # 取消落败的请求
+            for task in pending:
+                task.cancel()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取路由统计
+
+        Returns:
+            统计信息字典
+        """
+        return {
+            'providers': {key: stats.to_dict() for key, stats in self._stats.items()},
+            'hedged_requests': self.hedged_requests,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers
+        }
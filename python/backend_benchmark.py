@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+后端热路径基准测试
+使用飞行录制回放帧或合成帧，测量视频流水线各阶段与端到端的吞吐量和延迟，
+结果保存为JSON，并可与基线结果对比标记性能回归
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import contextlib
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+import numpy as np
+import cv2
+
+from frame_store import encode_jpeg_data_url
+from flight_recorder import FlightRecording
+from status_cache import StatusCache
+
+logger = logging.getLogger(__name__)
+
+
+BENCHMARK_FORMAT = "sightone-backend-benchmark"
+BENCHMARK_VERSION = 1
+
+# 各阶段（按执行顺序）
+STAGES = (
+    "detect_and_draw",
+    "qr_detect",
+    "jpeg_base64",
+    "broadcast",
+    "status_cache_update",
+    "end_to_end",
+)
+
+# Tello视频分辨率 (H, W)
+FRAME_SHAPE = (720, 960)
+
+# 对比基线的指标: 指标名 -> 是否越大越好
+COMPARE_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'throughput': True,
+}
+
+
+@dataclass
+class StageResult:
+    """单个阶段的基准结果"""
+    name: str
+    iterations: int = 0
+    total_seconds: float = 0.0
+    mean_ms: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    min_ms: float = 0.0
+    max_ms: float = 0.0
+    throughput: float = 0.0  # 每秒操作数（端到端为FPS）
+    skipped: Optional[str] = None  # 跳过原因
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_samples(cls, name: str, samples: List[float], extra: Optional[Dict[str, Any]] = None) -> 'StageResult':
+        """
+        从单次耗时样本计算统计
+
+        Args:
+            name: 阶段名称
+            samples: 每次迭代耗时（秒）
+            extra: 附加信息
+
+        Returns:
+            StageResult对象
+        """
+        latencies = np.asarray(samples, dtype=np.float64) * 1000.0
+        total = float(np.sum(samples))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return cls(
+            name=name,
+            iterations=len(samples),
+            total_seconds=round(total, 4),
+            mean_ms=round(float(latencies.mean()), 4),
+            p50_ms=round(float(p50), 4),
+            p95_ms=round(float(p95), 4),
+            p99_ms=round(float(p99), 4),
+            min_ms=round(float(latencies.min()), 4),
+            max_ms=round(float(latencies.max()), 4),
+            throughput=round(len(samples) / total, 2) if total > 0 else 0.0,
+            extra=extra or {}
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return asdict(self)
+
+
+class FakeClient:
+    """模拟WebSocket客户端，只统计收到的消息"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        初始化模拟客户端
+
+        Args:
+            latency: 每次发送的模拟网络延迟（秒）
+        """
+        self.latency = latency
+        self.messages = 0
+        self.bytes = 0
+
+    async def send(self, message):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages += 1
+        self.bytes += len(message)
+
+
+def synthetic_frames(count: int, seed: int = 0, with_qr: bool = True) -> List[np.ndarray]:
+    """
+    生成合成测试帧（BGR）：绿色背景、草莓状色块，可选植株QR码
+
+    Args:
+        count: 帧数
+        seed: 随机种子（保证结果可复现）
+        with_qr: 是否绘制植株QR码
+
+    Returns:
+        帧列表
+    """
+    rng = np.random.default_rng(seed)
+    height, width = FRAME_SHAPE
+    encoder = cv2.QRCodeEncoder.create() if with_qr and hasattr(cv2, 'QRCodeEncoder') else None
+
+    frames = []
+    for i in range(count):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = (40, 120, 50)
+        noise = rng.integers(0, 30, size=(height, width, 1), dtype=np.uint8)
+        frame = cv2.add(frame, np.repeat(noise, 3, axis=2))
+
+        for _ in range(6):
+            center = (int(rng.integers(80, width - 80)), int(rng.integers(80, height - 80)))
+            axes = (int(rng.integers(15, 35)), int(rng.integers(20, 40)))
+            color = (30, 30, 200) if rng.random() < 0.6 else (60, 200, 120)
+            cv2.ellipse(frame, center, axes, 0, 0, 360, color, -1)
+
+        if encoder is not None:
+            qr = encoder.encode(f"plant_{i % 5 + 1}")
+            qr = cv2.resize(qr, (180, 180), interpolation=cv2.INTER_NEAREST)
+            x, y = 40 + (i * 37) % (width - 300), 40 + (i * 23) % (height - 300)
+            frame[y:y + 180, x:x + 180] = cv2.cvtColor(qr, cv2.COLOR_GRAY2BGR)
+
+        frames.append(frame)
+    return frames
+
+
+def recording_frames(path: str, count: int) -> List[np.ndarray]:
+    """
+    从飞行录制中均匀抽取测试帧（复制到内存，避免计时包含磁盘读取）
+
+    Args:
+        path: 录制目录
+        count: 帧数
+
+    Returns:
+        帧列表
+    """
+    recording = FlightRecording(path)
+    if len(recording) == 0:
+        raise ValueError(f"录制为空: {path}")
+    indices = np.linspace(0, len(recording) - 1, num=min(count, len(recording))).astype(int)
+    return [np.array(recording.frame(int(i))) for i in indices]
+
+
+def status_samples(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    生成模拟无人机状态序列（电量缓降、高度抖动、偶发状态切换）
+
+    Args:
+        count: 数量
+        seed: 随机种子
+
+    Returns:
+        状态字典列表
+    """
+    rng = random.Random(seed)
+    samples = []
+    battery, height = 100, 0
+    for i in range(count):
+        if i % 50 == 0:
+            battery = max(0, battery - 1)
+        height = max(0, height + rng.choice((-3, 0, 0, 3, 8)))
+        samples.append({
+            'connected': True,
+            'flying': height > 0,
+            'battery': battery,
+            'height': height,
+            'temperature': 40 + (i // 200),
+            'wifi_signal': rng.randint(60, 90),
+            'position': {'x': rng.randint(-2, 2), 'y': rng.randint(-2, 2), 'z': height},
+            'mission_pad': {'id': -1},
+        })
+    return samples
+
+
+class BackendBenchmark:
+    """后端热路径基准测试"""
+
+    def __init__(
+        self,
+        frames: List[np.ndarray],
+        iterations: int = 200,
+        warmup: int = 10,
+        clients: int = 5,
+        client_latency: float = 0.0,
+        frame_source: str = "synthetic"
+    ):
+        """
+        初始化基准测试
+
+        Args:
+            frames: 测试帧（BGR），按迭代次数循环使用
+            iterations: 每个阶段的计时迭代次数
+            warmup: 预热迭代次数（不计时）
+            clients: 广播的模拟客户端数量
+            client_latency: 模拟客户端的发送延迟（秒）
+            frame_source: 帧来源描述（写入结果）
+        """
+        self.frames = frames
+        self.iterations = iterations
+        self.warmup = warmup
+        self.clients = clients
+        self.client_latency = client_latency
+        self.frame_source = frame_source
+
+        self._backend = None
+        self._devnull = open(os.devnull, 'w')
+
+    def _get_backend(self):
+        """按实时服务相同的方式构造后端（检测器配置与线上一致）"""
+        if self._backend is None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                from drone_backend import DroneBackendService
+                self._backend = DroneBackendService(ws_port=0, frame_http_port=0)
+            self._backend.connected_clients = {
+                FakeClient(self.client_latency) for _ in range(self.clients)
+            }
+        return self._backend
+
+    def _frame(self, index: int) -> np.ndarray:
+        return self.frames[index % len(self.frames)]
+
+    def _measure(self, name: str, func: Callable[[int], Any], extra: Optional[Dict[str, Any]] = None) -> StageResult:
+        """
+        计时同步阶段（检测器的日志输出被丢弃，但写入开销仍计入）
+
+        Args:
+            name: 阶段名称
+            func: 以迭代序号为参数的被测函数
+            extra: 附加信息
+
+        Returns:
+            StageResult对象
+        """
+        samples = []
+        with contextlib.redirect_stdout(self._devnull):
+            for i in range(self.warmup):
+                func(i)
+            for i in range(self.iterations):
+                start = time.perf_counter()
+                func(i)
+                samples.append(time.perf_counter() - start)
+        return StageResult.from_samples(name, samples, extra)
+
+    async def _measure_async(
+        self,
+        name: str,
+        func: Callable[[int], Awaitable[Any]],
+        extra: Optional[Dict[str, Any]] = None
+    ) -> StageResult:
+        """计时异步阶段"""
+        samples = []
+        with contextlib.redirect_stdout(self._devnull):
+            for i in range(self.warmup):
+                await func(i)
+            for i in range(self.iterations):
+                start = time.perf_counter()
+                await func(i)
+                samples.append(time.perf_counter() - start)
+        return StageResult.from_samples(name, samples, extra)
+
+    def bench_detect_and_draw(self) -> StageResult:
+        """StrawberryMaturityAnalyzer.detect_and_draw"""
+        analyzer = self._get_backend().strawberry_analyzer
+        if analyzer is None:
+            return StageResult(name="detect_and_draw", skipped="草莓检测器不可用（缺少模型或ultralytics/torch）")
+        return self._measure("detect_and_draw", lambda i: analyzer.detect_and_draw(self._frame(i).copy()))
+
+    def bench_qr_detect(self) -> StageResult:
+        """EnhancedQRDetector.detect（与线上相同的冷却配置）"""
+        from enhanced_qr_detector import PYZBAR_AVAILABLE
+
+        detector = self._get_backend().qr_detector
+        if detector is None or not PYZBAR_AVAILABLE:
+            return StageResult(name="qr_detect", skipped="QR检测不可用（pyzbar未安装）")
+
+        decoded = [0]
+
+        def run(i):
+            _, results = detector.detect(self._frame(i), draw_annotations=True)
+            decoded[0] += len(results)
+
+        result = self._measure("qr_detect", run)
+        result.extra = {'detector': type(detector).__name__, 'accepted_results': decoded[0]}
+        return result
+
+    def bench_jpeg_base64(self) -> StageResult:
+        """视频帧BGR→RGB、JPEG编码与base64"""
+        sizes = [len(encode_jpeg_data_url(frame)) for frame in self.frames[:20]]
+        return self._measure(
+            "jpeg_base64",
+            lambda i: encode_jpeg_data_url(self._frame(i), quality=80),
+            extra={'mean_payload_bytes': int(np.mean(sizes))}
+        )
+
+    async def bench_broadcast(self) -> StageResult:
+        """broadcast_message 经消息总线向N个模拟客户端扇出视频帧"""
+        backend = self._get_backend()
+        payloads = [encode_jpeg_data_url(frame) for frame in self.frames[:10]]
+
+        async def run(i):
+            await backend.broadcast_message('video_frame', {'frame': payloads[i % len(payloads)]})
+            await backend.message_bus.flush()
+
+        result = await self._measure_async("broadcast", run)
+        result.extra = {
+            'clients': len(backend.connected_clients),
+            'client_latency': self.client_latency,
+            'messages_per_second': round(result.throughput * len(backend.connected_clients), 2)
+        }
+        return result
+
+    def bench_status_cache_update(self) -> StageResult:
+        """StatusCache.update（差异检测、缓存与广播判定）"""
+        cache = StatusCache(min_broadcast_interval=0.0)
+        samples = status_samples(self.iterations + self.warmup)
+        result = self._measure("status_cache_update", lambda i: cache.update(samples[i]))
+        result.extra = {'broadcast_metrics': cache.broadcast_metrics.to_dict()}
+        return result
+
+    async def bench_end_to_end(self) -> StageResult:
+        """单帧完整流水线：草莓检测 → QR检测 → 编码 → 广播（同一线程顺序执行）"""
+        backend = self._get_backend()
+        analyzer = backend.strawberry_analyzer
+        detector = backend.qr_detector
+
+        async def run(i):
+            frame = self._frame(i).copy()
+            if analyzer is not None:
+                frame, _ = analyzer.detect_and_draw(frame)
+            if detector is not None:
+                frame, _ = detector.detect(frame, draw_annotations=True)
+            await backend.broadcast_message('video_frame', {'frame': encode_jpeg_data_url(frame, quality=80)})
+            await backend.message_bus.flush()
+
+        result = await self._measure_async("end_to_end", run)
+        result.extra = {
+            'fps': result.throughput,
+            'strawberry_detection': analyzer is not None,
+            'qr_detection': detector is not None
+        }
+        return result
+
+    async def run(self, stages: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        运行基准测试
+
+        Args:
+            stages: 要运行的阶段（默认全部）
+
+        Returns:
+            结果字典（可直接保存为JSON）
+        """
+        stages = list(stages or STAGES)
+        results: Dict[str, Any] = {}
+
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            logger.info(f"⏱️ 运行阶段: {stage}")
+            bench = getattr(self, f"bench_{stage}")
+            try:
+                result = bench()
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                logger.error(f"❌ 阶段 {stage} 失败: {e}")
+                result = StageResult(name=stage, skipped=f"运行失败: {e}")
+            results[stage] = result.to_dict()
+
+        return {
+            'format': BENCHMARK_FORMAT,
+            'version': BENCHMARK_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'environment': environment_info(),
+            'config': {
+                'iterations': self.iterations,
+                'warmup': self.warmup,
+                'clients': self.clients,
+                'client_latency': self.client_latency,
+                'frame_source': self.frame_source,
+                'frame_shape': list(self.frames[0].shape),
+                'frames': len(self.frames)
+            },
+            'stages': results
+        }
+
+
+def environment_info() -> Dict[str, Any]:
+    """运行环境信息（对比不同机器的结果时参考）"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def compare_with_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.15,
+    noise_floor_ms: float = 0.05
+) -> List[Dict[str, Any]]:
+    """
+    与基线结果对比
+
+    Args:
+        results: 本次结果
+        baseline: 基线结果
+        tolerance: 允许的相对退化比例（如0.15表示15%）
+        noise_floor_ms: 单次耗时变化小于该值时不判定回归（微秒级阶段的计时抖动）
+
+    Returns:
+        对比条目列表，regression为True表示性能回归
+    """
+    comparison = []
+    for stage, current in results.get('stages', {}).items():
+        reference = baseline.get('stages', {}).get(stage)
+        if not reference or current.get('skipped') or reference.get('skipped'):
+            continue
+
+        for metric, higher_is_better in COMPARE_METRICS.items():
+            old, new = reference.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            degradation = -change if higher_is_better else change
+            if higher_is_better:
+                delta_ms = abs(1000.0 / new - 1000.0 / old) if new else float('inf')
+            else:
+                delta_ms = abs(new - old)
+            significant = delta_ms >= noise_floor_ms
+            comparison.append({
+                'stage': stage,
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change': round(change, 4),
+                'regression': significant and degradation > tolerance,
+                'improvement': significant and degradation < -tolerance
+            })
+    return comparison
+
+
+def print_report(results: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]] = None):
+    """打印结果表"""
+    print(f"\n📊 基准测试结果 ({results['config']['frame_source']}, {results['config']['iterations']} 次迭代)")
+    print(f"{'阶段':<22}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'ops/s':>10}")
+    for name, stage in results['stages'].items():
+        if stage.get('skipped'):
+            print(f"{name:<22}⏭️ 跳过: {stage['skipped']}")
+            continue
+        print(
+            f"{name:<22}{stage['p50_ms']:>10.2f}{stage['p95_ms']:>10.2f}"
+            f"{stage['p99_ms']:>10.2f}{stage['throughput']:>10.1f}"
+        )
+
+    if comparison is None:
+        return
+
+    print("\n📈 与基线对比")
+    for entry in comparison:
+        flag = "❌ 回归" if entry['regression'] else ("✅ 提升" if entry['improvement'] else "  持平")
+        print(
+            f"{flag}  {entry['stage']:<22}{entry['metric']:<12}"
+            f"{entry['baseline']:>10.2f} → {entry['current']:<10.2f}({entry['change']:+.1%})"
+        )
+
+
+async def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='后端热路径基准测试')
+    parser.add_argument('--recording', help='使用飞行录制作为测试帧（默认生成合成帧）')
+    parser.add_argument('--frames', type=int, default=30, help='测试帧数量')
+    parser.add_argument('--iterations', type=int, default=200, help='每个阶段的计时迭代次数')
+    parser.add_argument('--warmup', type=int, default=10, help='预热迭代次数')
+    parser.add_argument('--clients', type=int, default=5, help='广播模拟客户端数量')
+    parser.add_argument('--client-latency', type=float, default=0.0, help='模拟客户端发送延迟（秒）')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, help='只运行指定阶段')
+    parser.add_argument('--output', help='结果JSON路径（默认 benchmark_results/benchmark_<时间>.json）')
+    parser.add_argument('--baseline', help='基线结果JSON，用于对比')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='判定回归的相对退化比例')
+    parser.add_argument('--noise-floor-ms', type=float, default=0.05, help='低于该耗时变化不判定回归')
+    parser.add_argument('--seed', type=int, default=0, help='合成帧随机种子')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.recording:
+        frames = recording_frames(args.recording, args.frames)
+        frame_source = f"recording:{args.recording}"
+    else:
+        frames = synthetic_frames(args.frames, seed=args.seed)
+        frame_source = f"synthetic:seed={args.seed}"
+
+    benchmark = BackendBenchmark(
+        frames,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        clients=args.clients,
+        client_latency=args.client_latency,
+        frame_source=frame_source
+    )
+    results = await benchmark.run(args.stages)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparison = compare_with_baseline(results, baseline, args.tolerance, args.noise_floor_ms)
+        results['baseline'] = {
+            'path': args.baseline,
+            'created_at': baseline.get('created_at'),
+            'tolerance': args.tolerance,
+            'comparison': comparison
+        }
+
+    output = args.output or os.path.join(
+        'benchmark_results', f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print_report(results, comparison)
+    print(f"\n💾 结果已保存: {output}")
+
+    if comparison and any(entry['regression'] for entry in comparison):
+        print("❌ 检测到性能回归")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -7,14 +7,16 @@
 
 import asyncio
 import aiohttp
-import json
 import logging
 import time
 import traceback
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from status_sync import StatusSubscriber
+from message_codec import decode_incoming, ENCODING_JSON, ENCODING_MSGPACK, MSGPACK_AVAILABLE, MSGPACK_SUBPROTOCOL
+
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -48,6 +50,8 @@ class BridgeConfig:
     
     # WebSocket配置
     ws_heartbeat_interval: float = 30.0  # WebSocket心跳间隔
+    ws_topics: Tuple[str, ...] = ("status", "mission")  # 订阅的主题（控制消息始终接收）
+    ws_encoding: str = ENCODING_JSON  # 请求的下行消息编码（msgpack需安装msgpack，服务端不支持时回退JSON）
 
 
 class BridgeClient:
@@ -79,6 +83,9 @@ class BridgeClient:
         # 状态回调
         self.status_callback: Optional[Callable] = None
         
+        # drone_status 快照/增量同步
+        self.drone_status_sync = StatusSubscriber('drone_status')
+        
         # 连接统计
         self.connection_attempts = 0
         self.last_connection_time: Optional[float] = None
@@ -409,21 +416,29 @@ class BridgeClient:
                 
                 logger.info(f"正在连接到WebSocket: {self.ws_url} (尝试 {reconnect_attempts + 1}/{max_reconnect_attempts})")
                 
+                protocols = ()
+                if self.config.ws_encoding == ENCODING_MSGPACK and MSGPACK_AVAILABLE:
+                    protocols = (MSGPACK_SUBPROTOCOL,)
+                
                 async with self.session.ws_connect(
                     self.ws_url,
                     heartbeat=self.config.ws_heartbeat_interval,
-                    timeout=aiohttp.ClientTimeout(total=self.config.connection_timeout)
+                    timeout=aiohttp.ClientTimeout(total=self.config.connection_timeout),
+                    protocols=protocols
                 ) as ws:
                     self.ws = ws
+                    if protocols:
+                        logger.info(f"WebSocket子协议: {ws.protocol or '未协商（JSON）'}")
+                    self.drone_status_sync.needs_resync = True
                     logger.info("✅ WebSocket连接已建立")
                     
                     # 重置重连计数
                     reconnect_attempts = 0
                     
-                    # 发送订阅消息
+                    # 发送订阅消息（只订阅状态与任务主题，不接收视频帧和检测结果）
                     await ws.send_json({
                         "type": "subscribe",
-                        "channel": "status_updates"
+                        "data": {"topics": list(self.config.ws_topics)}
                     })
                     logger.info("已发送状态订阅请求")
                     
@@ -449,10 +464,10 @@ class BridgeClient:
                     try:
                         # 接收消息循环
                         async for msg in ws:
-                            if msg.type == aiohttp.WSMsgType.TEXT:
+                            if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
                                 try:
-                                    # 解析消息
-                                    data = json.loads(msg.data)
+                                    # 解析消息（文本帧为JSON，二进制帧为MessagePack）
+                                    data = decode_incoming(msg.data)
                                     
                                     # 验证消息格式
                                     if not self._validate_status_message(data):
@@ -474,6 +489,18 @@ class BridgeClient:
                                             else:
                                                 self.status_callback(status_data)
                                     
+                                    elif self.drone_status_sync.handles(msg_type):
+                                        # 无人机状态快照或增量，序号不连续时请求重新同步
+                                        if self.drone_status_sync.apply(data):
+                                            if self.status_callback:
+                                                status_data = dict(self.drone_status_sync.state)
+                                                if asyncio.iscoroutinefunction(self.status_callback):
+                                                    await self.status_callback(status_data)
+                                                else:
+                                                    self.status_callback(status_data)
+                                        elif self.drone_status_sync.resync_due():
+                                            await ws.send_json(self.drone_status_sync.resync_request())
+                                    
                                     elif msg_type == "pong":
                                         # 心跳响应
                                         logger.debug("收到心跳响应")
@@ -487,18 +514,19 @@ class BridgeClient:
                                         # 连接确认
                                         logger.info("WebSocket连接已确认")
                                     
+                                    elif msg_type == "subscribed":
+                                        # 订阅确认
+                                        logger.info(f"已订阅主题: {data.get('data', {}).get('topics')}")
+                                    
                                     else:
                                         logger.debug(f"收到未知消息类型: {msg_type}")
                                         
-                                except json.JSONDecodeError as e:
-                                    logger.error(f"WebSocket消息JSON解析失败: {e}")
-                                    logger.error(f"原始消息: {msg.data}")
+                                except ValueError as e:
+                                    logger.error(f"WebSocket消息解析失败: {e}")
+                                    logger.error(f"原始消息: {msg.data[:200]!r}")
                                 except Exception as e:
                                     logger.error(f"处理WebSocket消息失败: {e}")
                                     
-                            elif msg.type == aiohttp.WSMsgType.BINARY:
-                                logger.warning("收到二进制消息，跳过")
-                                
                             elif msg.type == aiohttp.WSMsgType.ERROR:
                                 logger.error(f"WebSocket错误: {ws.exception()}")
                                 break
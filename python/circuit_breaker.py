@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+服务调用保护
+熔断器（closed / open / half_open）与基于延迟的AIMD自适应并发限制
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 直接拒绝，经过恢复时间后进入half_open
+    - half_open: 只放行少量探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(
+        self,
+        name: str = "service",
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            name: 服务名称（用于日志）
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后多久进入半开状态（秒）
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        # 统计
+        self.total_successes = 0
+        self.total_failures = 0
+        self.rejected_calls = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态（open超过恢复时间时视为half_open）"""
+        if self._state == STATE_OPEN and self.retry_after() <= 0:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> float:
+        """距离允许探测还有多少秒（非open状态为0）"""
+        if self._state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.recovery_timeout - time.time())
+
+    def is_open(self) -> bool:
+        """是否处于拒绝请求的状态（不占用半开探测名额）"""
+        return self.state == STATE_OPEN
+
+    def allow_request(self) -> bool:
+        """
+        判断是否放行一次请求（放行后必须调用 record_success / record_failure / record_ignored）
+
+        Returns:
+            是否放行
+        """
+        if self._state == STATE_OPEN:
+            if self.retry_after() > 0:
+                self.rejected_calls += 1
+                return False
+            self._transition(STATE_HALF_OPEN)
+
+        if self._state == STATE_HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                self.rejected_calls += 1
+                return False
+            self._half_open_calls += 1
+
+        return True
+
+    def record_success(self):
+        """记录一次成功"""
+        self.total_successes += 1
+        self._consecutive_failures = 0
+        if self._state == STATE_HALF_OPEN:
+            self._half_open_calls = max(0, self._half_open_calls - 1)
+            self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        """记录一次失败"""
+        self.total_failures += 1
+        self._consecutive_failures += 1
+
+        if self._state == STATE_HALF_OPEN:
+            self._half_open_calls = max(0, self._half_open_calls - 1)
+            self._transition(STATE_OPEN)
+        elif self._state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold:
+            self._transition(STATE_OPEN)
+
+    def record_ignored(self):
+        """请求结束但不反映服务健康状况（如参数错误），只归还探测名额"""
+        if self._state == STATE_HALF_OPEN:
+            self._half_open_calls = max(0, self._half_open_calls - 1)
+
+    def reset(self):
+        """重置为关闭状态"""
+        self._transition(STATE_CLOSED)
+        self._consecutive_failures = 0
+
+    def _transition(self, state: str):
+        """切换状态"""
+        if state == self._state:
+            return
+
+        previous = self._state
+        self._state = state
+        self._half_open_calls = 0
+
+        if state == STATE_OPEN:
+            self._opened_at = time.time()
+            self.times_opened += 1
+            logger.warning(
+                f"🔌 {self.name} 熔断器打开（连续失败 {self._consecutive_failures} 次），"
+                f"{self.recovery_timeout:.0f}秒内快速失败"
+            )
+        elif state == STATE_CLOSED:
+            logger.info(f"✅ {self.name} 熔断器关闭（{previous} → closed）")
+        else:
+            logger.info(f"🔍 {self.name} 熔断器半开，放行探测请求")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取熔断器统计
+
+        Returns:
+            统计信息字典
+        """
+        return {
+            'state': self.state,
+            'consecutive_failures': self._consecutive_failures,
+            'retry_after': round(self.retry_after(), 2),
+            'total_successes': self.total_successes,
+            'total_failures': self.total_failures,
+            'rejected_calls': self.rejected_calls,
+            'times_opened': self.times_opened
+        }
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    基于延迟的AIMD自适应并发限制
+
+    以滑动窗口内的最小延迟作为基线：延迟不超过 基线 × latency_tolerance 时
+    每个请求加法增长 1/limit（约每轮增加1），超时、过载或延迟超标时乘法下降。
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 3,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.7,
+        window_size: int = 50
+    ):
+        """
+        初始化并发限制器
+
+        Args:
+            initial_limit: 初始并发上限
+            min_limit: 最小并发上限
+            max_limit: 最大并发上限
+            latency_tolerance: 延迟超过基线的倍数视为拥塞
+            backoff_ratio: 拥塞时并发上限的乘法下降系数
+            window_size: 基线延迟的采样窗口
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._latencies: deque = deque(maxlen=window_size)
+        self._condition: Optional[asyncio.Condition] = None
+
+        # 统计
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """当前进行中的请求数"""
+        return self._in_flight
+
+    @property
+    def baseline_latency(self) -> Optional[float]:
+        """基线延迟（窗口内最小值）"""
+        return min(self._latencies) if self._latencies else None
+
+    def _get_condition(self) -> asyncio.Condition:
+        """延迟创建，确保绑定到运行中的事件循环"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """等待并占用一个并发名额"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self):
+        """归还并发名额"""
+        condition = self._get_condition()
+        async with condition:
+            self._in_flight = max(0, self._in_flight - 1)
+            condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def record(self, latency: Optional[float], overloaded: bool = False):
+        """
+        根据一次请求结果调整并发上限
+
+        Args:
+            latency: 请求延迟（秒），失败时为None
+            overloaded: 是否为超时或过载（429）等拥塞信号
+        """
+        if overloaded or latency is None:
+            self._decrease()
+            return
+
+        baseline = self.baseline_latency
+        self._latencies.append(latency)
+
+        if baseline is not None and latency > baseline * self.latency_tolerance:
+            self._decrease()
+        elif self._limit < self.max_limit:
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self.increases += 1
+
+    def _decrease(self):
+        """乘法下降"""
+        new_limit = max(self.min_limit, self._limit * self.backoff_ratio)
+        if new_limit < self._limit:
+            self._limit = new_limit
+            self.decreases += 1
+            logger.info(f"📉 并发上限下降至 {self.limit}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取并发限制统计
+
+        Returns:
+            统计信息字典
+        """
+        baseline = self.baseline_latency
+        return {
+            'limit': self.limit,
+            'in_flight': self._in_flight,
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'baseline_latency': round(baseline, 3) if baseline is not None else None,
+            'increases': self.increases,
+            'decreases': self.decreases
+        }
+
+
+async def main():
+    """使用示例"""
+    logging.basicConfig(level=logging.INFO)
+
+    breaker = CircuitBreaker(name="demo", failure_threshold=2, recovery_timeout=0.5)
+    for _ in range(3):
+        if breaker.allow_request():
+            breaker.record_failure()
+    print(f"🔌 熔断器: {breaker.get_statistics()}")
+
+    await asyncio.sleep(0.6)
+    if breaker.allow_request():
+        breaker.record_success()
+    print(f"✅ 恢复后: {breaker.get_statistics()}")
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=6)
+    for latency in [0.5] * 10 + [2.0]:
+        async with limiter:
+            limiter.record(latency)
+    print(f"📊 并发限制: {limiter.get_statistics()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -29,6 +29,11 @@ try:
 except (ImportError, ModuleNotFoundError):
     from qr_detector import EnhancedQRDetector # pyright: ignore [reportImplicitRelativeImport]
 
+try:
+    from .diagnosis_report_parser import extract_json_object
+except (ImportError, ModuleNotFoundError):
+    from diagnosis_report_parser import extract_json_object # pyright: ignore [reportImplicitRelativeImport]
+
 
 @dataclass
 class DiagnosisReport:
@@ -311,11 +316,11 @@ class CropDiagnosisWorkflow:
                     print(f"⚠️ API 返回空內容: {result}")
                     return None
                 
-                # 解析JSON响应
+                # 解析JSON响应（容忍代码块包裹和前后说明文字）
                 try:
-                    diagnosis = json.loads(content)
+                    diagnosis = extract_json_object(content)
                     return diagnosis
-                except json.JSONDecodeError as je:
+                except ValueError as je:
                     print(f"⚠️ JSON 解析失敗: {je}")
                     # 如果返回不是JSON，包装为JSON
                     return {
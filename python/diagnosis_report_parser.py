@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+诊断报告解析器
+解析结构化输出（JSON Schema）和Markdown格式的诊断报告
+"""
+
+import re
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+# 严重程度映射
+SEVERITY_MAP = {"低": "low", "中": "medium", "高": "high"}
+SEVERITY_TEXT = {"low": "低", "medium": "中", "high": "高"}
+
+# 缺失字段时的默认值
+DEFAULT_SUMMARY = "未提供摘要"
+DEFAULT_SEVERITY = "medium"
+DEFAULT_CONFIDENCE = 0.75
+
+# Markdown报告章节标题
+SECTION_SUMMARY = "诊断摘要"
+SECTION_DISEASES = "病害识别"
+SECTION_SEVERITY = "严重程度"
+SECTION_RECOMMENDATIONS = "建议措施"
+
+# 预编译的行级正则（单遍解析时逐行使用）
+_SEVERITY_RE = re.compile(r'等级[:：]\s*\[?(低|中|高)\]?')
+_CONFIDENCE_RE = re.compile(r'置信度[:：]\s*\[?(\d+(?:\.\d+)?)\s*%?\]?')
+_BULLET_RE = re.compile(r'^\s*[-*]\s*(.+?)\s*$')
+_NUMBERED_RE = re.compile(r'^\s*\d+\.\s*(.+?)\s*$')
+_LIST_SEPARATOR_RE = re.compile(r'[,，、]')
+
+
+# 单植株诊断的结构化输出Schema
+DIAGNOSIS_JSON_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "severity": {"type": "string", "enum": ["low", "medium", "high"]},
+        "confidence": {"type": "number"},
+        "diseases": {"type": "array", "items": {"type": "string"}},
+        "analysis": {"type": "string"},
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "prevention": {"type": "string"}
+    },
+    "required": [
+        "summary", "severity", "confidence", "diseases",
+        "analysis", "recommendations", "prevention"
+    ],
+    "additionalProperties": False
+}
+
+# 批量诊断的结构化输出Schema（每个条目额外包含植株ID和遮罩提示词）
+BATCH_DIAGNOSIS_JSON_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "plants": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "plant_id": {"type": "integer"},
+                    "mask_prompt": {"type": "string"},
+                    **DIAGNOSIS_JSON_SCHEMA["properties"]
+                },
+                "required": ["plant_id", "mask_prompt"] + DIAGNOSIS_JSON_SCHEMA["required"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["plants"],
+    "additionalProperties": False
+}
+
+
+@dataclass
+class ParsedReport:
+    """解析后的诊断报告字段"""
+    summary: str = DEFAULT_SUMMARY
+    severity: str = DEFAULT_SEVERITY  # low, medium, high
+    diseases: List[str] = field(default_factory=list)
+    recommendations: List[str] = field(default_factory=list)
+    confidence: float = DEFAULT_CONFIDENCE
+    mask_prompt: Optional[str] = None
+    analysis: str = ""
+    prevention: str = ""
+
+    # 使用了默认值的字段
+    missing_fields: List[str] = field(default_factory=list)
+
+    def as_tuple(self) -> tuple:
+        """返回 (summary, severity, diseases, recommendations, confidence)"""
+        return self.summary, self.severity, self.diseases, self.recommendations, self.confidence
+
+
+def _normalize_confidence(value: float) -> float:
+    """百分比形式的置信度转换为小数"""
+    return value / 100 if value > 1 else value
+
+
+def parse_markdown_report(markdown_report: str, warn_missing: bool = True) -> ParsedReport:
+    """
+    单遍解析Markdown诊断报告
+
+    按行扫描一次报告：`## ` 标题切换当前章节（`###` 子标题归入所属章节），
+    严重程度和置信度在扫描过程中用预编译正则匹配。
+
+    Args:
+        markdown_report: Markdown格式的诊断报告
+        warn_missing: 缺少字段时是否记录警告
+
+    Returns:
+        ParsedReport对象
+    """
+    sections: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    severity: Optional[str] = None
+    confidence: Optional[float] = None
+
+    for line in markdown_report.splitlines():
+        if line.startswith('## '):
+            current = sections.setdefault(line[3:].strip(), [])
+            continue
+
+        if current is not None:
+            current.append(line)
+
+        if severity is None and '等级' in line:
+            match = _SEVERITY_RE.search(line)
+            if match:
+                severity = SEVERITY_MAP[match.group(1)]
+
+        if confidence is None and '置信度' in line:
+            match = _CONFIDENCE_RE.search(line)
+            if match:
+                confidence = _normalize_confidence(float(match.group(1)))
+
+    parsed = ParsedReport()
+
+    # 诊断摘要
+    summary = "\n".join(sections.get(SECTION_SUMMARY, ())).strip()
+    if summary:
+        parsed.summary = summary
+    else:
+        parsed.missing_fields.append('summary')
+
+    # 严重程度
+    if severity:
+        parsed.severity = severity
+    else:
+        parsed.missing_fields.append('severity')
+
+    # 置信度
+    if confidence is not None:
+        parsed.confidence = confidence
+    else:
+        parsed.missing_fields.append('confidence')
+
+    # 病害列表：优先取列表项，否则按分隔符拆分
+    disease_lines = sections.get(SECTION_DISEASES)
+    if disease_lines is None:
+        parsed.missing_fields.append('diseases')
+    else:
+        items = [m.group(1) for m in map(_BULLET_RE.match, disease_lines) if m]
+        if not items:
+            items = _LIST_SEPARATOR_RE.split(" ".join(disease_lines))
+        parsed.diseases = [d.strip() for d in items if d.strip()]
+
+    # 建议措施：编号列表项（包含各子标题下的条目）
+    recommendation_lines = sections.get(SECTION_RECOMMENDATIONS)
+    if recommendation_lines is None:
+        parsed.missing_fields.append('recommendations')
+    else:
+        parsed.recommendations = [
+            m.group(1) for m in map(_NUMBERED_RE.match, recommendation_lines) if m
+        ]
+
+    if warn_missing and parsed.missing_fields:
+        logger.warning(f"⚠️ 诊断报告缺少字段，使用默认值: {', '.join(parsed.missing_fields)}")
+
+    return parsed
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    从模型返回文本中提取JSON对象
+
+    容忍Markdown代码块和前后说明文字。
+
+    Args:
+        text: 模型返回文本
+
+    Returns:
+        解析后的字典
+
+    Raises:
+        ValueError: 文本中没有有效的JSON对象
+    """
+    start = text.find('{')
+    end = text.rfind('}')
+    if start < 0 or end <= start:
+        raise ValueError("返回内容中没有JSON对象")
+
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON解析失败: {e}")
+
+    if not isinstance(data, dict):
+        raise ValueError("返回内容不是JSON对象")
+
+    return data
+
+
+def parse_structured_report(data: Dict[str, Any], warn_missing: bool = True) -> ParsedReport:
+    """
+    解析结构化输出（JSON）诊断结果并规范化字段
+
+    Args:
+        data: 结构化诊断结果
+        warn_missing: 缺少字段时是否记录警告
+
+    Returns:
+        ParsedReport对象
+    """
+    parsed = ParsedReport()
+
+    summary = str(data.get('summary') or "").strip()
+    if summary:
+        parsed.summary = summary
+    else:
+        parsed.missing_fields.append('summary')
+
+    severity = str(data.get('severity') or "").strip().lower()
+    severity = SEVERITY_MAP.get(severity, severity)
+    if severity in SEVERITY_TEXT:
+        parsed.severity = severity
+    else:
+        parsed.missing_fields.append('severity')
+
+    try:
+        parsed.confidence = _normalize_confidence(float(data['confidence']))
+    except (KeyError, TypeError, ValueError):
+        parsed.missing_fields.append('confidence')
+
+    diseases = data.get('diseases')
+    if isinstance(diseases, list):
+        parsed.diseases = [str(d).strip() for d in diseases if str(d).strip()]
+    else:
+        parsed.missing_fields.append('diseases')
+
+    recommendations = data.get('recommendations')
+    if isinstance(recommendations, list):
+        parsed.recommendations = [str(r).strip() for r in recommendations if str(r).strip()]
+    else:
+        parsed.missing_fields.append('recommendations')
+
+    parsed.mask_prompt = str(data.get('mask_prompt') or "").strip() or None
+    parsed.analysis = str(data.get('analysis') or "").strip()
+    parsed.prevention = str(data.get('prevention') or "").strip()
+
+    if warn_missing and parsed.missing_fields:
+        logger.warning(f"⚠️ 结构化诊断结果缺少字段，使用默认值: {', '.join(parsed.missing_fields)}")
+
+    return parsed
+
+
+def render_markdown_report(parsed: ParsedReport) -> str:
+    """
+    将结构化诊断结果渲染为与Markdown诊断报告一致的章节布局
+
+    Args:
+        parsed: 解析后的诊断报告字段
+
+    Returns:
+        Markdown格式报告
+    """
+    return "\n".join([
+        f"## {SECTION_SUMMARY}",
+        parsed.summary,
+        "",
+        f"## {SECTION_DISEASES}",
+        "\n".join(f"- {d}" for d in parsed.diseases) or "- 未识别到病害",
+        "",
+        f"## {SECTION_SEVERITY}",
+        f"- 等级: {SEVERITY_TEXT[parsed.severity]}",
+        f"- 置信度: {parsed.confidence:.0%}",
+        "",
+        "## 详细分析",
+        parsed.analysis or "未提供分析",
+        "",
+        f"## {SECTION_RECOMMENDATIONS}",
+        "\n".join(f"{i + 1}. {r}" for i, r in enumerate(parsed.recommendations)) or "无",
+        "",
+        "## 预防措施",
+        parsed.prevention or "未提供"
+    ])
+
+
+# 基准测试用的示例报告
+SAMPLE_MARKDOWN_REPORT = """## 诊断摘要
+植株整体长势一般，叶片出现明显病斑。病害处于发展初期，及时处理可控制。
+
+## 病害识别
+- 草莓灰霉病
+- 叶斑病
+
+## 严重程度
+- 等级: 中
+- 置信度: 85%
+- 影响范围: 约30%叶片受影响
+
+## 详细分析
+### 病害特征
+叶片表面出现褐色圆形斑点，边缘呈紫红色。
+
+### 可能原因
+湿度过高，通风不良。
+
+### 发展趋势
+若不处理，病斑将在一周内扩散至相邻叶片。
+
+## 建议措施
+### 立即措施
+1. 摘除病叶并集中销毁
+2. 喷施腐霉利等杀菌剂
+
+### 后续处理
+1. 加强通风，降低棚内湿度
+2. 每7天复查一次
+
+## 预防措施
+合理密植，避免偏施氮肥。
+
+---
+*注意：本诊断基于图像分析，建议结合实地观察和专业检测确认。*"""
+
+SAMPLE_STRUCTURED_REPORT = json.dumps({
+    "summary": "植株整体长势一般，叶片出现明显病斑。",
+    "severity": "medium",
+    "confidence": 0.85,
+    "diseases": ["草莓灰霉病", "叶斑病"],
+    "analysis": "叶片表面出现褐色圆形斑点，湿度过高导致。",
+    "recommendations": ["摘除病叶并集中销毁", "喷施杀菌剂", "加强通风"],
+    "prevention": "合理密植，避免偏施氮肥。"
+}, ensure_ascii=False)
+
+
+def benchmark_parse(iterations: int = 10000) -> Dict[str, float]:
+    """
+    报告解析吞吐量微基准
+
+    Args:
+        iterations: 每种解析方式的迭代次数
+
+    Returns:
+        每种解析方式的吞吐量（报告/秒）
+    """
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse_markdown_report(SAMPLE_MARKDOWN_REPORT, warn_missing=False)
+    results['markdown_reports_per_sec'] = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse_structured_report(extract_json_object(SAMPLE_STRUCTURED_REPORT), warn_missing=False)
+    results['structured_reports_per_sec'] = iterations / (time.perf_counter() - start)
+
+    return results
+
+
+def main():
+    """解析示例与吞吐量基准"""
+    logging.basicConfig(level=logging.INFO)
+
+    parsed = parse_markdown_report(SAMPLE_MARKDOWN_REPORT)
+    print("📄 Markdown解析结果:")
+    print(f"   摘要: {parsed.summary}")
+    print(f"   严重程度: {parsed.severity}, 置信度: {parsed.confidence:.0%}")
+    print(f"   病害: {parsed.diseases}")
+    print(f"   建议: {parsed.recommendations}")
+
+    print("\n⏱️ 解析吞吐量:")
+    for name, value in benchmark_parse().items():
+        print(f"   {name}: {value:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,19 @@
 
 import time
 import base64
+import asyncio
 import logging
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple, Union, Set
 from datetime import datetime
 import numpy as np
-import cv2
 
 from ai_config_manager import AIConfigManager
-from unipixel_client import UnipixelClient
+from unipixel_client import UnipixelClient, UnipixelResult, BatchSegmentationTask
+from segmentation_fallback_service import LocalSegmentationService
 from ai_diagnosis_service import AIDiagnosisService, DiagnosisReport
+from frame_store import FrameBuffer, encode_png_rgb
+from mask_analytics import LesionMetrics, analyze_mask
+from mask_codec import union_mask
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +29,21 @@ logger = logging.getLogger(__name__)
 class DiagnosisWorkflowManager:
     """诊断工作流管理器"""
     
-    def __init__(self, cooldown_seconds: int = 30):
+    def __init__(
+        self,
+        cooldown_seconds: int = 30,
+        batch_mode: bool = False,
+        batch_window_seconds: float = 2.0,
+        max_batch_size: int = 4
+    ):
         """
         初始化诊断工作流管理器
         
         Args:
             cooldown_seconds: 同一植株ID的诊断冷却时间（秒）
+            batch_mode: 是否启用批量诊断（窗口内的植株合并为一次多图VLM请求）
+            batch_window_seconds: 批量收集窗口（秒）
+            max_batch_size: 单批最大植株数
         """
         self.enabled: bool = False
         self.cooldown_seconds: int = cooldown_seconds
@@ -45,11 +58,20 @@ class DiagnosisWorkflowManager:
         # 新增：服务依赖
         self.ai_config_manager: Optional[AIConfigManager] = None
         self.unipixel_client: Optional[UnipixelClient] = None
+        self.local_segmentation: Optional[LocalSegmentationService] = None
         self.ai_diagnosis_service: Optional[AIDiagnosisService] = None
         
         # 进度回调函数
         self.progress_callback: Optional[Callable] = None
         
+        # 批量诊断
+        self.batch_mode: bool = batch_mode
+        self.batch_window_seconds: float = batch_window_seconds
+        self.max_batch_size: int = max_batch_size
+        self._batch_queue: List[Tuple[int, str, asyncio.Future]] = []
+        self._batch_flush_task: Optional[asyncio.Task] = None  # 批量窗口计时器
+        self._batch_tasks: Set[asyncio.Task] = set()  # 进行中的批量诊断
+        
         # 初始化服务
         self._initialize_services()
     
@@ -64,6 +86,9 @@ class DiagnosisWorkflowManager:
             self.unipixel_client = UnipixelClient()
             logger.info("✅ Unipixel客户端初始化成功")
             
+            # 本地分割（Unipixel不可用或熔断时的降级方案）
+            self.local_segmentation = LocalSegmentationService()
+            
             # AI诊断服务将在配置AI后创建
             logger.info("ℹ️ AI诊断服务将在配置AI后创建")
             
@@ -83,8 +108,12 @@ class DiagnosisWorkflowManager:
             
             self.ai_config_manager.load_config_from_frontend(config_data)
             
-            # 创建AI诊断服务
-            self.ai_diagnosis_service = AIDiagnosisService(self.ai_config_manager)
+            if self.ai_diagnosis_service and self.ai_diagnosis_service.config_manager is self.ai_config_manager:
+                # 复用诊断服务以保留提供商延迟统计；客户端按提供商/模型缓存，需清除以使用新的API密钥
+                self.ai_diagnosis_service.router.reset_clients()
+            else:
+                # 创建AI诊断服务
+                self.ai_diagnosis_service = AIDiagnosisService(self.ai_config_manager)
             
             logger.info(f"✅ AI配置已更新: {config_data.get('provider')}/{config_data.get('model')}")
             
@@ -92,6 +121,36 @@ class DiagnosisWorkflowManager:
             logger.error(f"❌ 设置AI配置失败: {e}")
             raise
     
+    def set_batch_config(
+        self,
+        enabled: bool,
+        window_seconds: Optional[float] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        """
+        设置批量诊断配置
+        
+        Args:
+            enabled: 是否启用批量诊断
+            window_seconds: 批量收集窗口（秒）
+            max_batch_size: 单批最大植株数
+        """
+        if window_seconds is not None:
+            if window_seconds < 0:
+                raise ValueError("批量窗口不能为负数")
+            self.batch_window_seconds = window_seconds
+        
+        if max_batch_size is not None:
+            if max_batch_size < 1:
+                raise ValueError("批量大小必须大于0")
+            self.max_batch_size = max_batch_size
+        
+        self.batch_mode = enabled
+        logger.info(
+            f"✅ 批量诊断: {'启用' if enabled else '禁用'} "
+            f"(窗口: {self.batch_window_seconds}秒, 最大批量: {self.max_batch_size})"
+        )
+    
     def set_progress_callback(self, callback: Callable):
         """
         设置进度回调函数
@@ -136,14 +195,14 @@ class DiagnosisWorkflowManager:
     async def execute_diagnosis(
         self,
         plant_id: int,
-        frame: np.ndarray
+        frame: Union[np.ndarray, FrameBuffer]
     ) -> Optional[DiagnosisReport]:
         """
         执行完整的三阶段诊断流程
         
         Args:
             plant_id: 植株ID
-            frame: 当前帧图像（OpenCV格式）
+            frame: 当前帧图像（OpenCV格式），或帧存储中的共享帧缓冲区
             
         Returns:
             DiagnosisReport对象，如果失败则返回None
@@ -175,6 +234,10 @@ class DiagnosisWorkflowManager:
             # 将图像转换为base64
             image_base64 = self._frame_to_base64(frame)
             
+            # 批量模式：加入批量队列，等待整批诊断完成
+            if self.batch_mode:
+                return await self._execute_batched(plant_id, image_base64, start_time)
+            
             # 阶段1: AI生成遮罩提示词 (33%)
             self._send_progress(plant_id, "generating_mask_prompt", "AI正在分析病害部位...", 10)
             
@@ -193,34 +256,23 @@ class DiagnosisWorkflowManager:
             
             mask_base64 = None
             mask_description = None
+            lesion_metrics = None
+            mask_result = await self._segment_with_fallback(plant_id, image_base64, mask_prompt)
             
-            if self.unipixel_client:
-                try:
-                    # 检查Unipixel服务可用性
-                    if await self.unipixel_client.is_available():
-                        mask_result = await self.unipixel_client.generate_mask(
-                            image_base64=image_base64,
-                            query=mask_prompt
-                        )
-                        
-                        if mask_result.success:
-                            mask_base64 = mask_result.mask_base64
-                            mask_description = mask_result.description
-                            logger.info(f"✅ Unipixel生成遮罩图成功")
-                            self._send_progress(plant_id, "generating_mask", "遮罩图生成成功", 66)
-                        else:
-                            logger.warning(f"⚠️ Unipixel生成失败: {mask_result.error}")
-                            self._send_progress(plant_id, "generating_mask", "遮罩图生成失败，继续诊断", 66)
-                    else:
-                        logger.warning("⚠️ Unipixel服务不可用")
-                        self._send_progress(plant_id, "generating_mask", "Unipixel不可用，跳过遮罩图", 66)
-                        
-                except Exception as e:
-                    logger.warning(f"⚠️ Unipixel调用失败: {e}")
-                    self._send_progress(plant_id, "generating_mask", "遮罩图生成失败，继续诊断", 66)
+            if mask_result and mask_result.success:
+                mask_base64 = mask_result.mask_base64
+                mask_description = mask_result.description
+                
+                lesion_metrics = self._quantify_lesions(mask_result, self._frame_to_rgb(frame))
+                if lesion_metrics:
+                    mask_description = (
+                        f"{mask_description or mask_prompt}"
+                        f"（病斑面积占比 {lesion_metrics.area_ratio:.1%}，"
+                        f"共 {lesion_metrics.component_count} 处病斑）"
+                    )
+                self._send_progress(plant_id, "generating_mask", "遮罩图生成成功", 66)
             else:
-                logger.warning("⚠️ Unipixel客户端未初始化")
-                self._send_progress(plant_id, "generating_mask", "Unipixel未配置，跳过遮罩图", 66)
+                self._send_progress(plant_id, "generating_mask", "遮罩图生成失败，继续诊断", 66)
             
             # 阶段3: AI生成最终诊断报告 (100%)
             self._send_progress(plant_id, "generating_report", "AI正在生成诊断报告...", 70)
@@ -233,6 +285,10 @@ class DiagnosisWorkflowManager:
                 mask_prompt=mask_prompt
             )
             
+            # 附加遮罩测量指标
+            if lesion_metrics:
+                self._apply_lesion_metrics(report, lesion_metrics)
+            
             # 更新处理时间
             report.processing_time = time.time() - start_time
             
@@ -249,26 +305,276 @@ class DiagnosisWorkflowManager:
             self._send_progress(plant_id, "error", f"诊断失败: {str(e)}", 0)
             return None
     
-    def _frame_to_base64(self, frame: np.ndarray) -> str:
+    async def _execute_batched(
+        self,
+        plant_id: int,
+        image_base64: str,
+        start_time: float
+    ) -> Optional[DiagnosisReport]:
+        """
+        将植株加入批量队列并等待其诊断结果
+        
+        Args:
+            plant_id: 植株ID
+            image_base64: 图像base64
+            start_time: 诊断开始时间
+            
+        Returns:
+            DiagnosisReport对象
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._batch_queue.append((plant_id, image_base64, future))
+        self._send_progress(
+            plant_id, "queued_for_batch",
+            f"等待批量诊断 ({len(self._batch_queue)}/{self.max_batch_size})", 5
+        )
+        
+        if len(self._batch_queue) >= self.max_batch_size:
+            # 批量已满，立即提交（取消窗口计时器，避免其提前提交下一批）
+            if self._batch_flush_task is not None and not self._batch_flush_task.done():
+                self._batch_flush_task.cancel()
+            self._batch_flush_task = None
+            self._start_batch_flush()
+        elif self._batch_flush_task is None or self._batch_flush_task.done():
+            self._batch_flush_task = asyncio.ensure_future(self._flush_batch_after_window())
+        
+        report = await future
+        report.processing_time = time.time() - start_time
+        
+        self.complete_diagnosis(plant_id, report.__dict__)
+        logger.info(f"✅ 诊断完成 (耗时: {report.processing_time:.2f}秒)")
+        self._send_progress(plant_id, "complete", "诊断完成", 100)
+        
+        return report
+    
+    def _start_batch_flush(self):
+        """在独立任务中提交一批（窗口计时器被取消时不会中断进行中的批量诊断）"""
+        task = asyncio.ensure_future(self._flush_batch())
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _flush_batch_after_window(self):
+        """等待批量窗口结束后提交队列"""
+        await asyncio.sleep(self.batch_window_seconds)
+        self._start_batch_flush()
+    
+    async def _flush_batch(self):
+        """提交当前队列中的一批植株（一次多图VLM请求）"""
+        batch = self._batch_queue[:self.max_batch_size]
+        self._batch_queue = self._batch_queue[self.max_batch_size:]
+        if not batch:
+            return
+        
+        # 队列中仍有剩余，安排下一批
+        if self._batch_queue and (self._batch_flush_task is None or self._batch_flush_task.done()):
+            self._batch_flush_task = asyncio.ensure_future(self._flush_batch_after_window())
+        
+        reports: List[Optional[DiagnosisReport]] = [None] * len(batch)
+        error = "批量任务已取消"
+        try:
+            plants = [(plant_id, image_base64) for plant_id, image_base64, _ in batch]
+            for plant_id, _, _ in batch:
+                self._send_progress(
+                    plant_id, "generating_report", f"AI正在批量诊断 {len(batch)} 个植株...", 30
+                )
+            
+            try:
+                reports = list(await self.ai_diagnosis_service.diagnose_batch(plants))
+            except Exception as e:
+                logger.warning(f"⚠️ 批量诊断失败，逐个诊断: {e}")
+                reports = [None] * len(batch)
+            
+            # 批量结果中缺失的植株回退到单株诊断
+            for index, (plant_id, image_base64, _) in enumerate(batch):
+                if reports[index] is None:
+                    try:
+                        reports[index] = await self.ai_diagnosis_service.diagnose(
+                            plant_id=plant_id,
+                            image_base64=image_base64
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ 植株 {plant_id} 诊断失败: {e}")
+            
+            await self._attach_batch_masks(batch, reports)
+            
+            for (plant_id, _, future), report in zip(batch, reports):
+                if future.done():
+                    continue
+                if report is None:
+                    future.set_exception(RuntimeError(f"植株 {plant_id} 诊断失败"))
+                else:
+                    future.set_result(report)
+        except Exception as e:
+            error = str(e)
+            logger.error(f"❌ 批量诊断异常: {e}")
+        finally:
+            # 任何未处理的异常（含取消）都不能让等待中的植株永久挂起
+            for plant_id, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"植株 {plant_id} 批量诊断失败: {error}"))
+    
+    async def _attach_batch_masks(
+        self,
+        batch: List[Tuple[int, str, asyncio.Future]],
+        reports: List[Optional[DiagnosisReport]]
+    ):
+        """按各植株的mask_prompt并发生成遮罩图并附加到报告（失败的植株降级到本地分割）"""
+        tasks = []
+        for (plant_id, image_base64, _), report in zip(batch, reports):
+            if report and report.mask_prompt and not report.mask_image:
+                self._send_progress(plant_id, "generating_mask", "Unipixel正在生成遮罩图...", 80)
+                tasks.append(BatchSegmentationTask(
+                    task_id=str(plant_id),
+                    image_base64=image_base64,
+                    query=report.mask_prompt,
+                    mask_format="rle"
+                ))
+        
+        if not tasks:
+            return
+        
+        masks: Dict[str, UnipixelResult] = {}
+        if self.unipixel_client:
+            try:
+                if await self.unipixel_client.is_available():
+                    results = await self.unipixel_client.batch_generate_masks(tasks)
+                    masks = {
+                        result.task_id: result.result
+                        for result in results if result.result.success and result.result.mask_base64
+                    }
+                else:
+                    logger.warning("⚠️ Unipixel服务不可用，批量诊断使用本地分割")
+            except Exception as e:
+                logger.warning(f"⚠️ 批量遮罩生成失败: {e}")
+        
+        # 降级到本地分割
+        if self.local_segmentation:
+            for task in tasks:
+                if task.task_id not in masks:
+                    result = await self.local_segmentation.segment(
+                        image_base64=task.image_base64,
+                        query=task.query
+                    )
+                    if result.success:
+                        masks[task.task_id] = result
+        
+        for report in reports:
+            if report is None or str(report.plant_id) not in masks:
+                continue
+            mask_result = masks[str(report.plant_id)]
+            mask_base64 = mask_result.mask_base64
+            if not mask_base64.startswith('data:image/'):
+                mask_base64 = f"data:image/png;base64,{mask_base64}"
+            report.mask_image = mask_base64
+            
+            lesion_metrics = self._quantify_lesions(mask_result)
+            if lesion_metrics:
+                self._apply_lesion_metrics(report, lesion_metrics)
+    
+    async def _segment_with_fallback(
+        self,
+        plant_id: int,
+        image_base64: str,
+        mask_prompt: str
+    ) -> Optional[UnipixelResult]:
+        """
+        生成遮罩图：优先Unipixel，服务不可用、熔断或失败时降级到本地分割
+        
+        Args:
+            plant_id: 植株ID
+            image_base64: 图像base64编码
+            mask_prompt: 遮罩提示词
+            
+        Returns:
+            UnipixelResult，均不可用时返回None
+        """
+        if self.unipixel_client:
+            try:
+                # 检查Unipixel服务可用性（熔断期间立即返回不可用）
+                if await self.unipixel_client.is_available():
+                    mask_result = await self.unipixel_client.generate_mask(
+                        image_base64=image_base64,
+                        query=mask_prompt,
+                        mask_format="rle"
+                    )
+                    if mask_result.success:
+                        logger.info(f"✅ Unipixel生成遮罩图成功")
+                        return mask_result
+                    logger.warning(f"⚠️ Unipixel生成失败: {mask_result.error}")
+                else:
+                    logger.warning("⚠️ Unipixel服务不可用")
+            except Exception as e:
+                logger.warning(f"⚠️ Unipixel调用失败: {e}")
+        else:
+            logger.warning("⚠️ Unipixel客户端未初始化")
+        
+        if not self.local_segmentation:
+            return None
+        
+        self._send_progress(plant_id, "generating_mask", "Unipixel不可用，使用本地分割...", 50)
+        return await self.local_segmentation.segment(image_base64=image_base64, query=mask_prompt)
+    
+    def _quantify_lesions(
+        self,
+        mask_result,
+        image_rgb: Optional[np.ndarray] = None
+    ) -> Optional[LesionMetrics]:
+        """
+        从分割结果的二值遮罩计算病斑指标
+        
+        Args:
+            mask_result: UnipixelResult（需包含binary_masks）
+            image_rgb: 原始RGB图像，用于颜色统计（可选）
+            
+        Returns:
+            LesionMetrics，没有二值遮罩时返回None
+        """
+        if not mask_result.binary_masks:
+            return None
+        
+        try:
+            metrics = analyze_mask(union_mask(mask_result.binary_masks), image_rgb)
+            logger.info(
+                f"📐 病斑面积占比: {metrics.area_ratio:.1%}, "
+                f"病斑数: {metrics.component_count}, 测量严重程度: {metrics.measured_severity}"
+            )
+            return metrics
+        except Exception as e:
+            logger.warning(f"⚠️ 病斑量化失败: {e}")
+            return None
+    
+    def _apply_lesion_metrics(self, report: DiagnosisReport, metrics: LesionMetrics):
+        """
+        将病斑指标写入报告
+        
+        病斑面积占比以整帧像素为分母，背景越多占比越低，因此测量的严重程度单独保存，
+        报告的severity保留AI判断的结果。
+        """
+        report.lesion_metrics = metrics.to_dict()
+        report.measured_severity = metrics.measured_severity
+        if report.severity != metrics.measured_severity:
+            logger.info(f"📐 测量严重程度 {metrics.measured_severity} 与AI判断 {report.severity} 不一致")
+    
+    def _frame_to_rgb(self, frame: Union[np.ndarray, FrameBuffer]) -> Optional[np.ndarray]:
+        """获取帧的RGB视图（BGR通道翻转，不复制数据）"""
+        array = frame.array if isinstance(frame, FrameBuffer) else frame
+        return array[..., ::-1] if array is not None and array.ndim == 3 else None
+    
+    def _frame_to_base64(self, frame: Union[np.ndarray, FrameBuffer]) -> str:
         """
         将OpenCV图像转换为base64编码
         
         Args:
-            frame: OpenCV图像（BGR格式）
+            frame: OpenCV图像（BGR格式），或共享帧缓冲区（复用其缓存的PNG编码）
             
         Returns:
             base64编码的图像字符串（包含data:image/png;base64,前缀）
         """
-        # 将BGR转换为RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if isinstance(frame, FrameBuffer):
+            return frame.to_data_url('png')
         
-        # 编码为PNG
-        success, buffer = cv2.imencode('.png', frame_rgb)
-        if not success:
-            raise ValueError("图像编码失败")
-        
-        # 转换为base64
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
+        # 将BGR转换为RGB并编码为PNG
+        image_base64 = base64.b64encode(encode_png_rgb(frame)).decode('utf-8')
         
         return f"data:image/png;base64,{image_base64}"
     
@@ -413,7 +719,11 @@ class DiagnosisWorkflowManager:
             'ai_model': None,
             'ai_supports_vision': False,
             'unipixel_available': False,
-            'diagnosis_enabled': self.enabled
+            'diagnosis_enabled': self.enabled,
+            'batch_mode': self.batch_mode,
+            'batch_window_seconds': self.batch_window_seconds,
+            'max_batch_size': self.max_batch_size,
+            'batch_queue_size': len(self._batch_queue)
         }
         
         # AI配置状态
@@ -423,8 +733,17 @@ class DiagnosisWorkflowManager:
             status['ai_provider'] = config.provider
             status['ai_model'] = config.model
             status['ai_supports_vision'] = config.supports_vision
+            status['ai_fallback_providers'] = [
+                f"{c.provider}/{c.model}" for c in self.ai_config_manager.fallback_configs
+            ]
+        
+        # 提供商路由统计
+        if self.ai_diagnosis_service:
+            status['provider_routing'] = self.ai_diagnosis_service.router.get_statistics()
         
         # Unipixel状态（需要异步检查，这里只返回客户端是否存在）
         status['unipixel_client_initialized'] = self.unipixel_client is not None
+        if self.unipixel_client:
+            status['unipixel'] = self.unipixel_client.get_statistics()
         
         return status
@@ -41,15 +41,12 @@ if _backend_dir not in sys.path:
 # 打印启动横幅
 print_banner()
 
-import json
 from typing import Any, Dict, cast, Optional, Set
 import asyncio
 import threading
 import time
 import argparse
-from datetime import datetime
 import traceback
-import base64
 import numpy as np
 
 # 预定义可选依赖名称
@@ -130,10 +127,20 @@ try:
 except ImportError:
     print("⚠️ websockets库未安装，WebSocket功能将不可用")
 
+from frame_store import FrameStore, FrameBuffer, FrameHTTPServer, encode_jpeg
+from flight_recorder import FlightRecorder, FlightRecording, ReplayFrameSource, REPLAY_MODES
+from status_sync import StatusPublisher
+from tello_telemetry import TelloTelemetry, TelloState
+from message_bus import MessageBus
+from subscriptions import SubscriptionRegistry, topic_for, TOPIC_STATUS, TOPIC_DETECTION, TOPIC_VIDEO
+from message_codec import (encode_for, decode_incoming, iso_now, negotiate, server_subprotocols, select_subprotocol,
+                           supported_encodings, encoding_for_subprotocol, EmbeddedImage, ENCODING_JSON)
+
 
 class DroneControllerAdapter:
-    def __init__(self, tello_drone: 'Tello'):
+    def __init__(self, tello_drone: 'Tello', telemetry: Optional[TelloTelemetry] = None):
         self.tello = tello_drone
+        self.telemetry = telemetry
         self._is_connected = False
         self._is_flying = False
     
@@ -145,11 +152,18 @@ class DroneControllerAdapter:
     def mission_pad_id(self):
         """获取当前检测到的Mission Pad ID"""
         try:
+            if self.telemetry and self.telemetry.is_fresh:
+                return self.telemetry.latest.mid
             if self.tello:
                 return self.tello.get_mission_pad_id()
         except Exception as e:
             print(f"获取Mission Pad ID失败: {e}")
         return -1
+
+    def current_height(self) -> int:
+        """当前高度（cm），优先使用推送的遥测"""
+        height = self.telemetry.value('h') if self.telemetry else None
+        return self.tello.get_height() if height is None else height
         
     def takeoff(self):
         try:
@@ -157,7 +171,7 @@ class DroneControllerAdapter:
                 # 检查实际飞行状态，而不只是内部标志
                 try:
                     # 尝试获取高度来判断是否在飞行
-                    height = self.tello.get_height()
+                    height = self.current_height()
                     if height > 10:  # 如果高度大于10cm，认为已经在飞行
                         print(f"⚠️ 无人机已在飞行中 (高度: {height}cm)")
                         self._is_flying = True
@@ -191,7 +205,7 @@ class DroneControllerAdapter:
         """设置飞行高度（厘米）"""
         try:
             if self.tello and self._is_flying:
-                current_height = self.tello.get_height()
+                current_height = self.current_height()
                 diff = height_cm - current_height
                 if abs(diff) > 20:  # 只有差异大于20cm才调整
                     if diff > 0:
@@ -243,7 +257,7 @@ class DroneControllerAdapter:
 class DroneBackendService:
     """无人机后端服务 (V4 - 单循环简化版)"""
 
-    def __init__(self, ws_port=3002):
+    def __init__(self, ws_port=3002, frame_http_port=3005, recordings_dir='recordings'):
         self.ws_port = ws_port
         self.drone: Optional['Tello'] = None
         self.drone_adapter: Optional[DroneControllerAdapter] = None
@@ -255,9 +269,24 @@ class DroneBackendService:
         
         self.is_running = True
         self.connected_clients: Set[Any] = set()
+        # 客户端协商的消息编码（json/msgpack），未协商时为JSON
+        self.client_encodings: Dict[Any, str] = {}
+        # 客户端主题订阅：只序列化和发送客户端订阅的主题（未订阅的客户端收到全部消息）
+        self.subscriptions = SubscriptionRegistry()
         self.main_loop: Optional[asyncio.AbstractEventLoop] = None
+        # 出站消息总线：按类型合并与限速，控制和错误消息优先于视频帧
+        self.message_bus = MessageBus(self._send_to_clients)
+        # 客户端主题限速窗口结束时补发被丢弃的最新值
+        self._trailing_task: Optional[asyncio.Task] = None
 
         self.drone_state = {'flying': False, 'battery': 0, 'connected': False, 'challenge_cruise_active': False}
+        # 状态增量同步：新客户端收到带序号的快照，之后只广播变化字段
+        self.status_publisher = StatusPublisher('drone_status')
+        self.status_publisher.publish(self.drone_state)
+        # 直接发给客户端的快照序号：总线中尚未发出的更早增量不再发给该客户端（避免快照之后收到旧增量）
+        self.client_status_seq: Dict[Any, int] = {}
+        # Tello推送的状态包（约10Hz）直接更新drone_state，无需逐项查询
+        self.telemetry: Optional[TelloTelemetry] = None
 
         self.video_streaming = False
         self.video_thread: Optional[threading.Thread] = None
@@ -265,6 +294,16 @@ class DroneBackendService:
         self.qr_detection_enabled = False
         self.last_qr_results: List[Dict] = []
         
+        # 共享帧存储：诊断、录制和广播共用同一份帧数据，客户端按ID通过HTTP获取图像
+        self.frame_store = FrameStore()
+        self.frame_http_server = FrameHTTPServer(self.frame_store, port=frame_http_port)
+        self.frame_http_enabled = False
+        
+        # 飞行录制与回放：回放源替代Tello帧读取器，无需硬件即可驱动检测流水线
+        self.flight_recorder = FlightRecorder(root_dir=recordings_dir)
+        self.replay_source: Optional[ReplayFrameSource] = None
+        self.frame_interval = 1 / 30  # 视频循环间隔（fast回放时为0）
+        
         self._initialize_detectors()
 
     def _initialize_detectors(self):
@@ -331,22 +370,39 @@ class DroneBackendService:
         frame_read = None
         last_summary_broadcast_time = 0
 
-        while self.video_streaming and self.drone:
+        while self.video_streaming and (self.drone or self.replay_source):
             try:
-                if not self.drone_state.get('connected', False): 
+                replay_source = self.replay_source
+                if not replay_source and not self.drone_state.get('connected', False): 
                     break
                 
                 if frame_read is None:
-                    frame_read = self.drone.get_frame_read()
+                    frame_read = replay_source or self.drone.get_frame_read()
                     if frame_read is None: 
                         time.sleep(0.5)
                         continue
 
                 # 1. 获取帧（BGR色域 - OpenCV默认）
                 frame = frame_read.frame
+                if frame is None and replay_source and replay_source.finished:
+                    print("⏹️ 回放结束")
+                    if self.main_loop and not self.main_loop.is_closed():
+                        asyncio.run_coroutine_threadsafe(
+                            self.broadcast_message('replay_status', replay_source.get_status()),
+                            self.main_loop
+                        )
+                    break
                 if frame is None or not cv2: 
                     time.sleep(0.05)
                     continue
+                
+                # 录制原始帧和遥测；回放时使用录制中的遥测
+                if replay_source:
+                    telemetry = replay_source.telemetry
+                    if telemetry['battery'] >= 0:
+                        self.drone_state['battery'] = telemetry['battery']
+                elif self.flight_recorder.is_recording:
+                    self.flight_recorder.record(frame, self._telemetry_snapshot())
 
                 # 色域处理流程：
                 # - 输入: BGR (OpenCV)
@@ -390,10 +446,10 @@ class DroneBackendService:
                         )
                         self.last_qr_results = qr_results
                         
-                        # 广播QR检测结果
-                        if qr_results:
+                        # 广播QR检测结果（没有检测主题订阅者时跳过QR码图像裁剪和编码）
+                        if qr_results and self.subscriptions.has_subscribers(TOPIC_DETECTION, self.connected_clients):
                             if self.main_loop and not self.main_loop.is_closed():
-                                # 准备QR结果数据（包含base64图像）
+                                # 准备QR结果数据（包含QR码裁剪图像）
                                 qr_data_list = []
                                 for qr in qr_results:
                                     qr_data = {
@@ -402,7 +458,7 @@ class DroneBackendService:
                                         'timestamp': qr.get('timestamp')
                                     }
                                     
-                                    # 裁剪QR码区域并编码为base64
+                                    # 裁剪QR码区域并编码为JPEG（JSON客户端收到base64，MessagePack客户端收到字节）
                                     if 'bbox' in qr and qr['bbox']:
                                         try:
                                             x, y, w, h = qr['bbox']
@@ -421,8 +477,7 @@ class DroneBackendService:
                                             
                                             # 编码为JPEG
                                             _, qr_buffer = cv2.imencode('.jpg', qr_crop_rgb, [cv2.IMWRITE_JPEG_QUALITY, 90])
-                                            qr_image_b64 = base64.b64encode(qr_buffer.tobytes()).decode('utf-8')
-                                            qr_data['qr_image'] = qr_image_b64
+                                            qr_data['qr_image'] = EmbeddedImage(qr_buffer.tobytes(), as_data_url=False)
                                             qr_data['size'] = f"{w}x{h}"
                                         except Exception as e:
                                             print(f"⚠️ QR码图像裁剪失败: {e}")
@@ -442,6 +497,7 @@ class DroneBackendService:
 
                 # 4. 检查诊断触发
                 if qr_results and self.diagnosis_manager and self.diagnosis_manager.enabled:
+                    frame_buffer: Optional[FrameBuffer] = None
                     try:
                         for qr in qr_results:
                             plant_id = qr.get('plant_id')
@@ -507,32 +563,43 @@ class DroneBackendService:
                                         self.main_loop
                                     )
                                 
+                                # 没有可用的事件循环时诊断任务无法执行，不占用帧引用
+                                if not self.main_loop or self.main_loop.is_closed():
+                                    continue
+                                
+                                # 同一帧只复制一次，多个诊断任务共享（各持有一个引用，由诊断任务释放）
+                                if frame_buffer is None:
+                                    frame_buffer = self.frame_store.put(frame)
+                                else:
+                                    self.frame_store.acquire(frame_buffer.frame_id)
+                                
                                 # 异步执行完整诊断流程
-                                asyncio.run_coroutine_threadsafe(
-                                    self._execute_diagnosis_async(plant_id, frame.copy()),
-                                    self.main_loop
-                                )
+                                diagnosis = self._execute_diagnosis_async(plant_id, frame_buffer)
+                                try:
+                                    asyncio.run_coroutine_threadsafe(diagnosis, self.main_loop)
+                                except RuntimeError:
+                                    # 事件循环在检查后关闭，任务不会执行，释放本任务的引用
+                                    diagnosis.close()
+                                    self.frame_store.release(frame_buffer.frame_id)
                     except Exception as e:
                         print(f"❌ 诊断触发错误: {e}")
                         traceback.print_exc()
 
-                # 5. 转换BGR到RGB用于前端显示
-                # 前端浏览器期望RGB色域
-                annotated_frame_rgb = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-                
-                # 6. 编码并广播帧
-                _, buffer = cv2.imencode('.jpg', annotated_frame_rgb, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                frame_b64 = base64.b64encode(buffer.tobytes()).decode('utf-8')
-                
-                if self.main_loop and not self.main_loop.is_closed():
+                # 5. 转换BGR到RGB（前端浏览器期望RGB色域）并编码为JPEG，没有视频订阅者时跳过编码
+                # JSON客户端收到data URL，MessagePack客户端直接收到JPEG字节
+                # 6. 广播帧
+                if self.main_loop and not self.main_loop.is_closed() and \
+                        self.subscriptions.has_subscribers(TOPIC_VIDEO, self.connected_clients):
+                    frame_image = EmbeddedImage(encode_jpeg(annotated_frame, quality=80))
                     asyncio.run_coroutine_threadsafe(
                         self.broadcast_message('video_frame', {
-                            'frame': f'data:image/jpeg;base64,{frame_b64}'
+                            'frame': frame_image
                         }),
                         self.main_loop
                     )
                 
-                time.sleep(1/30)  # 30 FPS
+                if self.frame_interval > 0:
+                    time.sleep(self.frame_interval)  # 默认30 FPS
 
             except Exception as e:
                 print(f"❌ 视频流错误: {e}")
@@ -541,31 +608,93 @@ class DroneBackendService:
         
         print("📹 视频流处理器已停止")
 
+    def _telemetry_snapshot(self) -> Dict[str, Any]:
+        """当前遥测（最近一个Tello状态包，不发送命令）"""
+        telemetry: Dict[str, Any] = {'timestamp': time.time()}
+        state = self.telemetry.latest if self.telemetry and self.telemetry.is_fresh else None
+        if state:
+            telemetry.update({'battery': state.bat, 'height': state.h, 'mission_pad': state.mid})
+        return telemetry
+
+    def _on_telemetry(self, state: TelloState):
+        """遥测线程回调：转交主循环更新状态"""
+        if self.main_loop and not self.main_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._apply_telemetry(state), self.main_loop)
+
+    async def _apply_telemetry(self, state: TelloState):
+        if not self.drone_state['connected']: return
+        self.drone_state.update({'battery': state.bat, 'height': state.h, 'temperature': state.temperature})
+        # 只有字段变化时publish才生成增量
+        await self.broadcast_drone_status()
+
+    def _start_telemetry(self):
+        self._stop_telemetry()
+        self.telemetry = TelloTelemetry(self.drone)
+        self.telemetry.add_listener(self._on_telemetry)
+        self.telemetry.start()
+
+    def _stop_telemetry(self):
+        if self.telemetry:
+            self.telemetry.stop()
+            self.telemetry = None
+
+    def start_replay(self, path: str, mode: str = 'realtime', speed: float = 1.0, loop: bool = False) -> ReplayFrameSource:
+        """用录制回放替代Tello帧源启动视频流水线"""
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"不支持的回放模式: {mode}")
+        self.stop_streaming_thread()
+        self.replay_source = ReplayFrameSource(FlightRecording(path), mode=mode, speed=speed, loop=loop)
+        self.frame_interval = 0 if mode == 'fast' else 1 / 30
+        self.start_streaming_thread()
+        print(f"▶️ 开始回放: {path} (模式: {mode}, {len(self.replay_source.recording)} 帧)")
+        return self.replay_source
+
+    def stop_replay(self):
+        self.stop_streaming_thread()
+        self.replay_source = None
+        self.frame_interval = 1 / 30
+        if self.drone and self.drone_state.get('connected'):
+            self.start_streaming_thread()
+
     async def start_websocket_server(self):
         print(f"🚀 启动WebSocket服务器，端口: {self.ws_port}")
         self.main_loop = asyncio.get_event_loop()
+        self.message_bus.start()
 
         async def handle_client(websocket, path=None):
             print(f"🔌 客户端连接: {websocket.remote_address}")
             self.connected_clients.add(websocket)
+            self.client_encodings[websocket] = encoding_for_subprotocol(getattr(websocket, 'subprotocol', None))
+            self.subscriptions.add(websocket)
             try:
-                await websocket.send(json.dumps({'type': 'connection_established'}))
+                await self.send_to(websocket, {'type': 'connection_established', 'data': {
+                    'encoding': self.client_encodings[websocket], 'encodings': list(supported_encodings())}})
+                await self.send_status_snapshot(websocket, self.status_publisher.snapshot())
                 async for message in websocket:
                     await self.handle_websocket_message(websocket, message)
             except (websockets.exceptions.ConnectionClosed, websockets.exceptions.ConnectionClosedError):
                 print(f"📴 客户端断开连接: {websocket.remote_address}")
             finally:
                 self.connected_clients.discard(websocket)
+                self.client_encodings.pop(websocket, None)
+                self.client_status_seq.pop(websocket, None)
+                self.subscriptions.remove(websocket)
 
         if websockets:
-            server = await websockets.serve(handle_client, "localhost", self.ws_port)
+            server = await websockets.serve(handle_client, "localhost", self.ws_port,
+                                          subprotocols=server_subprotocols(), select_subprotocol=select_subprotocol)
             print(f"✅ WebSocket服务器已启动: ws://localhost:{self.ws_port}")
+            
+            try:
+                self.frame_http_enabled = await self.frame_http_server.start()
+            except OSError as e:
+                print(f"⚠️ 帧HTTP服务启动失败，诊断图像将内联发送: {e}")
             return server
         return None
 
     async def handle_websocket_message(self, websocket, message):
         try:
-            data = json.loads(message)
+            data = decode_incoming(message)
             msg_type = data.get('type')
             msg_data = data.get('data', {})
             print(f"收到消息: {msg_type}")
@@ -598,7 +727,8 @@ class DroneBackendService:
             self.drone.connect()
             battery = self.drone.get_battery()
             self.drone_state.update({'connected': True, 'battery': battery})
-            self.drone_adapter = DroneControllerAdapter(self.drone)
+            self._start_telemetry()
+            self.drone_adapter = DroneControllerAdapter(self.drone, self.telemetry)
             self.drone_adapter.update_connection_status(True)
             
             # 初始化任务控制器
@@ -647,16 +777,20 @@ class DroneBackendService:
                     self.mission_controller = None
             
             self.drone.streamon()
+            self.replay_source = None
+            self.frame_interval = 1 / 30
             self.start_streaming_thread()
             print(f"✅ 无人机连接成功，电量: {battery}%")
             await self.broadcast_drone_status()
         except Exception as e:
+            self._stop_telemetry()
             self.drone = None
             await self.send_error(websocket, f"连接失败: {e}")
 
     async def handle_drone_disconnect(self, websocket, data):
         if self.drone:
             self.stop_streaming_thread()
+            self._stop_telemetry()
             try: self.drone.streamoff(); self.drone.end()
             except Exception: pass
             self.drone = None
@@ -665,6 +799,41 @@ class DroneBackendService:
             await self.broadcast_message('status_update', '📴 无人机已断开连接')
             await self.broadcast_drone_status()
 
+    async def handle_start_recording(self, websocket, data):
+        if not self.video_streaming: return await self.send_error(websocket, "视频流未启动，无法录制")
+        try:
+            self.flight_recorder.start(name=data.get('name'), metadata={'ws_port': self.ws_port})
+        except (RuntimeError, ValueError, OSError) as e:
+            return await self.send_error(websocket, f"开始录制失败: {e}")
+        await self.broadcast_message('recording_status', self.flight_recorder.get_status())
+
+    async def handle_stop_recording(self, websocket, data):
+        path = await asyncio.get_running_loop().run_in_executor(None, self.flight_recorder.stop)
+        await self.broadcast_message('recording_status', {**self.flight_recorder.get_status(), 'saved_path': path})
+
+    async def handle_start_replay(self, websocket, data):
+        if self.drone: return await self.send_error(websocket, "请先断开无人机再回放")
+        try:
+            # 客户端只能回放录制目录下的录制
+            source = self.start_replay(
+                str(self.flight_recorder.resolve_recording(data.get('path', ''))),
+                mode=data.get('mode', 'realtime'),
+                speed=float(data.get('speed', 1.0)),
+                loop=bool(data.get('loop', False))
+            )
+        except (ValueError, OSError) as e:
+            return await self.send_error(websocket, f"回放失败: {e}")
+        await self.broadcast_message('replay_status', source.get_status())
+
+    async def handle_stop_replay(self, websocket, data):
+        self.stop_replay()
+        await self.broadcast_message('replay_status', {'finished': True, 'stopped': True})
+
+    async def handle_replay_step(self, websocket, data):
+        if not self.replay_source: return await self.send_error(websocket, "没有进行中的回放")
+        self.replay_source.step(int(data.get('count', 1)))
+        await self.send_to(websocket, {'type': 'replay_status', 'data': self.replay_source.get_status()})
+
     async def handle_drone_takeoff(self, websocket, data):
         if self.drone_adapter and self.drone_adapter.takeoff():
             self.drone_state['flying'] = True; await self.broadcast_drone_status()
@@ -722,7 +891,33 @@ class DroneBackendService:
             await self.broadcast_detection_status()
         else:
             await self.send_error(websocket, "诊断工作流管理器未初始化")
-    
+
+    async def handle_set_diagnosis_batch_config(self, websocket, data):
+        """设置批量诊断配置（多个植株合并为一次VLM请求）"""
+        if not self.diagnosis_manager:
+            await self.send_error(websocket, "诊断工作流管理器未初始化")
+            return
+
+        try:
+            enabled = bool(data.get('enabled', self.diagnosis_manager.batch_mode))
+            window_seconds = data.get('window_seconds')
+            max_batch_size = data.get('max_batch_size')
+
+            self.diagnosis_manager.set_batch_config(
+                enabled,
+                window_seconds=float(window_seconds) if window_seconds is not None else None,
+                max_batch_size=int(max_batch_size) if max_batch_size is not None else None
+            )
+            await self.broadcast_message('diagnosis_batch_config_updated', {
+                'enabled': self.diagnosis_manager.batch_mode,
+                'window_seconds': self.diagnosis_manager.batch_window_seconds,
+                'max_batch_size': self.diagnosis_manager.max_batch_size
+            })
+        except (TypeError, ValueError) as e:
+            await self.send_error(websocket, f"批量诊断参数无效: {e}")
+        except Exception as e:
+            await self.send_error(websocket, f"设置批量诊断失败: {e}")
+
     async def handle_set_qr_cooldown(self, websocket, data):
         """设置QR扫描冷却时间"""
         if not self.qr_detector:
@@ -764,10 +959,10 @@ class DroneBackendService:
         try:
             if hasattr(self.qr_detector, 'get_cooldown_status'):
                 status = self.qr_detector.get_cooldown_status()
-                await websocket.send(json.dumps({
+                await self.send_to(websocket, {
                     'type': 'qr_cooldown_status',
                     'data': status
-                }))
+                })
             else:
                 await self.send_error(websocket, "当前QR检测器不支持冷却状态查询")
         except Exception as e:
@@ -853,10 +1048,10 @@ class DroneBackendService:
         try:
             status = self.diagnosis_manager.get_service_status()
             
-            await websocket.send(json.dumps({
+            await self.send_to(websocket, {
                 'type': 'ai_config_status',
                 'data': status
-            }))
+            })
             
         except Exception as e:
             await self.send_error(websocket, f"获取AI配置状态失败: {str(e)}")
@@ -1043,7 +1238,8 @@ class DroneBackendService:
             
             elif action == 'get_battery':
                 if self.drone:
-                    battery = self.drone.get_battery()
+                    battery = self.telemetry.value('bat') if self.telemetry else None
+                    if battery is None: battery = self.drone.get_battery()
                     self.drone_state['battery'] = battery
                     result['success'] = True
                     result['message'] = f'电量: {battery}%'
@@ -1112,10 +1308,10 @@ class DroneBackendService:
                 result['message'] = f'未知命令: {action}'
             
             # 发送响应
-            await websocket.send(json.dumps({
+            await self.send_to(websocket, {
                 'type': 'drone_command_response',
                 'data': result
-            }))
+            })
             
             if result['success']:
                 print(f"✅ 命令执行成功: {action}")
@@ -1125,22 +1321,22 @@ class DroneBackendService:
         except Exception as e:
             print(f"❌ 执行命令异常: {action} - {e}")
             traceback.print_exc()
-            await websocket.send(json.dumps({
+            await self.send_to(websocket, {
                 'type': 'drone_command_response',
                 'data': {
                     'success': False,
                     'action': action,
                     'message': f'命令执行异常: {str(e)}'
                 }
-            }))
+            })
 
-    async def _execute_diagnosis_async(self, plant_id: int, frame: np.ndarray):
+    async def _execute_diagnosis_async(self, plant_id: int, frame_buffer: FrameBuffer):
         """
         异步执行完整的三阶段诊断流程
         
         Args:
             plant_id: 植株ID
-            frame: 图像帧（BGR格式）
+            frame_buffer: 帧存储中的帧缓冲区（BGR格式），本任务持有一个引用
         """
         try:
             # 设置进度回调
@@ -1161,12 +1357,15 @@ class DroneBackendService:
             self.diagnosis_manager.set_progress_callback(progress_callback)
             
             # 执行诊断
-            report = await self.diagnosis_manager.execute_diagnosis(plant_id, frame)
+            report = await self.diagnosis_manager.execute_diagnosis(plant_id, frame_buffer)
             
             if report:
                 # 清理markdown中的图片引用（避免渲染问题）
                 clean_markdown = self._remove_images_from_markdown(report.markdown_report)
                 
+                # 图像通过帧HTTP服务按ID获取，不在消息中内联base64
+                images = self._get_report_images(report, frame_buffer)
+                
                 # 诊断成功，广播完整报告
                 await self.broadcast_message('diagnosis_complete', {
                     'plant_id': report.plant_id,
@@ -1175,8 +1374,7 @@ class DroneBackendService:
                         'id': report.id,
                         'plant_id': report.plant_id,
                         'timestamp': report.timestamp,
-                        'original_image': report.original_image,
-                        'mask_image': report.mask_image,
+                        **images,
                         'mask_prompt': report.mask_prompt,
                         'markdown_report': clean_markdown,
                         'summary': report.summary,
@@ -1185,7 +1383,8 @@ class DroneBackendService:
                         'recommendations': report.recommendations,
                         'ai_model': report.ai_model,
                         'confidence': report.confidence,
-                        'processing_time': report.processing_time
+                        'processing_time': report.processing_time,
+                        'lesion_metrics': report.lesion_metrics
                     }
                 })
                 print(f"✅ 植株 {plant_id} 诊断完成")
@@ -1207,6 +1406,49 @@ class DroneBackendService:
             })
             print(f"❌ 植株 {plant_id} 诊断异常: {e}")
             traceback.print_exc()
+        finally:
+            self.frame_store.release(frame_buffer.frame_id)
+    
+    def _get_report_images(self, report, frame_buffer: FrameBuffer) -> Dict[str, Any]:
+        """
+        获取诊断报告中图像的引用
+        
+        帧HTTP服务可用时返回图像URL和帧ID（前端可直接用作<img src>），
+        否则回退为内联base64。
+        
+        Args:
+            report: 诊断报告
+            frame_buffer: 原始帧缓冲区
+            
+        Returns:
+            original_image / mask_image 及对应帧ID
+        """
+        if not self.frame_http_enabled:
+            return {
+                'original_image': report.original_image,
+                'mask_image': report.mask_image
+            }
+        
+        images = {
+            'original_image': self.frame_http_server.url_for(frame_buffer.frame_id),
+            'original_image_id': frame_buffer.frame_id,
+            'mask_image': None,
+            'mask_image_id': None
+        }
+        
+        if report.mask_image:
+            try:
+                mask_buffer = self.frame_store.put_data_url(report.mask_image)
+                # 不持有引用：遮罩图保留到按LRU淘汰为止
+                self.frame_store.release(mask_buffer.frame_id)
+                fmt = mask_buffer.available_formats()[0]
+                images['mask_image'] = self.frame_http_server.url_for(mask_buffer.frame_id, fmt)
+                images['mask_image_id'] = mask_buffer.frame_id
+            except (ValueError, TypeError) as e:
+                print(f"⚠️ 遮罩图存入帧存储失败，内联发送: {e}")
+                images['mask_image'] = report.mask_image
+        
+        return images
     
     def _remove_images_from_markdown(self, markdown_text: str) -> str:
         """
@@ -1270,28 +1512,101 @@ class DroneBackendService:
         # 配置有效
         return True, None
 
-    async def broadcast_message(self, msg_type, data=None):
-        if not self.connected_clients: return
+    async def broadcast_message(self, msg_type, data=None, seq=None):
+        if not self.subscriptions.has_subscribers(topic_for(msg_type), self.connected_clients): return
         payload = {'type': msg_type, 'data': data}
-        if msg_type not in ['drone_status', 'video_frame']:
-            payload['timestamp'] = datetime.now().isoformat()
-        message = json.dumps(payload, ensure_ascii=False)
-        tasks = [client.send(message) for client in self.connected_clients]
+        if seq is not None: payload['seq'] = seq
+        if msg_type not in ['drone_status', 'drone_status_patch', 'video_frame']:
+            payload['timestamp'] = iso_now()
+        self.message_bus.publish(msg_type, payload)
+
+    async def _send_to_clients(self, payload):
+        # 只发给订阅了该主题的客户端；只保留最新值的消息受客户端的主题限速约束，增量等须逐条送达的消息不受限速
+        msg_type = payload['type']
+        droppable = self.message_bus.policy_for(msg_type).coalesce is not None
+        recipients = self.subscriptions.recipients(self.connected_clients, msg_type, droppable, payload)
+        if droppable and self.subscriptions.next_trailing_due() is not None: self._schedule_trailing_flush()
+        recipients = self._skip_stale_status(recipients, payload)
+        if not recipients: return
+        # 每种编码只序列化一次，同编码的客户端共用
+        encoded = {}
+        tasks = []
+        for client in recipients:
+            encoding = self.client_encodings.get(client, ENCODING_JSON)
+            if encoding not in encoded: encoded[encoding] = encode_for(encoding, payload)
+            tasks.append(client.send(encoded[encoding]))
         await asyncio.gather(*tasks, return_exceptions=True)
 
+    def _skip_stale_status(self, recipients, payload):
+        # 已直接收到更新快照的客户端跳过排队中的旧状态消息
+        seq = payload.get('seq')
+        if seq is None or not self.client_status_seq: return recipients
+        return [client for client in recipients if seq > self.client_status_seq.get(client, -1)]
+
+    def _schedule_trailing_flush(self):
+        if self._trailing_task is None or self._trailing_task.done():
+            self._trailing_task = asyncio.ensure_future(self._flush_trailing())
+
+    async def _flush_trailing(self):
+        # 限速窗口结束后把突发中的最后一个值补发给被限速的客户端（如停止录制、回放结束等状态）
+        while True:
+            due = self.subscriptions.next_trailing_due()
+            if due is None: return
+            await asyncio.sleep(max(due - time.monotonic(), 0.0))
+            tasks = []
+            for client, payload in self.subscriptions.take_trailing():
+                if client in self.connected_clients and self._skip_stale_status([client], payload):
+                    tasks.append(self.send_to(client, payload))
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def send_to(self, websocket, payload):
+        await websocket.send(encode_for(self.client_encodings.get(websocket, ENCODING_JSON), payload))
+
+    async def send_status_snapshot(self, websocket, snapshot):
+        # 先记录快照序号再发送，总线中序号不大于快照的增量不会在快照之后到达该客户端
+        self.client_status_seq[websocket] = snapshot.seq
+        await self.send_to(websocket, snapshot.to_dict())
+
+    async def handle_negotiate_encoding(self, websocket, data):
+        # 确认消息仍按原编码发送，之后的消息使用新编码（文本帧为JSON，二进制帧为MessagePack）
+        encoding = negotiate(data.get('encoding'))
+        await self.send_to(websocket, {'type': 'encoding_negotiated', 'data': {'encoding': encoding}})
+        self.client_encodings[websocket] = encoding
+        print(f"🔤 客户端消息编码: {encoding}")
+
+    async def handle_subscribe(self, websocket, data):
+        # data: {'topics': ['status', 'diagnosis'], 'max_rate': {'video': 5}, 'replace': False}；首次订阅后只收到所订阅的主题和控制消息
+        try: subscription, added = self.subscriptions.subscribe(websocket, data or {})
+        except (TypeError, ValueError) as e: await self.send_error(websocket, f"订阅失败: {e}"); return
+        await self.send_to(websocket, {'type': 'subscribed', 'data': subscription.to_dict()})
+        # 重新订阅状态主题时期间的增量已丢失，先发送当前快照
+        if TOPIC_STATUS in added: await self.send_status_snapshot(websocket, self.status_publisher.snapshot())
+        print(f"📬 客户端订阅: {subscription.to_dict()}")
+
+    async def handle_unsubscribe(self, websocket, data):
+        try: subscription = self.subscriptions.unsubscribe(websocket, data or {})
+        except (TypeError, ValueError) as e: await self.send_error(websocket, f"取消订阅失败: {e}"); return
+        await self.send_to(websocket, {'type': 'subscribed', 'data': subscription.to_dict()})
+
     async def send_error(self, websocket, error_message):
-        await websocket.send(json.dumps({'type': 'error', 'data': {'message': error_message}}))
+        await self.send_to(websocket, {'type': 'error', 'data': {'message': error_message}})
 
     async def broadcast_drone_status(self):
-        if self.drone and self.drone_state['connected']:
-            try: self.drone_state['battery'] = self.drone.get_battery()
-            except: pass
-        await self.broadcast_message('drone_status', self.drone_state)
+        # 电量等遥测由 _apply_telemetry 随状态包更新；只广播变化字段；状态未变化时不广播（客户端已有最新快照）
+        message = self.status_publisher.publish(self.drone_state)
+        if message: await self.broadcast_message(message.type, message.data, seq=message.seq)
+
+    async def handle_status_resync(self, websocket, data):
+        snapshot = self.status_publisher.resync()
+        print(f"🔄 客户端请求状态重新同步 (last_seq={data.get('last_seq')}, 当前seq={snapshot.seq})")
+        await self.send_status_snapshot(websocket, snapshot)
 
     def cleanup(self):
         print("🧹 清理资源...")
         self.is_running = False
         self.stop_streaming_thread()
+        self.flight_recorder.stop()
+        self._stop_telemetry()
         if self.drone:
             try: self.drone.end()
             except: pass
@@ -1300,13 +1615,25 @@ class DroneBackendService:
 async def main():
     parser = argparse.ArgumentParser(description='无人机后端服务 (V4)')
     parser.add_argument('--ws-port', type=int, default=3002, help='WebSocket服务端口')
+    parser.add_argument('--frame-http-port', type=int, default=3005, help='帧图像HTTP服务端口')
+    parser.add_argument('--recordings-dir', default='recordings', help='飞行录制保存目录')
+    parser.add_argument('--replay', help='启动时回放飞行录制（无需无人机）')
+    parser.add_argument('--replay-mode', choices=REPLAY_MODES, default='realtime', help='回放模式')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='realtime回放倍速')
+    parser.add_argument('--replay-loop', action='store_true', help='循环回放')
     args = parser.parse_args()
-    backend = DroneBackendService(ws_port=args.ws_port)
+    backend = DroneBackendService(
+        ws_port=args.ws_port, frame_http_port=args.frame_http_port, recordings_dir=args.recordings_dir
+    )
     try:
         server = await backend.start_websocket_server()
+        if args.replay:
+            backend.start_replay(args.replay, mode=args.replay_mode, speed=args.replay_speed, loop=args.replay_loop)
         if server: await server.wait_closed()
     except KeyboardInterrupt: print("\n⏹️ 收到停止信号...")
-    finally: backend.cleanup()
+    finally:
+        await backend.frame_http_server.stop()
+        backend.cleanup()
 
 if __name__ == "__main__":
     try: asyncio.run(main())
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+飞行录制与回放
+将原始帧流和遥测（电量、高度、Mission Pad ID）写入分块、可内存映射的录制目录，
+并提供可替代Tello帧读取器的回放源（实时 / 尽快 / 单步）
+
+录制目录结构:
+    meta.json                     录制信息与各分块帧数
+    chunk_00000.frames.npy        (N, H, W, C) uint8 原始帧
+    chunk_00000.telemetry.npy     (N,) TELEMETRY_DTYPE 遥测
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+RECORDING_FORMAT = "sightone-flight-recording"
+RECORDING_VERSION = 1
+META_FILE = "meta.json"
+
+# 每帧遥测记录
+TELEMETRY_DTYPE = np.dtype([
+    ('timestamp', '<f8'),   # 采集时间（秒，time.time()）
+    ('battery', '<i2'),     # 电量百分比，未知为-1
+    ('height', '<i2'),      # 高度（厘米），未知为-1
+    ('mission_pad', '<i2')  # Mission Pad ID，未检测到为-1
+])
+
+# 回放模式
+REPLAY_MODES = ("realtime", "fast", "step")
+
+
+def is_recording_dir(path: str) -> bool:
+    """判断目录是否为飞行录制"""
+    meta_path = Path(path) / META_FILE
+    if not meta_path.is_file():
+        return False
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('format') == RECORDING_FORMAT
+    except (OSError, json.JSONDecodeError):
+        return False
+
+
+class FlightRecorder:
+    """
+    飞行录制器
+
+    帧直接写入预分配的内存映射分块文件（每帧一次内存拷贝），
+    分块写满后刷新并更新meta.json，进程中断时最多丢失当前分块的帧数信息
+    （读取时可根据遥测时间戳恢复）。
+    """
+
+    def __init__(self, root_dir: str = "recordings", chunk_frames: int = 150):
+        """
+        初始化录制器
+
+        Args:
+            root_dir: 录制根目录（每次录制创建一个子目录）
+            chunk_frames: 每个分块的帧数
+        """
+        self.root_dir = Path(root_dir)
+        self.chunk_frames = chunk_frames
+
+        self.path: Optional[Path] = None
+        self._meta: Dict[str, Any] = {}
+        self._frames: Optional[np.memmap] = None
+        self._telemetry: Optional[np.memmap] = None
+        self._chunk_count = 0
+        self._frame_shape: Optional[Tuple[int, ...]] = None
+        self._lock = threading.Lock()
+
+        # 统计
+        self.frames_recorded = 0
+        self.bytes_recorded = 0
+        self.started_at = 0.0
+
+    @property
+    def is_recording(self) -> bool:
+        """是否正在录制"""
+        return self.path is not None
+
+    def resolve_recording(self, name: str) -> Path:
+        """
+        将录制名称解析为录制根目录下的路径（用于客户端传入的名称）
+
+        Args:
+            name: 录制名称，或 stop() 返回的录制路径
+
+        Returns:
+            录制目录路径
+
+        Raises:
+            ValueError: 名称为空或路径不在录制根目录下
+        """
+        if not name:
+            raise ValueError("未指定录制名称")
+        root = self.root_dir.resolve()
+        for path in (Path(name).resolve(), (root / name).resolve()):
+            if root in path.parents:
+                return path
+        raise ValueError(f"录制不在录制目录 {self.root_dir} 下: {name}")
+
+    def start(self, name: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        开始录制
+
+        Args:
+            name: 录制名称（默认按时间命名）
+            metadata: 附加信息（写入meta.json）
+
+        Returns:
+            录制目录路径
+
+        Raises:
+            RuntimeError: 已在录制
+            ValueError: 名称包含路径
+        """
+        with self._lock:
+            if self.path is not None:
+                raise RuntimeError(f"已在录制: {self.path}")
+
+            name = name or datetime.now().strftime('flight_%Y%m%d_%H%M%S')
+            if Path(name).name != name or name in ('.', '..'):
+                raise ValueError(f"无效的录制名称: {name}")
+            self.path = self.root_dir / name
+            self.path.mkdir(parents=True, exist_ok=False)
+
+            self.started_at = time.time()
+            self.frames_recorded = 0
+            self.bytes_recorded = 0
+            self._frame_shape = None
+            self._meta = {
+                'format': RECORDING_FORMAT,
+                'version': RECORDING_VERSION,
+                'created_at': datetime.now().isoformat(),
+                'chunk_frames': self.chunk_frames,
+                'metadata': metadata or {},
+                'chunks': []
+            }
+            self._write_meta()
+
+        logger.info(f"⏺️ 开始飞行录制: {self.path}")
+        return str(self.path)
+
+    def record(self, frame: np.ndarray, telemetry: Optional[Dict[str, Any]] = None):
+        """
+        录制一帧（在视频线程中调用）
+
+        Args:
+            frame: 原始帧（不会被修改）
+            telemetry: {'battery', 'height', 'mission_pad', 'timestamp'}，缺失项记为-1
+        """
+        with self._lock:
+            if self.path is None:
+                return
+
+            # 首帧或分辨率变化时开启新分块
+            if self._frames is None or frame.shape != self._frame_shape or \
+                    self._chunk_count >= self.chunk_frames:
+                self._open_chunk(frame.shape, frame.dtype)
+
+            index = self._chunk_count
+            self._frames[index] = frame
+
+            telemetry = telemetry or {}
+            self._telemetry[index] = (
+                telemetry.get('timestamp') or time.time(),
+                telemetry.get('battery', -1),
+                telemetry.get('height', -1),
+                telemetry.get('mission_pad', -1)
+            )
+
+            self._chunk_count += 1
+            self.frames_recorded += 1
+            self.bytes_recorded += frame.nbytes
+
+    def stop(self) -> Optional[str]:
+        """
+        停止录制
+
+        Returns:
+            录制目录路径，未在录制时返回None
+        """
+        with self._lock:
+            if self.path is None:
+                return None
+
+            self._close_chunk()
+            self._meta['duration'] = round(time.time() - self.started_at, 3)
+            self._meta['total_frames'] = self.frames_recorded
+            self._write_meta()
+
+            path = self.path
+            self.path = None
+
+        logger.info(f"⏹️ 飞行录制已保存: {path} ({self.frames_recorded} 帧)")
+        return str(path)
+
+    def _open_chunk(self, shape: Tuple[int, ...], dtype):
+        """关闭当前分块并预分配新分块（调用方持有锁）"""
+        self._close_chunk()
+
+        index = len(self._meta['chunks'])
+        frames_name = f"chunk_{index:05d}.frames.npy"
+        telemetry_name = f"chunk_{index:05d}.telemetry.npy"
+
+        self._frames = np.lib.format.open_memmap(
+            self.path / frames_name, mode='w+', dtype=dtype, shape=(self.chunk_frames,) + tuple(shape)
+        )
+        self._telemetry = np.lib.format.open_memmap(
+            self.path / telemetry_name, mode='w+', dtype=TELEMETRY_DTYPE, shape=(self.chunk_frames,)
+        )
+        self._frame_shape = shape
+        self._chunk_count = 0
+
+        self._meta['chunks'].append({
+            'frames': frames_name,
+            'telemetry': telemetry_name,
+            'shape': list(shape),
+            'count': None  # 写满或停止时更新
+        })
+        self._write_meta()
+
+    def _close_chunk(self):
+        """刷新当前分块并记录帧数（调用方持有锁）"""
+        if self._frames is None:
+            return
+
+        self._frames.flush()
+        self._telemetry.flush()
+        self._meta['chunks'][-1]['count'] = self._chunk_count
+        self._write_meta()
+
+        self._frames = None
+        self._telemetry = None
+
+    def _write_meta(self):
+        """原子写入meta.json"""
+        tmp_path = self.path / (META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path / META_FILE)
+
+    def get_status(self) -> Dict[str, Any]:
+        """
+        获取录制状态
+
+        Returns:
+            状态字典
+        """
+        return {
+            'recording': self.is_recording,
+            'path': str(self.path) if self.path else None,
+            'frames': self.frames_recorded,
+            'bytes': self.bytes_recorded,
+            'duration': round(time.time() - self.started_at, 2) if self.is_recording else 0
+        }
+
+
+class FlightRecording:
+    """只读打开的飞行录制（帧按需从内存映射读取）"""
+
+    def __init__(self, path: str):
+        """
+        打开录制
+
+        Args:
+            path: 录制目录
+
+        Raises:
+            ValueError: 不是有效的飞行录制
+        """
+        self.path = Path(path)
+        if not is_recording_dir(path):
+            raise ValueError(f"不是有效的飞行录制: {path}")
+
+        with open(self.path / META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self._frames: List[np.ndarray] = []
+        self._telemetry: List[np.ndarray] = []
+        for chunk in self.meta['chunks']:
+            frames = np.load(self.path / chunk['frames'], mmap_mode='r')
+            telemetry = np.load(self.path / chunk['telemetry'], mmap_mode='r')
+
+            count = chunk.get('count')
+            if count is None:
+                # 录制中断：按已写入的遥测时间戳恢复帧数
+                count = int(np.count_nonzero(telemetry['timestamp'] > 0))
+
+            self._frames.append(frames[:count])
+            self._telemetry.append(telemetry[:count])
+
+        self._offsets = np.cumsum([0] + [len(t) for t in self._telemetry])
+        self.timestamps = (
+            np.concatenate([t['timestamp'] for t in self._telemetry])
+            if self._telemetry else np.zeros(0, dtype=np.float64)
+        )
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    @property
+    def duration(self) -> float:
+        """录制时长（秒）"""
+        if len(self) < 2:
+            return 0.0
+        return float(self.timestamps[-1] - self.timestamps[0])
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """全局帧序号 → (分块, 分块内序号)"""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        chunk = int(np.searchsorted(self._offsets, index, side='right')) - 1
+        return chunk, index - int(self._offsets[chunk])
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        获取帧（只读内存映射视图，需要修改时请复制）
+
+        Args:
+            index: 帧序号
+
+        Returns:
+            帧数组
+        """
+        chunk, offset = self._locate(index)
+        return self._frames[chunk][offset]
+
+    def telemetry(self, index: int) -> Dict[str, Any]:
+        """
+        获取帧对应的遥测
+
+        Args:
+            index: 帧序号
+
+        Returns:
+            {'timestamp', 'battery', 'height', 'mission_pad'}
+        """
+        chunk, offset = self._locate(index)
+        record = self._telemetry[chunk][offset]
+        return {name: record[name].item() for name in TELEMETRY_DTYPE.names}
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, Dict[str, Any]]]:
+        for index in range(len(self)):
+            yield self.frame(index), self.telemetry(index)
+
+    def info(self) -> Dict[str, Any]:
+        """录制概要"""
+        return {
+            'path': str(self.path),
+            'created_at': self.meta.get('created_at'),
+            'frames': len(self),
+            'chunks': len(self._frames),
+            'duration': round(self.duration, 2),
+            'fps': round((len(self) - 1) / self.duration, 2) if self.duration > 0 else None,
+            'shapes': sorted({tuple(c['shape']) for c in self.meta['chunks']}),
+            'metadata': self.meta.get('metadata', {})
+        }
+
+
+class ReplayFrameSource:
+    """
+    回放帧源，接口与djitellopy的BackgroundFrameRead一致（读取 .frame 属性）
+
+    - realtime: 按录制时间戳节奏返回当前帧（可设置倍速）
+    - fast: 每次读取 .frame 前进一帧，尽快处理
+    - step: 只有调用 step() 才前进
+    """
+
+    def __init__(self, recording: FlightRecording, mode: str = "realtime", speed: float = 1.0, loop: bool = False):
+        """
+        初始化回放源
+
+        Args:
+            recording: 飞行录制
+            mode: realtime / fast / step
+            speed: realtime模式下的倍速
+            loop: 播放结束后是否从头循环
+        """
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"不支持的回放模式: {mode}")
+        if len(recording) == 0:
+            raise ValueError("录制中没有帧")
+
+        self.recording = recording
+        self.mode = mode
+        self.speed = speed
+        self.loop = loop
+
+        self.index = 0
+        self.finished = False
+        self._started_at: Optional[float] = None
+        self._step_pending = 0
+        self._lock = threading.Lock()
+
+        # 统计
+        self.frames_served = 0
+
+    @property
+    def frame(self) -> Optional[np.ndarray]:
+        """当前帧（播放结束后为None）"""
+        with self._lock:
+            if self.finished:
+                return None
+
+            if self.mode == "fast":
+                index = self._advance_to(self.index + (1 if self.frames_served else 0))
+            elif self.mode == "step":
+                index = self._advance_to(self.index + self._step_pending)
+                self._step_pending = 0
+            else:
+                index = self._advance_to(self._realtime_index())
+
+            if index is None:
+                return None
+
+            self.frames_served += 1
+            return self.recording.frame(index)
+
+    @property
+    def telemetry(self) -> Dict[str, Any]:
+        """当前帧的遥测"""
+        return self.recording.telemetry(min(self.index, len(self.recording) - 1))
+
+    def _realtime_index(self) -> int:
+        """按经过时间计算应播放的帧"""
+        now = time.time()
+        if self._started_at is None:
+            self._started_at = now
+        elapsed = (now - self._started_at) * self.speed
+        timestamps = self.recording.timestamps
+        target = timestamps[0] + elapsed
+        if self.loop and self.recording.duration > 0:
+            target = timestamps[0] + elapsed % self.recording.duration
+        index = int(np.searchsorted(timestamps, target, side='right')) - 1
+        if not self.loop and target > timestamps[-1] + 0.5:
+            return len(self.recording)  # 播放结束
+        return max(index, 0)
+
+    def _advance_to(self, index: int) -> Optional[int]:
+        """移动到指定帧，处理循环和结束（调用方持有锁）"""
+        if index >= len(self.recording):
+            if not self.loop:
+                self.finished = True
+                return None
+            index %= len(self.recording)
+        self.index = index
+        return index
+
+    def step(self, count: int = 1):
+        """单步模式下前进若干帧"""
+        with self._lock:
+            self._step_pending += count
+
+    def get_status(self) -> Dict[str, Any]:
+        """
+        获取回放状态
+
+        Returns:
+            状态字典
+        """
+        return {
+            'path': str(self.recording.path),
+            'mode': self.mode,
+            'speed': self.speed,
+            'loop': self.loop,
+            'index': self.index,
+            'frames': len(self.recording),
+            'frames_served': self.frames_served,
+            'finished': self.finished
+        }
+
+
+def record_from_video(video_path: str, root_dir: str, name: Optional[str] = None,
+                      chunk_frames: int = 150) -> str:
+    """
+    将视频文件转换为飞行录制（无遥测，时间戳按视频帧率生成）
+
+    Args:
+        video_path: 视频文件
+        root_dir: 录制根目录
+        name: 录制名称
+        chunk_frames: 每个分块的帧数
+
+    Returns:
+        录制目录路径
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频: {video_path}")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    recorder = FlightRecorder(root_dir, chunk_frames=chunk_frames)
+    recorder.start(name=name or Path(video_path).stem, metadata={'source': video_path, 'fps': fps})
+
+    start = time.time()
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            recorder.record(frame, {'timestamp': start + index / fps})
+            index += 1
+    finally:
+        capture.release()
+        path = recorder.stop()
+    return path
+
+
+def main():
+    """命令行工具: 查看录制信息、从视频导入、测试回放吞吐"""
+    parser = argparse.ArgumentParser(description='飞行录制工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info_parser = subparsers.add_parser('info', help='查看录制信息')
+    info_parser.add_argument('path')
+
+    import_parser = subparsers.add_parser('import-video', help='将视频文件转换为飞行录制')
+    import_parser.add_argument('video')
+    import_parser.add_argument('--output', default='recordings')
+    import_parser.add_argument('--name')
+
+    play_parser = subparsers.add_parser('play', help='回放录制并统计读取吞吐')
+    play_parser.add_argument('path')
+    play_parser.add_argument('--mode', choices=REPLAY_MODES, default='fast')
+    play_parser.add_argument('--speed', type=float, default=1.0)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'info':
+        print(json.dumps(FlightRecording(args.path).info(), ensure_ascii=False, indent=2, default=list))
+    elif args.command == 'import-video':
+        print(f"✅ 已导入: {record_from_video(args.video, args.output, args.name)}")
+    elif args.command == 'play':
+        source = ReplayFrameSource(FlightRecording(args.path), mode=args.mode, speed=args.speed)
+        start = time.time()
+        checksum = 0
+        while True:
+            frame = source.frame
+            if frame is None:
+                break
+            checksum += int(frame[0, 0, 0])
+            if args.mode == 'step':
+                source.step()
+            elif args.mode == 'realtime':
+                time.sleep(1 / 120)
+        elapsed = time.time() - start
+        print(f"📊 回放 {source.frames_served} 帧，耗时 {elapsed:.2f}秒 ({source.frames_served / elapsed:.1f} FPS)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+帧存储
+视频线程与诊断、录制、广播任务之间共享的只读帧缓冲区，按帧ID引用计数，
+并提供按ID获取图像的轻量HTTP端点
+"""
+
+import time
+import uuid
+import base64
+import logging
+import threading
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+import numpy as np
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+try:
+    from aiohttp import web
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    web = None
+    AIOHTTP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# 编码格式对应的MIME类型
+MIME_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg'
+}
+
+
+def encode_png_rgb(frame: np.ndarray) -> bytes:
+    """
+    将OpenCV帧（BGR）按诊断流程的约定转换为RGB后编码为PNG
+
+    Args:
+        frame: OpenCV图像（BGR格式）
+
+    Returns:
+        PNG字节
+    """
+    if not CV2_AVAILABLE:
+        raise RuntimeError("OpenCV未安装")
+
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    success, buffer = cv2.imencode('.png', frame_rgb)
+    if not success:
+        raise ValueError("图像编码失败")
+    return buffer.tobytes()
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = 80) -> bytes:
+    """
+    将OpenCV帧（BGR）转换为RGB后编码为JPEG字节（视频流推送格式）
+
+    Args:
+        frame: OpenCV图像（BGR格式）
+        quality: JPEG质量
+
+    Returns:
+        JPEG字节
+    """
+    if not CV2_AVAILABLE:
+        raise RuntimeError("OpenCV未安装")
+
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    success, buffer = cv2.imencode('.jpg', frame_rgb, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("图像编码失败")
+    return buffer.tobytes()
+
+
+def encode_jpeg_data_url(frame: np.ndarray, quality: int = 80) -> str:
+    """
+    将OpenCV帧（BGR）编码为JPEG data URL
+
+    Args:
+        frame: OpenCV图像（BGR格式）
+        quality: JPEG质量
+
+    Returns:
+        data:image/jpeg;base64,... 字符串
+    """
+    return 'data:image/jpeg;base64,' + base64.b64encode(encode_jpeg(frame, quality)).decode('ascii')
+
+
+class FrameBuffer:
+    """
+    不可变帧缓冲区
+
+    像素数据设为只读，各编码结果（如PNG）只生成一次并缓存，
+    供诊断、录制和HTTP获取共享。
+    """
+
+    def __init__(
+        self,
+        frame_id: str,
+        array: Optional[np.ndarray] = None,
+        encoded: Optional[Dict[str, bytes]] = None
+    ):
+        """
+        初始化帧缓冲区
+
+        Args:
+            frame_id: 帧ID
+            array: 像素数据（将被设为只读）
+            encoded: 预编码数据 {格式: 字节}
+        """
+        if array is not None:
+            array.flags.writeable = False
+
+        self.frame_id = frame_id
+        self.array = array
+        self.created_at = time.time()
+        self.refcount = 0
+
+        self._encoded: Dict[str, bytes] = dict(encoded or {})
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """占用字节数（像素数据 + 已缓存的编码）"""
+        size = self.array.nbytes if self.array is not None else 0
+        return size + sum(len(data) for data in self._encoded.values())
+
+    def get_encoded(self, fmt: str, encoder: Optional[Callable[[np.ndarray], bytes]] = None) -> bytes:
+        """
+        获取指定格式的编码数据（首次调用时编码并缓存）
+
+        Args:
+            fmt: 格式（如 png）
+            encoder: 编码函数，默认PNG使用 encode_png_rgb
+
+        Returns:
+            编码后的字节
+
+        Raises:
+            ValueError: 没有像素数据且没有该格式的预编码数据
+        """
+        with self._lock:
+            data = self._encoded.get(fmt)
+            if data is not None:
+                return data
+
+            if self.array is None:
+                raise ValueError(f"帧 {self.frame_id} 没有 {fmt} 格式数据")
+
+            if encoder is None:
+                if fmt != 'png':
+                    raise ValueError(f"未指定 {fmt} 格式的编码函数")
+                encoder = encode_png_rgb
+
+            data = encoder(self.array)
+            self._encoded[fmt] = data
+            return data
+
+    def available_formats(self):
+        """已缓存的编码格式"""
+        with self._lock:
+            return list(self._encoded.keys())
+
+    def to_data_url(self, fmt: str = 'png') -> str:
+        """
+        转换为data URL（包含data:image/...;base64,前缀）
+
+        Args:
+            fmt: 格式
+
+        Returns:
+            data URL字符串
+        """
+        data = self.get_encoded(fmt)
+        mime = MIME_TYPES.get(fmt, 'application/octet-stream')
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+class FrameStore:
+    """
+    线程安全的帧存储
+
+    - put() 只复制一次帧数据，返回已持有一个引用的缓冲区
+    - 持有引用的帧不会被淘汰；引用归零后仍可按ID获取，直到超出容量按LRU淘汰
+    """
+
+    def __init__(self, max_frames: int = 64, max_bytes: int = 256 * 1024 * 1024):
+        """
+        初始化帧存储
+
+        Args:
+            max_frames: 最多保留的帧数
+            max_bytes: 最多占用的字节数
+        """
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+
+        self._frames: "OrderedDict[str, FrameBuffer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计
+        self.frames_stored = 0
+        self.frames_evicted = 0
+
+    @staticmethod
+    def _new_frame_id() -> str:
+        """生成帧ID"""
+        return uuid.uuid4().hex
+
+    def put(self, frame: np.ndarray, copy: bool = True) -> FrameBuffer:
+        """
+        存入一帧像素数据
+
+        Args:
+            frame: 图像帧
+            copy: 是否复制（调用方之后会修改原数组时必须为True）
+
+        Returns:
+            已持有一个引用的FrameBuffer，使用完毕后调用 release()
+        """
+        array = frame.copy() if copy else frame
+        return self._insert(FrameBuffer(self._new_frame_id(), array=array))
+
+    def put_encoded(self, data: bytes, fmt: str = 'png') -> FrameBuffer:
+        """
+        存入已编码的图像（如遮罩图）
+
+        Args:
+            data: 编码后的图像字节
+            fmt: 格式
+
+        Returns:
+            已持有一个引用的FrameBuffer
+        """
+        return self._insert(FrameBuffer(self._new_frame_id(), encoded={fmt: data}))
+
+    def put_data_url(self, data_url: str) -> FrameBuffer:
+        """
+        存入data URL或纯base64形式的图像
+
+        Args:
+            data_url: data:image/...;base64,... 或纯base64字符串
+
+        Returns:
+            已持有一个引用的FrameBuffer
+        """
+        fmt = 'png'
+        if data_url.startswith('data:') and ',' in data_url:
+            header, data_url = data_url.split(',', 1)
+            mime = header[5:].split(';')[0]
+            fmt = {v: k for k, v in MIME_TYPES.items()}.get(mime, 'png')
+        return self.put_encoded(base64.b64decode(data_url), fmt)
+
+    def _insert(self, buffer: FrameBuffer) -> FrameBuffer:
+        """加入存储并持有一个引用"""
+        with self._lock:
+            buffer.refcount = 1
+            self._frames[buffer.frame_id] = buffer
+            self.frames_stored += 1
+            self._evict_locked()
+        return buffer
+
+    def acquire(self, frame_id: str) -> Optional[FrameBuffer]:
+        """
+        获取帧并增加引用计数
+
+        Args:
+            frame_id: 帧ID
+
+        Returns:
+            FrameBuffer，不存在（或已被淘汰）时返回None
+        """
+        with self._lock:
+            buffer = self._frames.get(frame_id)
+            if buffer is not None:
+                buffer.refcount += 1
+                self._frames.move_to_end(frame_id)
+            return buffer
+
+    def release(self, frame_id: str):
+        """
+        释放一个引用
+
+        Args:
+            frame_id: 帧ID
+        """
+        with self._lock:
+            buffer = self._frames.get(frame_id)
+            if buffer is None:
+                return
+            buffer.refcount = max(0, buffer.refcount - 1)
+            self._evict_locked()
+
+    def get(self, frame_id: str) -> Optional[FrameBuffer]:
+        """
+        获取帧（不改变引用计数）
+
+        Args:
+            frame_id: 帧ID
+
+        Returns:
+            FrameBuffer或None
+        """
+        with self._lock:
+            buffer = self._frames.get(frame_id)
+            if buffer is not None:
+                self._frames.move_to_end(frame_id)
+            return buffer
+
+    def _evict_locked(self):
+        """按LRU淘汰未被引用的帧，直到满足容量限制（调用方持有锁）"""
+        total_bytes = sum(buffer.nbytes for buffer in self._frames.values())
+        if len(self._frames) <= self.max_frames and total_bytes <= self.max_bytes:
+            return
+
+        for frame_id in list(self._frames.keys()):
+            if len(self._frames) <= self.max_frames and total_bytes <= self.max_bytes:
+                break
+            buffer = self._frames[frame_id]
+            if buffer.refcount > 0:
+                continue
+            total_bytes -= buffer.nbytes
+            del self._frames[frame_id]
+            self.frames_evicted += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取存储统计
+
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            return {
+                'frames': len(self._frames),
+                'pinned_frames': sum(1 for b in self._frames.values() if b.refcount > 0),
+                'bytes': sum(b.nbytes for b in self._frames.values()),
+                'frames_stored': self.frames_stored,
+                'frames_evicted': self.frames_evicted
+            }
+
+
+class FrameHTTPServer:
+    """按帧ID获取图像的轻量HTTP服务: GET /frames/{frame_id}[.png|.jpg]"""
+
+    def __init__(self, store: FrameStore, host: str = "localhost", port: int = 3005):
+        """
+        初始化HTTP服务
+
+        Args:
+            store: 帧存储
+            host: 监听地址
+            port: 监听端口
+        """
+        self.store = store
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        """图像URL前缀"""
+        return f"http://{self.host}:{self.port}/frames"
+
+    def url_for(self, frame_id: str, fmt: str = 'png') -> str:
+        """帧图像的URL"""
+        return f"{self.base_url}/{frame_id}.{fmt}"
+
+    async def _handle_frame(self, request):
+        """处理图像获取请求"""
+        name = request.match_info['name']
+        frame_id, _, fmt = name.partition('.')
+
+        buffer = self.store.get(frame_id)
+        if buffer is None:
+            raise web.HTTPNotFound(text="frame not found")
+
+        if not fmt:
+            # 无扩展名：像素帧默认PNG，预编码图像使用其原始格式
+            formats = buffer.available_formats()
+            fmt = 'png' if buffer.array is not None or not formats else formats[0]
+
+        try:
+            # 首次请求像素帧时需要PNG编码，在线程池中执行以免阻塞事件循环（编码结果由FrameBuffer缓存）
+            data = await asyncio.get_running_loop().run_in_executor(None, buffer.get_encoded, fmt)
+        except ValueError:
+            raise web.HTTPNotFound(text=f"format {fmt} not available")
+
+        return web.Response(
+            body=data,
+            content_type=MIME_TYPES.get(fmt, 'application/octet-stream'),
+            headers={
+                # 帧不可变，可长期缓存
+                'Cache-Control': 'public, max-age=31536000, immutable',
+                'Access-Control-Allow-Origin': '*'
+            }
+        )
+
+    async def start(self) -> bool:
+        """
+        启动HTTP服务
+
+        Returns:
+            是否启动成功
+        """
+        if not AIOHTTP_AVAILABLE:
+            logger.warning("⚠️ aiohttp未安装，帧HTTP服务不可用")
+            return False
+
+        app = web.Application()
+        app.router.add_get('/frames/{name}', self._handle_frame)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        logger.info(f"✅ 帧HTTP服务已启动: {self.base_url}")
+        return True
+
+    async def stop(self):
+        """停止HTTP服务"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    """使用示例"""
+    logging.basicConfig(level=logging.INFO)
+
+    store = FrameStore(max_frames=2)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    buffer = store.put(frame)
+    print(f"✅ 存入帧: {buffer.frame_id} (只读: {not buffer.array.flags.writeable})")
+
+    if CV2_AVAILABLE:
+        png = buffer.get_encoded('png')
+        print(f"   PNG大小: {len(png)} 字节（再次获取复用缓存: {buffer.get_encoded('png') is png}）")
+
+    # 持有引用的帧不会被淘汰
+    for _ in range(3):
+        store.release(store.put(frame).frame_id)
+    print(f"   被引用的帧仍存在: {store.get(buffer.frame_id) is not None}")
+
+    store.release(buffer.frame_id)
+    print(f"📊 统计: {store.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+病斑遮罩分析
+从分割遮罩中计算病斑面积占比、连通域数量与尺寸分布、外接框和颜色统计
+"""
+
+import base64
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+# 按病斑面积占比划分严重程度的阈值: < low → low, < high → medium, 其余 → high
+SEVERITY_AREA_THRESHOLDS: Tuple[float, float] = (0.05, 0.20)
+
+# 连通域尺寸分布的分箱（占图像面积的比例）
+SIZE_BIN_EDGES = (0.0, 0.001, 0.005, 0.02, 0.05, 1.0)
+
+
+@dataclass
+class LesionMetrics:
+    """病斑量化指标"""
+    area_ratio: float  # 病斑像素占比
+    lesion_pixels: int
+    total_pixels: int
+    component_count: int  # 连通域（病斑）数量
+    measured_severity: str  # low, medium, high
+
+    # 连通域尺寸分布（像素）
+    largest_component: int = 0
+    mean_component: float = 0.0
+    median_component: float = 0.0
+    size_histogram: List[int] = field(default_factory=list)  # 按 SIZE_BIN_EDGES 分箱
+
+    # 最大的若干病斑外接框 [x, y, w, h, area]
+    bounding_boxes: List[List[int]] = field(default_factory=list)
+
+    # 病斑区域颜色统计（RGB），未提供图像时为None
+    mean_color: Optional[List[float]] = None
+    color_std: Optional[List[float]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return asdict(self)
+
+
+def severity_from_area_ratio(
+    area_ratio: float,
+    thresholds: Tuple[float, float] = SEVERITY_AREA_THRESHOLDS
+) -> str:
+    """
+    根据病斑面积占比判定严重程度
+
+    Args:
+        area_ratio: 病斑像素占比 (0-1)
+        thresholds: (低/中阈值, 中/高阈值)
+
+    Returns:
+        low, medium 或 high
+    """
+    low, high = thresholds
+    if area_ratio < low:
+        return "low"
+    if area_ratio < high:
+        return "medium"
+    return "high"
+
+
+def decode_mask_image(mask_base64: str, threshold: int = 127) -> np.ndarray:
+    """
+    将灰度遮罩图（如本地分割服务的PNG）解码为二值遮罩
+
+    Args:
+        mask_base64: 遮罩图base64（可包含data URL前缀）
+        threshold: 二值化阈值
+
+    Returns:
+        (H, W) 布尔遮罩
+    """
+    if ',' in mask_base64:
+        mask_base64 = mask_base64.split(',', 1)[1]
+
+    data = np.frombuffer(base64.b64decode(mask_base64), dtype=np.uint8)
+    mask = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise ValueError("遮罩图解码失败")
+    return mask > threshold
+
+
+def analyze_mask(
+    mask: np.ndarray,
+    image: Optional[np.ndarray] = None,
+    min_component_area: int = 16,
+    max_boxes: int = 20,
+    thresholds: Tuple[float, float] = SEVERITY_AREA_THRESHOLDS
+) -> LesionMetrics:
+    """
+    计算病斑遮罩的量化指标
+
+    Args:
+        mask: 二值遮罩 (H, W)，或多帧 (T, H, W)（取各帧并集）
+        image: 对应的RGB图像 (H, W, 3)，用于颜色统计（可选）
+        min_component_area: 小于该像素数的连通域视为噪声
+        max_boxes: 最多返回的外接框数量（按面积降序）
+        thresholds: 严重程度面积阈值
+
+    Returns:
+        LesionMetrics对象
+    """
+    mask = np.asarray(mask)
+    if mask.ndim == 3:
+        mask = mask.any(axis=0)
+    mask_u8 = mask.astype(np.uint8)
+
+    # 连通域分析（标签0为背景）
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask_u8, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = np.flatnonzero(areas >= min_component_area)
+    areas = areas[keep]
+
+    # 去除噪声连通域后的病斑像素
+    if len(keep) < count - 1:
+        valid = np.zeros(count, dtype=bool)
+        valid[keep + 1] = True
+        lesion = valid[labels]
+    else:
+        lesion = mask_u8.astype(bool)
+
+    total_pixels = int(mask_u8.size)
+    lesion_pixels = int(areas.sum())
+    area_ratio = lesion_pixels / total_pixels if total_pixels else 0.0
+
+    metrics = LesionMetrics(
+        area_ratio=area_ratio,
+        lesion_pixels=lesion_pixels,
+        total_pixels=total_pixels,
+        component_count=int(len(areas)),
+        measured_severity=severity_from_area_ratio(area_ratio, thresholds)
+    )
+
+    if len(areas):
+        metrics.largest_component = int(areas.max())
+        metrics.mean_component = float(areas.mean())
+        metrics.median_component = float(np.median(areas))
+        metrics.size_histogram = np.histogram(
+            areas / total_pixels, bins=SIZE_BIN_EDGES
+        )[0].tolist()
+
+        order = np.argsort(areas)[::-1][:max_boxes]
+        boxes = stats[keep[order] + 1][:, [
+            cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH,
+            cv2.CC_STAT_HEIGHT, cv2.CC_STAT_AREA
+        ]]
+        metrics.bounding_boxes = boxes.tolist()
+    else:
+        metrics.size_histogram = [0] * (len(SIZE_BIN_EDGES) - 1)
+
+    # 病斑区域颜色统计
+    if image is not None and lesion_pixels:
+        if image.shape[:2] != lesion.shape:
+            lesion = cv2.resize(
+                lesion.astype(np.uint8), (image.shape[1], image.shape[0]),
+                interpolation=cv2.INTER_NEAREST
+            ).astype(bool)
+        pixels = image[lesion].astype(np.float32)
+        if len(pixels):
+            metrics.mean_color = pixels.mean(axis=0).round(2).tolist()
+            metrics.color_std = pixels.std(axis=0).round(2).tolist()
+
+    return metrics
+
+
+def aggregate_metrics(metrics: List[LesionMetrics]) -> Dict[str, Any]:
+    """
+    汇总多个植株的病斑指标
+
+    Args:
+        metrics: 各植株的LesionMetrics列表
+
+    Returns:
+        汇总统计字典
+    """
+    if not metrics:
+        return {'plants': 0}
+
+    ratios = np.fromiter((m.area_ratio for m in metrics), dtype=np.float64, count=len(metrics))
+    components = np.fromiter((m.component_count for m in metrics), dtype=np.int64, count=len(metrics))
+    severities = [m.measured_severity for m in metrics]
+
+    return {
+        'plants': len(metrics),
+        'mean_area_ratio': float(ratios.mean()),
+        'p50_area_ratio': float(np.percentile(ratios, 50)),
+        'p90_area_ratio': float(np.percentile(ratios, 90)),
+        'max_area_ratio': float(ratios.max()),
+        'mean_component_count': float(components.mean()),
+        'severity_counts': {s: severities.count(s) for s in ('low', 'medium', 'high')}
+    }
+
+
+def main():
+    """分析示例"""
+    logging.basicConfig(level=logging.INFO)
+
+    image = np.full((480, 640, 3), (60, 140, 60), dtype=np.uint8)
+    mask = np.zeros((480, 640), dtype=bool)
+    mask[100:180, 150:260] = True
+    mask[300:330, 400:440] = True
+    mask[10:12, 10:12] = True  # 噪声
+    image[mask] = (150, 110, 40)
+
+    metrics = analyze_mask(mask, image)
+    print("📊 病斑指标:")
+    for key, value in metrics.to_dict().items():
+        print(f"   {key}: {value}")
+
+    print(f"\n📈 汇总: {aggregate_metrics([metrics] * 3)}")
+
+
+if __name__ == "__main__":
+    main()
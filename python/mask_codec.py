@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+二值遮罩编解码
+与Unipixel本地API的 mask_format=rle / bitpack 响应格式对应
+"""
+
+import base64
+import logging
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 支持的遮罩响应格式
+MASK_FORMATS = ("overlay", "rle", "bitpack")
+
+# SAM2 遮罩 logits 的二值化阈值（与 SAM2 的 mask_threshold 一致）
+DEFAULT_LOGIT_THRESHOLD = 0.0
+
+
+def binarize_mask(mask: np.ndarray, threshold: float = DEFAULT_LOGIT_THRESHOLD) -> np.ndarray:
+    """
+    按数据类型二值化遮罩
+
+    布尔遮罩原样返回；整数遮罩按非零判定；浮点遮罩按显式阈值判定（logits用0.0，概率用0.5）。
+    阈值不从数值范围推断，因此全0/全1遮罩的结果与其他遮罩一致。
+
+    Args:
+        mask: 遮罩数组
+        threshold: 浮点遮罩的阈值（大于阈值为前景）
+
+    Returns:
+        布尔遮罩（原始形状）
+    """
+    arr = np.asarray(mask)
+    if arr.dtype == np.bool_:
+        return arr
+    if np.issubdtype(arr.dtype, np.integer):
+        return arr != 0
+    return arr > threshold
+
+
+def rle_encode(mask: np.ndarray) -> Dict[str, Any]:
+    """
+    COCO风格未压缩RLE编码（列优先展开，从0的游程开始）
+
+    Args:
+        mask: 二维二值遮罩 (H, W)
+
+    Returns:
+        {"size": [H, W], "counts": [...]}
+    """
+    flat = np.asarray(mask).ravel(order="F").astype(np.uint8)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size]))).tolist()
+    if flat.size and flat[0]:
+        counts.insert(0, 0)
+    return {"size": list(mask.shape), "counts": counts}
+
+
+def rle_decode(rle: Dict[str, Any]) -> np.ndarray:
+    """
+    解码COCO风格未压缩RLE
+
+    Args:
+        rle: {"size": [H, W], "counts": [...]}
+
+    Returns:
+        二维布尔遮罩 (H, W)
+    """
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+
+    # 奇数位置的游程为前景
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    flat = np.repeat(values, counts)
+
+    if flat.size != height * width:
+        raise ValueError(f"RLE长度 {flat.size} 与尺寸 {height}x{width} 不匹配")
+
+    return flat.reshape((height, width), order="F")
+
+
+def bitpack_encode(mask: np.ndarray) -> Dict[str, Any]:
+    """
+    位压缩编码
+
+    Args:
+        mask: 任意形状的二值遮罩
+
+    Returns:
+        {"shape": [...], "bitorder": "big", "data": base64}
+    """
+    return {
+        "shape": list(mask.shape),
+        "bitorder": "big",
+        "data": base64.b64encode(np.packbits(mask, axis=None).tobytes()).decode("utf-8")
+    }
+
+
+def bitpack_decode(packed: Dict[str, Any]) -> np.ndarray:
+    """
+    解码位压缩遮罩
+
+    Args:
+        packed: {"shape": [...], "bitorder": "big"|"little", "data": base64}
+
+    Returns:
+        布尔遮罩（原始形状）
+    """
+    shape = tuple(packed["shape"])
+    count = int(np.prod(shape))
+    data = np.frombuffer(base64.b64decode(packed["data"]), dtype=np.uint8)
+    bits = np.unpackbits(data, count=count, bitorder=packed.get("bitorder", "big"))
+    return bits.astype(bool).reshape(shape)
+
+
+def encode_masks(masks: List[np.ndarray], mask_format: str) -> List[Any]:
+    """
+    编码Unipixel响应中的masks字段
+
+    Args:
+        masks: 每个分割目标的 (T, H, W) 二值遮罩
+        mask_format: rle 或 bitpack
+
+    Returns:
+        rle: 每个目标、每帧一个RLE；bitpack: 每个目标一个位压缩数组
+    """
+    if mask_format == "rle":
+        return [[rle_encode(frame) for frame in mask] for mask in masks]
+    if mask_format == "bitpack":
+        return [bitpack_encode(mask) for mask in masks]
+    raise ValueError(f"不支持的遮罩格式: {mask_format}")
+
+
+def decode_masks(masks: List[Any], mask_format: str) -> List[np.ndarray]:
+    """
+    解码Unipixel响应中的masks字段
+
+    Args:
+        masks: 响应中的masks列表（每个分割目标一项）
+        mask_format: rle 或 bitpack
+
+    Returns:
+        每个分割目标的 (T, H, W) 布尔遮罩
+    """
+    if mask_format == "rle":
+        return [np.stack([rle_decode(frame) for frame in frames]) for frames in masks]
+    if mask_format == "bitpack":
+        return [bitpack_decode(packed) for packed in masks]
+    raise ValueError(f"不支持的遮罩格式: {mask_format}")
+
+
+def union_mask(masks: List[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    合并所有分割目标的遮罩
+
+    Args:
+        masks: (T, H, W) 布尔遮罩列表
+
+    Returns:
+        合并后的遮罩，没有遮罩时返回None
+    """
+    if not masks:
+        return None
+    return np.logical_or.reduce(masks)
+
+
+def main():
+    """编解码示例"""
+    mask = np.zeros((1, 480, 640), dtype=bool)
+    mask[0, 100:200, 150:300] = True
+
+    rle = encode_masks([mask], "rle")[0]
+    packed = encode_masks([mask], "bitpack")[0]
+
+    assert np.array_equal(decode_masks([rle], "rle")[0], mask)
+    assert np.array_equal(decode_masks([packed], "bitpack")[0], mask)
+
+    print("✅ 编解码往返一致")
+    print(f"   RLE游程数: {len(rle[0]['counts'])}")
+    print(f"   位压缩大小: {len(packed['data'])} 字节 (base64)")
+
+
+if __name__ == "__main__":
+    main()
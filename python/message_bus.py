@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+出站消息总线
+所有广播消息先进入按优先级划分的队列：同一合并键只保留最新一条（如最新视频帧、每个植株最新的冷却通知），
+可按类型限速，控制和错误消息优先于视频帧发送
+"""
+
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+# 优先级（数值越小越先发送）
+PRIORITY_CONTROL = 0  # 控制响应、错误、任务状态
+PRIORITY_STATUS = 1  # 无人机状态
+PRIORITY_EVENT = 2  # 检测与诊断事件
+PRIORITY_BULK = 3  # 视频帧
+
+PRIORITIES = (PRIORITY_CONTROL, PRIORITY_STATUS, PRIORITY_EVENT, PRIORITY_BULK)
+
+
+def coalesce_latest(data: Any) -> Hashable:
+    """同类型消息只保留最新一条"""
+    return None
+
+
+def coalesce_by(field_name: str) -> Callable[[Any], Hashable]:
+    """
+    按数据字段合并（如每个植株只保留最新一条）
+
+    Args:
+        field_name: 数据中的字段名
+
+    Returns:
+        合并键函数
+    """
+    def key(data: Any) -> Hashable:
+        return data.get(field_name) if isinstance(data, dict) else None
+    return key
+
+
+@dataclass
+class MessagePolicy:
+    """消息类型的发送策略"""
+    priority: int = PRIORITY_EVENT
+    coalesce: Optional[Callable[[Any], Hashable]] = None  # 合并键函数，None表示逐条发送
+    min_interval: float = 0.0  # 同一合并键两次发送的最小间隔（秒），期间只保留最新一条
+    supersedes: Tuple[str, ...] = ()  # 入队时丢弃这些类型中尚未发送的消息
+
+
+DEFAULT_POLICY = MessagePolicy()
+
+DEFAULT_POLICIES: Dict[str, MessagePolicy] = {
+    # 控制与错误
+    'error': MessagePolicy(PRIORITY_CONTROL),
+    'status_update': MessagePolicy(PRIORITY_CONTROL),
+    'mission_status': MessagePolicy(PRIORITY_CONTROL),
+    'diagnosis_error': MessagePolicy(PRIORITY_CONTROL),
+    'diagnosis_config_error': MessagePolicy(PRIORITY_CONTROL, coalesce_by('plant_id'), min_interval=5.0),
+    # 状态: 快照包含完整状态，覆盖之前未发送的快照和增量；增量必须按序逐条发送
+    'drone_status': MessagePolicy(PRIORITY_STATUS, coalesce_latest, supersedes=('drone_status_patch',)),
+    'drone_status_patch': MessagePolicy(PRIORITY_STATUS),
+    'detection_status': MessagePolicy(PRIORITY_STATUS, coalesce_latest),
+    'mission_position': MessagePolicy(PRIORITY_STATUS, coalesce_latest),
+    'replay_status': MessagePolicy(PRIORITY_STATUS, coalesce_latest),
+    'recording_status': MessagePolicy(PRIORITY_STATUS, coalesce_latest),
+    # 检测与诊断事件（由视频循环逐帧产生）
+    'strawberry_summary': MessagePolicy(PRIORITY_EVENT, coalesce_latest),
+    'qr_detected': MessagePolicy(PRIORITY_EVENT, coalesce_latest, min_interval=0.2),
+    'qr_plant_detected': MessagePolicy(PRIORITY_EVENT, coalesce_by('plant_id'), min_interval=1.0),
+    'diagnosis_cooldown': MessagePolicy(PRIORITY_EVENT, coalesce_by('plant_id'), min_interval=1.0),
+    'diagnosis_progress': MessagePolicy(PRIORITY_EVENT, coalesce_by('plant_id')),
+    # 视频帧: 发送端跟不上时只发送最新帧
+    'video_frame': MessagePolicy(PRIORITY_BULK, coalesce_latest),
+}
+
+
+@dataclass
+class _QueuedMessage:
+    msg_type: str
+    payload: Dict[str, Any]
+    policy: MessagePolicy
+    slot: Tuple[str, Hashable]
+
+
+class MessageBus:
+    """
+    出站消息总线
+
+    每个优先级一个有序队列，以 (类型, 合并键) 为槽位：同槽位的新消息替换旧消息并保持原来的排队位置。
+    发送任务每次取最高优先级中第一条已到发送时间的消息交给发送函数。
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[Dict[str, Any]], Awaitable[None]],
+        policies: Optional[Dict[str, MessagePolicy]] = None,
+        default_policy: MessagePolicy = DEFAULT_POLICY
+    ):
+        """
+        初始化消息总线
+
+        Args:
+            sink: 发送函数，接收完整消息字典（{'type', 'data', ...}）
+            policies: 消息类型 -> 发送策略，默认使用 DEFAULT_POLICIES
+            default_policy: 未配置类型的策略
+        """
+        self.sink = sink
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default_policy = default_policy
+
+        self._lanes: Dict[int, 'OrderedDict[Tuple[str, Hashable], _QueuedMessage]'] = {}
+        self._last_sent: Dict[Tuple[str, Hashable], float] = {}
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.published = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.send_errors = 0
+        self.sent_by_type: Dict[str, int] = {}
+
+    def policy_for(self, msg_type: str) -> MessagePolicy:
+        """消息类型的发送策略"""
+        return self.policies.get(msg_type, self.default_policy)
+
+    def set_policy(self, msg_type: str, policy: MessagePolicy):
+        """设置消息类型的发送策略"""
+        self.policies[msg_type] = policy
+
+    @property
+    def pending(self) -> int:
+        """排队中的消息数"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def publish(self, msg_type: str, payload: Dict[str, Any]) -> bool:
+        """
+        消息入队（须在事件循环线程中调用）
+
+        Args:
+            msg_type: 消息类型
+            payload: 完整消息字典
+
+        Returns:
+            是否替换了尚未发送的同槽位消息
+        """
+        policy = self.policy_for(msg_type)
+        self.published += 1
+
+        for superseded_type in policy.supersedes:
+            self._drop_type(superseded_type)
+
+        if policy.coalesce is None:
+            slot = (msg_type, next(self._sequence))
+        else:
+            slot = (msg_type, policy.coalesce(payload.get('data')))
+
+        lane = self._lanes.setdefault(policy.priority, OrderedDict())
+        replaced = slot in lane
+        if replaced:
+            self.coalesced += 1
+        lane[slot] = _QueuedMessage(msg_type, payload, policy, slot)
+
+        if self._wakeup:
+            self._wakeup.set()
+        return replaced
+
+    def _drop_type(self, msg_type: str):
+        priority = self.policy_for(msg_type).priority
+        lane = self._lanes.get(priority)
+        if not lane:
+            return
+        stale = [slot for slot in lane if slot[0] == msg_type]
+        for slot in stale:
+            del lane[slot]
+        self.superseded += len(stale)
+
+    def _next_ready(self, now: float) -> Tuple[Optional[_QueuedMessage], Optional[float]]:
+        """
+        取出下一条可发送的消息
+
+        Returns:
+            (消息, None) 或 (None, 最早可发送时间)；队列为空时为 (None, None)
+        """
+        earliest = None
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            for slot, message in lane.items():
+                min_interval = message.policy.min_interval
+                due = self._last_sent.get(slot, 0.0) + min_interval if min_interval > 0 else now
+                if due <= now:
+                    del lane[slot]
+                    return message, None
+                if earliest is None or due < earliest:
+                    earliest = due
+        return None, earliest
+
+    async def _send(self, message: _QueuedMessage, now: float):
+        if message.policy.min_interval > 0:
+            self._last_sent[message.slot] = now
+        try:
+            await self.sink(message.payload)
+            self.sent += 1
+            self.sent_by_type[message.msg_type] = self.sent_by_type.get(message.msg_type, 0) + 1
+        except Exception as e:
+            self.send_errors += 1
+            logger.error(f"❌ 消息发送失败 ({message.msg_type}): {e}")
+
+    async def flush(self) -> int:
+        """
+        立即发送所有已到发送时间的消息（限速中的消息保留在队列中）
+
+        Returns:
+            发送的消息数
+        """
+        count = 0
+        while True:
+            now = time.monotonic()
+            message, _ = self._next_ready(now)
+            if message is None:
+                return count
+            await self._send(message, now)
+            count += 1
+
+    def start(self):
+        """在当前事件循环中启动发送任务"""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("📨 消息总线已启动")
+
+    async def stop(self):
+        """停止发送任务（未发送的消息保留在队列中）"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            message, due = self._next_ready(now)
+            if message is not None:
+                await self._send(message, now)
+                continue
+
+            self._wakeup.clear()
+            timeout = None if due is None else max(due - now, 0.001)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def clear(self):
+        """清空队列"""
+        self._lanes.clear()
+        self._last_sent.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取总线统计
+
+        Returns:
+            统计信息字典
+        """
+        return {
+            'published': self.published,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'superseded': self.superseded,
+            'send_errors': self.send_errors,
+            'pending': self.pending,
+            'pending_by_priority': {priority: len(lane) for priority, lane in self._lanes.items() if lane},
+            'sent_by_type': dict(self.sent_by_type)
+        }
+
+
+async def main():
+    """使用示例：模拟30FPS视频循环中每帧都产生冷却通知"""
+    logging.basicConfig(level=logging.INFO)
+
+    received = []
+
+    async def slow_sink(payload):
+        await asyncio.sleep(0.01)
+        received.append(payload['type'])
+
+    bus = MessageBus(slow_sink)
+    bus.start()
+
+    for frame in range(90):
+        bus.publish('video_frame', {'type': 'video_frame', 'data': {'frame': frame}})
+        bus.publish('diagnosis_cooldown', {'type': 'diagnosis_cooldown', 'data': {'plant_id': 'P1', 'remaining_seconds': 30 - frame // 30}})
+        if frame == 45:
+            bus.publish('error', {'type': 'error', 'data': {'message': '示例错误'}})
+        await asyncio.sleep(1 / 30)
+
+    await asyncio.sleep(0.2)
+    await bus.stop()
+
+    print(f"📤 实际发送: { {msg_type: received.count(msg_type) for msg_type in set(received)} }")
+    print(f"📊 {bus.get_statistics()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WebSocket消息编码
+优先使用orjson/msgspec，未安装时回退到标准库json；每条消息只序列化一次供所有客户端共用，
+高频消息类型使用预编译的消息模板。
+客户端可通过WebSocket子协议或首条消息协商为MessagePack二进制编码，内嵌图像直接以二进制发送
+"""
+
+import re
+import math
+import base64
+import json
+import time
+import logging
+from datetime import datetime, date
+from typing import Optional, Dict, Any, Tuple, Callable, Union, FrozenSet, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    msgspec = None
+    MSGSPEC_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+# 可用的JSON后端（按优先级）
+JSON_BACKENDS = ('orjson', 'msgspec', 'json')
+
+# 消息编码
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+
+# WebSocket子协议 -> 编码
+JSON_SUBPROTOCOL = 'sightone.json.v1'
+MSGPACK_SUBPROTOCOL = 'sightone.msgpack.v1'
+SUBPROTOCOL_ENCODINGS = {JSON_SUBPROTOCOL: ENCODING_JSON, MSGPACK_SUBPROTOCOL: ENCODING_MSGPACK}
+
+# 首条消息协商: {"type": "negotiate_encoding", "data": {"encoding": "msgpack"}}
+NEGOTIATE_MESSAGE_TYPE = 'negotiate_encoding'
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """服务端支持的消息编码"""
+    return (ENCODING_JSON, ENCODING_MSGPACK) if MSGPACK_AVAILABLE else (ENCODING_JSON,)
+
+
+def server_subprotocols() -> List[str]:
+    """服务端可接受的WebSocket子协议（客户端不请求子协议时仍按JSON连接）"""
+    protocols = [MSGPACK_SUBPROTOCOL] if MSGPACK_AVAILABLE else []
+    return protocols + [JSON_SUBPROTOCOL]
+
+
+def select_subprotocol(first: Any, offered: Sequence[str]) -> Optional[str]:
+    """
+    选择WebSocket子协议（作为 websockets.serve 的 select_subprotocol 参数）
+
+    新版websockets在服务端声明了子协议而客户端未请求时会拒绝握手，
+    这里改为未请求或无共同子协议时不使用子协议继续连接（即JSON）。
+    新版调用参数为 (connection, 客户端子协议)，旧版为 (客户端子协议, 服务端子协议)。
+
+    Returns:
+        选中的子协议，None表示不使用子协议
+    """
+    if isinstance(first, (list, tuple)):
+        offered = first
+    for subprotocol in server_subprotocols():
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def encoding_for_subprotocol(subprotocol: Optional[str]) -> str:
+    """
+    握手协商出的子协议对应的编码
+
+    Args:
+        subprotocol: websocket.subprotocol，未协商时为None
+
+    Returns:
+        编码名称，默认JSON
+    """
+    return SUBPROTOCOL_ENCODINGS.get(subprotocol, ENCODING_JSON)
+
+
+class EmbeddedImage:
+    """
+    消息中内嵌的图像
+
+    JSON编码时转换为 data URL 或纯base64字符串（只在有JSON客户端时计算一次并缓存），
+    MessagePack编码时直接作为二进制发送。
+    """
+    __slots__ = ('data', 'mime', 'as_data_url', '_text')
+
+    def __init__(self, data: bytes, mime: str = 'image/jpeg', as_data_url: bool = True):
+        """
+        Args:
+            data: 编码后的图像字节
+            mime: MIME类型
+            as_data_url: JSON中是否带 data:<mime>;base64, 前缀（否则为纯base64）
+        """
+        self.data = data
+        self.mime = mime
+        self.as_data_url = as_data_url
+        self._text: Optional[str] = None
+
+    def to_text(self) -> str:
+        """JSON中的字符串形式"""
+        if self._text is None:
+            encoded = base64.b64encode(self.data).decode('ascii')
+            self._text = f"data:{self.mime};base64,{encoded}" if self.as_data_url else encoded
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def available_backends() -> Tuple[str, ...]:
+    """已安装的JSON后端"""
+    installed = {'orjson': ORJSON_AVAILABLE, 'msgspec': MSGSPEC_AVAILABLE, 'json': True}
+    return tuple(name for name in JSON_BACKENDS if installed[name])
+
+
+def _json_default(obj: Any) -> Any:
+    """标准库不支持的类型（内嵌图像、NumPy数值与数组、日期、集合）"""
+    if isinstance(obj, EmbeddedImage):
+        return obj.to_text()
+    if NUMPY_AVAILABLE:
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def _replace_non_finite(obj: Any) -> Any:
+    """将NaN/Infinity替换为None（与orjson/msgspec输出null一致）"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _replace_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [_replace_non_finite(value) for value in obj]
+    if NUMPY_AVAILABLE and isinstance(obj, (np.generic, np.ndarray)):
+        return _replace_non_finite(obj.tolist())
+    return obj
+
+
+# 可直接拼接进JSON字符串的值不能包含需要转义的字符（引号、反斜杠、控制字符）
+_NEEDS_ESCAPE = re.compile(r'["\\\x00-\x1f]')
+
+
+_timestamp_cache = [0, '']
+
+
+def iso_now() -> str:
+    """
+    当前时间的ISO字符串（同一毫秒内复用，避免每条消息都格式化一次）
+
+    Returns:
+        如 "2024-01-01T12:00:00.123"
+    """
+    now = time.time()
+    millis = int(now * 1000)
+    if millis != _timestamp_cache[0]:
+        _timestamp_cache[0] = millis
+        _timestamp_cache[1] = datetime.fromtimestamp(now).isoformat(timespec='milliseconds')
+    return _timestamp_cache[1]
+
+
+class MessageSchema:
+    """
+    预编译的消息模板
+
+    消息类型和数据字段名预先编码为字符串片段，编码时只序列化字段值；
+    trusted 字段（如base64图像data URL）只含不需要转义的ASCII字符，直接拼接，不再扫描转义。
+    数据字段与模板不一致时返回None，由调用方走通用序列化。
+    """
+
+    def __init__(self, msg_type: str, data_fields: Tuple[str, ...], trusted_fields: Tuple[str, ...] = ()):
+        """
+        初始化模板
+
+        Args:
+            msg_type: 消息类型
+            data_fields: data 字典的字段（按顺序）
+            trusted_fields: 可直接拼接的字符串字段
+        """
+        self.msg_type = msg_type
+        self.data_fields = data_fields
+        self.trusted_fields: FrozenSet[str] = frozenset(trusted_fields)
+        self._field_set = frozenset(data_fields)
+        self._head = '{"type":' + json.dumps(msg_type) + ',"data":{'
+        self._prefixes = [(',' if index else '') + json.dumps(name) + ':' for index, name in enumerate(data_fields)]
+
+    def encode(self, payload: Dict[str, Any], dumps: Callable[[Any], str]) -> Optional[str]:
+        """
+        按模板编码
+
+        Args:
+            payload: 完整消息字典
+            dumps: 字段值序列化函数
+
+        Returns:
+            JSON字符串，不匹配模板时返回None
+        """
+        data = payload.get('data')
+        if type(data) is not dict or data.keys() != self._field_set:
+            return None
+
+        parts = [self._head]
+        for name, prefix in zip(self.data_fields, self._prefixes):
+            value = data[name]
+            parts.append(prefix)
+            if type(value) is EmbeddedImage:
+                value = value.to_text()
+            if name in self.trusted_fields and type(value) is str and not _NEEDS_ESCAPE.search(value):
+                parts.append('"')
+                parts.append(value)
+                parts.append('"')
+            else:
+                parts.append(dumps(value))
+        parts.append('}')
+
+        for key, value in payload.items():
+            if key != 'type' and key != 'data':
+                parts.append(',' + json.dumps(key) + ':')
+                parts.append(dumps(value))
+        parts.append('}')
+        return ''.join(parts)
+
+
+# 高频消息类型的模板（小消息用通用序列化更快，只为含大段base64的类型建模板）
+MESSAGE_SCHEMAS: Dict[str, MessageSchema] = {
+    schema.msg_type: schema for schema in (
+        MessageSchema('video_frame', ('frame',), trusted_fields=('frame',)),
+    )
+}
+
+
+class JSONCodec:
+    """
+    可插拔JSON编解码器
+
+    输出与 json.dumps(ensure_ascii=False) 等价的UTF-8文本（紧凑分隔符），
+    字典中的非字符串键按标准库规则转换为字符串；NaN/Infinity 在所有后端都编码为 null。
+    """
+
+    def __init__(self, backend: Optional[str] = None, schemas: Optional[Dict[str, MessageSchema]] = None):
+        """
+        初始化编解码器
+
+        Args:
+            backend: 'orjson' | 'msgspec' | 'json'，默认选择已安装的最快后端
+            schemas: 消息类型 -> 模板，默认使用 MESSAGE_SCHEMAS
+        """
+        backend = backend or available_backends()[0]
+        if backend not in available_backends():
+            raise ValueError(f"JSON后端不可用: {backend} (已安装: {', '.join(available_backends())})")
+        self.backend = backend
+        self.schemas = MESSAGE_SCHEMAS if schemas is None else schemas
+
+        if backend == 'orjson':
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            self.dumps_bytes: Callable[[Any], bytes] = lambda obj: orjson.dumps(obj, default=_json_default, option=options)
+            self.loads: Callable[[Union[str, bytes]], Any] = orjson.loads
+        elif backend == 'msgspec':
+            encoder = msgspec.json.Encoder(enc_hook=_json_default)
+            decoder = msgspec.json.Decoder()
+            self.dumps_bytes = encoder.encode
+            self.loads = decoder.decode
+        else:
+            self.dumps_bytes = lambda obj: self.dumps(obj).encode('utf-8')
+            self.loads = json.loads
+
+    def dumps(self, obj: Any) -> str:
+        """
+        序列化为字符串（WebSocket文本帧）
+
+        Args:
+            obj: 任意可序列化对象
+
+        Returns:
+            JSON字符串
+        """
+        if self.backend == 'json':
+            try:
+                return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default, allow_nan=False)
+            except ValueError:
+                # 含非有限浮点数：替换为None后重新编码（标准库默认会输出不合法的 NaN）
+                return json.dumps(_replace_non_finite(obj), ensure_ascii=False, separators=(',', ':'),
+                                  default=_json_default, allow_nan=False)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def encode_message(self, payload: Dict[str, Any]) -> str:
+        """
+        编码一条消息（有模板时使用模板）
+
+        Args:
+            payload: {'type', 'data', ...}
+
+        Returns:
+            JSON字符串
+        """
+        schema = self.schemas.get(payload.get('type'))
+        if schema is not None:
+            encoded = schema.encode(payload, self.dumps)
+            if encoded is not None:
+                return encoded
+        return self.dumps(payload)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    """MessagePack不支持的类型（内嵌图像以二进制发送）"""
+    if isinstance(obj, EmbeddedImage):
+        return obj.data
+    if NUMPY_AVAILABLE:
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+class MsgPackCodec:
+    """MessagePack编解码器（WebSocket二进制帧）"""
+
+    backend = ENCODING_MSGPACK
+
+    def __init__(self):
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("msgpack未安装")
+        self._packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+
+    def dumps(self, obj: Any) -> bytes:
+        """序列化为字节"""
+        return self._packer.pack(obj)
+
+    def encode_message(self, payload: Dict[str, Any]) -> bytes:
+        """编码一条消息"""
+        return self._packer.pack(payload)
+
+    def loads(self, data: bytes) -> Any:
+        """反序列化"""
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# 进程内共享的默认编解码器
+_default_codec: Optional[JSONCodec] = None
+_msgpack_codec: Optional[MsgPackCodec] = None
+
+
+def get_codec() -> JSONCodec:
+    """获取默认编解码器（首次调用时选择后端）"""
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = JSONCodec()
+        logger.info(f"📦 JSON编码后端: {_default_codec.backend}")
+    return _default_codec
+
+
+def dumps(obj: Any) -> str:
+    """使用默认编解码器序列化"""
+    return get_codec().dumps(obj)
+
+
+def encode_message(payload: Dict[str, Any]) -> str:
+    """使用默认编解码器编码消息"""
+    return get_codec().encode_message(payload)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """使用默认编解码器反序列化"""
+    return get_codec().loads(data)
+
+
+def get_msgpack_codec() -> MsgPackCodec:
+    """获取MessagePack编解码器"""
+    global _msgpack_codec
+    if _msgpack_codec is None:
+        _msgpack_codec = MsgPackCodec()
+    return _msgpack_codec
+
+
+def encode_for(encoding: str, payload: Dict[str, Any]) -> Union[str, bytes]:
+    """
+    按客户端协商的编码编码消息
+
+    Args:
+        encoding: ENCODING_JSON 或 ENCODING_MSGPACK
+        payload: 完整消息字典
+
+    Returns:
+        JSON文本或MessagePack字节
+    """
+    if encoding == ENCODING_MSGPACK:
+        return get_msgpack_codec().encode_message(payload)
+    return get_codec().encode_message(payload)
+
+
+def decode_incoming(message: Union[str, bytes]) -> Any:
+    """
+    解码客户端消息：文本帧按JSON，二进制帧按MessagePack
+
+    Raises:
+        ValueError: 消息无法解码
+    """
+    if isinstance(message, str):
+        # 各JSON后端的解码异常类型不同（msgspec.DecodeError 不是 ValueError），统一转换
+        try:
+            return get_codec().loads(message)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"无效的JSON消息: {e}") from e
+    if not MSGPACK_AVAILABLE:
+        raise ValueError("收到二进制消息，但msgpack未安装")
+    try:
+        return get_msgpack_codec().loads(message)
+    except Exception as e:
+        raise ValueError(f"无效的MessagePack消息: {e}") from e
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """
+    处理首条消息中的编码请求
+
+    Args:
+        requested: 客户端请求的编码
+
+    Returns:
+        实际采用的编码（不支持时为JSON）
+    """
+    return requested if requested in supported_encodings() else ENCODING_JSON
+
+
+def sample_messages(embedded_images: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    基准测试用的典型消息
+
+    Args:
+        embedded_images: 视频帧是否使用 EmbeddedImage（否则为 data URL 字符串）
+    """
+    import random
+
+    jpeg = random.Random(0).randbytes(60_000)
+    frame: Any = EmbeddedImage(jpeg) if embedded_images else 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+    return {
+        'video_frame': {'type': 'video_frame', 'data': {'frame': frame}},
+        'drone_status_patch': {'type': 'drone_status_patch', 'seq': 1024, 'data': [
+            {'op': 'replace', 'path': '/battery', 'value': 87},
+            {'op': 'replace', 'path': '/height', 'value': 132},
+        ]},
+        'diagnosis_cooldown': {'type': 'diagnosis_cooldown', 'timestamp': iso_now(), 'data': {
+            'plant_id': 'P-12', 'remaining_seconds': 42, 'message': '植株 P-12 在冷却期，剩余 42 秒'
+        }},
+        'strawberry_summary': {'type': 'strawberry_summary', 'timestamp': iso_now(), 'data': {
+            'total': 7, 'ripe': 3, 'half_ripe': 2, 'unripe': 2,
+            'detections': [{'bbox': [120, 80, 64, 64], 'confidence': 0.91, 'class': 'ripe'}] * 7
+        }},
+    }
+
+
+def _time_per_call(func: Callable[[Any], Any], arg: Any, iterations: int) -> float:
+    """单次调用耗时（微秒）"""
+    func(arg)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def benchmark(iterations: int = 2000) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    各编码方式处理典型消息的单条编码耗时、解码耗时和消息大小
+
+    Args:
+        iterations: 每种消息的编码次数
+
+    Returns:
+        {'encode_us': {方式: {消息类型: 微秒}}, 'decode_us': {...}, 'bytes': {...}}
+    """
+    messages = sample_messages()
+    variants: List[Tuple[str, Callable[[Any], Any], Callable[[Any], Any], Dict[str, Dict[str, Any]]]] = [
+        ('json.dumps (旧)', lambda payload: json.dumps(payload, ensure_ascii=False), json.loads, messages)
+    ]
+    for backend in available_backends():
+        codec = JSONCodec(backend)
+        generic = JSONCodec(backend, schemas={})
+        variants.append((backend, generic.encode_message, codec.loads, messages))
+        variants.append((f'{backend}+模板', codec.encode_message, codec.loads, messages))
+    if MSGPACK_AVAILABLE:
+        codec = MsgPackCodec()
+        variants.append(('msgpack+二进制图像', codec.encode_message, codec.loads, sample_messages(embedded_images=True)))
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {'encode_us': {}, 'decode_us': {}, 'bytes': {}}
+    for name, encode, decode, payloads in variants:
+        encoded = {msg_type: encode(payload) for msg_type, payload in payloads.items()}
+        results['encode_us'][name] = {
+            msg_type: _time_per_call(encode, payload, iterations) for msg_type, payload in payloads.items()
+        }
+        results['decode_us'][name] = {
+            msg_type: _time_per_call(decode, data, iterations) for msg_type, data in encoded.items()
+        }
+        results['bytes'][name] = {
+            msg_type: len(data.encode('utf-8') if isinstance(data, str) else data) for msg_type, data in encoded.items()
+        }
+    return results
+
+
+def main():
+    """消息编码微基准"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='WebSocket消息编码微基准（JSON各后端与MessagePack）')
+    parser.add_argument('--iterations', type=int, default=2000, help='每种消息的编码次数')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # 各后端输出必须解码为相同的对象
+    for payload in sample_messages().values():
+        expected = json.loads(json.dumps(payload, ensure_ascii=False))
+        for backend in available_backends():
+            assert json.loads(JSONCodec(backend).encode_message(payload)) == expected, backend
+
+    results = benchmark(args.iterations)
+    titles = {'encode_us': '单条消息编码耗时 (µs)', 'decode_us': '单条消息解码耗时 (µs)', 'bytes': '消息大小 (字节)'}
+    for metric, title in titles.items():
+        table = results[metric]
+        msg_types = list(next(iter(table.values())))
+        print(f"\n⏱️ {title}, {args.iterations} 次")
+        print(f"{'编码方式':<20}" + ''.join(f"{msg_type:>22}" for msg_type in msg_types))
+        for name, values in table.items():
+            print(f"{name:<20}" + ''.join(f"{values[msg_type]:>22.{0 if metric == 'bytes' else 2}f}" for msg_type in msg_types))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,8 @@ from enum import Enum
 from collections import deque, defaultdict
 import statistics
 
+from quantile_sketch import DDSketch, WindowedSketch, resolve_window, WINDOWS, DEFAULT_RELATIVE_ACCURACY
+
 
 logger = logging.getLogger(__name__)
 
@@ -87,14 +89,16 @@ class PerformanceMonitor:
     收集和管理性能指标
     """
     
-    def __init__(self, history_size: int = 1000):
+    def __init__(self, history_size: int = 1000, timer_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
         """
         初始化性能监控器
         
         Args:
             history_size: 历史记录大小
+            timer_accuracy: 计时器分位数的相对误差
         """
         self.history_size = history_size
+        self.timer_accuracy = timer_accuracy
         
         # 指标存储
         self.metrics: Dict[str, deque] = defaultdict(lambda: deque(maxlen=history_size))
@@ -105,8 +109,8 @@ class PerformanceMonitor:
         # 仪表
         self.gauges: Dict[str, float] = {}
         
-        # 计时器
-        self.timers: Dict[str, List[float]] = defaultdict(list)
+        # 计时器：流式分位数草图，记录为O(1)，支持最近1分钟/5分钟/1小时窗口
+        self.timers: Dict[str, WindowedSketch] = defaultdict(lambda: WindowedSketch(self.timer_accuracy))
         
         # 统计信息
         self.start_time = time.time()
@@ -166,11 +170,7 @@ class PerformanceMonitor:
             duration_ms: 持续时间（毫秒）
             tags: 标签
         """
-        self.timers[name].append(duration_ms)
-        
-        # 保持最近1000个记录
-        if len(self.timers[name]) > self.history_size:
-            self.timers[name] = self.timers[name][-self.history_size:]
+        self.timers[name].add(duration_ms)
         
         metric = PerformanceMetric(
             name=name,
@@ -181,7 +181,8 @@ class PerformanceMonitor:
         )
         
         self.metrics[name].append(metric)
-        logger.debug(f"计时器 {name} 记录: {duration_ms:.2f}ms")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"计时器 {name} 记录: {duration_ms:.2f}ms")
     
     def get_counter(self, name: str) -> int:
         """获取计数器值"""
@@ -191,30 +192,34 @@ class PerformanceMonitor:
         """获取仪表值"""
         return self.gauges.get(name)
     
-    def get_timer_stats(self, name: str) -> Dict[str, float]:
+    def get_timer_sketch(self, name: str, window: Any = None) -> Optional[DDSketch]:
         """
-        获取计时器统计信息
+        获取计时器的分位数草图（可与其他监控器的草图合并）
         
         Args:
             name: 计时器名称
+            window: 时间窗口（'1m'、'5m'、'1h' 或秒数），None表示全部记录
         
         Returns:
-            统计信息字典
+            草图，计时器不存在时返回None
         """
-        if name not in self.timers or not self.timers[name]:
-            return {}
+        if name not in self.timers:
+            return None
+        return self.timers[name].window(resolve_window(window))
+    
+    def get_timer_stats(self, name: str, window: Any = None) -> Dict[str, float]:
+        """
+        获取计时器统计信息（分位数为草图估计值，相对误差不超过 timer_accuracy）
         
-        values = self.timers[name]
+        Args:
+            name: 计时器名称
+            window: 时间窗口（'1m'、'5m'、'1h' 或秒数），None表示全部记录
         
-        return {
-            "count": len(values),
-            "min": min(values),
-            "max": max(values),
-            "mean": statistics.mean(values),
-            "median": statistics.median(values),
-            "p95": statistics.quantiles(values, n=20)[18] if len(values) >= 20 else max(values),
-            "p99": statistics.quantiles(values, n=100)[98] if len(values) >= 100 else max(values)
-        }
+        Returns:
+            统计信息字典
+        """
+        sketch = self.get_timer_sketch(name, window)
+        return sketch.get_stats() if sketch is not None else {}
     
     def get_metric_history(self, name: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
@@ -248,7 +253,10 @@ class PerformanceMonitor:
             "counters": dict(self.counters),
             "gauges": dict(self.gauges),
             "timers": {
-                name: self.get_timer_stats(name)
+                name: {
+                    **self.get_timer_stats(name),
+                    "windows": {window: self.get_timer_stats(name, window) for window in WINDOWS}
+                }
                 for name in self.timers.keys()
             },
             "uptime_seconds": time.time() - self.start_time
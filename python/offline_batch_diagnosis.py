@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+离线批量诊断
+遍历飞行图像目录或录制视频，按阶段（二维码识别、目标检测、分割、AI诊断）并发处理，
+按内容哈希跳过已处理项，支持中断后续跑，并生成汇总结果索引
+
+用法:
+    python offline_batch_diagnosis.py diagnosis_data/images --output batch_results \\
+        --ai-config ai_config.json --concurrency qr=4,segment=2,diagnose=2
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+import numpy as np
+import cv2
+
+from qr_detector import QRDetector
+from unipixel_client import UnipixelClient, UnipixelResult
+from segmentation_fallback_service import LocalSegmentationService
+from frame_store import encode_png_rgb
+from flight_recorder import FlightRecording, is_recording_dir
+from mask_analytics import LesionMetrics, analyze_mask, aggregate_metrics
+from mask_codec import union_mask
+from ai_config_manager import AIConfigManager
+from ai_diagnosis_service import AIDiagnosisService
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# 各阶段默认并发数
+DEFAULT_STAGE_CONCURRENCY = {'qr': 4, 'detect': 1, 'segment': 2, 'diagnose': 2}
+
+# CropDiagnosisWorkflow 保存的图像文件名: plant_{id}_{timestamp}.jpg
+FILENAME_PLANT_ID = re.compile(r'plant[_-]?(\d+)', re.IGNORECASE)
+
+# 未配置AI时的分割提示词
+DEFAULT_MASK_PROMPT = "病害区域"
+
+RESULTS_FILE = 'results.jsonl'
+INDEX_FILE = 'index.json'
+
+
+@dataclass
+class BatchItem:
+    """待处理项（一张图像或视频中的一帧）"""
+    source: str
+    content_hash: str
+    image: np.ndarray  # BGR
+    frame_index: Optional[int] = None
+
+
+@dataclass
+class BatchItemResult:
+    """单项处理结果（results.jsonl 中的一行）"""
+    content_hash: str
+    source: str
+    frame_index: Optional[int]
+    status: str  # done, failed, no_plant_id
+    plant_id: Optional[int] = None
+    qr_codes: Optional[List[Dict[str, Any]]] = None
+    detections: Optional[List[Dict[str, Any]]] = None
+    mask_prompt: Optional[str] = None
+    mask_path: Optional[str] = None
+    segmentation_method: Optional[str] = None
+    lesion_metrics: Optional[Dict[str, Any]] = None
+    report: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    stage_times: Optional[Dict[str, float]] = None
+    processed_at: str = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return asdict(self)
+
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    """
+    解析阶段并发配置
+
+    Args:
+        spec: 如 "qr=4,segment=2,diagnose=2"
+
+    Returns:
+        {阶段: 并发数}
+    """
+    concurrency = dict(DEFAULT_STAGE_CONCURRENCY)
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        stage, _, value = part.partition('=')
+        if stage not in DEFAULT_STAGE_CONCURRENCY or not value.isdigit() or int(value) < 1:
+            raise ValueError(f"无效的阶段并发配置: {part}")
+        concurrency[stage] = int(value)
+    return concurrency
+
+
+class OfflineBatchDiagnosis:
+    """离线批量诊断引擎"""
+
+    def __init__(
+        self,
+        output_dir: str,
+        ai_config: Optional[Dict[str, Any]] = None,
+        stage_concurrency: Optional[Dict[str, int]] = None,
+        unipixel_endpoint: Optional[str] = "http://localhost:8000/infer_unipixel_base64",
+        detect_model: Optional[str] = None,
+        frame_interval: float = 1.0,
+        require_plant_id: bool = True,
+        retry_failed: bool = True,
+        max_in_flight: Optional[int] = None
+    ):
+        """
+        初始化批量诊断引擎
+
+        Args:
+            output_dir: 输出目录（results.jsonl、index.json、masks/）
+            ai_config: AI配置（格式同前端配置），None时只做识别、检测和分割
+            stage_concurrency: 各阶段并发数 {'qr', 'detect', 'segment', 'diagnose'}
+            unipixel_endpoint: UniPixel端点，None时只使用本地分割
+            detect_model: YOLO模型ID，None时跳过目标检测
+            frame_interval: 视频抽帧间隔（秒）
+            require_plant_id: 未识别到植株ID的图像是否跳过诊断
+            retry_failed: 续跑时是否重试之前失败的项
+            max_in_flight: 同时处理的最大项数（限制内存占用）
+        """
+        self.output_dir = Path(output_dir)
+        self.masks_dir = self.output_dir / 'masks'
+        self.masks_dir.mkdir(parents=True, exist_ok=True)
+        self.results_path = self.output_dir / RESULTS_FILE
+        self.index_path = self.output_dir / INDEX_FILE
+
+        self.stage_concurrency = {**DEFAULT_STAGE_CONCURRENCY, **(stage_concurrency or {})}
+        self.frame_interval = frame_interval
+        self.require_plant_id = require_plant_id
+        self.retry_failed = retry_failed
+        self.max_in_flight = max_in_flight or 2 * sum(self.stage_concurrency.values())
+
+        # 各阶段服务
+        self.qr_detector = QRDetector()
+        self.unipixel_client = UnipixelClient(endpoint=unipixel_endpoint) if unipixel_endpoint else None
+        self.local_segmentation = LocalSegmentationService()
+
+        self.ai_diagnosis_service: Optional[AIDiagnosisService] = None
+        if ai_config:
+            config_manager = AIConfigManager()
+            config_manager.load_config_from_frontend(ai_config)
+            self.ai_diagnosis_service = AIDiagnosisService(config_manager)
+
+        self.detect_model = detect_model
+        self.detection_service = None
+        if detect_model:
+            from yolo_model_manager import YOLOModelManager
+            from yolo_detection_service import YOLODetectionService
+            self.detection_service = YOLODetectionService(YOLOModelManager())
+
+        # 断点：内容哈希 → 状态
+        self._checkpoint: Dict[str, str] = self._load_checkpoint()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        # 统计
+        self.counts: Dict[str, int] = {'done': 0, 'failed': 0, 'no_plant_id': 0, 'skipped': 0}
+        self.stage_totals: Dict[str, float] = {stage: 0.0 for stage in self.stage_concurrency}
+
+    # ------------------------------------------------------------------
+    # 断点与结果
+    # ------------------------------------------------------------------
+
+    def _load_checkpoint(self) -> Dict[str, str]:
+        """读取已有结果，返回 {内容哈希: 最新状态}"""
+        self._truncate_partial_line()
+        checkpoint: Dict[str, str] = {}
+        for record in self._read_results():
+            checkpoint[record['content_hash']] = record['status']
+        if checkpoint:
+            logger.info(f"📂 从断点恢复: {len(checkpoint)} 项已有记录")
+        return checkpoint
+
+    def _truncate_partial_line(self):
+        """截掉中断时写了一半的末行，避免续跑追加的记录与其拼在同一行"""
+        if not self.results_path.exists():
+            return
+        with open(self.results_path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                logger.warning("⚠️ results.jsonl末行不完整，已截断")
+
+    def _read_results(self) -> Iterator[Dict[str, Any]]:
+        """逐行读取results.jsonl（忽略中断时写了一半的行）"""
+        if not self.results_path.exists():
+            return
+        with open(self.results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def _should_skip(self, content_hash: str) -> bool:
+        """该内容是否已处理过"""
+        status = self._checkpoint.get(content_hash)
+        if status is None:
+            return False
+        return not (status == 'failed' and self.retry_failed)
+
+    def _append_result(self, result: BatchItemResult):
+        """追加一条结果并刷新到磁盘（作为断点）"""
+        with open(self.results_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result.to_dict(), ensure_ascii=False) + '\n')
+            f.flush()
+        self._checkpoint[result.content_hash] = result.status
+
+    # ------------------------------------------------------------------
+    # 输入遍历
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _list_sources(inputs: List[str]) -> List[Path]:
+        """展开输入路径为图像和视频文件列表"""
+        sources: List[Path] = []
+        for entry in inputs:
+            path = Path(entry)
+            if is_recording_dir(path):
+                sources.append(path)
+            elif path.is_dir():
+                sources.extend(sorted(
+                    p for p in path.rglob('*')
+                    if p.suffix.lower() in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+                ))
+            elif path.is_file():
+                sources.append(path)
+            else:
+                logger.warning(f"⚠️ 输入不存在: {entry}")
+        return sources
+
+    @staticmethod
+    def _read_and_hash(path: Path) -> Tuple[str, bytes]:
+        """读取文件并计算内容哈希"""
+        data = path.read_bytes()
+        return hashlib.sha256(data).hexdigest(), data
+
+    def _iter_video_frames(self, path: Path) -> Iterator[Tuple[int, np.ndarray]]:
+        """按抽帧间隔读取视频帧"""
+        capture = cv2.VideoCapture(str(path))
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            step = max(1, int(round(fps * self.frame_interval)))
+            index = 0
+            while True:
+                if not capture.grab():
+                    break
+                if index % step == 0:
+                    ok, frame = capture.retrieve()
+                    if ok:
+                        yield index, frame
+                index += 1
+        finally:
+            capture.release()
+
+    def _iter_recording_frames(self, path: Path) -> Iterator[Tuple[int, np.ndarray]]:
+        """按录制时间戳抽帧读取飞行录制"""
+        recording = FlightRecording(str(path))
+        next_time = None
+        for index in range(len(recording)):
+            timestamp = float(recording.telemetry(index)['timestamp'])
+            if next_time is None or timestamp >= next_time:
+                next_time = timestamp + self.frame_interval
+                yield index, np.array(recording.frame(index))
+
+    async def _iter_items(self, inputs: List[str]):
+        """异步遍历待处理项，已处理的内容在解码前跳过"""
+        loop = asyncio.get_running_loop()
+
+        for path in self._list_sources(inputs):
+            if path.suffix.lower() in VIDEO_EXTENSIONS or is_recording_dir(path):
+                frames = (
+                    self._iter_recording_frames(path) if path.is_dir()
+                    else self._iter_video_frames(path)
+                )
+                while True:
+                    entry = await loop.run_in_executor(None, next, frames, None)
+                    if entry is None:
+                        break
+                    index, frame = entry
+                    content_hash = hashlib.sha256(frame.tobytes()).hexdigest()
+                    if self._should_skip(content_hash):
+                        self.counts['skipped'] += 1
+                        continue
+                    self._checkpoint[content_hash] = 'in_progress'
+                    yield BatchItem(str(path), content_hash, frame, index)
+                continue
+
+            try:
+                content_hash, data = await loop.run_in_executor(None, self._read_and_hash, path)
+            except OSError as e:
+                logger.warning(f"⚠️ 读取失败 {path}: {e}")
+                continue
+
+            if self._should_skip(content_hash):
+                self.counts['skipped'] += 1
+                continue
+
+            image = await loop.run_in_executor(
+                None, cv2.imdecode, np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR
+            )
+            if image is None:
+                logger.warning(f"⚠️ 图像解码失败: {path}")
+                continue
+            # 同一次运行中重复的内容只处理一次
+            self._checkpoint[content_hash] = 'in_progress'
+            yield BatchItem(str(path), content_hash, image)
+
+    # ------------------------------------------------------------------
+    # 处理阶段
+    # ------------------------------------------------------------------
+
+    @asynccontextmanager
+    async def _stage(self, stage: str, times: Dict[str, float]):
+        """占用阶段并发名额并记录耗时"""
+        async with self._semaphores[stage]:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                times[stage] = round(times.get(stage, 0.0) + elapsed, 4)
+                self.stage_totals[stage] += elapsed
+
+    def _detect_qr(self, image: np.ndarray) -> List[Dict[str, Any]]:
+        """二维码识别（线程池中执行）"""
+        _, qr_results = self.qr_detector.detect(image, draw_annotations=False)
+        return qr_results
+
+    def _detect_objects(self, image: np.ndarray) -> List[Dict[str, Any]]:
+        """YOLO目标检测（线程池中执行）"""
+        success, message, result = self.detection_service.detect(
+            image, model_id=self.detect_model, draw_results=False
+        )
+        if not success:
+            raise RuntimeError(message)
+        return result['detections']
+
+    async def _segment(self, image_base64: str, mask_prompt: str) -> UnipixelResult:
+        """分割：优先UniPixel，不可用或失败时使用本地分割"""
+        if self.unipixel_client and await self.unipixel_client.is_available():
+            result = await self.unipixel_client.generate_mask(
+                image_base64=image_base64,
+                query=mask_prompt,
+                mask_format="rle"
+            )
+            if result.success:
+                return result
+            logger.warning(f"⚠️ UniPixel分割失败，使用本地分割: {result.error}")
+        return await self.local_segmentation.segment(image_base64=image_base64, query=mask_prompt)
+
+    def _save_mask(self, mask_base64: str, content_hash: str) -> Optional[str]:
+        """保存遮罩图，返回相对输出目录的路径"""
+        if not mask_base64:
+            return None
+        if ',' in mask_base64:
+            mask_base64 = mask_base64.split(',', 1)[1]
+        path = self.masks_dir / f"{content_hash[:16]}.png"
+        path.write_bytes(base64.b64decode(mask_base64))
+        return str(path.relative_to(self.output_dir))
+
+    async def _process(self, item: BatchItem) -> BatchItemResult:
+        """
+        处理单项：二维码识别 → 目标检测 → 遮罩提示词 → 分割 → AI诊断
+
+        Args:
+            item: 待处理项
+
+        Returns:
+            处理结果
+        """
+        loop = asyncio.get_running_loop()
+        times: Dict[str, float] = {}
+        result = BatchItemResult(
+            content_hash=item.content_hash,
+            source=item.source,
+            frame_index=item.frame_index,
+            status='failed',
+            stage_times=times
+        )
+
+        try:
+            # 二维码识别植株ID，识别不到时尝试从文件名解析
+            async with self._stage('qr', times):
+                qr_results = await loop.run_in_executor(None, self._detect_qr, item.image)
+            result.qr_codes = [
+                {k: qr[k] for k in ('data', 'bbox', 'plant_id')} for qr in qr_results
+            ]
+            result.plant_id = next(
+                (qr['plant_id'] for qr in qr_results if qr.get('plant_id') is not None), None
+            )
+            if result.plant_id is None:
+                match = FILENAME_PLANT_ID.search(os.path.basename(item.source))
+                if match:
+                    result.plant_id = int(match.group(1))
+
+            if result.plant_id is None and self.require_plant_id:
+                result.status = 'no_plant_id'
+                return result
+
+            # 目标检测
+            if self.detection_service:
+                async with self._stage('detect', times):
+                    result.detections = await loop.run_in_executor(None, self._detect_objects, item.image)
+
+            # 与实时诊断流程相同的编码约定（飞行中保存的图像与实时帧数组一致）
+            image_base64 = "data:image/png;base64," + base64.b64encode(
+                await loop.run_in_executor(None, encode_png_rgb, item.image)
+            ).decode('utf-8')
+
+            # 遮罩提示词
+            result.mask_prompt = DEFAULT_MASK_PROMPT
+            if self.ai_diagnosis_service:
+                async with self._stage('diagnose', times):
+                    try:
+                        result.mask_prompt = await self.ai_diagnosis_service.generate_mask_prompt(image_base64)
+                    except Exception as e:
+                        logger.warning(f"⚠️ 生成遮罩提示词失败，使用默认提示词: {e}")
+
+            # 分割与病斑量化
+            metrics: Optional[LesionMetrics] = None
+            async with self._stage('segment', times):
+                mask_result = await self._segment(image_base64, result.mask_prompt)
+                if mask_result.success:
+                    result.segmentation_method = (mask_result.metadata or {}).get('method', 'unipixel')
+                    result.mask_path = self._save_mask(mask_result.mask_base64, item.content_hash)
+                    if mask_result.binary_masks:
+                        metrics = await loop.run_in_executor(
+                            None, analyze_mask, union_mask(mask_result.binary_masks), item.image[..., ::-1]
+                        )
+                        result.lesion_metrics = metrics.to_dict()
+
+            # AI诊断，遮罩测量的严重程度单独保存，不覆盖AI判断
+            if self.ai_diagnosis_service:
+                async with self._stage('diagnose', times):
+                    report = await self.ai_diagnosis_service.diagnose(
+                        plant_id=result.plant_id or 0,
+                        image_base64=image_base64,
+                        mask_base64=mask_result.mask_base64 if mask_result.success else None,
+                        mask_description=mask_result.description if mask_result.success else None,
+                        mask_prompt=result.mask_prompt
+                    )
+                if metrics:
+                    report.lesion_metrics = metrics.to_dict()
+                    report.measured_severity = metrics.measured_severity
+                report_dict = asdict(report)
+                report_dict.pop('original_image', None)
+                report_dict.pop('mask_image', None)
+                result.report = report_dict
+
+            result.status = 'done'
+
+        except Exception as e:
+            result.error = str(e)
+            logger.error(f"❌ 处理失败 {item.source}: {e}")
+
+        return result
+
+    # ------------------------------------------------------------------
+    # 运行与索引
+    # ------------------------------------------------------------------
+
+    async def run(self, inputs: List[str]) -> Dict[str, Any]:
+        """
+        处理所有输入
+
+        Args:
+            inputs: 图像目录、图像文件或视频文件路径列表
+
+        Returns:
+            结果索引
+        """
+        self._semaphores = {
+            stage: asyncio.Semaphore(limit) for stage, limit in self.stage_concurrency.items()
+        }
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        pending: set = set()
+        start_time = time.time()
+
+        logger.info(f"🚀 开始离线批量诊断，阶段并发: {self.stage_concurrency}")
+
+        async def handle(item: BatchItem):
+            try:
+                result = await self._process(item)
+                result.processed_at = datetime.now().isoformat()
+                self._append_result(result)
+                self.counts[result.status] += 1
+
+                processed = self.counts['done'] + self.counts['failed'] + self.counts['no_plant_id']
+                if processed % 50 == 0:
+                    rate = processed / max(time.time() - start_time, 1e-6)
+                    logger.info(f"📊 已处理 {processed} 项 ({rate:.2f} 项/秒)，跳过 {self.counts['skipped']} 项")
+            finally:
+                in_flight.release()
+
+        async for item in self._iter_items(inputs):
+            await in_flight.acquire()
+            task = asyncio.create_task(handle(item))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+        elapsed = time.time() - start_time
+        logger.info(
+            f"✅ 批量诊断完成 (耗时: {elapsed:.1f}秒): 完成 {self.counts['done']}，失败 {self.counts['failed']}，"
+            f"无植株ID {self.counts['no_plant_id']}，跳过 {self.counts['skipped']}"
+        )
+
+        index = self.build_index()
+        index['last_run'] = {
+            'elapsed_seconds': round(elapsed, 2),
+            'counts': dict(self.counts),
+            'stage_seconds': {stage: round(total, 2) for stage, total in self.stage_totals.items()}
+        }
+        self.write_index(index)
+        return index
+
+    def build_index(self) -> Dict[str, Any]:
+        """
+        从results.jsonl生成汇总索引（每个内容哈希取最新记录）
+
+        Returns:
+            索引字典
+        """
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record in self._read_results():
+            latest[record['content_hash']] = record
+
+        records = sorted(latest.values(), key=lambda r: (r['source'], r['frame_index'] or 0))
+        status_counts: Dict[str, int] = {}
+        by_plant: Dict[str, List[str]] = {}
+        metrics: List[LesionMetrics] = []
+        items = []
+
+        for record in records:
+            status_counts[record['status']] = status_counts.get(record['status'], 0) + 1
+            if record['plant_id'] is not None:
+                by_plant.setdefault(str(record['plant_id']), []).append(record['content_hash'])
+
+            lesion = record.get('lesion_metrics')
+            if lesion:
+                metrics.append(LesionMetrics(**lesion))
+
+            report = record.get('report') or {}
+            items.append({
+                'content_hash': record['content_hash'],
+                'source': record['source'],
+                'frame_index': record['frame_index'],
+                'plant_id': record['plant_id'],
+                'status': record['status'],
+                'severity': report.get('severity'),
+                'measured_severity': (lesion or {}).get('measured_severity'),
+                'diseases': report.get('diseases'),
+                'area_ratio': (lesion or {}).get('area_ratio'),
+                'mask_path': record.get('mask_path'),
+                'error': record.get('error')
+            })
+
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'total': len(records),
+            'status_counts': status_counts,
+            'lesion_summary': aggregate_metrics(metrics),
+            'plants': by_plant,
+            'items': items
+        }
+
+    def write_index(self, index: Dict[str, Any]):
+        """原子写入索引文件"""
+        tmp_path = self.index_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+        logger.info(f"📋 结果索引: {self.index_path}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='离线批量诊断（支持断点续跑）')
+    parser.add_argument('inputs', nargs='+', help='图像目录、图像文件、视频文件或飞行录制目录')
+    parser.add_argument('--output', default='batch_results', help='输出目录')
+    parser.add_argument('--ai-config', help='AI配置JSON文件（格式同前端配置），不指定时跳过AI诊断')
+    parser.add_argument('--concurrency', default='', help='阶段并发，如 qr=4,detect=1,segment=2,diagnose=2')
+    parser.add_argument('--unipixel-endpoint', default='http://localhost:8000/infer_unipixel_base64')
+    parser.add_argument('--no-unipixel', action='store_true', help='只使用本地分割')
+    parser.add_argument('--detect-model', help='YOLO模型ID（不指定时跳过目标检测）')
+    parser.add_argument('--frame-interval', type=float, default=1.0, help='视频抽帧间隔（秒）')
+    parser.add_argument('--all-frames', action='store_true', help='未识别到植株ID的图像也进行诊断')
+    parser.add_argument('--no-retry-failed', action='store_true', help='续跑时不重试失败项')
+    parser.add_argument('--index-only', action='store_true', help='只根据已有结果重新生成索引')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    ai_config = None
+    if args.ai_config:
+        with open(args.ai_config, 'r', encoding='utf-8') as f:
+            ai_config = json.load(f)
+
+    engine = OfflineBatchDiagnosis(
+        output_dir=args.output,
+        ai_config=ai_config,
+        stage_concurrency=parse_concurrency(args.concurrency),
+        unipixel_endpoint=None if args.no_unipixel else args.unipixel_endpoint,
+        detect_model=args.detect_model,
+        frame_interval=args.frame_interval,
+        require_plant_id=not args.all_frames,
+        retry_failed=not args.no_retry_failed
+    )
+
+    if args.index_only:
+        engine.write_index(engine.build_index())
+        return
+
+    index = asyncio.run(engine.run(args.inputs))
+    print(f"\n📊 共 {index['total']} 项: {index['status_counts']}")
+    print(f"   病斑汇总: {index['lesion_summary']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流式分位数草图
+DDSketch: 按对数间隔分桶计数，分位数的相对误差有上界，记录为O(1)，同精度的草图可直接合并；
+按时间分片的滚动草图提供最近1分钟/5分钟/1小时等窗口视图
+"""
+
+import math
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Iterable, Sequence, Deque, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 默认相对误差（1%）
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# 最多保留的桶数，超出时合并最低的桶（1%精度下覆盖约9个数量级只需约1000个桶）
+DEFAULT_MAX_BINS = 2048
+
+# 小于该值的记录计入零桶（毫秒计时下即 1 纳秒）
+MIN_INDEXABLE_VALUE = 1e-6
+
+# 窗口名称 -> 秒
+WINDOWS: Dict[str, float] = {
+    '1m': 60.0,
+    '5m': 300.0,
+    '1h': 3600.0,
+}
+
+
+class DDSketch:
+    """
+    DDSketch分位数草图
+
+    值 v 落入桶 ceil(log(v) / log(gamma))，gamma = (1 + a) / (1 - a)，
+    返回的分位数与真实值的相对误差不超过 a。min/max/count/sum 精确记录。
+    """
+
+    __slots__ = ('relative_accuracy', 'max_bins', 'gamma', '_log_gamma', 'bins',
+                 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        """
+        初始化草图
+
+        Args:
+            relative_accuracy: 分位数相对误差（0~1）
+            max_bins: 最多保留的桶数
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy 必须在 (0, 1) 之间: {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.bins: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self) -> int:
+        return int(self.count)
+
+    def add(self, value: float, weight: float = 1.0):
+        """
+        记录一个值（负值按零处理）
+
+        Args:
+            value: 值
+            weight: 权重
+        """
+        if value > MIN_INDEXABLE_VALUE:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            bins = self.bins
+            bins[index] = bins.get(index, 0.0) + weight
+            if len(bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += weight
+
+        self.count += weight
+        self.sum += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _collapse(self):
+        """合并最低的桶，使桶数不超过上限（只影响最小值附近的精度）"""
+        indices = sorted(self.bins)
+        excess = len(indices) - self.max_bins
+        target = indices[excess]
+        self.bins[target] += sum(self.bins.pop(index) for index in indices[:excess])
+
+    def merge(self, other: 'DDSketch'):
+        """
+        合并另一个草图
+
+        Args:
+            other: 相对误差相同的草图
+
+        Raises:
+            ValueError: 相对误差不同
+        """
+        if other.count == 0:
+            return
+        if other.gamma != self.gamma:
+            raise ValueError("只能合并相对误差相同的草图")
+
+        bins = self.bins
+        for index, weight in other.bins.items():
+            bins[index] = bins.get(index, 0.0) + weight
+        if len(bins) > self.max_bins:
+            self._collapse()
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> 'DDSketch':
+        """复制草图"""
+        sketch = DDSketch(self.relative_accuracy, self.max_bins)
+        sketch.merge(self)
+        return sketch
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """
+        一次遍历计算多个分位数
+
+        Args:
+            qs: 分位数列表（0~1）
+
+        Returns:
+            估计值列表（限制在 [min, max] 内）；空草图返回None
+        """
+        if self.count == 0:
+            return [None] * len(qs)
+
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        results: List[Optional[float]] = [None] * len(qs)
+        indices = sorted(self.bins)
+
+        position = 0
+        cumulative = self.zero_count
+        for i in order:
+            q = min(max(qs[i], 0.0), 1.0)
+            rank = q * (self.count - 1)
+            if q == 0:
+                results[i] = self.min
+                continue
+            if q == 1:
+                results[i] = self.max
+                continue
+            if rank < cumulative:
+                results[i] = max(self.min, 0.0)
+                continue
+            while position < len(indices) and cumulative + self.bins[indices[position]] <= rank:
+                cumulative += self.bins[indices[position]]
+                position += 1
+            if position >= len(indices):
+                results[i] = self.max
+                continue
+            # 桶 (gamma^(i-1), gamma^i] 的代表值，相对误差不超过 relative_accuracy
+            estimate = 2 * self.gamma ** indices[position] / (1 + self.gamma)
+            results[i] = min(max(estimate, self.min), self.max)
+        return results
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        计算分位数
+
+        Args:
+            q: 分位数（0~1）
+
+        Returns:
+            估计值，空草图返回None
+        """
+        return self.quantiles((q,))[0]
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        汇总统计（字段与 PerformanceMonitor.get_timer_stats 一致）
+
+        Returns:
+            统计字典，空草图返回空字典
+        """
+        if self.count == 0:
+            return {}
+        median, p95, p99 = self.quantiles((0.5, 0.95, 0.99))
+        return {
+            "count": int(self.count),
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "median": median,
+            "p95": p95,
+            "p99": p99
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化（可通过 from_dict 恢复并与其他草图合并）"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(index): weight for index, weight in self.bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DDSketch':
+        """由 to_dict 的结果恢复草图"""
+        sketch = cls(data.get('relative_accuracy', DEFAULT_RELATIVE_ACCURACY))
+        sketch.bins = {int(index): float(weight) for index, weight in data.get('bins', {}).items()}
+        sketch.zero_count = float(data.get('zero_count', 0.0))
+        sketch.count = float(data.get('count', 0.0))
+        sketch.sum = float(data.get('sum', 0.0))
+        if sketch.count:
+            sketch.min = float(data['min'])
+            sketch.max = float(data['max'])
+        return sketch
+
+
+class RollingSketch:
+    """
+    按时间分片的滚动草图
+
+    每个时间片一个DDSketch，只保留最近 slices 个时间片；
+    窗口查询合并窗口内的时间片（窗口边界精度为一个时间片）。
+    """
+
+    def __init__(self, slice_seconds: float, slices: int, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        初始化滚动草图
+
+        Args:
+            slice_seconds: 时间片长度（秒）
+            slices: 保留的时间片数
+            relative_accuracy: 分位数相对误差
+        """
+        self.slice_seconds = slice_seconds
+        self.relative_accuracy = relative_accuracy
+        self._slices: Deque[Tuple[int, DDSketch]] = deque(maxlen=slices)
+
+    @property
+    def span(self) -> float:
+        """可查询的最长窗口（秒）"""
+        return self.slice_seconds * self._slices.maxlen
+
+    def add(self, value: float, now: Optional[float] = None):
+        """
+        记录一个值
+
+        Args:
+            value: 值
+            now: 当前时间（time.monotonic），默认自动获取
+        """
+        slot = int((time.monotonic() if now is None else now) // self.slice_seconds)
+        if not self._slices or self._slices[-1][0] != slot:
+            self._slices.append((slot, DDSketch(self.relative_accuracy)))
+        self._slices[-1][1].add(value)
+
+    def window(self, seconds: float, now: Optional[float] = None) -> DDSketch:
+        """
+        合并最近 seconds 秒内的时间片
+
+        Args:
+            seconds: 窗口长度（秒）
+            now: 当前时间（time.monotonic）
+
+        Returns:
+            合并后的草图
+        """
+        current = int((time.monotonic() if now is None else now) // self.slice_seconds)
+        oldest = current - max(int(math.ceil(seconds / self.slice_seconds)) - 1, 0)
+        merged = DDSketch(self.relative_accuracy)
+        for slot, sketch in reversed(self._slices):
+            if slot < oldest:
+                break
+            if slot <= current:
+                merged.merge(sketch)
+        return merged
+
+    def clear(self):
+        """清空"""
+        self._slices.clear()
+
+
+class WindowedSketch:
+    """
+    带窗口视图的计时草图
+
+    同时记录到全局草图和两级滚动草图（10秒片保留5分钟、1分钟片保留1小时），
+    每次记录为3次O(1)的桶计数；窗口查询最多合并60个时间片。
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        初始化
+
+        Args:
+            relative_accuracy: 分位数相对误差
+        """
+        self.total = DDSketch(relative_accuracy)
+        self._rings = (
+            RollingSketch(10.0, 30, relative_accuracy),
+            RollingSketch(60.0, 60, relative_accuracy),
+        )
+
+    def add(self, value: float, now: Optional[float] = None):
+        """记录一个值"""
+        now = time.monotonic() if now is None else now
+        self.total.add(value)
+        for ring in self._rings:
+            ring.add(value, now)
+
+    def window(self, seconds: Optional[float] = None, now: Optional[float] = None) -> DDSketch:
+        """
+        窗口草图
+
+        Args:
+            seconds: 窗口长度（秒），None表示全部记录；超过1小时按1小时计算
+
+        Returns:
+            草图（全部记录时为内部草图本身，不应修改）
+        """
+        if seconds is None:
+            return self.total
+        for ring in self._rings:
+            if seconds <= ring.span:
+                return ring.window(seconds, now)
+        return self._rings[-1].window(self._rings[-1].span, now)
+
+    def clear(self):
+        """清空"""
+        self.total = DDSketch(self.total.relative_accuracy)
+        for ring in self._rings:
+            ring.clear()
+
+
+def resolve_window(window: Any) -> Optional[float]:
+    """
+    解析窗口参数
+
+    Args:
+        window: None、秒数或窗口名称（'1m'、'5m'、'1h'）
+
+    Returns:
+        秒数，None表示全部记录
+
+    Raises:
+        ValueError: 未知窗口名称
+    """
+    if window is None or isinstance(window, (int, float)):
+        return window
+    if window in WINDOWS:
+        return WINDOWS[window]
+    raise ValueError(f"未知窗口: {window}（可用: {', '.join(WINDOWS)} 或秒数）")
+
+
+def exact_quantile(values: Iterable[float], q: float) -> float:
+    """精确分位数（线性插值，用于对比草图误差）"""
+    ordered = sorted(values)
+    rank = q * (len(ordered) - 1)
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def main():
+    """使用示例：对比草图与精确分位数，并测量记录耗时"""
+    import random
+    import statistics
+
+    logging.basicConfig(level=logging.INFO)
+
+    rng = random.Random(0)
+    values = [rng.lognormvariate(3.0, 0.6) for _ in range(200000)]
+
+    sketch = WindowedSketch()
+    start = time.perf_counter()
+    for value in values:
+        sketch.add(value)
+    record_us = (time.perf_counter() - start) / len(values) * 1e6
+
+    start = time.perf_counter()
+    stats = sketch.window().get_stats()
+    query_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    last_1000 = values[-1000:]
+    statistics.quantiles(last_1000, n=100)
+    list_query_ms = (time.perf_counter() - start) * 1000
+
+    print(f"⏱️ 记录: {record_us:.2f} µs/次, 查询: {query_ms:.3f} ms（原列表实现查询1000个值: {list_query_ms:.3f} ms）")
+    print(f"🪣 桶数: {len(sketch.total.bins)}")
+    for name, q in (('median', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        exact = exact_quantile(values, q)
+        error = abs(stats[name] - exact) / exact * 100
+        print(f"📊 {name:<6} 草图 {stats[name]:8.3f}  精确 {exact:8.3f}  误差 {error:.2f}%")
+    print(f"🕐 最近1分钟: {sketch.window(WINDOWS['1m']).get_stats()['count']} 条")
+
+
+if __name__ == "__main__":
+    main()
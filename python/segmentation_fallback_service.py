@@ -6,12 +6,11 @@
 检测UniPixel服务可用性，并在不可用时提供本地分割降级方案
 """
 
+import time
 import asyncio
 import logging
 import base64
-import io
-from typing import Optional, Dict, Any, Callable
-from PIL import Image
+from typing import Optional, Dict, Any, Callable, List, Tuple
 import numpy as np
 import cv2
 
@@ -20,14 +19,231 @@ from unipixel_client import UnipixelClient, UnipixelResult
 logger = logging.getLogger(__name__)
 
 
+# 预定义的HSV颜色范围（OpenCV: H 0-180, S/V 0-255），红色跨越色相环两端
+COLOR_RANGES: Dict[str, List[Tuple[Tuple[int, int, int], Tuple[int, int, int]]]] = {
+    '红': [((0, 100, 100), (10, 255, 255)), ((160, 100, 100), (180, 255, 255))],
+    '绿': [((40, 40, 40), (80, 255, 255))],
+    '蓝': [((100, 100, 100), (130, 255, 255))],
+    '黄': [((20, 100, 100), (40, 255, 255))],
+    '白': [((0, 0, 200), (180, 30, 255))],
+    '黑': [((0, 0, 0), (180, 255, 50))],
+}
+
+# 特定对象的颜色映射
+OBJECT_COLORS: Dict[str, str] = {
+    '草莓': '红',
+    '叶片': '绿',
+    '叶子': '绿',
+    '病害': '黄',
+    '斑点': '黄',
+    '果实': '红',
+}
+
+# 病斑类查询中作为宿主背景出现的对象（如"叶片上的病斑"不应标注整片叶子）
+HOST_OBJECTS = ('叶片', '叶子')
+LESION_COLOR = '黄'
+
+# 未识别查询词时的默认范围：所有非背景区域
+DEFAULT_RANGE = ((0, 30, 30), (180, 255, 255))
+
+# 支持的遮罩细化方法
+REFINE_METHODS = ("grabcut", "watershed")
+
+
 class LocalSegmentationService:
-    """本地分割服务（降级方案）"""
+    """
+    本地分割服务（降级方案）
+
+    每个HSV范围占用查找表的一个比特位，H/S/V三个通道各一张256项查找表，
+    一次 cv2.LUT + 按位与即可得到查询中所有匹配词的并集遮罩。
+    """
     
-    def __init__(self):
-        """初始化本地分割服务"""
+    def __init__(self, refine: Optional[str] = None, refine_max_side: int = 512):
+        """
+        初始化本地分割服务
+        
+        Args:
+            refine: 遮罩细化方法（grabcut / watershed），None表示不细化
+            refine_max_side: 细化时缩放到的最大边长（控制耗时）
+        """
+        if refine is not None and refine not in REFINE_METHODS:
+            raise ValueError(f"不支持的细化方法: {refine}")
+        
         self.available = True
+        self.refine = refine
+        self.refine_max_side = refine_max_side
+        
+        self._range_bits, self._lut = self._build_lookup_table()
+        self._kernels: Dict[int, np.ndarray] = {}
+        
         logger.info("🔧 初始化本地分割服务")
     
+    @staticmethod
+    def _build_lookup_table() -> Tuple[Dict[str, int], np.ndarray]:
+        """
+        预计算HSV阈值查找表
+        
+        Returns:
+            (颜色名(或default)→比特掩码, (256, 1, 3) uint8 查找表)
+        """
+        ranges = [(color, r) for color, rs in COLOR_RANGES.items() for r in rs]
+        ranges.append(('default', DEFAULT_RANGE))
+        if len(ranges) > 8:
+            raise ValueError("HSV范围数量超过查找表比特位数(8)")
+        
+        values = np.arange(256)
+        lut = np.zeros((256, 1, 3), dtype=np.uint8)
+        range_bits: Dict[str, int] = {}
+        
+        for bit, (color, (lower, upper)) in enumerate(ranges):
+            for channel in range(3):
+                inside = (values >= lower[channel]) & (values <= upper[channel])
+                lut[inside, 0, channel] |= np.uint8(1 << bit)
+            range_bits[color] = range_bits.get(color, 0) | (1 << bit)
+        
+        return range_bits, lut
+    
+    def _query_bits(self, query: str) -> int:
+        """
+        解析查询词中所有匹配的对象和颜色
+        
+        Args:
+            query: 查询提示词
+        
+        Returns:
+            查找表比特掩码
+        """
+        query_lower = query.lower()
+        objects = [obj for obj in OBJECT_COLORS if obj in query_lower]
+        if any(OBJECT_COLORS[obj] == LESION_COLOR for obj in objects):
+            objects = [obj for obj in objects if obj not in HOST_OBJECTS]
+        
+        colors = {OBJECT_COLORS[obj] for obj in objects}
+        colors.update(color for color in COLOR_RANGES if color in query_lower)
+        
+        if not colors:
+            logger.warning(f"⚠️ 未识别查询词'{query}'，使用默认分割")
+            return self._range_bits['default']
+        
+        bits = 0
+        for color in colors:
+            bits |= self._range_bits[color]
+        return bits
+    
+    def _kernel(self, shape: Tuple[int, int]) -> np.ndarray:
+        """按图像尺寸缩放的椭圆形态学核（缓存）"""
+        size = max(3, (min(shape) // 100) | 1)
+        kernel = self._kernels.get(size)
+        if kernel is None:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+            self._kernels[size] = kernel
+        return kernel
+    
+    def create_mask(self, image_bgr: np.ndarray, query: str) -> np.ndarray:
+        """
+        根据查询词创建遮罩
+        
+        Args:
+            image_bgr: OpenCV图像（BGR）
+            query: 查询提示词
+        
+        Returns:
+            0/255 uint8 遮罩
+        """
+        hsv = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2HSV)
+        
+        # 查找表 + 按位与：各通道都落在同一范围内的像素对应比特保留
+        bits = cv2.LUT(hsv, self._lut)
+        combined = cv2.bitwise_and(cv2.bitwise_and(bits[..., 0], bits[..., 1]), bits[..., 2])
+        mask = np.where(combined & self._query_bits(query), 255, 0).astype(np.uint8)
+        
+        # 形态学操作优化mask
+        kernel = self._kernel(mask.shape)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        
+        if self.refine and mask.any():
+            mask = self._refine_mask(image_bgr, mask)
+        
+        return mask
+    
+    def _refine_mask(self, image_bgr: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        使用GrabCut或分水岭细化颜色阈值遮罩（在缩小的图像上进行）
+        
+        Args:
+            image_bgr: OpenCV图像（BGR）
+            mask: 0/255 初始遮罩
+        
+        Returns:
+            细化后的 0/255 遮罩
+        """
+        height, width = mask.shape
+        scale = min(1.0, self.refine_max_side / max(height, width))
+        if scale < 1.0:
+            size = (int(width * scale), int(height * scale))
+            small_image = cv2.resize(image_bgr, size, interpolation=cv2.INTER_AREA)
+            small_mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        else:
+            small_image, small_mask = image_bgr, mask
+        
+        kernel = self._kernel(small_mask.shape)
+        sure_fg = cv2.erode(small_mask, kernel, iterations=2)
+        maybe_fg = cv2.dilate(small_mask, kernel, iterations=3)
+        
+        try:
+            if self.refine == "grabcut":
+                gc_mask = np.full(small_mask.shape, cv2.GC_BGD, dtype=np.uint8)
+                gc_mask[maybe_fg > 0] = cv2.GC_PR_BGD
+                gc_mask[small_mask > 0] = cv2.GC_PR_FGD
+                gc_mask[sure_fg > 0] = cv2.GC_FGD
+                bgd_model = np.zeros((1, 65), np.float64)
+                fgd_model = np.zeros((1, 65), np.float64)
+                cv2.grabCut(small_image, gc_mask, None, bgd_model, fgd_model, 2, cv2.GC_INIT_WITH_MASK)
+                refined = np.where((gc_mask == cv2.GC_FGD) | (gc_mask == cv2.GC_PR_FGD), 255, 0)
+            else:
+                _, markers = cv2.connectedComponents(sure_fg)
+                markers = markers + 1  # 背景标记为1
+                markers[(maybe_fg > 0) & (sure_fg == 0)] = 0  # 待定区域
+                markers = cv2.watershed(small_image, markers.astype(np.int32))
+                refined = np.where(markers > 1, 255, 0)
+        except cv2.error as e:
+            logger.warning(f"⚠️ 遮罩细化失败，使用阈值结果: {e}")
+            return mask
+        
+        refined = refined.astype(np.uint8)
+        if scale < 1.0:
+            refined = cv2.resize(refined, (width, height), interpolation=cv2.INTER_NEAREST)
+        return refined
+    
+    def segment_array(self, image_bgr: np.ndarray, query: str) -> Tuple[np.ndarray, bytes]:
+        """
+        同步分割（可在线程池中执行）
+        
+        Args:
+            image_bgr: OpenCV图像（BGR）
+            query: 查询提示词
+        
+        Returns:
+            (0/255 遮罩, PNG字节)
+        """
+        mask = self.create_mask(image_bgr, query)
+        success, buffer = cv2.imencode('.png', mask)
+        if not success:
+            raise ValueError("遮罩编码失败")
+        return mask, buffer.tobytes()
+    
+    def _segment_base64(self, image_base64: str, query: str) -> Tuple[np.ndarray, bytes]:
+        """解码base64图像并分割"""
+        if ',' in image_base64:
+            image_base64 = image_base64.split(',', 1)[1]
+        
+        data = np.frombuffer(base64.b64decode(image_base64), dtype=np.uint8)
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("图像解码失败")
+        return self.segment_array(image, query)
+    
     async def segment(
         self,
         image_base64: str,
@@ -36,79 +252,41 @@ class LocalSegmentationService:
         progress_callback: Optional[Callable[[int], None]] = None
     ) -> UnipixelResult:
         """
-        执行本地分割（简单的颜色阈值分割）
+        执行本地分割（颜色阈值分割，可选细化）
         
         Args:
             image_base64: 图像base64编码
-            query: 查询提示词（用于生成描述）
+            query: 查询提示词（匹配的所有对象/颜色词取并集）
             sample_frames: 采样帧数（本地实现忽略此参数）
             progress_callback: 进度回调
         
         Returns:
             UnipixelResult对象
         """
+        start_time = time.perf_counter()
         try:
             logger.info(f"🔧 使用本地分割服务处理: {query}")
             
             if progress_callback:
                 progress_callback(10)
             
-            # 解码base64图像
-            if ',' in image_base64:
-                image_base64 = image_base64.split(',')[1]
-            
-            image_data = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_data))
-            
-            if progress_callback:
-                progress_callback(30)
-            
-            # 转换为numpy数组
-            img_array = np.array(image)
-            
-            # 转换为HSV色彩空间
-            if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-                hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
-            else:
-                # 灰度图像
-                hsv = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-                hsv = cv2.cvtColor(hsv, cv2.COLOR_RGB2HSV)
-            
-            if progress_callback:
-                progress_callback(50)
-            
-            # 根据查询词选择颜色范围（简单的关键词匹配）
-            mask = self._create_mask_by_query(hsv, query)
-            
-            if progress_callback:
-                progress_callback(70)
-            
-            # 形态学操作优化mask
-            kernel = np.ones((5, 5), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-            
-            if progress_callback:
-                progress_callback(90)
-            
-            # 将mask转换为base64
-            mask_image = Image.fromarray(mask)
-            buffer = io.BytesIO()
-            mask_image.save(buffer, format='PNG')
-            mask_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            mask_base64 = f"data:image/png;base64,{mask_base64}"
+            # 解码、阈值和编码在线程池中执行，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            mask, png = await loop.run_in_executor(None, self._segment_base64, image_base64, query)
             
             if progress_callback:
                 progress_callback(100)
             
-            logger.info("✅ 本地分割完成")
+            processing_time = time.perf_counter() - start_time
+            logger.info(f"✅ 本地分割完成 (耗时: {processing_time * 1000:.1f}毫秒)")
             
             return UnipixelResult(
-                mask_base64=mask_base64,
+                mask_base64=f"data:image/png;base64,{base64.b64encode(png).decode('utf-8')}",
                 description=f"本地分割结果: {query}",
                 success=True,
-                processing_time=0.0,
-                metadata={'method': 'local_fallback', 'query': query}
+                processing_time=processing_time,
+                metadata={'method': 'local_fallback', 'query': query, 'refine': self.refine},
+                binary_masks=[(mask > 0)[None]]
             )
             
         except Exception as e:
@@ -117,77 +295,9 @@ class LocalSegmentationService:
                 mask_base64="",
                 description="",
                 success=False,
-                error=f"本地分割失败: {str(e)}"
+                error=f"本地分割失败: {str(e)}",
+                processing_time=time.perf_counter() - start_time
             )
-    
-    def _create_mask_by_query(self, hsv_image: np.ndarray, query: str) -> np.ndarray:
-        """
-        根据查询词创建mask
-        
-        Args:
-            hsv_image: HSV色彩空间的图像
-            query: 查询提示词
-        
-        Returns:
-            二值mask
-        """
-        query_lower = query.lower()
-        
-        # 预定义的颜色范围
-        color_ranges = {
-            '红': [(0, 100, 100), (10, 255, 255), (160, 100, 100), (180, 255, 255)],
-            '绿': [(40, 40, 40), (80, 255, 255)],
-            '蓝': [(100, 100, 100), (130, 255, 255)],
-            '黄': [(20, 100, 100), (40, 255, 255)],
-            '白': [(0, 0, 200), (180, 30, 255)],
-            '黑': [(0, 0, 0), (180, 255, 50)],
-        }
-        
-        # 特定对象的颜色映射
-        object_colors = {
-            '草莓': '红',
-            '叶片': '绿',
-            '叶子': '绿',
-            '病害': '黄',
-            '斑点': '黄',
-            '果实': '红',
-        }
-        
-        # 尝试匹配对象到颜色
-        target_color = None
-        for obj, color in object_colors.items():
-            if obj in query_lower:
-                target_color = color
-                break
-        
-        # 如果没有匹配，尝试直接匹配颜色
-        if not target_color:
-            for color in color_ranges.keys():
-                if color in query_lower:
-                    target_color = color
-                    break
-        
-        # 创建mask
-        if target_color and target_color in color_ranges:
-            ranges = color_ranges[target_color]
-            if len(ranges) == 4:  # 红色有两个范围
-                lower1 = np.array(ranges[0])
-                upper1 = np.array(ranges[1])
-                lower2 = np.array(ranges[2])
-                upper2 = np.array(ranges[3])
-                mask1 = cv2.inRange(hsv_image, lower1, upper1)
-                mask2 = cv2.inRange(hsv_image, lower2, upper2)
-                mask = cv2.bitwise_or(mask1, mask2)
-            else:
-                lower = np.array(ranges[0])
-                upper = np.array(ranges[1])
-                mask = cv2.inRange(hsv_image, lower, upper)
-        else:
-            # 默认：检测所有非背景区域
-            logger.warning(f"⚠️ 未识别查询词'{query}'，使用默认分割")
-            mask = cv2.inRange(hsv_image, np.array([0, 30, 30]), np.array([180, 255, 255]))
-        
-        return mask
 
 
 class SegmentationFallbackManager:
@@ -366,6 +476,99 @@ class SegmentationFallbackManager:
         }
 
 
+def _mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    """两个布尔遮罩的IoU（尺寸不同时将b缩放到a）"""
+    if a.shape != b.shape:
+        b = cv2.resize(b.astype(np.uint8), (a.shape[1], a.shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def _synthetic_images(count: int = 4) -> List[np.ndarray]:
+    """生成带黄色病斑的合成叶片图像（无测试图像时使用）"""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        image = np.full((720, 960, 3), (40, 120, 40), dtype=np.uint8)  # BGR绿色叶片
+        for _ in range(12):
+            center = (int(rng.integers(50, 910)), int(rng.integers(50, 670)))
+            cv2.circle(image, center, int(rng.integers(8, 40)), (40, 200, 220), -1)  # 黄色病斑
+        noise = rng.integers(-10, 10, image.shape)
+        images.append(np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+async def benchmark_local_segmentation(
+    image_dir: Optional[str] = None,
+    query: str = "叶片上的黄色病害斑点",
+    unipixel_endpoint: Optional[str] = None,
+    refine_methods: Tuple[Optional[str], ...] = (None,) + REFINE_METHODS
+) -> Dict[str, Any]:
+    """
+    本地分割基准测试：各细化方法的耗时，以及与UniPixel结果的IoU
+    
+    Args:
+        image_dir: 测试图像目录（None时使用合成图像）
+        query: 查询提示词
+        unipixel_endpoint: UniPixel端点（提供时以其rle遮罩为参考计算IoU）
+        refine_methods: 参与比较的细化方法
+    
+    Returns:
+        {方法名: {'mean_ms', 'p90_ms', 'mean_iou'}}
+    """
+    import glob
+    import os
+    
+    if image_dir:
+        paths = sorted(
+            path for path in glob.glob(os.path.join(image_dir, '*'))
+            if path.lower().endswith(('.png', '.jpg', '.jpeg'))
+        )
+        images = [image for image in (cv2.imread(path) for path in paths) if image is not None]
+    else:
+        images = _synthetic_images()
+    
+    if not images:
+        raise ValueError(f"目录中没有可用图像: {image_dir}")
+    
+    # UniPixel参考遮罩
+    references: List[Optional[np.ndarray]] = [None] * len(images)
+    if unipixel_endpoint:
+        from mask_codec import union_mask
+        client = UnipixelClient(endpoint=unipixel_endpoint, timeout=120)
+        for i, image in enumerate(images):
+            _, png = cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            result = await client.generate_mask(
+                image_base64=f"data:image/png;base64,{base64.b64encode(png.tobytes()).decode('utf-8')}",
+                query=query,
+                mask_format="rle",
+                include_overlay=False
+            )
+            if result.success and result.binary_masks:
+                references[i] = union_mask(result.binary_masks).any(axis=0)
+    
+    report: Dict[str, Any] = {'images': len(images), 'query': query}
+    for method in refine_methods:
+        service = LocalSegmentationService(refine=method)
+        service.segment_array(images[0], query)  # 预热
+        
+        times, ious = [], []
+        for image, reference in zip(images, references):
+            start = time.perf_counter()
+            mask, _ = service.segment_array(image, query)
+            times.append((time.perf_counter() - start) * 1000)
+            if reference is not None:
+                ious.append(_mask_iou(mask > 0, reference))
+        
+        report[method or 'threshold'] = {
+            'mean_ms': round(float(np.mean(times)), 2),
+            'p90_ms': round(float(np.percentile(times, 90)), 2),
+            'mean_iou': round(float(np.mean(ious)), 3) if ious else None
+        }
+    
+    return report
+
+
 # 使用示例
 async def main():
     """测试示例"""
@@ -374,6 +577,27 @@ async def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
+    import argparse
+    parser = argparse.ArgumentParser(description='分割服务降级管理器')
+    parser.add_argument('--benchmark', nargs='?', const='', default=None, metavar='IMAGE_DIR',
+                        help='运行本地分割基准测试（不指定目录时使用合成图像）')
+    parser.add_argument('--query', default='叶片上的黄色病害斑点', help='基准测试查询词')
+    parser.add_argument('--compare-unipixel', metavar='ENDPOINT',
+                        help='以UniPixel结果为参考计算IoU')
+    args = parser.parse_args()
+    
+    if args.benchmark is not None:
+        report = await benchmark_local_segmentation(
+            image_dir=args.benchmark or None,
+            query=args.query,
+            unipixel_endpoint=args.compare_unipixel
+        )
+        print(f"\n📊 本地分割基准 ({report['images']} 张图像, 查询: {report['query']})")
+        for method in ('threshold',) + REFINE_METHODS:
+            if method in report:
+                print(f"   {method}: {report[method]}")
+        return
+    
     # 创建降级管理器
     manager = SegmentationFallbackManager(
         unipixel_endpoint="http://localhost:8000/infer_unipixel_base64",
@@ -6,14 +6,19 @@
 """
 
 import time
+import hashlib
 import logging
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, NamedTuple
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timedelta
 from collections import deque
 from enum import Enum
 import json
 
+import numpy as np
+
+from telemetry_store import TelemetryStore, DEFAULT_CAPACITY, extract_telemetry, resolve_field, to_series
+
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +30,266 @@ class CacheStrategy(Enum):
     TIME_BASED = "time_based"  # 基于时间的缓存
 
 
+# 字段路径: 嵌套字典的键序列，如 ('drone_status', 'battery')
+FieldPath = Tuple[Any, ...]
+
+# 字段不存在的标记
+MISSING = object()
+
+# 任何变化都视为显著变化的关键字段
+CRITICAL_FIELDS = ('connected', 'flying', 'state')
+
+
+@dataclass
+class FieldRecord:
+    """单个叶子字段的版本记录"""
+    version: int = 0  # 最后修改的版本号
+    dirty: bool = False  # 自上次提交以来是否变化
+    committed: Any = MISSING  # 上次提交时的值（仅在dirty时有效）
+
+
+class FieldChange(NamedTuple):
+    """脏字段的变化（不存在的一方为 MISSING）"""
+    old: Any
+    new: Any
+
+
+class VersionedStatus:
+    """
+    字段级版本化状态记录
+    
+    状态值保存为嵌套字典，叶子字段以路径标识，每个叶子字段对应一条 FieldRecord。
+    每次写入有变化的字段时递增版本号并标记为脏字段，同时保留该字段上次提交时的值；
+    差异检测只需遍历脏字段，无需序列化。未变化的字段在写入时只做一次查找和比较。
+    """
+    
+    def __init__(self):
+        self._tree: Dict[Any, Any] = {}
+        self._fields: Dict[FieldPath, FieldRecord] = {}  # 叶子路径 -> 版本记录
+        self._dirty: Dict[FieldPath, FieldRecord] = {}  # 脏字段（按首次变化顺序）
+        self.version = 0
+        self.committed_version = 0
+    
+    def set(self, path: FieldPath, value: Any) -> bool:
+        """
+        写入字段（字典值按路径递归合并）
+        
+        Args:
+            path: 字段路径
+            value: 新值
+        
+        Returns:
+            是否有字段发生变化
+        """
+        node = self._tree
+        for depth, key in enumerate(path[:-1]):
+            child = node.get(key, MISSING)
+            if type(child) is not dict:
+                if child is not MISSING:
+                    self._mark_dirty(path[:depth + 1], child, MISSING)
+                child = node[key] = {}
+            node = child
+        return self._assign(node, path, value)
+    
+    def _assign(self, node: Dict[Any, Any], path: FieldPath, value: Any) -> bool:
+        """在父节点上写入字段"""
+        key = path[-1]
+        old = node.get(key, MISSING)
+        
+        if type(value) is dict and value:
+            if type(old) is not dict:
+                if old is not MISSING:
+                    self._mark_dirty(path, old, MISSING)
+                old = node[key] = {}
+            changed = False
+            for child_key, child_value in value.items():
+                changed = self._assign(old, path + (child_key,), child_value) or changed
+            return changed
+        
+        if type(old) is dict and old:
+            # 嵌套字典被替换为叶子值
+            self._drop(old, path)
+            old = MISSING
+        elif old is not MISSING and old == value:
+            return False
+        
+        self._mark_dirty(path, old, value)
+        node[key] = value.copy() if isinstance(value, (dict, list)) else value
+        return True
+    
+    def _drop(self, node: Dict[Any, Any], path: FieldPath):
+        """将子树的所有叶子字段标记为删除"""
+        for key, value in node.items():
+            if type(value) is dict and value:
+                self._drop(value, path + (key,))
+            else:
+                self._mark_dirty(path + (key,), value, MISSING)
+    
+    def remove(self, path: FieldPath) -> bool:
+        """
+        删除字段（包括嵌套子字段）
+        
+        Args:
+            path: 字段路径
+        
+        Returns:
+            是否删除了字段
+        """
+        node = self._tree
+        for key in path[:-1]:
+            node = node.get(key)
+            if type(node) is not dict:
+                return False
+        if path[-1] not in node:
+            return False
+        
+        old = node.pop(path[-1])
+        if type(old) is dict and old:
+            self._drop(old, path)
+        else:
+            self._mark_dirty(path, old, MISSING)
+        return True
+    
+    def replace(self, status_data: Dict[str, Any]) -> bool:
+        """
+        用完整状态替换当前记录（不再出现的字段被删除）
+        
+        Args:
+            status_data: 完整状态字典
+        
+        Returns:
+            是否有字段发生变化
+        """
+        return self._replace_node(self._tree, (), status_data)
+    
+    def _replace_node(self, node: Dict[Any, Any], prefix: FieldPath, mapping: Dict[Any, Any]) -> bool:
+        """逐层比较，路径只在字段变化时构造"""
+        changed = False
+        for key, value in mapping.items():
+            old = node.get(key, MISSING)
+            if type(value) is dict:
+                if value and type(old) is dict and old:
+                    changed = self._replace_node(old, prefix + (key,), value) or changed
+                    continue
+            elif old is not MISSING and old == value:
+                continue
+            changed = self._assign(node, prefix + (key,), value) or changed
+        
+        if len(node) > len(mapping):
+            for key in [key for key in node if key not in mapping]:
+                changed = self.remove(prefix + (key,)) or changed
+        return changed
+    
+    def _mark_dirty(self, path: FieldPath, old: Any, new: Any):
+        """记录字段变化并递增版本号"""
+        record = self._fields.get(path)
+        if record is None:
+            record = self._fields[path] = FieldRecord()
+        if not record.dirty:
+            record.dirty = True
+            record.committed = old
+            self._dirty[path] = record
+        elif record.committed == new:
+            # 变回已提交的值，不再是脏字段
+            record.dirty = False
+            record.committed = MISSING
+            del self._dirty[path]
+        self.version += 1
+        record.version = self.version
+    
+    def get(self, path: FieldPath, default: Any = None) -> Any:
+        """获取字段的值"""
+        node: Any = self._tree
+        for key in path:
+            if type(node) is not dict or key not in node:
+                return default
+            node = node[key]
+        return node
+    
+    @property
+    def dirty_fields(self) -> List[FieldPath]:
+        """自上次提交以来变化的字段路径"""
+        return list(self._dirty)
+    
+    def dirty_changes(self) -> Dict[FieldPath, FieldChange]:
+        """
+        获取脏字段的变化
+        
+        Returns:
+            字段路径 -> FieldChange(上次提交的值, 当前值)
+        """
+        return {
+            path: FieldChange(record.committed, self.get(path, MISSING))
+            for path, record in self._dirty.items()
+        }
+    
+    def field_record(self, path: FieldPath) -> Optional[FieldRecord]:
+        """字段的版本记录（从未写入时为None）"""
+        return self._fields.get(path)
+    
+    def field_version(self, path: FieldPath) -> int:
+        """字段最后修改的版本号（从未修改为0）"""
+        record = self._fields.get(path)
+        return record.version if record is not None else 0
+    
+    def commit(self) -> List[FieldPath]:
+        """
+        提交当前状态，清空脏字段
+        
+        Returns:
+            本次提交的脏字段路径
+        """
+        dirty = list(self._dirty)
+        for record in self._dirty.values():
+            record.dirty = False
+            record.committed = MISSING
+        self._dirty.clear()
+        self.committed_version = self.version
+        return dirty
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        复制当前状态（只在缓存或广播时调用）
+        
+        Returns:
+            状态字典
+        """
+        return _copy_tree(self._tree)
+    
+    def clear(self):
+        """清空记录"""
+        self._tree.clear()
+        self._fields.clear()
+        self._dirty.clear()
+        self.version = 0
+        self.committed_version = 0
+    
+    def __len__(self) -> int:
+        """叶子字段数量"""
+        return _count_leaves(self._tree)
+
+
+def _copy_tree(node: Dict[Any, Any]) -> Dict[Any, Any]:
+    """复制嵌套字典（叶子中的列表和空字典也复制）"""
+    return {
+        key: _copy_tree(value) if type(value) is dict else (value.copy() if type(value) is list else value)
+        for key, value in node.items()
+    }
+
+
+def _count_leaves(node: Dict[Any, Any]) -> int:
+    return sum(_count_leaves(value) if type(value) is dict and value else 1 for value in node.values())
+
+
 @dataclass
 class StatusCacheEntry:
     """状态缓存条目"""
     timestamp: float
     status_data: Dict[str, Any]
-    hash_value: str  # 状态数据的哈希值，用于快速比较
+    hash_value: Optional[str] = None  # 状态数据的哈希值，只在广播时计算
     change_detected: bool = False
     change_fields: List[str] = field(default_factory=list)
+    version: int = 0  # 对应的状态记录版本号
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -41,7 +298,8 @@ class StatusCacheEntry:
             'status_data': self.status_data,
             'hash_value': self.hash_value,
             'change_detected': self.change_detected,
-            'change_fields': self.change_fields
+            'change_fields': self.change_fields,
+            'version': self.version
         }
 
 
@@ -75,7 +333,9 @@ class StatusCache:
         max_history_size: int = 100,
         cache_ttl: float = 60.0,
         min_broadcast_interval: float = 0.1,
-        cache_strategy: CacheStrategy = CacheStrategy.CACHE_ON_CHANGE
+        cache_strategy: CacheStrategy = CacheStrategy.CACHE_ON_CHANGE,
+        telemetry_capacity: int = DEFAULT_CAPACITY,
+        record_telemetry: bool = True
     ):
         """
         初始化状态缓存
@@ -85,6 +345,8 @@ class StatusCache:
             cache_ttl: 缓存生存时间（秒）
             min_broadcast_interval: 最小广播间隔（秒），用于限流
             cache_strategy: 缓存策略
+            telemetry_capacity: 遥测时序存储容量（样本数，默认10Hz保存2小时）
+            record_telemetry: 是否在每次更新时记录遥测（由调用方通过 record_telemetry() 按遥测频率记录时关闭）
         """
         self.max_history_size = max_history_size
         self.cache_ttl = cache_ttl
@@ -94,9 +356,16 @@ class StatusCache:
         # 当前缓存的状态
         self.current_cache: Optional[StatusCacheEntry] = None
         
+        # 字段级版本化状态记录（差异检测只遍历脏字段）
+        self.record = VersionedStatus()
+        
         # 状态历史记录（使用deque实现固定大小的环形缓冲区）
         self.history: deque = deque(maxlen=max_history_size)
         
+        # 遥测时序（每次更新都记录数值字段，不受缓存策略影响）
+        self.telemetry = TelemetryStore(capacity=telemetry_capacity)
+        self.record_on_update = record_telemetry
+        
         # 广播指标
         self.broadcast_metrics = BroadcastMetrics()
         
@@ -125,64 +394,51 @@ class StatusCache:
             # 排序键以确保一致性
             json_str = json.dumps(status_data, sort_keys=True)
             
-            # 使用简单的哈希函数
-            import hashlib
             return hashlib.md5(json_str.encode()).hexdigest()
         except Exception as e:
             logger.error(f"计算哈希值失败: {e}")
             return str(time.time())
     
-    def _detect_differences(
-        self,
-        old_status: Dict[str, Any],
-        new_status: Dict[str, Any]
-    ) -> Tuple[bool, List[str]]:
+    def _is_significant(self, path: FieldPath, old_status: Dict[str, Any], new_status: Dict[str, Any]) -> bool:
         """
-        检测两个状态之间的差异
+        判断脏字段路径上的变化是否显著
+        
+        从顶层沿路径逐层比较上次缓存的状态与当前状态，规则与逐层比较完整状态时一致：
+        配置了阈值的字段，数值变化按阈值判定，其他变化（如 position 字典中任一分量变化）都显著；
+        关键字段任何变化都显著；两侧都是字典时进入下一层；其余字段的变化不显著。
         
         Args:
-            old_status: 旧状态
-            new_status: 新状态
+            path: 脏字段路径
+            old_status: 上次缓存的状态
+            new_status: 当前状态
         
         Returns:
-            (是否有显著差异, 变化的字段列表)
+            是否为显著变化
         """
-        changed_fields = []
-        has_significant_change = False
-        
-        # 检查所有字段
-        all_keys = set(old_status.keys()) | set(new_status.keys())
-        
-        for key in all_keys:
-            old_value = old_status.get(key)
-            new_value = new_status.get(key)
+        old_node, new_node = old_status, new_status
+        for key in path:
+            old_value = old_node.get(key)
+            new_value = new_node.get(key)
+            nested = type(old_value) is dict and type(new_value) is dict
+            # 脏字段的上级字典必然不同，只有叶子需要比较
+            if not nested and old_value == new_value:
+                return False
             
-            # 如果值不同
-            if old_value != new_value:
-                changed_fields.append(key)
-                
-                # 检查是否是显著变化
-                if key in self.diff_threshold:
-                    # 数值类型的阈值检查
-                    if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)):
-                        if abs(new_value - old_value) >= self.diff_threshold[key]:
-                            has_significant_change = True
-                    else:
-                        has_significant_change = True
-                elif key in ['connected', 'flying', 'state']:
-                    # 关键状态字段总是显著变化
-                    has_significant_change = True
-                elif isinstance(old_value, dict) and isinstance(new_value, dict):
-                    # 递归检查嵌套字典
-                    nested_change, _ = self._detect_differences(old_value, new_value)
-                    if nested_change:
-                        has_significant_change = True
-        
-        return has_significant_change, changed_fields
+            if key in self.diff_threshold:
+                if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)):
+                    return abs(new_value - old_value) >= self.diff_threshold[key]
+                return True
+            if key in CRITICAL_FIELDS:
+                return True
+            if not nested:
+                return False
+            old_node, new_node = old_value, new_value
+        
+        return False
     
     def update(self, status_data: Dict[str, Any]) -> Tuple[bool, bool]:
         """
-        更新缓存状态
+        更新缓存状态（完整状态，未出现的字段视为删除）
         
         Args:
             status_data: 新的状态数据
@@ -191,70 +447,115 @@ class StatusCache:
             (是否应该广播, 是否检测到变化)
         """
         try:
-            current_time = time.time()
-            
-            # 计算新状态的哈希值
-            new_hash = self._compute_hash(status_data)
-            
-            # 如果没有当前缓存，直接缓存并广播
-            if self.current_cache is None:
-                self.current_cache = StatusCacheEntry(
-                    timestamp=current_time,
-                    status_data=status_data.copy(),
-                    hash_value=new_hash,
-                    change_detected=True,
-                    change_fields=list(status_data.keys())
-                )
-                self._add_to_history(self.current_cache)
-                logger.debug("首次缓存状态")
-                return True, True
-            
-            # 检查缓存是否过期
-            cache_age = current_time - self.current_cache.timestamp
-            cache_expired = cache_age > self.cache_ttl
-            
-            # 快速哈希比较
-            if new_hash == self.current_cache.hash_value and not cache_expired:
-                # 状态完全相同且缓存未过期，不需要更新
-                logger.debug("状态未变化，使用缓存")
-                return False, False
-            
-            # 详细差异检测
-            has_significant_change, changed_fields = self._detect_differences(
-                self.current_cache.status_data,
-                status_data
-            )
-            
-            # 根据缓存策略决定是否缓存
-            should_cache = False
-            if self.cache_strategy == CacheStrategy.ALWAYS_CACHE:
-                should_cache = True
-            elif self.cache_strategy == CacheStrategy.CACHE_ON_CHANGE:
-                should_cache = has_significant_change or cache_expired
-            elif self.cache_strategy == CacheStrategy.TIME_BASED:
-                should_cache = cache_expired
-            
-            # 更新缓存
-            if should_cache:
-                self.current_cache = StatusCacheEntry(
-                    timestamp=current_time,
-                    status_data=status_data.copy(),
-                    hash_value=new_hash,
-                    change_detected=has_significant_change,
-                    change_fields=changed_fields
-                )
-                self._add_to_history(self.current_cache)
-                logger.debug(f"缓存已更新，变化字段: {changed_fields}")
-            
-            # 决定是否广播
-            should_broadcast = self._should_broadcast(has_significant_change, cache_expired)
-            
-            return should_broadcast, has_significant_change
-            
+            self.record.replace(status_data)
+            if self.record_on_update:
+                self.record_telemetry(self.record._tree)
+            return self._evaluate()
         except Exception as e:
             logger.error(f"更新缓存失败: {e}")
             return True, True  # 出错时默认广播
     
+    def update_fields(self, changes: Dict[str, Any]) -> Tuple[bool, bool]:
+        """
+        只写入变化的字段（嵌套字典按路径合并），开销只与写入的字段数量有关
+        
+        Args:
+            changes: 变化的字段
+        
+        Returns:
+            (是否应该广播, 是否检测到变化)
+        """
+        try:
+            for key, value in changes.items():
+                self.record.set((key,), value)
+            if self.record_on_update:
+                self.record_telemetry(self.record._tree)
+            return self._evaluate()
+        except Exception as e:
+            logger.error(f"更新缓存失败: {e}")
+            return True, True
+    
+    def record_telemetry(self, status_data: Dict[str, Any], timestamp: Optional[float] = None):
+        """
+        将状态中的遥测字段追加到时序存储
+        
+        Args:
+            status_data: 状态数据（扁平或 {'drone_status': {...}}）
+            timestamp: 采样时间戳，默认当前时间
+        """
+        values = extract_telemetry(status_data)
+        if values:
+            self.telemetry.append(values, timestamp)
+    
+    def _commit_entry(self, current_time: float, change_detected: bool, change_fields: List[str]) -> StatusCacheEntry:
+        """提交状态记录并生成缓存条目"""
+        self.record.commit()
+        entry = StatusCacheEntry(
+            timestamp=current_time,
+            status_data=self.record.snapshot(),
+            change_detected=change_detected,
+            change_fields=change_fields,
+            version=self.record.version
+        )
+        self._add_to_history(entry)
+        return entry
+    
+    def _evaluate(self) -> Tuple[bool, bool]:
+        """
+        根据脏字段决定是否缓存和广播
+        
+        Returns:
+            (是否应该广播, 是否检测到变化)
+        """
+        current_time = time.time()
+        
+        # 如果没有当前缓存，直接缓存并广播
+        if self.current_cache is None:
+            fields = list(dict.fromkeys(path[0] for path in self.record.dirty_fields))
+            self.current_cache = self._commit_entry(current_time, True, fields)
+            self.current_cache.hash_value = self._compute_hash(self.current_cache.status_data)
+            logger.debug("首次缓存状态")
+            return True, True
+        
+        # 检查缓存是否过期
+        cache_age = current_time - self.current_cache.timestamp
+        cache_expired = cache_age > self.cache_ttl
+        
+        changes = self.record.dirty_fields
+        if not changes and not cache_expired:
+            # 自上次缓存以来没有字段变化，不需要更新
+            logger.debug("状态未变化，使用缓存")
+            return False, False
+        
+        # 只检查脏字段
+        has_significant_change = False
+        for path in changes:
+            if self._is_significant(path, self.current_cache.status_data, self.record._tree):
+                has_significant_change = True
+                break
+        changed_fields = list(dict.fromkeys(path[0] for path in changes))
+        
+        # 根据缓存策略决定是否缓存
+        should_cache = False
+        if self.cache_strategy == CacheStrategy.ALWAYS_CACHE:
+            should_cache = True
+        elif self.cache_strategy == CacheStrategy.CACHE_ON_CHANGE:
+            should_cache = has_significant_change or cache_expired
+        elif self.cache_strategy == CacheStrategy.TIME_BASED:
+            should_cache = cache_expired
+        
+        # 更新缓存（未缓存时脏字段保留，细小变化会累积到超过阈值）
+        if should_cache:
+            self.current_cache = self._commit_entry(current_time, has_significant_change, changed_fields)
+            logger.debug(f"缓存已更新，变化字段: {changed_fields}")
+        
+        # 决定是否广播，只有真正广播时才计算哈希
+        should_broadcast = self._should_broadcast(has_significant_change, cache_expired)
+        if should_broadcast and self.current_cache.hash_value is None:
+            self.current_cache.hash_value = self._compute_hash(self.current_cache.status_data)
+        
+        return should_broadcast, has_significant_change
+    
     def _should_broadcast(self, has_change: bool, cache_expired: bool) -> bool:
         """
         决定是否应该广播状态更新
@@ -346,14 +647,16 @@ class StatusCache:
         Returns:
             历史记录列表
         """
-        history_list = list(self.history)
-        
-        # 时间过滤
+        # 时间过滤（历史按时间排列，从最新一端向前扫描到起始时间即停止）
         if since is not None:
-            history_list = [
-                entry for entry in history_list
-                if entry.timestamp >= since
-            ]
+            history_list = []
+            for entry in reversed(self.history):
+                if entry.timestamp < since:
+                    break
+                history_list.append(entry)
+            history_list.reverse()
+        else:
+            history_list = list(self.history)
         
         # 数量限制
         if limit is not None and limit > 0:
@@ -373,39 +676,70 @@ class StatusCache:
         """
         changes = []
         
-        for entry in self.history:
-            if entry.timestamp > timestamp and entry.change_detected:
+        # 从最新一端向前扫描，遇到更早的条目即停止
+        for entry in reversed(self.history):
+            if entry.timestamp <= timestamp:
+                break
+            if entry.change_detected:
                 changes.append({
                     'timestamp': datetime.fromtimestamp(entry.timestamp).isoformat(),
                     'changed_fields': entry.change_fields,
                     'status_data': entry.status_data
                 })
         
+        changes.reverse()
         return changes
     
     def get_field_history(
         self,
         field_name: str,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None
     ) -> List[Tuple[float, Any]]:
         """
         获取特定字段的历史值
         
+        遥测字段（电量、高度、温度、位置、速度）从时序存储中二分查找，
+        其他字段扫描缓存历史；字段名支持点号路径，如 'drone_status.battery'。
+        
         Args:
             field_name: 字段名称
             limit: 限制返回的记录数量
+            start: 起始时间戳（含）
+            end: 结束时间戳（含）
         
         Returns:
             (时间戳, 值) 元组列表
         """
+        telemetry_field = resolve_field(field_name)
+        if telemetry_field is not None:
+            if start is None and end is None and limit is not None and limit > 0:
+                data = self.telemetry.tail(limit, [telemetry_field])
+            else:
+                data = self.telemetry.query(start, end, [telemetry_field])
+            values = data[telemetry_field]
+            valid = ~np.isnan(values)
+            field_history = list(zip(data['timestamp'][valid].tolist(), values[valid].tolist()))
+            if limit is not None and limit > 0:
+                field_history = field_history[-limit:]
+            return field_history
+        
+        path = tuple(field_name.split('.'))
         field_history = []
         
         for entry in self.history:
-            if field_name in entry.status_data:
-                field_history.append((
-                    entry.timestamp,
-                    entry.status_data[field_name]
-                ))
+            if start is not None and entry.timestamp < start:
+                continue
+            if end is not None and entry.timestamp > end:
+                break
+            node: Any = entry.status_data
+            for key in path:
+                if not isinstance(node, dict) or key not in node:
+                    break
+                node = node[key]
+            else:
+                field_history.append((entry.timestamp, node))
         
         # 数量限制
         if limit is not None and limit > 0:
@@ -413,6 +747,45 @@ class StatusCache:
         
         return field_history
     
+    def get_telemetry(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        fields: Optional[List[str]] = None,
+        buckets: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        获取遥测时序（用于仪表盘图表）
+        
+        Args:
+            start: 起始时间戳
+            end: 结束时间戳
+            fields: 字段列表（支持 'battery'、'position.x' 等写法），默认全部
+            buckets: 降采样桶数量，None表示返回原始样本
+        
+        Returns:
+            可JSON序列化的时序字典；降采样时每个字段为 {'min', 'max', 'mean'}
+        """
+        if fields:
+            fields = [name for name in map(resolve_field, fields) if name is not None]
+        if buckets:
+            data = self.telemetry.downsample(start, end, buckets, fields)
+        else:
+            data = self.telemetry.query(start, end, fields)
+        return to_series(data)
+    
+    def export_telemetry(self, filepath: str) -> str:
+        """
+        导出遥测时序为可内存映射的 .npy 文件
+        
+        Args:
+            filepath: 文件路径
+        
+        Returns:
+            文件路径
+        """
+        return self.telemetry.export(filepath)
+    
     def get_statistics(self) -> Dict[str, Any]:
         """
         获取缓存统计信息
@@ -446,6 +819,10 @@ class StatusCache:
             'changed_entries': changed_entries,
             'change_rate': change_rate,
             'broadcast_metrics': self.broadcast_metrics.to_dict(),
+            'record_version': self.record.version,
+            'tracked_fields': len(self.record),
+            'dirty_fields': len(self.record.dirty_fields),
+            'telemetry': self.telemetry.get_statistics(),
             'current_cache_age': current_time - self.current_cache.timestamp if self.current_cache else None,
             'cache_expired': (current_time - self.current_cache.timestamp > self.cache_ttl) if self.current_cache else None
         }
@@ -458,7 +835,9 @@ class StatusCache:
     def clear_all(self):
         """清空所有缓存和历史记录"""
         self.current_cache = None
+        self.record.clear()
         self.history.clear()
+        self.telemetry.clear()
         self.broadcast_metrics = BroadcastMetrics()
         logger.info("所有缓存已清空")
     
@@ -17,11 +17,13 @@ from enum import Enum
 # 导入状态缓存模块
 try:
     from status_cache import StatusCache, CacheStrategy
+    from status_sync import StatusPublisher
     STATUS_CACHE_AVAILABLE = True
 except ImportError:
     STATUS_CACHE_AVAILABLE = False
     StatusCache = None
     CacheStrategy = None
+    StatusPublisher = None
 
 
 logger = logging.getLogger(__name__)
@@ -104,19 +106,37 @@ class StatusManager:
         sync_interval: float = 1.0,
         change_threshold: Dict[str, Any] = None,
         enable_cache: bool = True,
-        cache_config: Optional[Dict[str, Any]] = None
+        cache_config: Optional[Dict[str, Any]] = None,
+        min_sync_interval: float = 0.2,
+        max_sync_interval: float = 10.0,
+        backoff_factor: float = 1.5,
+        push_timeout: float = 3.0
     ):
         """
         初始化状态管理器
         
         Args:
-            sync_interval: 状态同步间隔（秒）
+            sync_interval: 状态同步间隔（秒），轮询的初始间隔
             change_threshold: 状态变化阈值配置
             enable_cache: 是否启用状态缓存优化
             cache_config: 缓存配置字典
+            min_sync_interval: 飞行中或状态变化时的轮询间隔（秒）
+            max_sync_interval: 状态稳定时轮询退避的上限（秒）
+            backoff_factor: 状态未变化时轮询间隔的增长倍数
+            push_timeout: 推送源超过该时间没有推送时恢复轮询（秒）
         """
         self.sync_interval = sync_interval
         
+        # 自适应轮询（仅在没有活跃推送源时使用）
+        self.min_sync_interval = min(min_sync_interval, sync_interval)
+        self.max_sync_interval = max(max_sync_interval, sync_interval)
+        self.backoff_factor = backoff_factor
+        self.push_timeout = push_timeout
+        self.current_sync_interval = sync_interval
+        self.last_push_time = 0.0
+        self.push_updates = 0
+        self.polls_skipped = 0
+        
         # 状态变化阈值
         self.change_threshold = change_threshold or {
             'battery': 5,  # 电池变化超过5%才通知
@@ -129,12 +149,16 @@ class StatusManager:
         self.current_drone_status = DroneStatusData()
         self.current_bridge_status = BridgeStatusData()
         
-        # 上一次状态（用于变化检测）
-        self.previous_drone_status = DroneStatusData()
+        # 上一次广播的状态（变化检测的基准，逐包的细小变化会累积到超过阈值）
+        self.last_broadcast_drone_status = DroneStatusData()
         
         # 状态订阅者
         self.subscribers: Set[Callable] = set()
         
+        # 增量订阅者: 回调 -> 是否已发送快照（先收到完整快照，之后只收到变化字段）
+        self.delta_subscribers: Dict[Callable, bool] = {}
+        self.status_publisher = StatusPublisher('status') if STATUS_CACHE_AVAILABLE else None
+        
         # 同步任务
         self.sync_task: Optional[asyncio.Task] = None
         self.is_syncing = False
@@ -154,7 +178,8 @@ class StatusManager:
                 max_history_size=cache_config.get('max_history_size', 100),
                 cache_ttl=cache_config.get('cache_ttl', 60.0),
                 min_broadcast_interval=cache_config.get('min_broadcast_interval', 0.1),
-                cache_strategy=cache_config.get('cache_strategy', CacheStrategy.CACHE_ON_CHANGE)
+                cache_strategy=cache_config.get('cache_strategy', CacheStrategy.CACHE_ON_CHANGE),
+                record_telemetry=False  # 遥测在 update_drone_status 中按接收频率记录
             )
             
             # 同步差异阈值到缓存
@@ -181,9 +206,6 @@ class StatusManager:
             bool: 状态是否发生变化
         """
         try:
-            # 保存旧状态
-            self.previous_drone_status = DroneStatusData(**asdict(self.current_drone_status))
-            
             # 更新状态
             for key, value in status_data.items():
                 if hasattr(self.current_drone_status, key):
@@ -192,6 +214,10 @@ class StatusManager:
             # 更新时间戳
             self.current_drone_status.timestamp = time.time()
             
+            # 每次更新都记录遥测时序（广播仍由变化检测和缓存决定）
+            if self.cache_enabled and self.status_cache:
+                self.status_cache.record_telemetry(status_data, self.current_drone_status.timestamp)
+            
             # 检测变化
             has_changes = self._detect_changes()
             
@@ -237,13 +263,13 @@ class StatusManager:
     
     def _detect_changes(self) -> bool:
         """
-        检测状态变化
+        检测状态变化（与上一次广播的状态比较）
         
         Returns:
             bool: 是否有显著变化
         """
         current = self.current_drone_status
-        previous = self.previous_drone_status
+        previous = self.last_broadcast_drone_status
         
         # 连接状态变化
         if current.connected != previous.connected:
@@ -284,7 +310,7 @@ class StatusManager:
         """
         changes = {}
         current = self.current_drone_status
-        previous = self.previous_drone_status
+        previous = self.last_broadcast_drone_status
         
         if current.connected != previous.connected:
             changes['connected'] = {'old': previous.connected, 'new': current.connected}
@@ -338,15 +364,19 @@ class StatusManager:
         """
         return self.current_bridge_status.to_dict()
     
-    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None], delta: bool = False) -> None:
         """
         订阅状态更新
         
         Args:
             callback: 状态更新回调函数
+            delta: 是否使用增量协议（回调收到 {'type', 'seq', 'data'} 快照或增量消息）
         """
-        self.subscribers.add(callback)
-        logger.info(f"新增状态订阅者，当前订阅者数量: {len(self.subscribers)}")
+        if delta and self.status_publisher:
+            self.delta_subscribers[callback] = False
+        else:
+            self.subscribers.add(callback)
+        logger.info(f"新增状态订阅者，当前订阅者数量: {len(self.subscribers) + len(self.delta_subscribers)}")
     
     def unsubscribe(self, callback: Callable) -> None:
         """
@@ -356,7 +386,44 @@ class StatusManager:
             callback: 要取消的回调函数
         """
         self.subscribers.discard(callback)
-        logger.info(f"移除状态订阅者，当前订阅者数量: {len(self.subscribers)}")
+        self.delta_subscribers.pop(callback, None)
+        logger.info(f"移除状态订阅者，当前订阅者数量: {len(self.subscribers) + len(self.delta_subscribers)}")
+    
+    async def request_resync(self, callback: Callable) -> bool:
+        """
+        增量订阅者发现序号缺口时请求完整快照
+        
+        Args:
+            callback: 增量订阅者回调
+        
+        Returns:
+            是否已发送快照
+        """
+        if callback not in self.delta_subscribers:
+            return False
+        
+        self.delta_subscribers[callback] = True
+        if not await self._deliver(callback, self.status_publisher.resync().to_dict()):
+            self.delta_subscribers.pop(callback, None)
+            return False
+        return True
+    
+    async def _deliver(self, subscriber: Callable, payload: Dict[str, Any]) -> bool:
+        """
+        调用订阅者
+        
+        Returns:
+            是否成功
+        """
+        try:
+            if asyncio.iscoroutinefunction(subscriber):
+                await subscriber(payload)
+            else:
+                subscriber(payload)
+            return True
+        except Exception as e:
+            logger.error(f"广播状态到订阅者失败: {e}")
+            return False
     
     async def broadcast_status(self, force: bool = False) -> None:
         """
@@ -365,7 +432,8 @@ class StatusManager:
         Args:
             force: 是否强制广播（忽略变化检测和缓存）
         """
-        if not self.subscribers:
+        if not self.subscribers and not self.delta_subscribers:
+            self._mark_broadcast()
             return
         
         status = self.get_current_status()
@@ -387,21 +455,95 @@ class StatusManager:
         # 调用所有订阅者
         failed_subscribers = set()
         for subscriber in self.subscribers:
-            try:
-                if asyncio.iscoroutinefunction(subscriber):
-                    await subscriber(status)
-                else:
-                    subscriber(status)
-            except Exception as e:
-                logger.error(f"广播状态到订阅者失败: {e}")
+            if not await self._deliver(subscriber, status):
                 failed_subscribers.add(subscriber)
         
+        # 增量订阅者: 新订阅者先收到快照，其余只收到变化字段
+        if self.delta_subscribers:
+            message = self.status_publisher.publish(status)
+            for subscriber, synced in list(self.delta_subscribers.items()):
+                if not synced:
+                    payload = self.status_publisher.snapshot().to_dict()
+                elif message:
+                    payload = message.to_dict()
+                else:
+                    continue
+                if await self._deliver(subscriber, payload):
+                    self.delta_subscribers[subscriber] = True
+                else:
+                    failed_subscribers.add(subscriber)
+        
         # 移除失败的订阅者
         self.subscribers -= failed_subscribers
+        for subscriber in failed_subscribers:
+            self.delta_subscribers.pop(subscriber, None)
+        
+        self._mark_broadcast()
+    
+    def _mark_broadcast(self) -> None:
+        """记录已广播的状态，作为后续变化检测的基准"""
+        self.last_broadcast_drone_status = DroneStatusData(**asdict(self.current_drone_status))
+    
+    async def push_drone_status(self, status_data: Dict[str, Any]) -> bool:
+        """
+        推送一条无人机状态（用于遥测流等主动推送的状态源）
+        
+        Args:
+            status_data: 状态数据字典
+        
+        Returns:
+            bool: 状态是否发生变化
+        """
+        self.last_push_time = time.time()
+        self.push_updates += 1
+        self.current_bridge_status.last_sync = self.last_push_time
+        
+        has_changes = self.update_drone_status(status_data)
+        if has_changes:
+            await self.broadcast_status()
+        return has_changes
+    
+    async def add_push_source(self, subscribe: Callable[[Callable], Any]) -> None:
+        """
+        注册推送式状态源（如 BridgeClient.subscribe_status_updates）
+        
+        推送源活跃期间定时轮询暂停，超过 push_timeout 没有推送时自动恢复轮询。
+        
+        Args:
+            subscribe: 订阅函数，接收一个状态回调；可以是协程函数
+        """
+        async def on_status(status_data: Any):
+            # 推送源也会转发文本通知等非状态消息，只接收状态字典
+            if isinstance(status_data, dict):
+                await self.push_drone_status(status_data)
+        
+        result = subscribe(on_status)
+        if asyncio.iscoroutine(result):
+            await result
+        logger.info("📡 已注册推送式状态源")
+    
+    def is_push_active(self) -> bool:
+        """推送源最近是否推送过状态"""
+        return self.last_push_time > 0 and time.time() - self.last_push_time < self.push_timeout
+    
+    def _next_sync_interval(self, interval: float, has_changes: bool) -> float:
+        """
+        计算下一次轮询间隔：飞行中或状态变化时加快，状态稳定时逐步退避
+        
+        Args:
+            interval: 当前间隔
+            has_changes: 本次轮询是否检测到变化
+        
+        Returns:
+            下一次轮询间隔（秒）
+        """
+        if has_changes or self.current_drone_status.flying:
+            return self.min_sync_interval
+        return min(interval * self.backoff_factor, self.max_sync_interval)
     
     async def start_sync(self, status_source: Callable) -> None:
         """
-        启动定时状态同步
+        启动自适应轮询状态同步（有活跃推送源时暂停轮询）
         
         Args:
             status_source: 状态源函数，返回状态数据字典
@@ -434,8 +576,17 @@ class StatusManager:
         Args:
             status_source: 状态源函数
         """
+        self.current_sync_interval = self.sync_interval
         try:
             while self.is_syncing:
+                # 推送源活跃时不轮询，等到推送可能过期时再检查
+                if self.is_push_active():
+                    self.polls_skipped += 1
+                    self.current_sync_interval = self.sync_interval
+                    await asyncio.sleep(max(self.last_push_time + self.push_timeout - time.time(), 0.01))
+                    continue
+                
+                has_changes = False
                 try:
                     # 获取最新状态
                     if asyncio.iscoroutinefunction(status_source):
@@ -466,8 +617,9 @@ class StatusManager:
                     self.current_bridge_status.error_count += 1
                     self.current_bridge_status.last_error = str(e)
                 
-                # 等待下一次同步
-                await asyncio.sleep(self.sync_interval)
+                # 等待下一次同步（间隔随飞行状态和变化自适应调整）
+                self.current_sync_interval = self._next_sync_interval(self.current_sync_interval, has_changes)
+                await asyncio.sleep(self.current_sync_interval)
                 
         except asyncio.CancelledError:
             logger.info("状态同步循环已取消")
@@ -490,8 +642,13 @@ class StatusManager:
             'last_sync': datetime.fromtimestamp(self.current_bridge_status.last_sync).isoformat() 
                         if self.current_bridge_status.last_sync > 0 else None,
             'last_error': self.current_bridge_status.last_error,
-            'subscribers_count': len(self.subscribers),
+            'subscribers_count': len(self.subscribers) + len(self.delta_subscribers),
+            'delta_subscribers_count': len(self.delta_subscribers),
             'is_syncing': self.is_syncing,
+            'current_sync_interval': self.current_sync_interval,
+            'push_active': self.is_push_active(),
+            'push_updates': self.push_updates,
+            'polls_skipped': self.polls_skipped,
             'cache_enabled': self.cache_enabled
         }
         
@@ -499,6 +656,9 @@ class StatusManager:
         if self.cache_enabled and self.status_cache:
             stats['cache_statistics'] = self.status_cache.get_statistics()
         
+        if self.status_publisher:
+            stats['delta_sync'] = self.status_publisher.get_statistics()
+        
         return stats
     
     def get_status_history(
@@ -525,7 +685,9 @@ class StatusManager:
     def get_field_history(
         self,
         field_name: str,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None
     ) -> List[tuple]:
         """
         获取特定字段的历史值（需要启用缓存）
@@ -533,6 +695,8 @@ class StatusManager:
         Args:
             field_name: 字段名称（支持嵌套，如 'drone_status.battery'）
             limit: 限制返回的记录数量
+            start: 起始时间戳（含）
+            end: 结束时间戳（含）
         
         Returns:
             (时间戳, 值) 元组列表
@@ -541,7 +705,53 @@ class StatusManager:
             logger.warning("状态缓存未启用，无法获取字段历史")
             return []
         
-        return self.status_cache.get_field_history(field_name, limit=limit)
+        return self.status_cache.get_field_history(field_name, limit=limit, start=start, end=end)
+    
+    def get_telemetry(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        fields: Optional[List[str]] = None,
+        buckets: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        获取遥测时序，可按时间分桶降采样（需要启用缓存）
+        
+        Args:
+            start: 起始时间戳
+            end: 结束时间戳
+            fields: 字段列表，默认全部
+            buckets: 降采样桶数量，None表示返回原始样本
+        
+        Returns:
+            时序字典
+        """
+        if not self.cache_enabled or not self.status_cache:
+            logger.warning("状态缓存未启用，无法获取遥测时序")
+            return {}
+        
+        return self.status_cache.get_telemetry(start, end, fields=fields, buckets=buckets)
+    
+    def export_telemetry(self, filepath: str) -> bool:
+        """
+        导出遥测时序为可内存映射的 .npy 文件（需要启用缓存）
+        
+        Args:
+            filepath: 文件路径
+        
+        Returns:
+            是否成功
+        """
+        if not self.cache_enabled or not self.status_cache:
+            logger.warning("状态缓存未启用，无法导出遥测时序")
+            return False
+        
+        try:
+            self.status_cache.export_telemetry(filepath)
+            return True
+        except Exception as e:
+            logger.error(f"导出遥测时序失败: {e}")
+            return False
     
     def get_changes_since(self, timestamp: float) -> List[Dict[str, Any]]:
         """
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+状态增量同步协议
+新订阅者先收到带序号的完整快照，之后只收到变化字段的JSON Patch风格增量；
+客户端发现序号不连续时请求重新同步
+"""
+
+import copy
+import time
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+
+from status_cache import VersionedStatus, FieldPath, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+# 客户端请求重新同步的消息类型
+RESYNC_MESSAGE_TYPE = "status_resync"
+
+# 增量消息类型后缀: drone_status -> drone_status_patch
+PATCH_SUFFIX = "_patch"
+
+# 增量操作数超过字段总数的该比例时改发完整快照
+SNAPSHOT_RATIO = 0.5
+
+
+def json_pointer(path: FieldPath) -> str:
+    """
+    将字段路径转换为JSON Pointer (RFC 6901)
+
+    Args:
+        path: 字段路径，如 ('position', 'x')
+
+    Returns:
+        如 "/position/x"
+    """
+    return ''.join('/' + str(key).replace('~', '~0').replace('/', '~1') for key in path)
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """
+    解析JSON Pointer
+
+    Args:
+        pointer: 如 "/position/x"
+
+    Returns:
+        键列表
+    """
+    if not pointer:
+        return []
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer.lstrip('/').split('/')]
+
+
+def apply_patch(state: Dict[str, Any], patch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    在状态字典上原地应用增量
+
+    Args:
+        state: 状态字典
+        patch: 操作列表 [{'op': 'add'|'replace'|'remove', 'path': str, 'value': Any}]
+
+    Returns:
+        更新后的状态字典
+    """
+    for operation in patch:
+        keys = parse_pointer(operation['path'])
+        if not keys:
+            continue
+
+        if operation['op'] == 'remove':
+            parents = []
+            node = state
+            for key in keys[:-1]:
+                child = node.get(key)
+                if not isinstance(child, dict):
+                    break
+                parents.append((node, key))
+                node = child
+            else:
+                node.pop(keys[-1], None)
+                # 清理因删除而变空的上级字典（服务端删除嵌套字段时会移除整个分支）
+                for parent, key in reversed(parents):
+                    if parent[key]:
+                        break
+                    del parent[key]
+            continue
+
+        node = state
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = {}
+            node = child
+        node[keys[-1]] = copy.deepcopy(operation.get('value'))
+
+    return state
+
+
+@dataclass
+class StatusMessage:
+    """状态同步消息"""
+    type: str
+    seq: int
+    data: Any
+
+    @property
+    def is_snapshot(self) -> bool:
+        return not self.type.endswith(PATCH_SUFFIX)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {'type': self.type, 'seq': self.seq, 'data': self.data}
+
+
+class StatusPublisher:
+    """
+    状态发布端
+
+    维护一份版本化状态记录，每次发布只把自上次发布以来变化的字段编码为增量，
+    序列化开销与变化量成正比，而不是与状态大小成正比。
+    """
+
+    def __init__(self, topic: str, snapshot_ratio: float = SNAPSHOT_RATIO):
+        """
+        初始化发布端
+
+        Args:
+            topic: 主题（即快照消息类型，如 drone_status）
+            snapshot_ratio: 增量操作数超过字段总数的该比例时改发完整快照
+        """
+        self.topic = topic
+        self.patch_type = topic + PATCH_SUFFIX
+        self.snapshot_ratio = snapshot_ratio
+
+        self.record = VersionedStatus()
+        self.seq = 0
+
+        # 统计
+        self.snapshots_sent = 0
+        self.patches_sent = 0
+        self.resyncs = 0
+
+    def publish(self, status: Dict[str, Any]) -> Optional[StatusMessage]:
+        """
+        发布新状态
+
+        Args:
+            status: 完整状态字典
+
+        Returns:
+            要广播的消息，状态未变化时返回None
+        """
+        self.record.replace(status)
+        changes = self.record.dirty_changes()
+        if not changes:
+            return None
+
+        self.record.commit()
+        self.seq += 1
+
+        if len(changes) > len(self.record) * self.snapshot_ratio:
+            self.snapshots_sent += 1
+            return StatusMessage(self.topic, self.seq, self.record.snapshot())
+
+        patch = []
+        for path, (old_value, new_value) in changes.items():
+            pointer = json_pointer(path)
+            if new_value is MISSING:
+                patch.append({'op': 'remove', 'path': pointer})
+            else:
+                op = 'add' if old_value is MISSING else 'replace'
+                patch.append({'op': op, 'path': pointer, 'value': new_value})
+
+        self.patches_sent += 1
+        return StatusMessage(self.patch_type, self.seq, patch)
+
+    def snapshot(self) -> StatusMessage:
+        """
+        当前完整快照（发给新订阅者或请求重新同步的客户端）
+
+        Returns:
+            快照消息
+        """
+        return StatusMessage(self.topic, self.seq, self.record.snapshot())
+
+    def resync(self) -> StatusMessage:
+        """响应客户端的重新同步请求"""
+        self.resyncs += 1
+        return self.snapshot()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取发布统计
+
+        Returns:
+            统计信息字典
+        """
+        return {
+            'topic': self.topic,
+            'seq': self.seq,
+            'snapshots_sent': self.snapshots_sent,
+            'patches_sent': self.patches_sent,
+            'resyncs': self.resyncs
+        }
+
+
+class StatusSubscriber:
+    """
+    状态订阅端
+
+    应用快照和增量；序号不大于当前序号的增量（重复或早于快照）直接忽略，
+    序号跳跃时标记需要重新同步，在收到新快照之前忽略后续增量。
+    """
+
+    def __init__(self, topic: str):
+        """
+        初始化订阅端
+
+        Args:
+            topic: 主题（快照消息类型）
+        """
+        self.topic = topic
+        self.patch_type = topic + PATCH_SUFFIX
+        self.state: Dict[str, Any] = {}
+        self.seq: Optional[int] = None
+        self.needs_resync = True
+        self._resync_requested_at = 0.0
+
+        # 统计
+        self.gaps_detected = 0
+        self.stale_ignored = 0
+
+    def handles(self, msg_type: Optional[str]) -> bool:
+        """是否为本主题的消息"""
+        return msg_type in (self.topic, self.patch_type)
+
+    def apply(self, message: Dict[str, Any]) -> bool:
+        """
+        应用一条同步消息
+
+        Args:
+            message: {'type', 'seq', 'data'}
+
+        Returns:
+            状态是否已更新（忽略过期增量或发现序号缺口时返回False）
+        """
+        msg_type = message.get('type')
+        seq = message.get('seq')
+
+        if msg_type == self.topic:
+            data = message.get('data') or {}
+            if seq is None:
+                # 旧版服务端: 无序号的完整状态，按合并处理
+                self.state.update(copy.deepcopy(data))
+                return True
+            self.state = copy.deepcopy(data)
+            self.seq = seq
+            self.needs_resync = False
+            return True
+
+        if msg_type != self.patch_type:
+            return False
+
+        if self.needs_resync:
+            return False
+
+        if seq is not None and self.seq is not None and seq <= self.seq:
+            # 已包含在当前状态中的增量（重复或早于快照），直接忽略
+            self.stale_ignored += 1
+            return False
+
+        if seq is None or self.seq is None or seq > self.seq + 1:
+            self.gaps_detected += 1
+            logger.warning(f"⚠️ {self.topic} 序号缺口: 期望 {None if self.seq is None else self.seq + 1}，收到 {seq}")
+            self.needs_resync = True
+            return False
+
+        apply_patch(self.state, message.get('data') or [])
+        self.seq = seq
+        return True
+
+    def resync_due(self, retry_interval: float = 2.0) -> bool:
+        """
+        是否应发送重新同步请求（等待快照期间按间隔重试，避免每条增量都请求一次）
+
+        Args:
+            retry_interval: 重试间隔（秒）
+        """
+        return self.needs_resync and time.time() - self._resync_requested_at >= retry_interval
+
+    def resync_request(self) -> Dict[str, Any]:
+        """
+        构造重新同步请求
+
+        Returns:
+            发给服务端的消息
+        """
+        self._resync_requested_at = time.time()
+        return {'type': RESYNC_MESSAGE_TYPE, 'data': {'topic': self.topic, 'last_seq': self.seq}}
+
+
+def main():
+    """使用示例"""
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+
+    publisher = StatusPublisher('drone_status')
+    subscriber = StatusSubscriber('drone_status')
+    status = {'connected': True, 'flying': False, 'battery': 90, 'position': {'x': 0, 'y': 0, 'z': 0}}
+
+    subscriber.apply(publisher.snapshot().to_dict())
+    publisher.publish(status)
+    subscriber.apply(publisher.snapshot().to_dict())
+
+    for battery in (89, 88):
+        status = {**status, 'battery': battery, 'flying': True}
+        message = publisher.publish(status)
+        encoded = json.dumps(message.to_dict())
+        print(f"📤 {message.type} seq={message.seq} ({len(encoded)} 字节): {message.data}")
+        subscriber.apply(json.loads(encoded))
+
+    # 丢失一条增量后触发重新同步
+    publisher.publish({**status, 'battery': 87})
+    lost = publisher.publish({**status, 'battery': 86})
+    if not subscriber.apply(lost.to_dict()):
+        print(f"🔄 检测到缺口，请求重新同步: {subscriber.resync_request()}")
+        subscriber.apply(publisher.resync().to_dict())
+
+    print(f"✅ 订阅端状态: {subscriber.state} (seq={subscriber.seq})")
+    print(f"📊 {publisher.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
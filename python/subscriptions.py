@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WebSocket客户端主题订阅
+广播消息按类型归入主题（状态、任务、检测、诊断、视频），客户端通过 subscribe 消息选择需要的主题，
+并可为每个主题设置最大发送频率（限速期间丢弃的最新值在窗口结束时补发）；未订阅的客户端仍收到全部消息
+"""
+
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Iterable, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 客户端订阅/取消订阅的消息类型
+SUBSCRIBE_MESSAGE_TYPE = "subscribe"
+UNSUBSCRIBE_MESSAGE_TYPE = "unsubscribe"
+
+# 主题
+TOPIC_CONTROL = "control"  # 错误、配置变更等，始终发送
+TOPIC_STATUS = "status"  # 无人机状态、检测开关、录制与回放状态
+TOPIC_MISSION = "mission"  # 任务状态与位置
+TOPIC_DETECTION = "detection"  # QR与草莓检测结果
+TOPIC_DIAGNOSIS = "diagnosis"  # 诊断进度与结果
+TOPIC_VIDEO = "video"  # 视频帧
+
+TOPICS = (TOPIC_CONTROL, TOPIC_STATUS, TOPIC_MISSION, TOPIC_DETECTION, TOPIC_DIAGNOSIS, TOPIC_VIDEO)
+
+MESSAGE_TOPICS: Dict[str, str] = {
+    'drone_status': TOPIC_STATUS,
+    'drone_status_patch': TOPIC_STATUS,
+    'status_update': TOPIC_STATUS,
+    'detection_status': TOPIC_STATUS,
+    'replay_status': TOPIC_STATUS,
+    'recording_status': TOPIC_STATUS,
+    'mission_status': TOPIC_MISSION,
+    'mission_position': TOPIC_MISSION,
+    'qr_detected': TOPIC_DETECTION,
+    'qr_plant_detected': TOPIC_DETECTION,
+    'qr_cooldown_updated': TOPIC_DETECTION,
+    'qr_cooldowns_cleared': TOPIC_DETECTION,
+    'strawberry_summary': TOPIC_DETECTION,
+    'video_frame': TOPIC_VIDEO,
+}
+
+# 旧版频道名 -> 主题（BridgeClient 曾发送 {"type": "subscribe", "channel": "status_updates"}）
+CHANNEL_ALIASES: Dict[str, str] = {
+    'status_updates': TOPIC_STATUS,
+}
+
+
+def topic_for(msg_type: str) -> str:
+    """
+    消息类型所属的主题
+
+    Args:
+        msg_type: 消息类型
+
+    Returns:
+        主题名；diagnosis_* 归入诊断主题，未登记的类型归入控制主题
+    """
+    topic = MESSAGE_TOPICS.get(msg_type)
+    if topic:
+        return topic
+    if msg_type.startswith('diagnosis_') and not msg_type.endswith('_config_updated'):
+        return TOPIC_DIAGNOSIS
+    return TOPIC_CONTROL
+
+
+def parse_topics(data: Dict[str, Any]) -> Optional[Set[str]]:
+    """
+    解析订阅请求中的主题
+
+    Args:
+        data: {'topics': [...]}，也接受 'topic'、'channel'、'channels'
+
+    Returns:
+        主题集合；请求 '*' 时为None（全部主题）
+
+    Raises:
+        ValueError: 包含未知主题
+    """
+    names: List[str] = []
+    for key in ('topics', 'topic', 'channels', 'channel'):
+        value = data.get(key)
+        if isinstance(value, str):
+            names.append(value)
+        elif isinstance(value, (list, tuple)):
+            names.extend(str(item) for item in value)
+
+    if '*' in names:
+        return None
+
+    topics = {CHANNEL_ALIASES.get(name, name) for name in names}
+    unknown = topics - set(TOPICS)
+    if unknown:
+        raise ValueError(f"未知主题: {', '.join(sorted(unknown))}（可用: {', '.join(TOPICS)}）")
+    return topics
+
+
+def parse_max_rates(value: Any, topics: Optional[Iterable[str]]) -> Dict[str, float]:
+    """
+    解析每个主题的最大发送频率
+
+    Args:
+        value: {主题: 次/秒}，或一个数值（应用到本次订阅的全部主题）
+        topics: 本次订阅的主题，None表示全部主题
+
+    Returns:
+        主题 -> 次/秒（0或负数表示不限速）
+
+    Raises:
+        ValueError: 频率不是数值或主题未知
+    """
+    if value is None:
+        return {}
+    if isinstance(value, dict):
+        rates = {CHANNEL_ALIASES.get(topic, topic): float(rate) for topic, rate in value.items()}
+    else:
+        rate = float(value)
+        rates = {topic: rate for topic in (TOPICS if topics is None else topics)}
+
+    unknown = set(rates) - set(TOPICS)
+    if unknown:
+        raise ValueError(f"未知主题: {', '.join(sorted(unknown))}")
+    return rates
+
+
+@dataclass
+class ClientSubscription:
+    """单个客户端的订阅"""
+    topics: Optional[Set[str]] = None  # None表示全部主题（未发送过订阅请求的客户端）
+    max_rates: Dict[str, float] = field(default_factory=dict)  # 主题 -> 次/秒（主题内每种消息类型各自限速）
+    last_sent: Dict[str, float] = field(default_factory=dict)  # 消息类型 -> 上次发送时间
+    trailing: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # 消息类型 -> 限速期间丢弃的最新消息
+    rate_limited: int = 0
+    trailing_sent: int = 0
+
+    def wants(self, topic: str) -> bool:
+        """是否订阅了主题（控制主题始终订阅）"""
+        return self.topics is None or topic == TOPIC_CONTROL or topic in self.topics
+
+    def subscribe(self, topics: Optional[Set[str]], max_rates: Dict[str, float]):
+        """添加主题（topics为None时订阅全部主题）并更新限速"""
+        if topics is None:
+            self.topics = None
+        elif self.topics is not None:
+            self.topics |= topics
+        for topic, rate in max_rates.items():
+            if rate > 0:
+                self.max_rates[topic] = rate
+            else:
+                self.max_rates.pop(topic, None)
+
+    def unsubscribe(self, topics: Optional[Set[str]]):
+        """取消主题（topics为None时取消全部主题，只保留控制消息）"""
+        if topics is None:
+            self.topics = set()
+        else:
+            self.topics = (set(TOPICS) if self.topics is None else self.topics) - topics
+        removed = set(topics or TOPICS)
+        for topic in removed:
+            self.max_rates.pop(topic, None)
+        for msg_type in [msg_type for msg_type in self.last_sent if topic_for(msg_type) in removed]:
+            del self.last_sent[msg_type]
+        for msg_type in [msg_type for msg_type in self.trailing if topic_for(msg_type) in removed]:
+            del self.trailing[msg_type]
+
+    def accepts(
+        self,
+        topic: str,
+        msg_type: str,
+        droppable: bool,
+        now: float,
+        payload: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        本条消息是否发送给该客户端
+
+        限速按消息类型计时：同一主题下的不同类型（如 qr_detected 与 strawberry_summary）互不挤占。
+        被限速丢弃的消息保留最新一条，由 take_trailing 在窗口结束时补发，突发中的最后一个值不会丢失。
+
+        Args:
+            topic: 消息主题
+            msg_type: 消息类型
+            droppable: 消息是否可丢弃（只保留最新值的消息；增量等必须逐条送达的消息不受限速影响）
+            now: 当前时间（time.monotonic）
+            payload: 完整消息字典（限速时保留用于补发）
+        """
+        if not self.wants(topic):
+            return False
+        rate = self.max_rates.get(topic)
+        if rate and droppable:
+            if now - self.last_sent.get(msg_type, float('-inf')) < 1.0 / rate:
+                self.rate_limited += 1
+                if payload is not None:
+                    self.trailing[msg_type] = payload
+                return False
+            self.last_sent[msg_type] = now
+        self.trailing.pop(msg_type, None)
+        return True
+
+    def next_trailing_due(self) -> Optional[float]:
+        """最早一条待补发消息的发送时间，没有时为None"""
+        due = None
+        for msg_type in self.trailing:
+            rate = self.max_rates.get(topic_for(msg_type))
+            msg_due = self.last_sent.get(msg_type, float('-inf')) + 1.0 / rate if rate else float('-inf')
+            if due is None or msg_due < due:
+                due = msg_due
+        return due
+
+    def take_trailing(self, now: float) -> List[Dict[str, Any]]:
+        """
+        取出限速窗口已结束的待补发消息（按新窗口计时）
+
+        Args:
+            now: 当前时间（time.monotonic）
+
+        Returns:
+            消息字典列表
+        """
+        payloads = []
+        for msg_type in list(self.trailing):
+            rate = self.max_rates.get(topic_for(msg_type))
+            if rate and now - self.last_sent.get(msg_type, float('-inf')) < 1.0 / rate:
+                continue
+            payloads.append(self.trailing.pop(msg_type))
+            self.last_sent[msg_type] = now
+        self.trailing_sent += len(payloads)
+        return payloads
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（用于订阅确认消息）"""
+        return {
+            'topics': list(TOPICS) if self.topics is None else sorted(self.topics | {TOPIC_CONTROL}),
+            'max_rates': dict(self.max_rates)
+        }
+
+
+class SubscriptionRegistry:
+    """
+    所有客户端的订阅表
+
+    在事件循环线程中修改；视频线程只通过 has_subscribers 读取，用于在没有订阅者时跳过JPEG编码。
+    """
+
+    def __init__(self):
+        self.clients: Dict[Any, ClientSubscription] = {}
+
+        # 统计
+        self.filtered = 0
+
+    def add(self, client: Any) -> ClientSubscription:
+        """登记新客户端（默认订阅全部主题）"""
+        subscription = self.clients[client] = ClientSubscription()
+        return subscription
+
+    def remove(self, client: Any):
+        """移除客户端"""
+        self.clients.pop(client, None)
+
+    def get(self, client: Any) -> ClientSubscription:
+        """客户端的订阅（未登记时自动登记）"""
+        subscription = self.clients.get(client)
+        return subscription if subscription is not None else self.add(client)
+
+    def subscribe(self, client: Any, data: Dict[str, Any]) -> Tuple[ClientSubscription, Set[str]]:
+        """
+        处理订阅请求
+
+        Args:
+            client: 客户端连接
+            data: {'topics': [...], 'max_rate': {主题: 次/秒} 或 次/秒, 'replace': 是否替换原有订阅}
+
+        Returns:
+            (订阅, 新增的主题)
+
+        Raises:
+            ValueError: 请求无效
+        """
+        topics = parse_topics(data)
+        if topics is not None and not topics:
+            raise ValueError(f"未指定主题（可用: {', '.join(TOPICS)}）")
+        max_rates = parse_max_rates(data.get('max_rate'), topics)
+        subscription = self.get(client)
+        before = {topic for topic in TOPICS if subscription.wants(topic)}
+
+        if data.get('replace') or subscription.topics is None:
+            # 首次订阅即从“全部主题”收窄为所请求的主题
+            subscription.topics = set()
+        subscription.subscribe(topics, max_rates)
+
+        added = {topic for topic in TOPICS if subscription.wants(topic)} - before
+        return subscription, added
+
+    def unsubscribe(self, client: Any, data: Dict[str, Any]) -> ClientSubscription:
+        """
+        处理取消订阅请求
+
+        Raises:
+            ValueError: 包含未知主题
+        """
+        topics = parse_topics(data) if data else None
+        subscription = self.get(client)
+        subscription.unsubscribe(topics)
+        return subscription
+
+    def has_subscribers(self, topic: str, clients: Iterable[Any]) -> bool:
+        """
+        是否有客户端订阅了主题（未登记的客户端视为订阅全部主题）
+
+        Args:
+            topic: 主题
+            clients: 已连接的客户端
+        """
+        for client in list(clients):
+            subscription = self.clients.get(client)
+            if subscription is None or subscription.wants(topic):
+                return True
+        return False
+
+    def recipients(
+        self,
+        clients: Iterable[Any],
+        msg_type: str,
+        droppable: bool,
+        payload: Optional[Dict[str, Any]] = None
+    ) -> List[Any]:
+        """
+        筛选本条消息的接收者
+
+        Args:
+            clients: 已连接的客户端
+            msg_type: 消息类型
+            droppable: 消息是否可因限速丢弃
+            payload: 完整消息字典（被限速的客户端保留用于补发）
+
+        Returns:
+            接收者列表
+        """
+        topic = topic_for(msg_type)
+        now = time.monotonic()
+        selected = []
+        for client in clients:
+            if self.get(client).accepts(topic, msg_type, droppable, now, payload):
+                selected.append(client)
+            else:
+                self.filtered += 1
+        return selected
+
+    def next_trailing_due(self) -> Optional[float]:
+        """所有客户端中最早一条待补发消息的发送时间（time.monotonic），没有时为None"""
+        dues = [due for due in (subscription.next_trailing_due() for subscription in self.clients.values())
+                if due is not None]
+        return min(dues) if dues else None
+
+    def take_trailing(self, now: Optional[float] = None) -> List[Tuple[Any, Dict[str, Any]]]:
+        """
+        取出所有客户端中限速窗口已结束的待补发消息
+
+        Args:
+            now: 当前时间，默认 time.monotonic()
+
+        Returns:
+            (客户端, 消息字典) 列表
+        """
+        now = time.monotonic() if now is None else now
+        return [
+            (client, payload)
+            for client, subscription in list(self.clients.items())
+            for payload in subscription.take_trailing(now)
+        ]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取订阅统计
+
+        Returns:
+            统计信息字典
+        """
+        subscribers = {topic: 0 for topic in TOPICS}
+        for subscription in list(self.clients.values()):
+            for topic in TOPICS:
+                if subscription.wants(topic):
+                    subscribers[topic] += 1
+        return {
+            'clients': len(self.clients),
+            'subscribers': subscribers,
+            'filtered': self.filtered,
+            'rate_limited': sum(subscription.rate_limited for subscription in self.clients.values()),
+            'trailing_pending': sum(len(subscription.trailing) for subscription in self.clients.values()),
+            'trailing_sent': sum(subscription.trailing_sent for subscription in self.clients.values())
+        }
+
+
+def main():
+    """使用示例：浏览器页面订阅全部主题，桥接客户端只订阅状态，报表页面订阅诊断并限速检测结果"""
+    logging.basicConfig(level=logging.INFO)
+
+    registry = SubscriptionRegistry()
+    registry.add('browser')
+    registry.subscribe('bridge', {'topics': ['status_updates']})
+    registry.subscribe('report', {'topics': ['diagnosis', 'detection'], 'max_rate': {'detection': 1}})
+
+    for msg_type in ('video_frame', 'drone_status_patch', 'qr_detected', 'qr_detected', 'diagnosis_complete', 'error'):
+        payload = {'type': msg_type, 'data': {}}
+        print(f"📤 {msg_type:<20} -> {registry.recipients(registry.clients, msg_type, msg_type != 'drone_status_patch', payload)}")
+
+    time.sleep(1.0)
+    print(f"⏱️ 窗口结束后补发: {[(client, payload['type']) for client, payload in registry.take_trailing()]}")
+
+    print(f"🎥 视频订阅者: {registry.has_subscribers(TOPIC_VIDEO, ['bridge', 'report'])}")
+    print(f"📊 {registry.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
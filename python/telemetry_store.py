@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+遥测时序存储
+基于NumPy列式环形缓冲区保存各遥测字段的历史数据，
+支持二分查找的时间范围查询、向量化分桶降采样（min/max/mean）和内存映射文件导出
+"""
+
+import os
+import time
+import logging
+from typing import Optional, Dict, Any, List, Tuple, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 遥测字段 -> 状态字典中的路径
+TELEMETRY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'battery': ('battery',),
+    'height': ('height',),
+    'temperature': ('temperature',),
+    'pos_x': ('position', 'x'),
+    'pos_y': ('position', 'y'),
+    'pos_z': ('position', 'z'),
+    'speed_x': ('speed', 'x'),
+    'speed_y': ('speed', 'y'),
+    'speed_z': ('speed', 'z'),
+}
+
+# 默认容量: 10Hz 采样保存2小时（约3MB）
+DEFAULT_CAPACITY = 10 * 3600 * 2
+
+# 降采样支持的聚合方式
+AGGREGATIONS = ("min", "max", "mean")
+
+
+def extract_telemetry(status: Dict[str, Any]) -> Dict[str, float]:
+    """
+    从状态字典中提取遥测字段（兼容扁平状态和 {'drone_status': {...}} 嵌套状态）
+
+    Args:
+        status: 状态字典
+
+    Returns:
+        字段名 -> 数值（缺失字段不包含在内）
+    """
+    source = status.get('drone_status', status)
+    if not isinstance(source, dict):
+        return {}
+
+    values = {}
+    for name, path in TELEMETRY_FIELDS.items():
+        node: Any = source
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                node = None
+                break
+            node = node[key]
+        if isinstance(node, (int, float)) and not isinstance(node, bool):
+            values[name] = node
+    return values
+
+
+def resolve_field(name: str) -> Optional[str]:
+    """
+    将字段名解析为遥测字段（支持 'battery'、'drone_status.battery'、'position.x'、'pos_x'）
+
+    Args:
+        name: 字段名
+
+    Returns:
+        遥测字段名，无法识别时返回None
+    """
+    if name in TELEMETRY_FIELDS:
+        return name
+
+    parts = tuple(part for part in name.split('.') if part != 'drone_status')
+    for field_name, path in TELEMETRY_FIELDS.items():
+        if parts == path:
+            return field_name
+    return None
+
+
+class TelemetryStore:
+    """
+    列式环形缓冲区
+
+    时间戳（float64）和每个字段（float32，缺失为NaN）各占一个预分配数组，
+    写满后覆盖最旧的数据。时间戳单调不减，查询时对按时间排列的（最多两段）数据二分查找。
+    """
+
+    def __init__(self, fields: Sequence[str] = tuple(TELEMETRY_FIELDS), capacity: int = DEFAULT_CAPACITY):
+        """
+        初始化存储
+
+        Args:
+            fields: 字段名列表
+            capacity: 最多保存的样本数
+        """
+        if capacity <= 0:
+            raise ValueError("容量必须大于0")
+
+        self.fields = list(fields)
+        self.capacity = capacity
+
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.full(capacity, np.nan, dtype=np.float32) for name in self.fields
+        }
+        self._head = 0  # 下一个写入位置
+        self._size = 0
+        self._last_timestamp = -np.inf
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """缓冲区占用的内存字节数"""
+        return self._timestamps.nbytes + sum(column.nbytes for column in self._columns.values())
+
+    def append(self, values: Dict[str, float], timestamp: Optional[float] = None):
+        """
+        追加一个样本
+
+        Args:
+            values: 字段名 -> 数值（未提供的字段记为NaN）
+            timestamp: 时间戳，默认当前时间（早于上一个样本时按上一个样本时间记录）
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        timestamp = max(timestamp, self._last_timestamp)
+
+        index = self._head
+        self._timestamps[index] = timestamp
+        for name, column in self._columns.items():
+            column[index] = values.get(name, np.nan)
+
+        self._last_timestamp = timestamp
+        self._head = (index + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, timestamps: np.ndarray, values: Dict[str, np.ndarray]):
+        """
+        批量追加样本（向量化写入，用于导入历史数据）
+
+        Args:
+            timestamps: 单调不减的时间戳数组
+            values: 字段名 -> 与时间戳等长的数组
+        """
+        timestamps = np.maximum.accumulate(np.maximum(np.asarray(timestamps, dtype=np.float64), self._last_timestamp))
+        count = len(timestamps)
+        if count == 0:
+            return
+        if count > self.capacity:
+            timestamps = timestamps[-self.capacity:]
+            values = {name: np.asarray(array)[-self.capacity:] for name, array in values.items()}
+            count = self.capacity
+
+        positions = (self._head + np.arange(count)) % self.capacity
+        self._timestamps[positions] = timestamps
+        for name, column in self._columns.items():
+            column[positions] = values[name] if name in values else np.nan
+
+        self._last_timestamp = float(timestamps[-1])
+        self._head = int((self._head + count) % self.capacity)
+        self._size = min(self._size + count, self.capacity)
+
+    def _segments(self) -> List[Tuple[int, int]]:
+        """按时间顺序排列的物理区间（最多两段）"""
+        if self._size < self.capacity:
+            return [(0, self._size)]
+        if self._head == 0:
+            return [(0, self.capacity)]
+        return [(self._head, self.capacity), (0, self._head)]
+
+    def _range_slices(self, start: Optional[float], end: Optional[float]) -> List[slice]:
+        """二分查找时间范围 [start, end] 对应的物理切片"""
+        slices = []
+        for seg_start, seg_end in self._segments():
+            timestamps = self._timestamps[seg_start:seg_end]
+            lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+            hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+            if lo < hi:
+                slices.append(slice(seg_start + lo, seg_start + hi))
+        return slices
+
+    def _gather(self, array: np.ndarray, slices: List[slice]) -> np.ndarray:
+        if len(slices) == 1:
+            return array[slices[0]].copy()
+        if not slices:
+            return array[:0].copy()
+        return np.concatenate([array[s] for s in slices])
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        时间范围查询
+
+        Args:
+            start: 起始时间戳（含），None表示最早
+            end: 结束时间戳（含），None表示最新
+            fields: 字段列表，默认全部
+
+        Returns:
+            {'timestamp': 数组, 字段名: 数组}
+        """
+        slices = self._range_slices(start, end)
+        result = {'timestamp': self._gather(self._timestamps, slices)}
+        for name in fields or self.fields:
+            result[name] = self._gather(self._columns[name], slices)
+        return result
+
+    def tail(self, count: int, fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        最近的若干样本
+
+        Args:
+            count: 样本数
+            fields: 字段列表，默认全部
+
+        Returns:
+            {'timestamp': 数组, 字段名: 数组}
+        """
+        count = max(0, min(count, self._size))
+        positions = (self._head - count + np.arange(count)) % self.capacity
+        result = {'timestamp': self._timestamps[positions]}
+        for name in fields or self.fields:
+            result[name] = self._columns[name][positions]
+        return result
+
+    def latest(self, field_name: str) -> Optional[float]:
+        """字段最新的非NaN值"""
+        if self._size == 0:
+            return None
+        for seg_start, seg_end in reversed(self._segments()):
+            column = self._columns[field_name][seg_start:seg_end]
+            valid = np.flatnonzero(~np.isnan(column))
+            if len(valid):
+                return float(column[valid[-1]])
+        return None
+
+    def downsample(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        buckets: int = 200,
+        fields: Optional[Sequence[str]] = None,
+        aggregations: Sequence[str] = AGGREGATIONS
+    ) -> Dict[str, Any]:
+        """
+        按时间等宽分桶降采样（用于仪表盘图表）
+
+        Args:
+            start: 起始时间戳，None表示最早样本
+            end: 结束时间戳，None表示最新样本
+            buckets: 桶数量
+            fields: 字段列表，默认全部
+            aggregations: 聚合方式（min/max/mean）
+
+        Returns:
+            {'timestamp': 各非空桶起始时间, 'count': 各桶样本数,
+             字段名: {'min': 数组, 'max': 数组, 'mean': 数组}}
+        """
+        fields = list(fields or self.fields)
+        data = self.query(start, end, fields)
+        timestamps = data['timestamp']
+        if len(timestamps) == 0:
+            return {'timestamp': timestamps, 'count': np.zeros(0, dtype=np.int64),
+                    **{name: {agg: np.zeros(0, dtype=np.float32) for agg in aggregations} for name in fields}}
+
+        range_start = timestamps[0] if start is None else start
+        range_end = timestamps[-1] if end is None else end
+        width = max(range_end - range_start, 1e-9) / max(buckets, 1)
+
+        # 各桶在（已排序的）样本中的起始位置，只保留非空桶
+        edges = range_start + width * np.arange(buckets + 1)
+        bounds = np.searchsorted(timestamps, edges[:-1], side='left')
+        bounds = np.append(bounds, len(timestamps))
+        nonempty = bounds[:-1] < bounds[1:]
+        starts = bounds[:-1][nonempty]
+        counts = np.diff(bounds)[nonempty]
+
+        result: Dict[str, Any] = {'timestamp': edges[:-1][nonempty], 'count': counts}
+        for name in fields:
+            values = data[name]
+            valid = ~np.isnan(values)
+            stats = {}
+            if 'min' in aggregations:
+                stats['min'] = np.fmin.reduceat(values, starts)
+            if 'max' in aggregations:
+                stats['max'] = np.fmax.reduceat(values, starts)
+            if 'mean' in aggregations:
+                sums = np.add.reduceat(np.where(valid, values, 0.0), starts, dtype=np.float64)
+                valid_counts = np.add.reduceat(valid.astype(np.int64), starts)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    stats['mean'] = (sums / valid_counts).astype(np.float32)
+            result[name] = stats
+        return result
+
+    def export(self, path: str) -> str:
+        """
+        按时间顺序导出为结构化 .npy 文件（可用 load(mmap=True) 以内存映射方式打开）
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            文件路径
+        """
+        dtype = np.dtype([('timestamp', np.float64)] + [(name, np.float32) for name in self.fields])
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        output = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self._size,))
+
+        offset = 0
+        for seg_start, seg_end in self._segments():
+            count = seg_end - seg_start
+            output['timestamp'][offset:offset + count] = self._timestamps[seg_start:seg_end]
+            for name in self.fields:
+                output[name][offset:offset + count] = self._columns[name][seg_start:seg_end]
+            offset += count
+
+        output.flush()
+        del output
+        logger.info(f"💾 遥测已导出: {path} ({self._size} 个样本)")
+        return path
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, capacity: Optional[int] = None) -> 'TelemetryStore':
+        """
+        加载导出的遥测文件
+
+        Args:
+            path: 文件路径
+            mmap: 是否以只读内存映射方式打开（不复制数据，容量等于样本数）
+            capacity: 非内存映射时的缓冲区容量，默认等于样本数
+
+        Returns:
+            TelemetryStore对象
+        """
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        fields = [name for name in data.dtype.names if name != 'timestamp']
+
+        if not mmap:
+            store = cls(fields, capacity=max(capacity or len(data), 1))
+            store.extend(data['timestamp'], {name: data[name] for name in fields})
+            return store
+
+        store = cls.__new__(cls)
+        store.fields = fields
+        store.capacity = max(len(data), 1)
+        store._timestamps = data['timestamp']
+        store._columns = {name: data[name] for name in fields}
+        store._size = len(data)
+        store._head = 0
+        store._last_timestamp = float(data['timestamp'][-1]) if len(data) else -np.inf
+        return store
+
+    def clear(self):
+        """清空数据"""
+        self._head = 0
+        self._size = 0
+        self._last_timestamp = -np.inf
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取存储统计
+
+        Returns:
+            统计信息字典
+        """
+        segments = self._segments()
+        span = 0.0
+        if self._size:
+            span = float(self._timestamps[segments[-1][1] - 1] - self._timestamps[segments[0][0]])
+        return {
+            'fields': self.fields,
+            'capacity': self.capacity,
+            'samples': self._size,
+            'memory_bytes': self.nbytes,
+            'time_span_seconds': round(span, 3)
+        }
+
+
+def to_series(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将查询或降采样结果转换为可JSON序列化的列表（NaN转为None）
+
+    Args:
+        data: query() 或 downsample() 的结果
+
+    Returns:
+        同结构的字典
+    """
+    def convert(value: Union[np.ndarray, Dict[str, Any]]):
+        if isinstance(value, dict):
+            return {key: convert(item) for key, item in value.items()}
+        array = np.asarray(value)
+        if array.dtype.kind == 'f':
+            return [None if np.isnan(item) else float(item) for item in array.tolist()]
+        return array.tolist()
+
+    return {key: convert(value) for key, value in data.items()}
+
+
+def main():
+    """使用示例"""
+    import tempfile
+
+    logging.basicConfig(level=logging.INFO)
+
+    store = TelemetryStore()
+    print(f"📦 容量 {store.capacity} 个样本，占用 {store.nbytes / 1024 / 1024:.1f} MB")
+
+    # 模拟3小时10Hz数据（超出容量后覆盖最旧数据）
+    count = 10 * 3600 * 3
+    now = time.time()
+    timestamps = now - count / 10 + np.arange(count) / 10
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    store.extend(timestamps, {
+        'battery': np.linspace(100, 20, count),
+        'height': 100 + 20 * np.sin(np.arange(count) / 300) + rng.normal(0, 2, count),
+        'temperature': 40 + np.arange(count) / count * 10,
+    })
+    print(f"✍️ 写入 {count} 个样本: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"📊 {store.get_statistics()}")
+
+    start = time.perf_counter()
+    recent = store.query(now - 60, now, ['height'])
+    print(f"🔍 最近60秒: {len(recent['timestamp'])} 个样本 ({(time.perf_counter() - start) * 1000:.2f} ms)")
+
+    start = time.perf_counter()
+    chart = store.downsample(buckets=120, fields=['battery', 'height'])
+    print(f"📉 降采样为 {len(chart['timestamp'])} 桶 ({(time.perf_counter() - start) * 1000:.2f} ms), "
+          f"高度最大值前5: {np.round(chart['height']['max'][:5], 1)}")
+
+    path = os.path.join(tempfile.mkdtemp(), 'telemetry.npy')
+    store.export(path)
+    mapped = TelemetryStore.load(path)
+    print(f"🗺️ 内存映射加载: {len(mapped)} 个样本, 最新电量 {mapped.latest('battery'):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,10 @@ from queue import Queue, Empty
 import base64
 import httpx
 
+from tello_telemetry import TelloTelemetry, TelloState
+from message_codec import (encode_for, decode_incoming, negotiate, server_subprotocols, select_subprotocol, supported_encodings,
+                           encoding_for_subprotocol, ENCODING_JSON, NEGOTIATE_MESSAGE_TYPE)
+
 # AI 服务支持
 try:
     from openai import OpenAI, AzureOpenAI
@@ -61,6 +65,7 @@ class TelloIntelligentAgent:
         
         # WebSocket连接管理
         self.websocket_clients = set()
+        self.client_encodings: Dict[Any, str] = {}  # 客户端协商的消息编码（json/msgpack）
         
         # AI 客户端配置
         self.ai_provider = None  # 'azure', 'ollama', 'openai'
@@ -83,6 +88,10 @@ class TelloIntelligentAgent:
             'flight_time': 0
         }
         
+        # 遥测订阅：Tello推送的状态包直接更新drone_status
+        self.telemetry: Optional[TelloTelemetry] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        
         # 命令映射
         self.command_mapping = {
             'takeoff': self._takeoff,
@@ -245,8 +254,11 @@ class TelloIntelligentAgent:
                 self.drone_status['connected'] = True
                 self.drone_status['battery'] = battery
                 
-                # 启动状态更新线程
-                threading.Thread(target=self._status_update_loop, daemon=True).start()
+                # 订阅状态包（约10Hz），取代定时查询
+                self.loop = asyncio.get_running_loop()
+                self.telemetry = TelloTelemetry(self.tello)
+                self.telemetry.add_listener(self._on_telemetry)
+                self.telemetry.start()
                 
                 logger.info(f"Tello无人机连接成功，电池电量: {battery}%")
                 return {
@@ -278,6 +290,9 @@ class TelloIntelligentAgent:
                 self._stop_video_stream()
             
             # 断开连接
+            if self.telemetry:
+                self.telemetry.stop()
+                self.telemetry = None
             if self.tello:
                 self.tello.end()
             
@@ -618,7 +633,9 @@ class TelloIntelligentAgent:
     
     async def _get_battery(self) -> Dict[str, Any]:
         """获取电池电量"""
-        battery = self.tello.get_battery()
+        battery = self.telemetry.value('bat') if self.telemetry else None
+        if battery is None:
+            battery = self.tello.get_battery()
         self.drone_status['battery'] = battery
         return {'message': f'电池电量: {battery}%', 'battery': battery}
     
@@ -628,15 +645,14 @@ class TelloIntelligentAgent:
             return {'message': '无人机未连接'}
         
         try:
-            battery = self.tello.get_battery()
-            temperature = self.tello.get_temperature()
-            height = self.tello.get_height()
-            
-            self.drone_status.update({
-                'battery': battery,
-                'temperature': temperature,
-                'height': height
-            })
+            if self.telemetry and self.telemetry.is_fresh:
+                self.drone_status.update(self.telemetry.latest.to_status())
+            else:
+                self.drone_status.update({
+                    'battery': self.tello.get_battery(),
+                    'temperature': self.tello.get_temperature(),
+                    'height': self.tello.get_height()
+                })
             
             return {
                 'message': '状态获取成功',
@@ -650,30 +666,20 @@ class TelloIntelligentAgent:
         # Tello会自动悬停，这里只是确认状态
         return {'message': '无人机悬停中'}
     
-    def _status_update_loop(self):
-        """状态更新循环"""
-        while self.connected:
-            try:
-                if self.tello:
-                    battery = self.tello.get_battery()
-                    temperature = self.tello.get_temperature()
-                    height = self.tello.get_height()
-                    
-                    self.drone_status.update({
-                        'battery': battery,
-                        'temperature': temperature,
-                        'height': height,
-                        'connected': self.connected,
-                        'flying': self.flying
-                    })
-                    
-                    # 广播状态更新
-                    asyncio.create_task(self._broadcast_status())
-                    
-            except Exception as e:
-                logger.error(f"状态更新失败: {e}")
-            
-            time.sleep(2)  # 每2秒更新一次状态
+    def _on_telemetry(self, state: TelloState):
+        """遥测回调（在遥测线程中调用）：状态变化时在主循环中广播"""
+        if not self.connected:
+            return
+        
+        status = state.to_status()
+        status.pop('mission_pad', None)
+        status.update({'connected': self.connected, 'flying': self.flying})
+        if all(self.drone_status.get(key) == value for key, value in status.items()):
+            return
+        
+        self.drone_status.update(status)
+        if self.loop and not self.loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._broadcast_status(), self.loop)
     
     async def _broadcast_status(self):
         """广播状态更新到所有WebSocket客户端"""
@@ -682,13 +688,18 @@ class TelloIntelligentAgent:
                 'type': 'drone_status',
                 'data': self.drone_status
             }
+            # 每种编码只序列化一次，同编码的客户端共用
+            encoded = {}
             
             # 创建要移除的客户端列表
             clients_to_remove = []
             
             for client in self.websocket_clients.copy():
                 try:
-                    await client.send(json.dumps(message))
+                    encoding = self.client_encodings.get(client, ENCODING_JSON)
+                    if encoding not in encoded:
+                        encoded[encoding] = encode_for(encoding, message)
+                    await client.send(encoded[encoding])
                 except websockets.exceptions.ConnectionClosed:
                     clients_to_remove.append(client)
                 except Exception as e:
@@ -707,10 +718,14 @@ class TelloIntelligentAgent:
             'type': event_type,
             'data': payload
         }
+        encoded = {}
         clients_to_remove = []
         for client in self.websocket_clients.copy():
             try:
-                await client.send(json.dumps(message))
+                encoding = self.client_encodings.get(client, ENCODING_JSON)
+                if encoding not in encoded:
+                    encoded[encoding] = encode_for(encoding, message)
+                await client.send(encoded[encoding])
             except websockets.exceptions.ConnectionClosed:
                 clients_to_remove.append(client)
             except Exception as e:
@@ -776,8 +791,14 @@ class TelloIntelligentAgent:
             data = message.get('data', {})
             
             response = {'type': f'{message_type}_response'}
+            negotiated_encoding = None
             
-            if message_type == 'connect_drone':
+            if message_type == NEGOTIATE_MESSAGE_TYPE:
+                # 响应仍按原编码发送，之后的消息使用新编码
+                negotiated_encoding = negotiate(data.get('encoding'))
+                response.update({'success': True, 'encoding': negotiated_encoding})
+                
+            elif message_type == 'connect_drone':
                 result = await self.connect_drone()
                 response.update(result)
                 
@@ -823,8 +844,11 @@ class TelloIntelligentAgent:
             # 检查连接状态后再发送响应
             if websocket.open:
                 try:
-                    await websocket.send(json.dumps(response))
+                    await self._send(websocket, response)
                     logger.info(f"成功发送响应: {message_type}")
+                    if negotiated_encoding:
+                        self.client_encodings[websocket] = negotiated_encoding
+                        logger.info(f"客户端消息编码: {negotiated_encoding}")
                 except websockets.exceptions.ConnectionClosed:
                     logger.warning(f"尝试发送响应时连接已关闭: {message_type}")
                     return  # 连接已关闭，直接返回
@@ -862,10 +886,14 @@ class TelloIntelligentAgent:
             }
             try:
                 if websocket.open:
-                    await websocket.send(json.dumps(error_response))
+                    await self._send(websocket, error_response)
             except Exception as send_error:
                 logger.error(f"发送错误响应失败: {send_error}")
     
+    async def _send(self, websocket: WebSocketServerProtocol, payload: Dict[str, Any]):
+        """按客户端协商的编码发送消息"""
+        await websocket.send(encode_for(self.client_encodings.get(websocket, ENCODING_JSON), payload))
+    
     async def _send_analysis_to_3002(self, ai_analysis: Dict[str, Any]):
         """发送AI分析结果到3002端口的后端服务"""
         try:
@@ -979,42 +1007,45 @@ class TelloIntelligentAgent:
     async def websocket_handler(self, websocket: WebSocketServerProtocol, path: str):
         """WebSocket连接处理器 - 保持持久连接"""
         self.websocket_clients.add(websocket)
-        logger.info(f"新的WebSocket连接建立: {websocket.remote_address}")
+        self.client_encodings[websocket] = encoding_for_subprotocol(getattr(websocket, 'subprotocol', None))
+        logger.info(f"新的WebSocket连接建立: {websocket.remote_address} (编码: {self.client_encodings[websocket]})")
         
         try:
             # 发送连接确认消息
-            await websocket.send(json.dumps({
+            await self._send(websocket, {
                 'type': 'connection_established',
                 'success': True,
-                'message': '连接已建立，等待命令...'
-            }))
+                'message': '连接已建立，等待命令...',
+                'encoding': self.client_encodings[websocket],
+                'encodings': list(supported_encodings())
+            })
             
             # 持续监听消息，保持连接
             async for message in websocket:
                 try:
-                    data = json.loads(message)
+                    data = decode_incoming(message)
                     logger.info(f"收到消息类型: {data.get('type')}")
                     await self.handle_websocket_message(websocket, data)
                     # 消息处理完成后，连接继续保持打开状态
                     logger.info(f"消息处理完成，连接保持打开: {data.get('type')}")
-                except json.JSONDecodeError as je:
-                    logger.error(f"JSON解析错误: {je}, 原始消息: {message[:200]}")
+                except ValueError as je:
+                    logger.error(f"消息解析错误: {je}, 原始消息: {message[:200]!r}")
                     if websocket.open:
-                        await websocket.send(json.dumps({
+                        await self._send(websocket, {
                             'type': 'error',
                             'success': False,
-                            'error': '无效的JSON格式'
-                        }))
+                            'error': '无效的消息格式'
+                        })
                 except Exception as e:
                     logger.error(f"处理消息失败: {e}")
                     logger.error(f"错误堆栈: {traceback.format_exc()}")
                     if websocket.open:
                         try:
-                            await websocket.send(json.dumps({
+                            await self._send(websocket, {
                                 'type': 'error',
                                 'success': False,
                                 'error': str(e)
-                            }))
+                            })
                         except Exception as send_err:
                             logger.error(f"发送错误响应失败: {send_err}")
         except websockets.exceptions.ConnectionClosedOK:
@@ -1028,6 +1059,7 @@ class TelloIntelligentAgent:
             logger.error(f"错误堆栈: {traceback.format_exc()}")
         finally:
             self.websocket_clients.discard(websocket)
+            self.client_encodings.pop(websocket, None)
             logger.info(f"WebSocket客户端已移除: {websocket.remote_address}")
     
     async def start_server(self, host: str = 'localhost', port: int = 3004):
@@ -1042,7 +1074,9 @@ class TelloIntelligentAgent:
             ping_timeout=60,       # 60秒超时（增加以适应长时间命令执行）
             close_timeout=10,      # 关闭超时
             max_size=10 * 1024 * 1024,  # 最大消息大小10MB
-            compression=None       # 禁用压缩以提高性能
+            compression=None,      # 禁用压缩以提高性能
+            subprotocols=server_subprotocols(),  # 可选MessagePack编码，未请求子协议时为JSON
+            select_subprotocol=select_subprotocol
         )
         
         logger.info(f"Tello智能代理服务器启动成功 - 持久连接模式")
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tello遥测订阅
+Tello在UDP 8890端口以约10Hz主动推送状态包，本模块每包只解析一次为紧凑的类型化记录，
+并推送给监听者（StatusManager、后端状态广播等），取代逐项的状态查询调用
+"""
+
+import time
+import socket
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Union
+
+logger = logging.getLogger(__name__)
+
+
+# Tello状态包端口
+STATE_PORT = 8890
+
+# 超过该时间未收到状态包视为遥测过期（秒）
+STALE_AFTER = 1.0
+
+# 状态包字段 -> 类型（SDK 2.0）
+STATE_FIELDS: Dict[str, type] = {
+    'mid': int, 'x': int, 'y': int, 'z': int,
+    'pitch': int, 'roll': int, 'yaw': int,
+    'vgx': int, 'vgy': int, 'vgz': int,
+    'templ': int, 'temph': int,
+    'tof': int, 'h': int, 'bat': int,
+    'baro': float, 'time': int,
+    'agx': float, 'agy': float, 'agz': float,
+}
+
+
+@dataclass
+class TelloState:
+    """一个Tello状态包（单位沿用SDK: 厘米、分米/秒、摄氏度、秒）"""
+    __slots__ = tuple(STATE_FIELDS) + ('timestamp',)
+
+    mid: int
+    x: int
+    y: int
+    z: int
+    pitch: int
+    roll: int
+    yaw: int
+    vgx: int
+    vgy: int
+    vgz: int
+    templ: int
+    temph: int
+    tof: int
+    h: int
+    bat: int
+    baro: float
+    time: int
+    agx: float
+    agy: float
+    agz: float
+    timestamp: float
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any], timestamp: Optional[float] = None) -> 'TelloState':
+        """
+        由字段字典构造（缺失字段记为0，任务卡ID缺失记为-1）
+
+        Args:
+            fields: 字段名 -> 值（字符串或数值）
+            timestamp: 接收时间戳，默认当前时间
+        """
+        values = []
+        for name, cast in STATE_FIELDS.items():
+            value = fields.get(name)
+            if value is None:
+                values.append(-1 if name == 'mid' else cast(0))
+                continue
+            try:
+                values.append(cast(value))
+            except ValueError:
+                values.append(cast(float(value)))
+        return cls(*values, time.time() if timestamp is None else timestamp)
+
+    @property
+    def temperature(self) -> float:
+        """平均温度"""
+        return (self.templ + self.temph) / 2
+
+    @property
+    def mission_pad_id(self) -> int:
+        """检测到的任务卡ID，未检测到为-1"""
+        return self.mid
+
+    def to_status(self) -> Dict[str, Any]:
+        """
+        转换为状态字典（字段与 StatusManager.DroneStatusData 一致）
+
+        Returns:
+            状态字典；检测到任务卡时包含相对任务卡的位置
+        """
+        status = {
+            'battery': self.bat,
+            'temperature': self.temperature,
+            'height': self.h,
+            'speed': {'x': self.vgx, 'y': self.vgy, 'z': self.vgz},
+            'flight_time': self.time,
+            'mission_pad': self.mid,
+        }
+        if self.mid >= 0:
+            status['position'] = {'x': self.x, 'y': self.y, 'z': self.z}
+        return status
+
+
+def parse_state(packet: Union[bytes, str], timestamp: Optional[float] = None) -> TelloState:
+    """
+    解析状态包
+
+    Args:
+        packet: 原始状态包，如 b"mid:-1;x:0;...;agz:-999.00;\\r\\n"
+        timestamp: 接收时间戳
+
+    Returns:
+        TelloState
+
+    Raises:
+        ValueError: 包格式无效
+    """
+    if isinstance(packet, bytes):
+        packet = packet.decode('ascii', errors='replace')
+
+    fields = {}
+    for item in packet.strip().split(';'):
+        key, sep, value = item.partition(':')
+        if sep and key in STATE_FIELDS:
+            fields[key] = value
+
+    if 'bat' not in fields:
+        raise ValueError(f"无效的Tello状态包: {packet[:60]!r}")
+    return TelloState.from_fields(fields, timestamp)
+
+
+class TelloTelemetry:
+    """
+    Tello遥测订阅器
+
+    两种接收方式:
+    - 传入djitellopy的Tello对象: djitellopy已占用8890端口并解析状态包，
+      此时跟随其状态字典（每个包生成一个新字典），不发送任何命令
+    - 不传入Tello对象: 自行绑定8890端口接收原始状态包
+
+    每个新状态包在后台线程中解析一次，保存为最新记录并同步调用所有监听者。
+    """
+
+    def __init__(
+        self,
+        tello: Optional[Any] = None,
+        host: str = '0.0.0.0',
+        port: int = STATE_PORT,
+        stale_after: float = STALE_AFTER
+    ):
+        """
+        初始化遥测订阅器
+
+        Args:
+            tello: djitellopy的Tello对象（可选）
+            host: 自行接收时绑定的地址
+            port: 自行接收时绑定的端口
+            stale_after: 遥测过期时间（秒）
+        """
+        self.tello = tello
+        self.host = host
+        self.port = port
+        self.stale_after = stale_after
+
+        self.latest: Optional[TelloState] = None
+        self._listeners: List[Callable[[TelloState], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._socket: Optional[socket.socket] = None
+        self._running = False
+
+        # 统计
+        self.packets = 0
+        self.parse_errors = 0
+        self.started_at = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    @property
+    def is_fresh(self) -> bool:
+        """最近是否收到过状态包"""
+        return self.latest is not None and time.time() - self.latest.timestamp <= self.stale_after
+
+    def add_listener(self, callback: Callable[[TelloState], None]):
+        """
+        添加监听者（在接收线程中调用，耗时操作应转交给其他线程或事件循环）
+
+        Args:
+            callback: 接收TelloState的回调
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[TelloState], None]):
+        """移除监听者"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def value(self, name: str, default: Any = None) -> Any:
+        """
+        读取最新记录的字段（遥测过期时返回默认值）
+
+        Args:
+            name: 字段或属性名，如 'bat'、'h'、'temperature'
+            default: 默认值
+        """
+        if not self.is_fresh:
+            return default
+        return getattr(self.latest, name, default)
+
+    def start(self):
+        """启动接收线程"""
+        if self._running:
+            return
+
+        if self.tello is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind((self.host, self.port))
+            self._socket.settimeout(0.5)
+            target = self._receive_loop
+        else:
+            target = self._follow_loop
+
+        self._running = True
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=target, daemon=True, name='tello-telemetry')
+        self._thread.start()
+        logger.info(f"📡 Tello遥测已启动 ({'djitellopy状态' if self.tello is not None else f'UDP {self.port}'})")
+
+    def stop(self):
+        """停止接收线程"""
+        if not self._running:
+            return
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+        logger.info(f"📡 Tello遥测已停止 (共 {self.packets} 个状态包)")
+
+    def _receive_loop(self):
+        """自行接收原始状态包"""
+        while self._running:
+            try:
+                packet, _ = self._socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            try:
+                state = parse_state(packet)
+            except ValueError:
+                self.parse_errors += 1
+                continue
+            self._dispatch(state)
+
+    def _follow_loop(self):
+        """跟随djitellopy解析好的状态字典（每个包对应一个新字典对象）"""
+        last = None
+        while self._running:
+            try:
+                fields = self.tello.get_current_state()
+            except Exception:
+                fields = None
+
+            if fields and fields is not last:
+                last = fields
+                try:
+                    self._dispatch(TelloState.from_fields(fields))
+                except (TypeError, ValueError):
+                    self.parse_errors += 1
+            time.sleep(0.005)
+
+    def _dispatch(self, state: TelloState):
+        self.latest = state
+        self.packets += 1
+        for callback in list(self._listeners):
+            try:
+                callback(state)
+            except Exception as e:
+                logger.error(f"遥测监听者出错: {e}")
+
+    def publish_to(self, status_manager: Any, loop: asyncio.AbstractEventLoop) -> Callable[[TelloState], None]:
+        """
+        将每个状态包推送到StatusManager（在其事件循环中执行）
+
+        Args:
+            status_manager: StatusManager实例
+            loop: StatusManager所在的事件循环
+
+        Returns:
+            已注册的监听者（可用于 remove_listener）
+        """
+        def forward(state: TelloState):
+            if not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(status_manager.push_drone_status(state.to_status()), loop)
+
+        self.add_listener(forward)
+        return forward
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取遥测统计
+
+        Returns:
+            统计信息字典
+        """
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            'running': self._running,
+            'source': 'djitellopy' if self.tello is not None else f'udp:{self.port}',
+            'packets': self.packets,
+            'parse_errors': self.parse_errors,
+            'rate_hz': round(self.packets / elapsed, 2) if elapsed > 0 else 0.0,
+            'fresh': self.is_fresh,
+            'age_seconds': round(time.time() - self.latest.timestamp, 3) if self.latest else None
+        }
+
+
+def main():
+    """使用示例：监听Tello状态包（需连接Tello的WiFi并已发送command指令）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Tello遥测监听')
+    parser.add_argument('--port', type=int, default=STATE_PORT, help='状态包端口')
+    parser.add_argument('--duration', type=float, default=10.0, help='监听时长（秒）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    sample = b"mid:-1;x:-100;y:-100;z:-100;mpry:0,0,0;pitch:0;roll:1;yaw:-3;vgx:0;vgy:0;vgz:0;templ:60;temph:63;tof:10;h:0;bat:87;baro:135.05;time:0;agx:-3.00;agy:-2.00;agz:-999.00;\r\n"
+    print(f"🧪 示例状态包: {parse_state(sample).to_status()}")
+
+    telemetry = TelloTelemetry(port=args.port)
+    telemetry.add_listener(lambda state: print(f"📡 电量 {state.bat}% 高度 {state.h}cm 温度 {state.temperature}°C"))
+    telemetry.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        telemetry.stop()
+    print(f"📊 {telemetry.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""pytest配置：python/ 下的模块为平铺模块，测试时加入导入路径"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
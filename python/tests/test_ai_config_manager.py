@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""GeminiClient 按密钥绑定客户端测试"""
+
+import types
+
+from ai_config_manager import GeminiClient
+
+
+def make_client(model_class):
+    configured = []
+    client = GeminiClient.__new__(GeminiClient)
+    client.genai = types.SimpleNamespace(GenerativeModel=model_class, configure=lambda **kwargs: configured.append(kwargs))
+    client.api_key = 'key-a'
+    client._service = object()
+    return client, configured
+
+
+def test_model_uses_the_client_bound_to_its_key():
+    class GenerativeModel:
+        def __init__(self, name):
+            self.name = name
+            self._async_client = None
+
+    client, configured = make_client(GenerativeModel)
+    model = client.model('gemini-1.5-pro')
+    assert model._async_client is client._service
+    assert configured == []
+
+
+def test_model_falls_back_to_global_configuration_without_private_client():
+    class GenerativeModel:
+        def __init__(self, name):
+            self.name = name
+
+    client, configured = make_client(GenerativeModel)
+    model = client.model('gemini-1.5-pro')
+    assert not hasattr(model, '_async_client')
+    assert configured == [{'api_key': 'key-a'}]
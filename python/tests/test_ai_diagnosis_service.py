@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""AIDiagnosisService 结构化输出回退测试"""
+
+import asyncio
+import json
+
+import pytest
+
+from ai_config_manager import AIConfig
+from ai_diagnosis_service import AIDiagnosisService, is_structured_output_rejection
+from ai_provider_router import DiagnosisProviderRouter
+
+
+STRUCTURED_RESPONSE = json.dumps({
+    'summary': '叶片出现褐斑', 'severity': 'medium', 'confidence': 0.8,
+    'diseases': ['叶斑病'], 'recommendations': ['摘除病叶']
+})
+
+MARKDOWN_RESPONSE = "## 诊断摘要\n叶片出现褐斑\n\n## 严重程度\n中等\n"
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, message=''):
+        super().__init__(message or f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeConfigManager:
+    def get_all_configs(self):
+        return []
+
+
+def make_service(responses, timeout=5.0):
+    """responses: 依次返回的结果（异常则抛出）"""
+    service = AIDiagnosisService(FakeConfigManager(), router=DiagnosisProviderRouter(
+        FakeConfigManager(), request_timeout=timeout))
+    calls = []
+
+    async def fake_call(prompt, images, config, client, max_tokens=None, response_schema=None):
+        calls.append(response_schema is not None)
+        result = responses.pop(0)
+        if isinstance(result, (int, float)) and not isinstance(result, bool):
+            await asyncio.sleep(result)
+            return MARKDOWN_RESPONSE
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    service._call_diagnosis_provider = fake_call
+    return service, calls
+
+
+CONFIG = AIConfig(provider='openai', model='gpt-4o', api_key='k', api_base='', supports_vision=True)
+KEY = DiagnosisProviderRouter.provider_key(CONFIG)
+
+
+def request(service, timeout=None):
+    return asyncio.run(service._request_diagnosis(1, ['img'], None, None, CONFIG, None, timeout=timeout))
+
+
+def test_structured_success():
+    service, calls = make_service([STRUCTURED_RESPONSE])
+    parsed, _ = request(service)
+    assert parsed.severity == 'medium'
+    assert calls == [True]
+
+
+def test_rejection_falls_back_and_remembers_provider():
+    service, calls = make_service([HTTPError(400, 'response_format is not supported'), MARKDOWN_RESPONSE])
+    request(service)
+    assert calls == [True, False]
+    assert KEY in service._structured_unsupported
+
+
+@pytest.mark.parametrize('error', [HTTPError(503), asyncio.TimeoutError(), ConnectionError('reset')])
+def test_transient_failures_do_not_blacklist_or_retry(error):
+    service, calls = make_service([error, MARKDOWN_RESPONSE])
+    with pytest.raises(type(error)):
+        request(service)
+    assert calls == [True]
+    assert KEY not in service._structured_unsupported
+
+
+def test_non_json_response_is_parsed_without_retry():
+    service, calls = make_service([MARKDOWN_RESPONSE])
+    parsed, report = request(service)
+    assert calls == [True]
+    assert report == MARKDOWN_RESPONSE
+    assert KEY not in service._structured_unsupported
+
+
+def test_markdown_retry_stays_within_budget():
+    service, calls = make_service([HTTPError(400), 1.0])
+    with pytest.raises(asyncio.TimeoutError):
+        request(service, timeout=0.2)
+    assert KEY not in service._structured_unsupported
+
+
+def test_is_structured_output_rejection():
+    assert is_structured_output_rejection(HTTPError(400))
+    assert is_structured_output_rejection(ValueError("Unsupported parameter: 'response_format'"))
+    assert not is_structured_output_rejection(HTTPError(500))
+    assert not is_structured_output_rejection(asyncio.TimeoutError())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""DiagnosisProviderRouter 客户端缓存、对冲与故障转移测试"""
+
+import asyncio
+
+import pytest
+
+from ai_config_manager import AIConfig
+from ai_provider_router import DiagnosisProviderRouter
+
+
+class FakeConfigManager:
+    def __init__(self):
+        self.created = []
+
+    def create_client(self, config):
+        client = object()
+        self.created.append((config.api_key, client))
+        return client
+
+    def get_all_configs(self):
+        return []
+
+
+def make_config(api_key):
+    return AIConfig(provider='google', model='gemini-1.5-pro', api_key=api_key,
+                    api_base='', supports_vision=True)
+
+
+def test_clients_are_cached_per_api_key():
+    manager = FakeConfigManager()
+    router = DiagnosisProviderRouter(manager)
+
+    first = router._get_client(make_config('key-a'))
+    assert router._get_client(make_config('key-a')) is first
+    assert router._get_client(make_config('key-b')) is not first
+    assert [key for key, _ in manager.created] == ['key-a', 'key-b']
+
+
+def test_reset_clients_recreates_clients():
+    manager = FakeConfigManager()
+    router = DiagnosisProviderRouter(manager)
+
+    first = router._get_client(make_config('key-a'))
+    router.reset_clients()
+    assert router._get_client(make_config('key-a')) is not first
+
+
+class FakeProviderClient:
+    """按设定延迟返回结果或抛出异常的提供商客户端"""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def run(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self.name
+
+
+class FakeProviderManager:
+    def __init__(self, *clients):
+        self.clients = {client.name: client for client in clients}
+        self.configs = [
+            AIConfig(provider='fake', model=client.name, api_key=client.name, api_base='', supports_vision=True)
+            for client in clients
+        ]
+
+    def create_client(self, config):
+        return self.clients[config.model]
+
+    def get_all_configs(self):
+        return list(self.configs)
+
+
+def route(router):
+    async def call(config, client):
+        return await client.run()
+
+    async def scenario():
+        result = await router.execute('diagnose', call)
+        await asyncio.sleep(0)  # 让被取消的请求处理取消
+        return result
+
+    return asyncio.run(scenario())
+
+
+def test_fast_primary_wins_without_hedging():
+    primary, backup = FakeProviderClient('primary', delay=0.01), FakeProviderClient('backup')
+    router = DiagnosisProviderRouter(FakeProviderManager(primary, backup), default_hedge_delay=0.5)
+
+    assert route(router) == 'primary'
+    assert router.hedged_requests == 0
+    assert backup.calls == 0
+
+
+def test_slow_primary_triggers_exactly_one_hedge_and_loser_is_cancelled():
+    primary = FakeProviderClient('primary', delay=1.0)
+    backup = FakeProviderClient('backup', delay=0.02)
+    spare = FakeProviderClient('spare', delay=0.02)
+    router = DiagnosisProviderRouter(
+        FakeProviderManager(primary, backup, spare), default_hedge_delay=0.1, min_hedge_delay=0.01
+    )
+
+    assert route(router) == 'backup'
+    assert router.hedged_requests == 1 and router.hedge_wins == 1
+    assert spare.calls == 0
+    assert primary.cancelled == 1
+
+    # 落败请求的耗时计入延迟窗口，但不计为成功或失败
+    stats = router._get_stats(router.provider_key(router.config_manager.configs[0]), 'diagnose')
+    assert len(stats.latencies) == 1 and stats.total_requests == 0
+
+
+def test_primary_error_fails_over_immediately():
+    primary = FakeProviderClient('primary', error=ConnectionError("连接被拒绝"))
+    backup = FakeProviderClient('backup', delay=0.01)
+    router = DiagnosisProviderRouter(FakeProviderManager(primary, backup), default_hedge_delay=5.0)
+
+    assert route(router) == 'backup'
+    assert router.failovers == 1 and router.hedged_requests == 0
+    stats = router._get_stats(router.provider_key(router.config_manager.configs[0]), 'diagnose')
+    assert stats.total_failures == 1
+
+
+def test_error_raised_once_all_providers_fail():
+    primary = FakeProviderClient('primary', error=ConnectionError("连接被拒绝"))
+    backup = FakeProviderClient('backup', error=TimeoutError("超时"))
+    router = DiagnosisProviderRouter(FakeProviderManager(primary, backup))
+
+    with pytest.raises(RuntimeError) as excinfo:
+        route(router)
+    assert 'primary' in str(excinfo.value) and 'backup' in str(excinfo.value)
+    assert primary.calls == backup.calls == 1
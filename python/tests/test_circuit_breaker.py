@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""熔断器状态转换与AIMD自适应并发测试"""
+
+import asyncio
+import types
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import (
+    AdaptiveConcurrencyLimiter, CircuitBreaker, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_breaker_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30.0)
+
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == STATE_OPEN and breaker.times_opened == 1
+
+    # 打开期间快速失败
+    assert not breaker.allow_request()
+    assert breaker.rejected_calls == 1
+    assert breaker.retry_after() == 30.0
+
+    # 恢复时间后只放行一个探测请求
+    clock[0] += 30.0
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10.0)
+    breaker.allow_request()
+    breaker.record_failure()
+
+    clock[0] += 10.0
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN and breaker.times_opened == 2
+    assert breaker.retry_after() == 10.0
+
+
+def test_ignored_probe_returns_its_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10.0)
+    breaker.allow_request()
+    breaker.record_failure()
+    clock[0] += 10.0
+
+    assert breaker.allow_request()
+    breaker.record_ignored()
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_limiter_additive_increase():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+    # 每个请求增加 1/limit：2 → 2.5 → 2.9 → 3.24
+    for _ in range(2):
+        limiter.record(0.5)
+    assert limiter.limit == 2
+    limiter.record(0.5)
+    assert limiter.limit == 3
+    for _ in range(20):
+        limiter.record(0.5)
+    assert limiter.limit == 4
+    assert limiter.baseline_latency == 0.5
+
+
+def test_limiter_multiplicative_decrease():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, min_limit=2, max_limit=8, backoff_ratio=0.5)
+    limiter.record(0.5)
+
+    # 延迟超过基线×容忍倍数视为拥塞
+    limiter.record(2.0)
+    assert limiter.limit == 4
+    limiter.record(None, overloaded=True)
+    assert limiter.limit == 2
+    limiter.record(None)
+    assert limiter.limit == 2
+    assert limiter.decreases == 2
+
+
+def test_limiter_blocks_beyond_limit():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await limiter.release()
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
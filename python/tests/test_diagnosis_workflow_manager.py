@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""DiagnosisWorkflowManager 批量诊断测试"""
+
+import asyncio
+
+import numpy as np
+
+from ai_diagnosis_service import DiagnosisReport
+from diagnosis_workflow_manager import DiagnosisWorkflowManager
+
+
+def make_report(plant_id):
+    return DiagnosisReport(
+        id=f"diag_{plant_id}", plant_id=plant_id, timestamp='', original_image='',
+        mask_image=None, mask_prompt=None, markdown_report='', summary='', severity='low',
+        diseases=[], recommendations=[], ai_model='fake', confidence=0.9, processing_time=0.0
+    )
+
+
+class FakeDiagnosisService:
+    """按植株ID返回报告；missing 中的植株在批量结果里缺失"""
+
+    def __init__(self, missing=(), batch_error=None):
+        self.missing = set(missing)
+        self.batch_error = batch_error
+        self.batches = []
+        self.single = []
+
+    async def diagnose_batch(self, plants):
+        self.batches.append([plant_id for plant_id, _ in plants])
+        if self.batch_error:
+            raise self.batch_error
+        return [None if plant_id in self.missing else make_report(plant_id) for plant_id, _ in plants]
+
+    async def diagnose(self, plant_id, image_base64, **kwargs):
+        self.single.append(plant_id)
+        return make_report(plant_id)
+
+
+def make_manager(service, window=0.05, max_batch_size=2):
+    manager = DiagnosisWorkflowManager(batch_mode=True, batch_window_seconds=window, max_batch_size=max_batch_size)
+    manager.ai_diagnosis_service = service
+    manager.ai_config_manager.validate_vision_support = lambda: True
+    manager.unipixel_client = None
+    manager.local_segmentation = None
+    return manager
+
+
+FRAME = np.zeros((4, 4, 3), dtype=np.uint8)
+
+
+def diagnose_all(manager, plant_ids, timeout=2.0):
+    async def scenario():
+        tasks = [asyncio.ensure_future(manager.execute_diagnosis(plant_id, FRAME)) for plant_id in plant_ids]
+        return await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+
+    return asyncio.run(scenario())
+
+
+def test_full_batch_flushes_immediately_and_cancels_window_timer():
+    service = FakeDiagnosisService()
+    manager = make_manager(service, window=10.0, max_batch_size=2)
+
+    reports = diagnose_all(manager, [1, 2], timeout=1.0)
+    assert [report.plant_id for report in reports] == [1, 2]
+    assert service.batches == [[1, 2]]
+    assert manager._batch_flush_task is None
+
+
+def test_window_flushes_partial_batch_and_full_batch_is_not_cut_short():
+    service = FakeDiagnosisService()
+    manager = make_manager(service, window=0.2, max_batch_size=2)
+
+    async def scenario():
+        first = [asyncio.ensure_future(manager.execute_diagnosis(plant_id, FRAME)) for plant_id in (1, 2)]
+        await asyncio.gather(*first)
+        await asyncio.sleep(0.1)
+        # 满批提交时已取消第一批的计时器，下一批从加入起等待完整窗口
+        third = asyncio.ensure_future(manager.execute_diagnosis(3, FRAME))
+        await asyncio.sleep(0.15)
+        assert service.batches == [[1, 2]]
+        return await asyncio.wait_for(third, 1.0)
+
+    report = asyncio.run(scenario())
+    assert report.plant_id == 3
+    assert service.batches == [[1, 2], [3]]
+
+
+def test_missing_batch_results_fall_back_to_single_diagnosis():
+    service = FakeDiagnosisService(missing={2})
+    manager = make_manager(service, max_batch_size=3)
+
+    reports = diagnose_all(manager, [1, 2, 3])
+    assert [report.plant_id for report in reports] == [1, 2, 3]
+    assert service.single == [2]
+
+    service = FakeDiagnosisService(batch_error=RuntimeError("上游超时"))
+    manager = make_manager(service, max_batch_size=2)
+    reports = diagnose_all(manager, [4, 5])
+    assert [report.plant_id for report in reports] == [4, 5]
+    assert service.single == [4, 5]
+
+
+def test_error_after_batch_fails_waiters_instead_of_hanging():
+    service = FakeDiagnosisService()
+    manager = make_manager(service, max_batch_size=2)
+
+    async def broken_attach(batch, reports):
+        raise RuntimeError("遮罩下载失败")
+
+    manager._attach_batch_masks = broken_attach
+    errors = []
+    manager.set_progress_callback(lambda plant_id, stage, message, progress: stage == "error" and errors.append(plant_id))
+
+    assert diagnose_all(manager, [1, 2], timeout=1.0) == [None, None]
+    assert sorted(errors) == [1, 2]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""DroneBackendService 状态快照与排队增量的顺序测试"""
+
+import asyncio
+
+import pytest
+
+from message_codec import decode_incoming
+
+drone_backend = pytest.importorskip('drone_backend')
+
+
+class FakeClient:
+    def __init__(self):
+        self.received = []
+
+    async def send(self, message):
+        self.received.append(decode_incoming(message))
+
+    def seqs(self, msg_type):
+        return [m['seq'] for m in self.received if m['type'] == msg_type]
+
+
+@pytest.fixture(scope='module')
+def service():
+    return drone_backend.DroneBackendService()
+
+
+def connect(service, client):
+    service.connected_clients.add(client)
+    service.subscriptions.add(client)
+
+
+def test_resync_snapshot_drops_pending_older_patches(service):
+    async def scenario():
+        synced, other = FakeClient(), FakeClient()
+        connect(service, synced)
+        connect(service, other)
+        try:
+            service.drone_state['battery'] = 77
+            await service.broadcast_drone_status()  # 增量排队中，尚未发送
+
+            await service.handle_status_resync(synced, {'last_seq': 0})
+            snapshot_seq = synced.seqs('drone_status')[-1]
+            await service.message_bus.flush()
+
+            # 已收到快照的客户端不再收到序号不大于快照的增量，其他客户端照常收到
+            assert all(seq > snapshot_seq for seq in synced.seqs('drone_status_patch'))
+            assert other.seqs('drone_status_patch') == [snapshot_seq]
+
+            service.drone_state['battery'] = 76
+            await service.broadcast_drone_status()
+            await service.message_bus.flush()
+            assert synced.seqs('drone_status_patch') == [snapshot_seq + 1]
+        finally:
+            for client in (synced, other):
+                service.connected_clients.discard(client)
+                service.subscriptions.remove(client)
+                service.client_status_seq.pop(client, None)
+
+    asyncio.run(scenario())
+
+
+def test_resubscribe_snapshot_drops_pending_older_patches(service):
+    async def scenario():
+        client = FakeClient()
+        connect(service, client)
+        try:
+            await service.handle_subscribe(client, {'topics': ['mission']})
+            service.drone_state['battery'] = 55
+            await service.broadcast_drone_status()  # 客户端未订阅状态时排队的增量
+
+            await service.handle_subscribe(client, {'topics': ['status']})
+            snapshot_seq = client.seqs('drone_status')[-1]
+            await service.message_bus.flush()
+            assert all(seq > snapshot_seq for seq in client.seqs('drone_status_patch'))
+        finally:
+            service.connected_clients.discard(client)
+            service.subscriptions.remove(client)
+            service.client_status_seq.pop(client, None)
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_client_receives_final_status_of_a_burst(service):
+    async def scenario():
+        client = FakeClient()
+        connect(service, client)
+        try:
+            await service.handle_subscribe(client, {'topics': ['status'], 'max_rate': {'status': 10}})
+            for state in ('recording', 'saving', 'stopped'):
+                await service.broadcast_message('recording_status', {'state': state})
+                await service.message_bus.flush()
+            await asyncio.sleep(0.15)
+
+            states = [m['data']['state'] for m in client.received if m['type'] == 'recording_status']
+            assert states == ['recording', 'stopped']
+        finally:
+            service.connected_clients.discard(client)
+            service.subscriptions.remove(client)
+            service.client_status_seq.pop(client, None)
+
+    asyncio.run(scenario())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""飞行录制分块、中断恢复与回放模式测试"""
+
+import asyncio
+import json
+import types
+
+import numpy as np
+import pytest
+
+import flight_recorder
+from flight_recorder import FlightRecorder, FlightRecording, ReplayFrameSource, META_FILE
+
+
+def make_frame(index, shape=(4, 6, 3)):
+    return np.full(shape, index, dtype=np.uint8)
+
+
+def record(root, count, chunk_frames=3, stop=True, name='flight'):
+    recorder = FlightRecorder(str(root), chunk_frames=chunk_frames)
+    recorder.start(name=name)
+    for index in range(count):
+        recorder.record(make_frame(index), {'timestamp': 100.0 + index * 0.5, 'battery': 90, 'height': index})
+    return recorder, recorder.stop() if stop else str(recorder.path)
+
+
+def test_chunks_roll_over_when_full_or_resolution_changes(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), chunk_frames=3)
+    recorder.start(name='flight')
+    for index in range(7):
+        recorder.record(make_frame(index))
+    recorder.record(make_frame(7, shape=(2, 2, 3)))
+    path = recorder.stop()
+
+    meta = json.loads((tmp_path / 'flight' / META_FILE).read_text(encoding='utf-8'))
+    assert [chunk['count'] for chunk in meta['chunks']] == [3, 3, 1, 1]
+    assert meta['total_frames'] == 8
+
+    recording = FlightRecording(path)
+    assert len(recording) == 8
+    assert [int(recording.frame(index)[0, 0, 0]) for index in range(8)] == list(range(8))
+    assert recording.frame(7).shape == (2, 2, 3)
+
+
+def test_interrupted_recording_recovers_frame_count(tmp_path):
+    recorder, path = record(tmp_path, 4, chunk_frames=3, stop=False)
+    # 模拟进程中断：最后一个分块已写入数据但 meta.json 中的帧数仍为空
+    recorder._frames.flush()
+    recorder._telemetry.flush()
+    meta = json.loads((tmp_path / 'flight' / META_FILE).read_text(encoding='utf-8'))
+    assert meta['chunks'][-1]['count'] is None
+
+    recording = FlightRecording(path)
+    assert len(recording) == 4
+    assert recording.telemetry(3)['height'] == 3
+
+
+def test_telemetry_lines_up_with_frames(tmp_path):
+    _, path = record(tmp_path, 5)
+    recording = FlightRecording(path)
+    for index, (frame, telemetry) in enumerate(recording):
+        assert int(frame[0, 0, 0]) == telemetry['height'] == index
+        assert telemetry['timestamp'] == 100.0 + index * 0.5
+        assert telemetry['mission_pad'] == -1
+    assert recording.duration == 2.0
+
+
+def test_fast_mode_advances_on_every_read(tmp_path):
+    _, path = record(tmp_path, 3)
+    source = ReplayFrameSource(FlightRecording(path), mode='fast')
+
+    assert [int(source.frame[0, 0, 0]) for _ in range(3)] == [0, 1, 2]
+    assert source.telemetry['height'] == 2
+    assert source.frame is None and source.finished
+    assert source.frames_served == 3
+
+
+def test_step_mode_only_advances_on_step(tmp_path):
+    _, path = record(tmp_path, 3)
+    source = ReplayFrameSource(FlightRecording(path), mode='step')
+
+    assert int(source.frame[0, 0, 0]) == 0
+    assert int(source.frame[0, 0, 0]) == 0
+    source.step(2)
+    assert int(source.frame[0, 0, 0]) == 2
+    source.step()
+    assert source.frame is None and source.finished
+
+
+def test_realtime_mode_follows_timestamps_and_loops(tmp_path, monkeypatch):
+    _, path = record(tmp_path, 5)  # 时间戳间隔0.5秒，时长2秒
+    now = [0.0]
+    monkeypatch.setattr(flight_recorder, 'time', types.SimpleNamespace(time=lambda: now[0]))
+
+    source = ReplayFrameSource(FlightRecording(path), mode='realtime', speed=2.0, loop=True)
+    played = []
+    for _ in range(6):
+        played.append(int(source.frame[0, 0, 0]))
+        now[0] += 0.25  # 2倍速：每次前进0.5秒录制时间
+    assert played == [0, 1, 2, 3, 0, 1]
+    assert not source.finished
+
+    once = ReplayFrameSource(FlightRecording(path), mode='realtime')
+    assert int(once.frame[0, 0, 0]) == 0
+    now[0] += 3.0
+    assert once.frame is None and once.finished
+
+
+def test_replay_paths_are_confined_to_recordings_dir(tmp_path):
+    root = tmp_path / 'recordings'
+    _, saved_path = record(root, 2)
+    recorder = FlightRecorder(str(root))
+
+    assert recorder.resolve_recording('flight') == (root / 'flight').resolve()
+    assert recorder.resolve_recording(saved_path) == (root / 'flight').resolve()
+
+    _, outside = record(tmp_path / 'elsewhere', 2)
+    for name in ('', '.', '../elsewhere/flight', outside, '/etc'):
+        with pytest.raises(ValueError):
+            recorder.resolve_recording(name)
+
+    with pytest.raises(ValueError):
+        recorder.start(name='../escape')
+    assert not (tmp_path / 'escape').exists()
+
+
+def test_backend_rejects_replay_outside_recordings_dir(tmp_path):
+    drone_backend = pytest.importorskip('drone_backend')
+    _, outside = record(tmp_path / 'elsewhere', 2)
+    service = drone_backend.DroneBackendService(recordings_dir=str(tmp_path / 'recordings'))
+
+    class FakeClient:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, message):
+            self.sent.append(message)
+
+    client = FakeClient()
+    asyncio.run(service.handle_start_replay(client, {'path': outside, 'mode': 'fast'}))
+    assert service.replay_source is None
+    assert len(client.sent) == 1 and '回放失败' in client.sent[0]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""FrameStore 引用计数与 FrameHTTPServer 测试"""
+
+import asyncio
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+import frame_store
+from frame_store import FrameStore, FrameHTTPServer
+
+
+def make_frame(value=0):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_referenced_frames_are_not_evicted():
+    store = FrameStore(max_frames=2)
+    held = store.put(make_frame(1))
+    for value in range(2, 6):
+        store.release(store.put(make_frame(value)).frame_id)
+    assert store.get(held.frame_id) is not None
+
+    store.release(held.frame_id)
+    for value in range(6, 9):
+        store.release(store.put(make_frame(value)).frame_id)
+    assert store.get(held.frame_id) is None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(not frame_store.AIOHTTP_AVAILABLE, reason="需要aiohttp")
+def test_http_server_encodes_png_off_the_event_loop(monkeypatch):
+    import aiohttp
+
+    encode_threads = []
+    original = frame_store.encode_png_rgb
+
+    def recording_encoder(frame):
+        encode_threads.append(threading.current_thread())
+        return original(frame)
+
+    monkeypatch.setattr(frame_store, 'encode_png_rgb', recording_encoder)
+
+    async def run():
+        store = FrameStore()
+        buffer = store.put(make_frame(128))
+        server = FrameHTTPServer(store, port=free_port())
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(server.url_for(buffer.frame_id)) as response:
+                    assert response.status == 200
+                    assert response.content_type == 'image/png'
+                    body = await response.read()
+                async with session.get(server.url_for('missing')) as response:
+                    assert response.status == 404
+        finally:
+            await server.stop()
+        return body
+
+    body = asyncio.run(run())
+    assert body.startswith(b'\x89PNG')
+    assert encode_threads and encode_threads[0] is not threading.main_thread()
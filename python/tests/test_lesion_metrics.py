@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""病斑指标写入诊断报告测试"""
+
+import numpy as np
+
+from ai_diagnosis_service import DiagnosisReport
+from diagnosis_workflow_manager import DiagnosisWorkflowManager
+from mask_analytics import analyze_mask
+
+
+def make_report(severity):
+    return DiagnosisReport(
+        id='r1', plant_id=1, timestamp='', original_image='', mask_image=None, mask_prompt=None,
+        markdown_report='', summary='', severity=severity, diseases=[], recommendations=[],
+        ai_model='test', confidence=0.9, processing_time=0.0
+    )
+
+
+def test_measured_severity_does_not_override_ai_severity():
+    # 病斑只占整帧的一小部分，但可能占植株的大部分
+    mask = np.zeros((100, 100), dtype=bool)
+    mask[:10, :10] = True
+    metrics = analyze_mask(mask)
+
+    report = make_report('high')
+    DiagnosisWorkflowManager()._apply_lesion_metrics(report, metrics)
+
+    assert report.severity == 'high'
+    assert report.measured_severity == metrics.measured_severity == 'low'
+    assert report.lesion_metrics['area_ratio'] == metrics.area_ratio
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""遮罩编解码往返与二值化测试"""
+
+import numpy as np
+import pytest
+
+from mask_codec import (
+    binarize_mask, bitpack_decode, bitpack_encode, decode_masks, encode_masks,
+    rle_decode, rle_encode, union_mask
+)
+
+
+def sample_masks():
+    rng = np.random.default_rng(0)
+    partial = np.zeros((2, 7, 9), dtype=bool)
+    partial[0, 1:4, 2:6] = True
+    partial[1, :, 0] = True
+    return {
+        'empty': np.zeros((2, 7, 9), dtype=bool),
+        'full': np.ones((2, 7, 9), dtype=bool),
+        'partial': partial,
+        'random': rng.random((3, 5, 11)) > 0.5,
+    }
+
+
+@pytest.mark.parametrize('name', list(sample_masks()))
+def test_rle_round_trip(name):
+    mask = sample_masks()[name]
+    for frame in mask:
+        rle = rle_encode(frame)
+        assert sum(rle['counts']) == frame.size
+        assert np.array_equal(rle_decode(rle), frame)
+
+
+def test_rle_counts_start_with_background_run():
+    assert rle_encode(np.ones((2, 2), dtype=bool))['counts'] == [0, 4]
+    assert rle_encode(np.zeros((2, 2), dtype=bool))['counts'] == [4]
+
+
+@pytest.mark.parametrize('name', list(sample_masks()))
+def test_bitpack_round_trip(name):
+    mask = sample_masks()[name]
+    packed = bitpack_encode(mask)
+    assert packed['shape'] == list(mask.shape)
+    assert np.array_equal(bitpack_decode(packed), mask)
+
+
+@pytest.mark.parametrize('mask_format', ['rle', 'bitpack'])
+def test_encode_decode_masks(mask_format):
+    masks = list(sample_masks().values())
+    decoded = decode_masks(encode_masks(masks, mask_format), mask_format)
+    for original, result in zip(masks, decoded):
+        assert np.array_equal(original, result)
+
+
+def test_unknown_format_rejected():
+    with pytest.raises(ValueError):
+        encode_masks([], 'overlay')
+    with pytest.raises(ValueError):
+        decode_masks([], 'png')
+
+
+def test_binarize_uses_dtype_not_value_range():
+    # 全0/全1的概率图不会因数值范围改变阈值
+    assert not binarize_mask(np.zeros((2, 2), dtype=np.float32)).any()
+    assert binarize_mask(np.ones((2, 2), dtype=np.float32)).all()
+    assert not binarize_mask(np.full((2, 2), 0.3), threshold=0.5).any()
+    assert binarize_mask(np.full((2, 2), 0.7), threshold=0.5).all()
+
+    logits = np.array([[-2.0, 0.0], [0.5, 3.0]])
+    assert binarize_mask(logits).tolist() == [[False, False], [True, True]]
+
+    assert binarize_mask(np.array([[0, 1], [255, 0]], dtype=np.uint8)).tolist() == [[False, True], [True, False]]
+    flags = np.array([True, False])
+    assert binarize_mask(flags) is flags
+
+
+def test_union_mask():
+    assert union_mask([]) is None
+    a = np.array([True, False, False])
+    b = np.array([False, False, True])
+    assert union_mask([a, b]).tolist() == [True, False, True]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""出站消息总线的优先级、合并与限速测试"""
+
+import asyncio
+
+from message_bus import MessageBus, MessagePolicy, PRIORITY_CONTROL, PRIORITY_EVENT, coalesce_by, coalesce_latest
+
+
+def make_bus(policies=None):
+    sent = []
+
+    async def sink(payload):
+        sent.append(payload)
+
+    return MessageBus(sink, policies), sent
+
+
+def message(msg_type, **data):
+    return {'type': msg_type, 'data': data}
+
+
+def test_higher_priority_lanes_are_sent_first():
+    bus, sent = make_bus()
+    bus.publish('video_frame', message('video_frame', frame=1))
+    bus.publish('qr_detected', message('qr_detected', qr_id='a'))
+    bus.publish('drone_status_patch', {'type': 'drone_status_patch', 'seq': 1, 'data': []})
+    bus.publish('error', message('error', message='x'))
+
+    assert asyncio.run(bus.flush()) == 4
+    assert [m['type'] for m in sent] == ['error', 'drone_status_patch', 'qr_detected', 'video_frame']
+
+
+def test_coalesced_message_keeps_its_queue_position():
+    bus, sent = make_bus()
+    bus.publish('diagnosis_progress', message('diagnosis_progress', plant_id='P1', progress=10))
+    bus.publish('diagnosis_progress', message('diagnosis_progress', plant_id='P2', progress=10))
+    assert bus.publish('diagnosis_progress', message('diagnosis_progress', plant_id='P1', progress=50))
+
+    asyncio.run(bus.flush())
+    assert [(m['data']['plant_id'], m['data']['progress']) for m in sent] == [('P1', 50), ('P2', 10)]
+    assert bus.coalesced == 1
+
+
+def test_uncoalesced_messages_are_sent_in_order():
+    bus, sent = make_bus()
+    for seq in range(1, 6):
+        bus.publish('drone_status_patch', {'type': 'drone_status_patch', 'seq': seq, 'data': []})
+    asyncio.run(bus.flush())
+    assert [m['seq'] for m in sent] == [1, 2, 3, 4, 5]
+
+
+def test_snapshot_supersedes_pending_patches():
+    bus, sent = make_bus()
+    bus.publish('drone_status_patch', {'type': 'drone_status_patch', 'seq': 1, 'data': []})
+    bus.publish('drone_status_patch', {'type': 'drone_status_patch', 'seq': 2, 'data': []})
+    bus.publish('drone_status', {'type': 'drone_status', 'seq': 3, 'data': {}})
+    bus.publish('drone_status_patch', {'type': 'drone_status_patch', 'seq': 4, 'data': []})
+
+    asyncio.run(bus.flush())
+    assert [(m['type'], m['seq']) for m in sent] == [('drone_status', 3), ('drone_status_patch', 4)]
+    assert bus.superseded == 2
+
+
+def test_min_interval_holds_latest_until_due():
+    policies = {'cooldown': MessagePolicy(PRIORITY_EVENT, coalesce_by('plant_id'), min_interval=60.0)}
+    bus, sent = make_bus(policies)
+    bus.publish('cooldown', message('cooldown', plant_id='P1', remaining=30))
+    asyncio.run(bus.flush())
+    bus.publish('cooldown', message('cooldown', plant_id='P1', remaining=29))
+    bus.publish('cooldown', message('cooldown', plant_id='P1', remaining=28))
+
+    # 限速中的消息保留在队列，且只保留最新一条
+    assert asyncio.run(bus.flush()) == 0
+    assert bus.pending == 1
+    assert [m['data']['remaining'] for m in sent] == [30]
+
+
+def test_running_bus_delivers_and_reports_statistics():
+    policies = {'tick': MessagePolicy(PRIORITY_CONTROL, coalesce_latest)}
+
+    async def scenario():
+        bus, sent = make_bus(policies)
+        bus.start()
+        bus.publish('tick', message('tick', n=1))
+        bus.publish('other', message('other'))
+        await asyncio.sleep(0.05)
+        await bus.stop()
+        return bus, sent
+
+    bus, sent = asyncio.run(scenario())
+    assert [m['type'] for m in sent] == ['tick', 'other']
+    stats = bus.get_statistics()
+    assert stats['sent'] == 2 and stats['pending'] == 0
+    assert stats['sent_by_type'] == {'tick': 1, 'other': 1}
+
+
+def test_sink_errors_are_counted_and_do_not_stop_the_bus():
+    async def failing_sink(payload):
+        raise RuntimeError('closed')
+
+    bus = MessageBus(failing_sink)
+    bus.publish('error', message('error'))
+    assert asyncio.run(bus.flush()) == 1
+    assert bus.send_errors == 1 and bus.sent == 0
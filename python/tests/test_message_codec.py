@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""WebSocket消息编解码测试"""
+
+import json
+import math
+
+import numpy as np
+import pytest
+
+import message_codec
+from message_codec import (
+    EmbeddedImage, JSONCodec, MessageSchema, available_backends, decode_incoming, encode_for,
+    negotiate, select_subprotocol, ENCODING_JSON, ENCODING_MSGPACK, JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL
+)
+
+BACKENDS = available_backends()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_round_trip_matches_stdlib(backend):
+    codec = JSONCodec(backend)
+    payload = {'type': 'status_update', 'timestamp': '2024-01-01T00:00:00', 'data': {
+        'text': '植株 P-1 "引号" \\ 换行\n', 'count': 3, 'ratio': 0.25, 'nested': {'ok': True, 'none': None},
+        'items': [1, 2.5, 'a'], 1: 'int key'
+    }}
+    encoded = codec.encode_message(payload)
+    assert json.loads(encoded) == json.loads(json.dumps(payload, ensure_ascii=False))
+    assert codec.loads(encoded)['data']['text'] == payload['data']['text']
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_non_finite_floats_encode_as_null(backend):
+    codec = JSONCodec(backend)
+    payload = {'type': 'x', 'data': {
+        'nan': float('nan'), 'inf': float('inf'), 'ninf': -math.inf, 'np': np.float32('nan'),
+        'list': [1.0, float('nan')], 'finite': 1.5
+    }}
+    decoded = json.loads(codec.dumps(payload))  # 严格JSON，标准库也能解析
+    assert decoded['data'] == {'nan': None, 'inf': None, 'ninf': None, 'np': None, 'list': [1.0, None], 'finite': 1.5}
+
+
+def test_non_finite_output_is_identical_across_backends():
+    payload = {'type': 'x', 'data': {'value': float('nan'), 'values': [float('inf'), 2]}}
+    outputs = {backend: json.loads(JSONCodec(backend).dumps(payload)) for backend in BACKENDS}
+    assert len({json.dumps(value, sort_keys=True) for value in outputs.values()}) == 1
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_schema_output_matches_generic_encoding(backend):
+    codec = JSONCodec(backend)
+    payload = {'type': 'video_frame', 'seq': 3, 'data': {'frame': 'data:image/jpeg;base64,QUJD'}}
+    encoded = codec.encode_message(payload)
+    assert encoded.startswith('{"type":"video_frame","data":{"frame":"data:image/jpeg;base64,QUJD"}')
+    assert json.loads(encoded) == payload
+
+
+@pytest.mark.parametrize('value', ['a"b', 'a\\b', 'line\nbreak', 'tab\there', 'nul\x00', 'esc\x1b'])
+def test_trusted_field_with_escapable_characters_is_escaped(value):
+    schema = MessageSchema('video_frame', ('frame',), trusted_fields=('frame',))
+    encoded = schema.encode({'type': 'video_frame', 'data': {'frame': value}}, json.dumps)
+    assert json.loads(encoded)['data']['frame'] == value
+
+
+def test_schema_mismatch_falls_back():
+    schema = MessageSchema('video_frame', ('frame',))
+    assert schema.encode({'type': 'video_frame', 'data': {'frame': 'x', 'extra': 1}}, json.dumps) is None
+
+
+def test_embedded_image_json_and_msgpack():
+    image = EmbeddedImage(b'\xff\xd8jpeg')
+    payload = {'type': 'video_frame', 'data': {'frame': image}}
+
+    text = encode_for(ENCODING_JSON, payload)
+    assert json.loads(text)['data']['frame'] == image.to_text()
+    assert image.to_text().startswith('data:image/jpeg;base64,')
+
+    if not message_codec.MSGPACK_AVAILABLE:
+        pytest.skip('msgpack未安装')
+    packed = encode_for(ENCODING_MSGPACK, payload)
+    assert isinstance(packed, bytes)
+    assert decode_incoming(packed)['data']['frame'] == b'\xff\xd8jpeg'
+
+
+def test_decode_incoming_text_and_invalid_binary():
+    assert decode_incoming('{"type":"heartbeat"}') == {'type': 'heartbeat'}
+    with pytest.raises(ValueError):
+        decode_incoming(b'\xc1')
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_invalid_text_message_raises_value_error(backend, monkeypatch):
+    monkeypatch.setattr(message_codec, '_default_codec', JSONCodec(backend))
+    with pytest.raises(ValueError):
+        decode_incoming('{"type": ')
+
+
+def test_backend_specific_decode_errors_become_value_error(monkeypatch):
+    class DecodeError(Exception):
+        """与 msgspec.DecodeError 一样不是 ValueError 的子类"""
+
+    class StrictCodec:
+        def loads(self, data):
+            raise DecodeError("truncated")
+
+    monkeypatch.setattr(message_codec, '_default_codec', StrictCodec())
+    with pytest.raises(ValueError, match='truncated'):
+        decode_incoming('{"type": ')
+
+
+def test_negotiation_and_subprotocol_selection():
+    assert negotiate('unknown') == ENCODING_JSON
+    assert negotiate(ENCODING_JSON) == ENCODING_JSON
+    # 新版参数 (connection, 客户端子协议)，旧版参数 (客户端子协议, 服务端子协议)
+    assert select_subprotocol(object(), []) is None
+    assert select_subprotocol(object(), [JSON_SUBPROTOCOL]) == JSON_SUBPROTOCOL
+    assert select_subprotocol([JSON_SUBPROTOCOL], [JSON_SUBPROTOCOL]) == JSON_SUBPROTOCOL
+    if message_codec.MSGPACK_AVAILABLE:
+        assert negotiate(ENCODING_MSGPACK) == ENCODING_MSGPACK
+        assert select_subprotocol(object(), [JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL]) == MSGPACK_SUBPROTOCOL
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""离线批量诊断断点续跑、内容哈希去重与索引测试"""
+
+import asyncio
+import base64
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from offline_batch_diagnosis import OfflineBatchDiagnosis
+from unipixel_client import UnipixelResult
+
+
+MASK_BASE64 = base64.b64encode(
+    cv2.imencode('.png', np.zeros((4, 4), dtype=np.uint8))[1].tobytes()
+).decode('utf-8')
+
+
+def write_image(path, value):
+    image = np.full((8, 8, 3), value, dtype=np.uint8)
+    assert cv2.imwrite(str(path), image)
+    return path
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """替换二维码识别和分割阶段，记录调用并可指定失败的图像"""
+    state = {'qr_calls': 0, 'segment_calls': 0, 'fail_values': set()}
+
+    def fake_detect_qr(self, image):
+        state['qr_calls'] += 1
+        return [{'data': 'plant', 'bbox': [], 'plant_id': int(image[0, 0, 0])}]
+
+    async def fake_segment(self, image_base64, mask_prompt):
+        state['segment_calls'] += 1
+        image = cv2.imdecode(
+            np.frombuffer(base64.b64decode(image_base64.split(',', 1)[1]), dtype=np.uint8),
+            cv2.IMREAD_COLOR
+        )
+        if int(image[0, 0, 0]) in state['fail_values']:
+            raise RuntimeError("分割服务不可用")
+        return UnipixelResult(mask_base64=MASK_BASE64, description="", success=True)
+
+    monkeypatch.setattr(OfflineBatchDiagnosis, '_detect_qr', fake_detect_qr)
+    monkeypatch.setattr(OfflineBatchDiagnosis, '_segment', fake_segment)
+    return state
+
+
+def make_engine(output_dir, **kwargs):
+    return OfflineBatchDiagnosis(str(output_dir), unipixel_endpoint=None, **kwargs)
+
+
+def read_records(output_dir):
+    with open(output_dir / 'results.jsonl', 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_second_run_skips_done_items(tmp_path, stages):
+    images, output = tmp_path / 'images', tmp_path / 'out'
+    images.mkdir()
+    write_image(images / 'a.png', 10)
+    write_image(images / 'b.png', 20)
+
+    first = asyncio.run(make_engine(output).run([str(images)]))
+    assert first['last_run']['counts']['done'] == 2
+    assert stages['segment_calls'] == 2
+
+    engine = make_engine(output)
+    second = asyncio.run(engine.run([str(images)]))
+
+    assert engine.counts == {'done': 0, 'failed': 0, 'no_plant_id': 0, 'skipped': 2}
+    assert stages['qr_calls'] == 2
+    assert stages['segment_calls'] == 2
+    assert len(read_records(output)) == 2
+    assert second['total'] == 2
+    assert second['status_counts'] == {'done': 2}
+    assert second['plants'].keys() == {'10', '20'}
+
+
+def test_second_run_retries_failed_items(tmp_path, stages):
+    images, output = tmp_path / 'images', tmp_path / 'out'
+    images.mkdir()
+    write_image(images / 'a.png', 10)
+    write_image(images / 'b.png', 20)
+
+    stages['fail_values'] = {20}
+    first = asyncio.run(make_engine(output).run([str(images)]))
+    assert first['status_counts'] == {'done': 1, 'failed': 1}
+    failed = next(item for item in first['items'] if item['status'] == 'failed')
+    assert failed['error'] == "分割服务不可用"
+
+    stages['fail_values'] = set()
+    engine = make_engine(output)
+    second = asyncio.run(engine.run([str(images)]))
+
+    assert engine.counts == {'done': 1, 'failed': 0, 'no_plant_id': 0, 'skipped': 1}
+    assert stages['segment_calls'] == 3
+    # 同一哈希的新记录覆盖旧的失败记录
+    assert len(read_records(output)) == 3
+    assert second['total'] == 2
+    assert second['status_counts'] == {'done': 2}
+
+
+def test_failed_items_skipped_without_retry(tmp_path, stages):
+    images, output = tmp_path / 'images', tmp_path / 'out'
+    images.mkdir()
+    write_image(images / 'a.png', 10)
+
+    stages['fail_values'] = {10}
+    asyncio.run(make_engine(output).run([str(images)]))
+
+    stages['fail_values'] = set()
+    engine = make_engine(output, retry_failed=False)
+    index = asyncio.run(engine.run([str(images)]))
+
+    assert engine.counts['skipped'] == 1
+    assert stages['segment_calls'] == 1
+    assert index['status_counts'] == {'failed': 1}
+
+
+def test_duplicate_image_in_same_run_processed_once(tmp_path, stages):
+    images, output = tmp_path / 'images', tmp_path / 'out'
+    images.mkdir()
+    write_image(images / 'a.png', 10)
+    (images / 'copy.png').write_bytes((images / 'a.png').read_bytes())
+
+    engine = make_engine(output)
+    index = asyncio.run(engine.run([str(images)]))
+
+    assert engine.counts == {'done': 1, 'failed': 0, 'no_plant_id': 0, 'skipped': 1}
+    assert stages['qr_calls'] == 1
+    assert stages['segment_calls'] == 1
+    assert len(read_records(output)) == 1
+    assert index['total'] == 1
+    assert index['items'][0]['source'].endswith('a.png')
+
+
+def test_half_written_last_line_is_ignored(tmp_path, stages):
+    images, output = tmp_path / 'images', tmp_path / 'out'
+    images.mkdir()
+    write_image(images / 'a.png', 10)
+    write_image(images / 'b.png', 20)
+
+    asyncio.run(make_engine(output).run([str(images / 'a.png')]))
+    with open(output / 'results.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"content_hash": "deadbeef", "status": "do')
+
+    engine = make_engine(output)
+    assert list(engine._checkpoint.values()) == ['done']
+    assert engine.build_index()['total'] == 1
+
+    # 续跑时跳过已完成项，只处理新图像
+    index = asyncio.run(engine.run([str(images)]))
+    assert engine.counts['done'] == 1
+    assert engine.counts['skipped'] == 1
+    assert stages['segment_calls'] == 2
+    assert index['total'] == 2
+    assert index['status_counts'] == {'done': 2}
+    # 截断后新记录不会与不完整的末行拼接
+    assert [r['status'] for r in read_records(output)] == ['done', 'done']
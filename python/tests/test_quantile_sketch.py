@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""DDSketch 分位数误差与滚动窗口测试"""
+
+import math
+import random
+
+import pytest
+
+from quantile_sketch import DDSketch, RollingSketch, WindowedSketch, resolve_window
+
+QS = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999)
+
+
+def lognormal_values(count=20000, seed=1):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(2.0, 1.5) for _ in range(count)]
+
+
+@pytest.mark.parametrize('accuracy', [0.01, 0.05])
+def test_quantiles_within_relative_error_bound(accuracy):
+    values = lognormal_values()
+    sketch = DDSketch(accuracy)
+    for value in values:
+        sketch.add(value)
+
+    ordered = sorted(values)
+    for q, estimate in zip(QS, sketch.quantiles(QS)):
+        expected = ordered[int(math.floor(q * (len(ordered) - 1)))]
+        assert abs(estimate - expected) <= accuracy * expected * (1 + 1e-9), q
+
+
+def test_exact_count_min_max_mean():
+    values = lognormal_values(1000)
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    stats = sketch.get_stats()
+    assert stats['count'] == 1000
+    assert stats['min'] == min(values) and stats['max'] == max(values)
+    assert stats['mean'] == pytest.approx(sum(values) / len(values))
+    assert sketch.quantile(0) == min(values) and sketch.quantile(1) == max(values)
+
+
+def test_empty_and_zero_values():
+    sketch = DDSketch()
+    assert sketch.quantile(0.5) is None
+    assert sketch.get_stats() == {}
+    for value in (0.0, 0.0, 0.0, 5.0):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == 5.0
+
+
+def test_merge_equals_single_sketch_and_serialization_round_trip():
+    values = lognormal_values(5000)
+    whole, left, right = DDSketch(), DDSketch(), DDSketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index % 2 else right).add(value)
+    left.merge(right)
+    assert left.quantiles(QS) == whole.quantiles(QS)
+    assert left.count == whole.count
+
+    restored = DDSketch.from_dict(whole.to_dict())
+    assert restored.quantiles(QS) == whole.quantiles(QS)
+    assert restored.get_stats() == whole.get_stats()
+
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch.from_dict({**whole.to_dict(), 'relative_accuracy': 0.02}))
+
+
+def test_bin_limit_keeps_high_quantiles_accurate():
+    sketch = DDSketch(0.01, max_bins=64)
+    values = [10 ** (i / 100) for i in range(900)]  # 覆盖9个数量级
+    for value in values:
+        sketch.add(value)
+    assert len(sketch.bins) <= 64
+    ordered = sorted(values)
+    expected = ordered[int(0.99 * (len(ordered) - 1))]
+    assert abs(sketch.quantile(0.99) - expected) <= 0.01 * expected * (1 + 1e-9)
+
+
+def test_rolling_window_drops_old_slices():
+    rolling = RollingSketch(slice_seconds=10.0, slices=6)
+    for second in range(60):
+        rolling.add(1.0 if second < 30 else 100.0, now=second)
+
+    recent = rolling.window(20.0, now=59.0)
+    assert recent.count == 20 and recent.min == 100.0
+    assert rolling.window(60.0, now=59.0).count == 60
+    # 超出保留范围的时间片被丢弃
+    assert rolling.window(60.0, now=89.0).count == 30
+    assert rolling.span == 60.0
+
+
+def test_windowed_sketch_selects_ring_by_window():
+    sketch = WindowedSketch()
+    for second in range(0, 600, 5):
+        sketch.add(float(second), now=float(second))
+
+    assert sketch.window(None).count == 120
+    assert sketch.window(60.0, now=599.0).count == 12
+    assert sketch.window(300.0, now=599.0).count == 60
+    assert sketch.window(7200.0, now=599.0).count == 120
+    sketch.clear()
+    assert sketch.window(None).count == 0
+
+
+def test_resolve_window():
+    assert resolve_window(None) is None
+    assert resolve_window('5m') == 300.0
+    assert resolve_window(42) == 42
+    with pytest.raises(ValueError):
+        resolve_window('2d')
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""StatusCache 差异检测与 VersionedStatus 测试"""
+
+import copy
+import random
+
+from status_cache import StatusCache, VersionedStatus, FieldChange, MISSING
+
+THRESHOLDS = {'battery': 1, 'temperature': 1, 'height': 5, 'position': 2}
+
+
+def reference_significant(old_status, new_status):
+    """逐层比较完整状态的原始规则"""
+    for key in set(old_status) | set(new_status):
+        old_value = old_status.get(key)
+        new_value = new_status.get(key)
+        if old_value == new_value:
+            continue
+        if key in THRESHOLDS:
+            if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)):
+                if abs(new_value - old_value) >= THRESHOLDS[key]:
+                    return True
+            else:
+                return True
+        elif key in ('connected', 'flying', 'state'):
+            return True
+        elif isinstance(old_value, dict) and isinstance(new_value, dict):
+            if reference_significant(old_value, new_value):
+                return True
+    return False
+
+
+def make_status(rng, previous=None):
+    status = copy.deepcopy(previous) if previous else {
+        'drone_status': {
+            'connected': True, 'flying': False, 'battery': 90, 'temperature': 40, 'height': 0,
+            'speed': {'x': 0, 'y': 0, 'z': 0}, 'position': {'x': 0, 'y': 0, 'z': 0},
+            'wifi_signal': 80, 'flight_time': 0, 'timestamp': '0'
+        },
+        'bridge_status': {'connected_to_drone_backend': True, 'sync_count': 0},
+        'statistics': {'total_updates': 0}
+    }
+    drone = status['drone_status']
+    drone['timestamp'] = str(rng.random())
+    status['statistics']['total_updates'] += 1
+    field = rng.choice(['battery', 'temperature', 'height', 'position', 'speed', 'flying', 'wifi_signal', 'sync'])
+    if field in ('position', 'speed'):
+        drone[field][rng.choice('xyz')] += rng.choice([-1, 1])
+    elif field == 'flying':
+        if rng.random() < 0.05:
+            drone['flying'] = not drone['flying']
+    elif field == 'sync':
+        status['bridge_status']['sync_count'] += 1
+    else:
+        drone[field] += rng.choice([-1, 0, 1, 2])
+    return status
+
+
+def test_significance_matches_full_status_comparison():
+    rng = random.Random(7)
+    cache = StatusCache(min_broadcast_interval=0.0, cache_ttl=1e9, record_telemetry=False)
+    baseline = None
+    status = None
+    mismatches = 0
+
+    for _ in range(6000):
+        status = make_status(rng, status)
+        _, has_change = cache.update(status)
+        if baseline is None:
+            expected = True
+        else:
+            expected = reference_significant(baseline, status)
+        mismatches += has_change != expected
+        if expected:
+            baseline = copy.deepcopy(status)
+
+    assert mismatches == 0
+
+
+def test_position_threshold_applies_to_the_dict_not_each_axis():
+    cache = StatusCache(min_broadcast_interval=0.0, record_telemetry=False)
+    status = {'drone_status': {'position': {'x': 0, 'y': 0}, 'speed': {'x': 0}, 'battery': 50}}
+    cache.update(status)
+
+    # position 中任一分量变化都显著
+    status = copy.deepcopy(status)
+    status['drone_status']['position']['x'] = 1
+    assert cache.update(status) == (True, True)
+
+    # speed 未配置阈值，分量变化不显著；battery 低于阈值
+    status = copy.deepcopy(status)
+    status['drone_status']['speed']['x'] = 5
+    status['drone_status']['battery'] = 50.5
+    assert cache.update(status)[1] is False
+
+
+def test_versioned_status_tracks_dirty_fields_with_typed_records():
+    record = VersionedStatus()
+    record.replace({'a': {'b': 1}, 'c': 2})
+    record.commit()
+
+    assert record.set(('a', 'b'), 2)
+    assert not record.set(('c',), 2)
+    assert record.dirty_changes() == {('a', 'b'): FieldChange(1, 2)}
+    field = record.field_record(('a', 'b'))
+    assert field.dirty and field.committed == 1 and field.version == record.version
+
+    # 变回已提交的值不再是脏字段
+    record.set(('a', 'b'), 1)
+    assert record.dirty_fields == []
+
+    record.remove(('c',))
+    assert record.dirty_changes() == {('c',): FieldChange(2, MISSING)}
+    assert record.commit() == [('c',)]
+    assert not record.field_record(('c',)).dirty
+    assert record.snapshot() == {'a': {'b': 1}}
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""StatusManager 推送状态的变化检测与自适应轮询测试"""
+
+import asyncio
+import types
+
+import pytest
+
+import status_manager
+from status_manager import StatusManager
+
+
+def climb(manager, step=3, top=297):
+    broadcasts = []
+    manager.subscribe(lambda status: broadcasts.append(status['drone_status']['height']))
+
+    async def run():
+        await manager.push_drone_status({'connected': True, 'height': 0})
+        for height in range(step, top + 1, step):
+            await manager.push_drone_status({'height': height})
+
+    asyncio.run(run())
+    return broadcasts
+
+
+@pytest.mark.parametrize('enable_cache', [False, True])
+def test_slow_climb_is_broadcast(enable_cache):
+    manager = StatusManager(enable_cache=enable_cache, cache_config={'min_broadcast_interval': 0.0})
+    heights = climb(manager)
+
+    # 高度阈值10cm：每累积超过阈值就广播一次，而不是只在首包广播
+    assert len(heights) >= 297 // 12
+    assert heights[-1] >= 297 - manager.change_threshold['height']
+    assert all(b - a >= manager.change_threshold['height'] for a, b in zip(heights[1:], heights[2:]))
+
+
+def test_small_jitter_is_not_broadcast():
+    manager = StatusManager(enable_cache=False)
+    broadcasts = []
+    manager.subscribe(broadcasts.append)
+
+    async def run():
+        await manager.push_drone_status({'connected': True, 'height': 100})
+        for height in (101, 99, 102, 98, 100):
+            await manager.push_drone_status({'height': height})
+
+    asyncio.run(run())
+    assert len(broadcasts) == 1
+
+
+class FakeClock:
+    """替换 status_manager 中的 time 与 asyncio.sleep：sleep 只记录间隔并推进时钟"""
+
+    def __init__(self, monkeypatch, manager, max_sleeps, on_sleep=None):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+        self.manager = manager
+        self.max_sleeps = max_sleeps
+        self.on_sleep = on_sleep
+
+        fake_asyncio = types.SimpleNamespace(**{name: getattr(asyncio, name) for name in dir(asyncio) if not name.startswith('__')})
+        fake_asyncio.sleep = self.sleep
+        monkeypatch.setattr(status_manager, 'asyncio', fake_asyncio)
+        monkeypatch.setattr(status_manager, 'time', types.SimpleNamespace(time=lambda: self.now))
+
+    async def sleep(self, delay):
+        self.sleeps.append(round(delay, 3))
+        self.now += delay
+        if self.on_sleep:
+            await self.on_sleep(len(self.sleeps))
+        if len(self.sleeps) >= self.max_sleeps:
+            self.manager.is_syncing = False
+
+    def run(self, source):
+        self.manager.is_syncing = True
+        asyncio.run(self.manager._sync_loop(source))
+
+
+def make_polling_manager():
+    return StatusManager(
+        sync_interval=1.0, enable_cache=False, min_sync_interval=0.2, max_sync_interval=4.0,
+        backoff_factor=2.0, push_timeout=3.0
+    )
+
+
+def scripted_source(states):
+    """按顺序返回状态，最后一个状态之后保持不变"""
+    calls = []
+
+    def source():
+        calls.append(len(calls))
+        return {'success': True, **states[min(len(calls) - 1, len(states) - 1)]}
+
+    source.calls = calls
+    return source
+
+
+def test_polling_backs_off_while_stable_up_to_max_interval(monkeypatch):
+    manager = make_polling_manager()
+    clock = FakeClock(monkeypatch, manager, max_sleeps=7)
+    clock.run(scripted_source([{'connected': True, 'battery': 80}]))
+
+    # 首次轮询检测到连接变化，之后状态稳定逐步退避
+    assert clock.sleeps == [0.2, 0.4, 0.8, 1.6, 3.2, 4.0, 4.0]
+    assert manager.polls_skipped == 0
+
+
+def test_change_or_flight_returns_to_min_interval(monkeypatch):
+    manager = make_polling_manager()
+    clock = FakeClock(monkeypatch, manager, max_sleeps=6)
+    clock.run(scripted_source([
+        {'connected': True, 'battery': 80},
+        {'connected': True, 'battery': 80},
+        {'connected': True, 'battery': 80},
+        {'connected': True, 'battery': 60},
+        {'connected': True, 'battery': 60},
+    ]))
+    assert clock.sleeps == [0.2, 0.4, 0.8, 0.2, 0.4, 0.8]
+
+    manager = make_polling_manager()
+    clock = FakeClock(monkeypatch, manager, max_sleeps=4)
+    clock.run(scripted_source([{'connected': True, 'flying': True, 'battery': 80}]))
+    assert clock.sleeps == [0.2, 0.2, 0.2, 0.2]
+
+
+def test_push_source_pauses_polling_until_push_timeout(monkeypatch):
+    manager = make_polling_manager()
+
+    async def push_during_poll(count):
+        if count == 3:
+            await manager.push_drone_status({'connected': True, 'battery': 70})
+
+    clock = FakeClock(monkeypatch, manager, max_sleeps=6, on_sleep=push_during_poll)
+    source = scripted_source([{'connected': True, 'battery': 70}])
+
+    async def subscribe(callback):
+        await callback({'connected': True, 'battery': 70})
+        await callback("文本通知")  # 非状态消息被忽略
+
+    asyncio.run(manager.add_push_source(subscribe))
+    assert manager.push_updates == 1 and manager.is_push_active()
+
+    clock.run(source)
+    # 推送活跃：等到推送过期（3秒）→ 从初始间隔恢复轮询 → 轮询间隙收到推送后再次暂停
+    assert clock.sleeps == [3.0, 2.0, 4.0, 3.0, 2.0, 4.0]
+    assert manager.polls_skipped == 2
+    assert len(source.calls) == 4
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""状态快照/增量同步测试"""
+
+import copy
+
+from status_sync import StatusPublisher, StatusSubscriber, apply_patch
+
+
+def make_pair():
+    publisher = StatusPublisher('drone_status')
+    subscriber = StatusSubscriber('drone_status')
+    status = {'connected': True, 'battery': 90, 'position': {'x': 0, 'y': 0}}
+    publisher.publish(status)
+    assert subscriber.apply(publisher.snapshot().to_dict())
+    return publisher, subscriber, status
+
+
+def test_consecutive_patches_are_applied():
+    publisher, subscriber, status = make_pair()
+    for battery in (89, 88, 87):
+        status = {**status, 'battery': battery, 'position': {'x': battery, 'y': 0}}
+        message = publisher.publish(status)
+        assert message.type == 'drone_status_patch'
+        assert subscriber.apply(message.to_dict())
+    assert subscriber.state == status
+    assert subscriber.seq == publisher.seq
+
+
+def test_stale_patches_are_ignored_without_resync():
+    publisher, subscriber, status = make_pair()
+    queued = publisher.publish({**status, 'battery': 89})
+    # 快照在已排队的增量之后发出，增量序号不大于快照序号
+    assert subscriber.apply(publisher.snapshot().to_dict())
+    assert not subscriber.apply(queued.to_dict())
+    assert not subscriber.needs_resync
+    assert subscriber.stale_ignored == 1
+    assert subscriber.gaps_detected == 0
+    assert subscriber.state['battery'] == 89
+
+    # 重复的增量同样忽略
+    message = publisher.publish({**status, 'battery': 88})
+    assert subscriber.apply(message.to_dict())
+    assert not subscriber.apply(message.to_dict())
+    assert not subscriber.needs_resync
+
+
+def test_sequence_gap_requires_resync_until_snapshot():
+    publisher, subscriber, status = make_pair()
+    publisher.publish({**status, 'battery': 89})  # 丢失
+    message = publisher.publish({**status, 'battery': 88})
+
+    assert not subscriber.apply(message.to_dict())
+    assert subscriber.needs_resync
+    assert subscriber.gaps_detected == 1
+    assert subscriber.resync_due()
+    request = subscriber.resync_request()
+    assert request['data'] == {'topic': 'drone_status', 'last_seq': 1}
+    assert not subscriber.resync_due()
+
+    # 等待快照期间的增量不应用
+    later = publisher.publish({**status, 'battery': 87})
+    assert not subscriber.apply(later.to_dict())
+    assert subscriber.gaps_detected == 1
+
+    assert subscriber.apply(publisher.resync().to_dict())
+    assert not subscriber.needs_resync
+    assert subscriber.state['battery'] == 87
+
+
+def test_unchanged_status_publishes_nothing():
+    publisher, _, status = make_pair()
+    assert publisher.publish(copy.deepcopy(status)) is None
+
+
+def test_patch_round_trip_with_add_replace_remove():
+    publisher = StatusPublisher('drone_status', snapshot_ratio=1.0)
+    old = {'a': 1, 'b': {'c': 2, 'd': 3}, 'e/f': 4, 'h': 0, 'i': 0}
+    new = {'a': 1, 'b': {'c': 5}, 'e/f': 6, 'g': {'x': [1, 2]}, 'h': 0, 'i': 0}
+    publisher.publish(old)
+    message = publisher.publish(new)
+    assert message.type == 'drone_status_patch'
+    assert {op['op'] for op in message.data} == {'add', 'replace', 'remove'}
+
+    state = copy.deepcopy(old)
+    apply_patch(state, message.data)
+    assert state == new
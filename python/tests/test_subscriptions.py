@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""客户端主题订阅与限速测试"""
+
+import pytest
+
+from subscriptions import (
+    ClientSubscription, SubscriptionRegistry, TOPIC_CONTROL, TOPIC_DETECTION, TOPIC_STATUS, TOPIC_VIDEO,
+    TOPICS, parse_max_rates, parse_topics, topic_for
+)
+
+
+def test_topic_for_message_types():
+    assert topic_for('drone_status_patch') == TOPIC_STATUS
+    assert topic_for('video_frame') == TOPIC_VIDEO
+    assert topic_for('diagnosis_complete') == 'diagnosis'
+    assert topic_for('diagnosis_config_updated') == TOPIC_CONTROL
+    assert topic_for('error') == TOPIC_CONTROL
+
+
+def test_parse_topics_and_rates():
+    assert parse_topics({'channel': 'status_updates'}) == {TOPIC_STATUS}
+    assert parse_topics({'topics': ['*']}) is None
+    with pytest.raises(ValueError):
+        parse_topics({'topics': ['bogus']})
+    assert parse_max_rates(2, {TOPIC_VIDEO}) == {TOPIC_VIDEO: 2.0}
+    assert parse_max_rates(None, None) == {}
+    with pytest.raises(ValueError):
+        parse_max_rates({'bogus': 1}, None)
+
+
+def test_unregistered_and_default_clients_receive_everything():
+    registry = SubscriptionRegistry()
+    registry.add('browser')
+    assert registry.recipients(['browser', 'unknown'], 'video_frame', droppable=True) == ['browser', 'unknown']
+    assert registry.has_subscribers(TOPIC_VIDEO, ['unknown'])
+
+
+def test_subscription_filters_topics_but_keeps_control():
+    registry = SubscriptionRegistry()
+    subscription, added = registry.subscribe('bridge', {'topics': ['status']})
+    assert added == set()  # 默认已订阅全部主题，收窄后没有新增
+    assert subscription.to_dict()['topics'] == sorted({TOPIC_STATUS, TOPIC_CONTROL})
+
+    assert registry.recipients(['bridge'], 'drone_status_patch', droppable=False) == ['bridge']
+    assert registry.recipients(['bridge'], 'error', droppable=False) == ['bridge']
+    assert registry.recipients(['bridge'], 'video_frame', droppable=True) == []
+    assert not registry.has_subscribers(TOPIC_VIDEO, ['bridge'])
+    assert registry.filtered == 1
+
+    _, added = registry.subscribe('bridge', {'topics': ['video']})
+    assert added == {TOPIC_VIDEO}
+    _, added = registry.subscribe('bridge', {'topics': ['detection'], 'replace': True})
+    assert registry.get('bridge').topics == {TOPIC_DETECTION}
+
+    registry.unsubscribe('bridge', {})
+    assert registry.get('bridge').topics == set()
+    with pytest.raises(ValueError):
+        registry.subscribe('bridge', {})
+
+
+def test_rate_cap_applies_per_message_type_and_only_to_droppable_messages():
+    subscription = ClientSubscription()
+    subscription.subscribe(None, {TOPIC_DETECTION: 2.0, TOPIC_STATUS: 1.0})
+
+    # 同一主题的不同类型各自计时
+    assert subscription.accepts(TOPIC_DETECTION, 'qr_detected', True, now=0.0)
+    assert subscription.accepts(TOPIC_DETECTION, 'strawberry_summary', True, now=0.1)
+    assert not subscription.accepts(TOPIC_DETECTION, 'qr_detected', True, now=0.3)
+    assert subscription.accepts(TOPIC_DETECTION, 'qr_detected', True, now=0.5)
+    assert subscription.rate_limited == 1
+
+    # 增量等必须逐条送达的消息不受限速
+    for now in (0.0, 0.01, 0.02):
+        assert subscription.accepts(TOPIC_STATUS, 'drone_status_patch', False, now=now)
+
+    subscription.unsubscribe({TOPIC_DETECTION})
+    assert TOPIC_DETECTION not in subscription.max_rates
+    assert 'qr_detected' not in subscription.last_sent
+
+
+def test_registry_statistics():
+    registry = SubscriptionRegistry()
+    registry.add('browser')
+    registry.subscribe('bridge', {'topics': ['status'], 'max_rate': 5})
+    stats = registry.get_statistics()
+    assert stats['clients'] == 2
+    assert stats['subscribers'][TOPIC_STATUS] == 2
+    assert stats['subscribers'][TOPIC_VIDEO] == 1
+    assert set(stats['subscribers']) == set(TOPICS)
+
+
+def test_last_value_of_a_rate_limited_burst_is_delivered_after_the_window():
+    subscription = ClientSubscription()
+    subscription.subscribe(None, {TOPIC_STATUS: 2.0})
+
+    def status(state):
+        return {'type': 'recording_status', 'data': {'state': state}}
+
+    assert subscription.accepts(TOPIC_STATUS, 'recording_status', True, 0.0, status('recording'))
+    assert not subscription.accepts(TOPIC_STATUS, 'recording_status', True, 0.1, status('saving'))
+    assert not subscription.accepts(TOPIC_STATUS, 'recording_status', True, 0.2, status('stopped'))
+    assert subscription.next_trailing_due() == 0.5
+
+    assert subscription.take_trailing(0.3) == []
+    assert subscription.take_trailing(0.5) == [status('stopped')]
+    assert subscription.take_trailing(2.0) == []
+
+    # 补发开启新窗口；窗口内随后正常发送的值会取代待补发的值
+    assert not subscription.accepts(TOPIC_STATUS, 'recording_status', True, 0.6, status('recording'))
+    assert subscription.accepts(TOPIC_STATUS, 'recording_status', True, 1.0, status('stopped'))
+    assert subscription.next_trailing_due() is None
+
+
+def test_registry_collects_trailing_messages_per_client():
+    registry = SubscriptionRegistry()
+    registry.subscribe('report', {'topics': ['detection'], 'max_rate': 1})
+    registry.add('browser')
+    for count in range(3):
+        payload = {'type': 'strawberry_summary', 'data': {'count': count}}
+        registry.recipients(['report', 'browser'], 'strawberry_summary', True, payload)
+
+    assert registry.take_trailing(float('-inf')) == []
+    due = registry.next_trailing_due()
+    assert registry.take_trailing(due) == [('report', {'type': 'strawberry_summary', 'data': {'count': 2}})]
+    assert registry.get_statistics()['trailing_sent'] == 1
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""遥测环形缓冲区的查询、降采样与导出测试"""
+
+import numpy as np
+
+from telemetry_store import TelemetryStore, extract_telemetry, resolve_field, to_series
+
+
+def filled_store(count, capacity):
+    store = TelemetryStore(['battery', 'height'], capacity=capacity)
+    for i in range(count):
+        store.append({'battery': 100 - i, 'height': i}, timestamp=float(i))
+    return store
+
+
+def test_ring_wraps_and_keeps_time_order():
+    store = filled_store(13, capacity=5)
+    assert len(store) == 5
+
+    data = store.query()
+    assert data['timestamp'].tolist() == [8.0, 9.0, 10.0, 11.0, 12.0]
+    assert data['height'].tolist() == [8, 9, 10, 11, 12]
+
+    # 范围跨越环形缓冲区的两段
+    assert store.query(9.5, 11.0, ['battery'])['battery'].tolist() == [90, 89]
+    assert store.query(20.0)['timestamp'].size == 0
+    assert store.tail(2)['height'].tolist() == [11, 12]
+    assert store.tail(99)['timestamp'].size == 5
+
+
+def test_extend_matches_append():
+    appended = filled_store(13, capacity=5)
+    extended = TelemetryStore(['battery', 'height'], capacity=5)
+    timestamps = np.arange(13, dtype=np.float64)
+    extended.extend(timestamps, {'battery': 100 - timestamps, 'height': timestamps})
+
+    for name in ('timestamp', 'battery', 'height'):
+        assert np.array_equal(appended.query()[name], extended.query()[name])
+
+
+def test_timestamps_never_go_backwards():
+    store = TelemetryStore(['battery'], capacity=4)
+    store.append({'battery': 1}, timestamp=10.0)
+    store.append({'battery': 2}, timestamp=5.0)
+    assert store.query()['timestamp'].tolist() == [10.0, 10.0]
+
+
+def test_latest_skips_missing_values():
+    store = TelemetryStore(['battery', 'height'], capacity=3)
+    assert store.latest('battery') is None
+    store.append({'battery': 80, 'height': 1}, timestamp=1.0)
+    store.append({'height': 2}, timestamp=2.0)
+    store.append({'height': 3}, timestamp=3.0)
+    assert store.latest('battery') == 80
+    store.append({'height': 4}, timestamp=4.0)
+    assert store.latest('battery') is None
+    assert store.latest('height') == 4
+
+
+def test_downsample_aggregates_each_bucket():
+    store = TelemetryStore(['height'], capacity=100)
+    for i in range(10):
+        store.append({'height': np.nan if i == 3 else i}, timestamp=float(i))
+
+    result = store.downsample(0.0, 10.0, buckets=2)
+    assert result['timestamp'].tolist() == [0.0, 5.0]
+    assert result['count'].tolist() == [5, 5]
+    assert result['height']['min'].tolist() == [0, 5]
+    assert result['height']['max'].tolist() == [4, 9]
+    assert np.allclose(result['height']['mean'], [(0 + 1 + 2 + 4) / 4, 7])
+
+    empty = store.downsample(50.0, 60.0)
+    assert empty['count'].size == 0 and empty['height']['mean'].size == 0
+
+
+def test_export_load_round_trip(tmp_path):
+    store = filled_store(13, capacity=5)
+    path = store.export(str(tmp_path / 'telemetry.npy'))
+
+    for mmap in (True, False):
+        loaded = TelemetryStore.load(path, mmap=mmap)
+        assert loaded.fields == ['battery', 'height']
+        assert len(loaded) == 5
+        for name in ('timestamp', 'battery', 'height'):
+            assert np.array_equal(loaded.query()[name], store.query()[name])
+        assert loaded.latest('height') == 12
+
+    grown = TelemetryStore.load(path, mmap=False, capacity=8)
+    grown.append({'height': 13}, timestamp=13.0)
+    assert len(grown) == 6 and grown.get_statistics()['time_span_seconds'] == 5.0
+
+
+def test_clear_and_statistics():
+    store = filled_store(3, capacity=10)
+    assert store.get_statistics()['samples'] == 3
+    store.clear()
+    assert len(store) == 0 and store.query()['timestamp'].size == 0
+    store.append({'battery': 1}, timestamp=0.0)
+    assert store.get_statistics()['time_span_seconds'] == 0.0
+
+
+def test_extract_and_resolve_fields():
+    status = {'drone_status': {'battery': 70, 'position': {'x': 1.5, 'y': 'n/a'}, 'flying': True}}
+    assert extract_telemetry(status) == {'battery': 70, 'pos_x': 1.5}
+    assert extract_telemetry({'height': 3}) == {'height': 3}
+
+    assert resolve_field('battery') == 'battery'
+    assert resolve_field('drone_status.position.x') == 'pos_x'
+    assert resolve_field('position.z') == 'pos_z'
+    assert resolve_field('wifi_signal') is None
+
+
+def test_to_series_converts_nan_to_none():
+    store = TelemetryStore(['battery'], capacity=2)
+    store.append({}, timestamp=1.0)
+    store.append({'battery': 50}, timestamp=2.0)
+    assert to_series(store.query()) == {'timestamp': [1.0, 2.0], 'battery': [None, 50.0]}
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Tello状态包解析与遥测订阅测试"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tello_telemetry import TelloState, TelloTelemetry, parse_state
+
+SAMPLE = (
+    b"mid:-1;x:-100;y:-100;z:-100;mpry:0,0,0;pitch:0;roll:1;yaw:-3;vgx:0;vgy:0;vgz:0;"
+    b"templ:60;temph:63;tof:10;h:0;bat:87;baro:135.05;time:0;agx:-3.00;agy:-2.00;agz:-999.00;\r\n"
+)
+
+
+def test_parse_sample_packet():
+    state = parse_state(SAMPLE, timestamp=5.0)
+    assert state.bat == 87 and state.roll == 1 and state.yaw == -3
+    assert state.baro == pytest.approx(135.05) and state.agz == -999.0
+    assert state.temperature == 61.5
+    assert state.timestamp == 5.0
+
+    status = state.to_status()
+    assert status['battery'] == 87 and status['mission_pad'] == -1
+    assert 'position' not in status  # 未检测到任务卡时不提供位置
+
+
+def test_mission_pad_position_and_float_valued_int_fields():
+    packet = SAMPLE.replace(b"mid:-1", b"mid:4").replace(b"h:0", b"h:120.0").replace(b"x:-100", b"x:35")
+    state = parse_state(packet.decode('ascii'))
+    assert state.mid == state.mission_pad_id == 4
+    assert state.h == 120 and isinstance(state.h, int)
+    assert state.to_status()['position'] == {'x': 35, 'y': -100, 'z': -100}
+
+
+@pytest.mark.parametrize('packet', [b"", b"ok", b"\xff\xfe", b"mid:1;x:2;", b"bat:high;h:0;"])
+def test_malformed_packets_raise_value_error(packet):
+    with pytest.raises(ValueError):
+        parse_state(packet)
+
+
+def test_missing_fields_default_to_zero_and_mid_to_minus_one():
+    state = TelloState.from_fields({'bat': '50'}, timestamp=1.0)
+    assert state.mid == -1
+    assert state.h == 0 and state.baro == 0.0
+    assert state.bat == 50
+
+
+class FakeTello:
+    """依次返回给定的状态字典，之后一直返回最后一个对象"""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.calls = 0
+        self.exhausted = threading.Event()
+
+    def get_current_state(self):
+        self.calls += 1
+        if len(self.states) > 1:
+            item = self.states.pop(0)
+        else:
+            item = self.states[0]
+            self.exhausted.set()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+def test_follow_loop_dispatches_each_new_state_dict_once():
+    first = {'bat': 80, 'h': 10}
+    second = {'bat': 80, 'h': 10}  # 内容相同但是新包
+    tello = FakeTello([first, first, None, ConnectionError("断开"), second, second, {'bat': 'n/a'}, second])
+    telemetry = TelloTelemetry(tello=tello)
+    received = []
+    telemetry.add_listener(received.append)
+
+    telemetry.start()
+    try:
+        assert tello.exhausted.wait(2.0)
+        time.sleep(0.05)
+    finally:
+        telemetry.stop()
+
+    # 重复出现的同一字典对象只分发一次；最后一个对象在无效包之后再次出现，视为新包
+    assert [state.h for state in received] == [10, 10, 10]
+    assert telemetry.packets == 3
+    assert telemetry.parse_errors == 1
+    assert telemetry.latest is received[-1]
+
+
+def test_value_returns_default_when_stale():
+    telemetry = TelloTelemetry(stale_after=1.0)
+    assert telemetry.value('bat', -1) == -1
+    telemetry._dispatch(parse_state(SAMPLE))
+    assert telemetry.value('bat') == 87
+    assert telemetry.value('temperature') == 61.5
+    telemetry.latest.timestamp -= 5
+    assert telemetry.value('bat', -1) == -1
+
+
+def test_publish_to_forwards_states_to_status_manager_loop():
+    class FakeStatusManager:
+        def __init__(self):
+            self.pushed = []
+
+        async def push_drone_status(self, status):
+            self.pushed.append((threading.current_thread(), status))
+
+    manager = FakeStatusManager()
+    telemetry = TelloTelemetry()
+
+    async def scenario():
+        forward = telemetry.publish_to(manager, asyncio.get_running_loop())
+        # 状态包在接收线程中分发
+        await asyncio.get_running_loop().run_in_executor(None, telemetry._dispatch, parse_state(SAMPLE))
+        for _ in range(50):
+            if manager.pushed:
+                break
+            await asyncio.sleep(0.01)
+        return forward
+
+    forward = asyncio.run(scenario())
+    assert len(manager.pushed) == 1
+    thread, status = manager.pushed[0]
+    assert thread is threading.main_thread()
+    assert status['battery'] == 87
+
+    # 事件循环关闭后不再转发，也不抛出异常
+    forward(parse_state(SAMPLE))
+    telemetry.remove_listener(forward)
+    assert telemetry._listeners == []
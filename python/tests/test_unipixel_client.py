@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""UnipixelClient 进行中请求合并与熔断测试"""
+
+import asyncio
+
+import pytest
+
+import unipixel_client
+from circuit_breaker import STATE_HALF_OPEN
+from unipixel_client import BatchSegmentationTask, UnipixelClient, UnipixelResult
+
+
+def test_cancelled_leader_fails_coalesced_waiters_without_cancelling_them():
+    async def scenario():
+        client = UnipixelClient()
+        started = asyncio.Event()
+
+        async def slow_request(**kwargs):
+            started.set()
+            await asyncio.sleep(10)
+            return UnipixelResult(mask_base64="", description="", success=True)
+
+        client._request_mask = slow_request
+        leader = asyncio.create_task(client.generate_mask("aW1n", query="病害区域"))
+        await started.wait()
+        follower = asyncio.create_task(client.generate_mask("aW1n", query="病害区域"))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        with pytest.raises(RuntimeError):
+            await follower
+        assert not follower.cancelled()
+        assert client.coalesced_requests == 1
+        assert not client._inflight
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_half_open_slot(monkeypatch):
+    class HangingResponse:
+        async def __aenter__(self):
+            await asyncio.sleep(10)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    class HangingSession:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def post(self, *args, **kwargs):
+            return HangingResponse()
+
+    monkeypatch.setattr(unipixel_client.aiohttp, 'ClientSession', HangingSession)
+
+    async def scenario():
+        client = UnipixelClient(failure_threshold=1, recovery_timeout=0.0)
+        client.circuit_breaker.allow_request()
+        client.circuit_breaker.record_failure()
+        assert client.circuit_breaker.state == STATE_HALF_OPEN
+
+        probe = asyncio.create_task(client.generate_mask("aW1n"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert client.circuit_breaker._half_open_calls == 0
+        assert client.concurrency_limiter.in_flight == 0
+        assert client.circuit_breaker.allow_request()
+
+    asyncio.run(scenario())
+
+
+def counting_client(**kwargs):
+    """_request_mask 替换为计数的假实现，按 results 中的顺序返回结果"""
+    client = UnipixelClient(**kwargs)
+    calls = []
+
+    async def request(**request_kwargs):
+        calls.append(request_kwargs['query'])
+        mask = f"mask-{len(calls)}"
+        await asyncio.sleep(0.01)
+        return UnipixelResult(mask_base64=mask, description="", success=True)
+
+    client._request_mask = request
+    return client, calls
+
+
+def test_identical_request_hits_cache():
+    client, calls = counting_client()
+
+    async def scenario():
+        first = await client.generate_mask("aW1n", query="叶斑", mask_format="rle")
+        second = await client.generate_mask("aW1n", query="叶斑", mask_format="rle")
+        other_format = await client.generate_mask("aW1n", query="叶斑", mask_format="bitpack")
+        return first, second, other_format
+
+    first, second, other_format = asyncio.run(scenario())
+    assert calls == ["叶斑", "叶斑"]
+    assert second.mask_base64 == first.mask_base64 and second.metadata['source'] == 'cache'
+    assert other_format.mask_base64 != first.mask_base64
+    assert client.cache_hits == 1 and client.cache_misses == 2
+
+
+def test_cache_evicts_least_recently_used_entry():
+    client, calls = counting_client(result_cache_size=2)
+
+    async def scenario():
+        for query in ("a", "b", "a", "c", "a", "b"):
+            await client.generate_mask("aW1n", query=query)
+
+    asyncio.run(scenario())
+    # "a" 最近被命中，放入 "c" 时淘汰 "b"
+    assert calls == ["a", "b", "c", "b"]
+    assert client.get_cache_stats()['cache_size'] == 2
+
+
+def test_cache_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(unipixel_client.time, 'time', lambda: now[0])
+    client, calls = counting_client(result_cache_ttl=60)
+
+    async def scenario():
+        await client.generate_mask("aW1n", query="叶斑")
+        now[0] += 59
+        await client.generate_mask("aW1n", query="叶斑")
+        now[0] += 2
+        await client.generate_mask("aW1n", query="叶斑")
+
+    asyncio.run(scenario())
+    assert calls == ["叶斑", "叶斑"]
+
+
+def test_failed_result_is_not_cached():
+    client = UnipixelClient()
+    outcomes = [False, True]
+
+    async def request(**kwargs):
+        success = outcomes.pop(0)
+        return UnipixelResult(mask_base64="m" if success else "", description="", success=success, error=None if success else "HTTP 500")
+
+    client._request_mask = request
+
+    async def scenario():
+        return [await client.generate_mask("aW1n") for _ in range(3)]
+
+    results = asyncio.run(scenario())
+    assert [result.success for result in results] == [False, True, True]
+    assert results[2].metadata['source'] == 'cache'
+    assert not outcomes
+
+
+def test_batch_deduplicates_and_fans_out_results():
+    client, calls = counting_client()
+    progress = []
+    tasks = [
+        BatchSegmentationTask(task_id="p1", image_base64="aW1n", query="叶斑"),
+        BatchSegmentationTask(task_id="p2", image_base64="b3RoZXI=", query="叶斑"),
+        BatchSegmentationTask(task_id="p3", image_base64="aW1n", query="叶斑", callback=progress.append),
+    ]
+
+    results = asyncio.run(client.batch_generate_masks(tasks))
+    assert len(calls) == 2
+    assert [result.task_id for result in results] == ["p1", "p2", "p3"]
+    assert [result.index for result in results] == [0, 1, 2]
+    assert results[2].result is results[0].result
+    assert results[1].result.mask_base64 != results[0].result.mask_base64
+    assert progress == [100]
@@ -9,13 +9,18 @@ Unipixel客户端
 
 import aiohttp
 import asyncio
+import hashlib
 import logging
-from dataclasses import dataclass
-from typing import Optional, Callable, List, Dict, Any
-from queue import Queue
-from threading import Lock
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional, Callable, List, Dict, Any, Tuple
 import time
 
+import numpy as np
+
+from mask_codec import MASK_FORMATS, decode_masks
+from circuit_breaker import CircuitBreaker, AdaptiveConcurrencyLimiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,6 +33,7 @@ class UnipixelResult:
     error: Optional[str] = None
     processing_time: float = 0.0
     metadata: Optional[Dict[str, Any]] = None  # 额外元数据
+    binary_masks: Optional[List[np.ndarray]] = None  # 每个分割目标的 (T, H, W) 二值遮罩（rle/bitpack格式时）
 
 
 @dataclass
@@ -38,6 +44,8 @@ class BatchSegmentationTask:
     query: str
     sample_frames: int = 16
     callback: Optional[Callable] = None
+    mask_format: str = "overlay"
+    include_overlay: bool = True
 
 
 @dataclass
@@ -56,7 +64,12 @@ class UnipixelClient:
         endpoint: str = "http://localhost:8000/infer_unipixel_base64",
         timeout: int = 30,
         max_retries: int = 3,
-        max_concurrent: int = 3
+        max_concurrent: int = 3,
+        max_concurrent_limit: int = 8,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        result_cache_size: int = 128,
+        result_cache_ttl: float = 600
     ):
         """
         初始化Unipixel客户端
@@ -65,7 +78,12 @@ class UnipixelClient:
             endpoint: Unipixel API端点
             timeout: 请求超时时间（秒）
             max_retries: 最大重试次数
-            max_concurrent: 最大并发请求数
+            max_concurrent: 初始并发请求数（随延迟自适应调整）
+            max_concurrent_limit: 自适应并发上限
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断后多久放行探测请求（秒）
+            result_cache_size: 结果缓存最大条目数（0表示禁用缓存）
+            result_cache_ttl: 结果缓存有效期（秒）
         """
         self.endpoint = endpoint
         self.timeout = timeout
@@ -73,26 +91,178 @@ class UnipixelClient:
         self.max_concurrent = max_concurrent
         self._availability_cache: Optional[bool] = None
         self._cache_timestamp: float = 0
-        self._cache_ttl: int = 300  # 缓存5分钟
-        self._task_queue: Queue = Queue()
-        self._processing_lock: Lock = Lock()
-        self._active_tasks: int = 0
+        self._cache_ttl: int = 300  # 可用缓存5分钟
+        self._negative_cache_ttl: float = recovery_timeout  # 不可用缓存与熔断恢复时间一致
+        
+        # 熔断器与自适应并发（generate_mask 与 batch_generate_masks 共享）
+        self.circuit_breaker = CircuitBreaker(
+            name="Unipixel",
+            failure_threshold=failure_threshold,
+            recovery_timeout=recovery_timeout
+        )
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=max_concurrent,
+            max_limit=max(max_concurrent, max_concurrent_limit)
+        )
+        
+        # 结果缓存（LRU + TTL）与进行中请求合并
+        self.result_cache_size = result_cache_size
+        self.result_cache_ttl = result_cache_ttl
+        self._result_cache: "OrderedDict[str, Tuple[float, UnipixelResult]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        # 缓存统计
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced_requests = 0
+    
+    @staticmethod
+    def _request_key(
+        image_base64: str,
+        query: str,
+        sample_frames: int,
+        mask_format: str,
+        include_overlay: bool
+    ) -> str:
+        """
+        生成请求缓存键（图像哈希 + 查询参数）
+        
+        Returns:
+            缓存键字符串
+        """
+        image_hash = hashlib.sha1(image_base64.encode('utf-8')).hexdigest()
+        return f"{image_hash}|{query}|{sample_frames}|{mask_format}|{int(include_overlay)}"
+    
+    def _cache_get(self, key: str) -> Optional[UnipixelResult]:
+        """读取未过期的缓存结果"""
+        entry = self._result_cache.get(key)
+        if entry is None:
+            return None
+        
+        cached_at, result = entry
+        if time.time() - cached_at > self.result_cache_ttl:
+            del self._result_cache[key]
+            return None
+        
+        self._result_cache.move_to_end(key)
+        return result
+    
+    def _cache_put(self, key: str, result: UnipixelResult):
+        """写入缓存并按LRU淘汰"""
+        if self.result_cache_size <= 0:
+            return
+        
+        self._result_cache[key] = (time.time(), result)
+        self._result_cache.move_to_end(key)
+        while len(self._result_cache) > self.result_cache_size:
+            self._result_cache.popitem(last=False)
+    
+    @staticmethod
+    def _mark_result(result: UnipixelResult, source: str) -> UnipixelResult:
+        """复制结果并在元数据中标记来源（cache / coalesced）"""
+        return replace(result, metadata={**(result.metadata or {}), 'source': source})
     
     async def generate_mask(
         self,
         image_base64: str,
         query: str = "病害区域",
         sample_frames: int = 16,
-        progress_callback: Optional[Callable[[int], None]] = None
+        progress_callback: Optional[Callable[[int], None]] = None,
+        mask_format: str = "overlay",
+        include_overlay: bool = True
     ) -> UnipixelResult:
         """
         生成遮罩图
         
+        相同（图像, 查询参数）的请求优先命中结果缓存；
+        已有相同请求在进行中时等待其结果，而不重复调用服务。
+        
+        Args:
+            image_base64: 图像base64编码（包含data:image/...前缀）
+            query: 查询提示词（描述要标注的区域）
+            sample_frames: 采样帧数
+            progress_callback: 进度回调函数，接收进度百分比(0-100)
+            mask_format: overlay（叠加渲染图）、rle 或 bitpack（二值遮罩）
+            include_overlay: 是否同时返回叠加渲染图
+        
+        Returns:
+            UnipixelResult对象
+        """
+        if mask_format not in MASK_FORMATS:
+            raise ValueError(f"不支持的遮罩格式: {mask_format}")
+        
+        key = self._request_key(image_base64, query, sample_frames, mask_format, include_overlay)
+        
+        # 结果缓存
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            logger.info(f"♻️ Unipixel结果命中缓存: {query}")
+            if progress_callback:
+                progress_callback(100)
+            return self._mark_result(cached, 'cache')
+        
+        # 合并进行中的相同请求
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced_requests += 1
+            logger.info(f"🔗 合并进行中的Unipixel请求: {query}")
+            result = await asyncio.shield(inflight)
+            if progress_callback:
+                progress_callback(100)
+            return self._mark_result(result, 'coalesced')
+        
+        self.cache_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        
+        try:
+            result = await self._request_mask(
+                image_base64=image_base64,
+                query=query,
+                sample_frames=sample_frames,
+                progress_callback=progress_callback,
+                mask_format=mask_format,
+                include_overlay=include_overlay
+            )
+        except asyncio.CancelledError:
+            # 发起方被取消时，合并等待的请求以普通错误结束，而不是被当作自身被取消
+            future.set_exception(RuntimeError(f"合并的Unipixel请求已被取消: {query}"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免无等待者时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        
+        # 只缓存成功结果，失败结果不应阻止后续重试
+        if result.success:
+            self._cache_put(key, result)
+        future.set_result(result)
+        return result
+    
+    async def _request_mask(
+        self,
+        image_base64: str,
+        query: str,
+        sample_frames: int,
+        progress_callback: Optional[Callable[[int], None]],
+        mask_format: str,
+        include_overlay: bool
+    ) -> UnipixelResult:
+        """
+        调用Unipixel服务生成遮罩图（带重试，不经过缓存）
+        
         Args:
             image_base64: 图像base64编码（包含data:image/...前缀）
             query: 查询提示词（描述要标注的区域）
             sample_frames: 采样帧数
             progress_callback: 进度回调函数，接收进度百分比(0-100)
+            mask_format: overlay（叠加渲染图）、rle 或 bitpack（二值遮罩）
+            include_overlay: 是否同时返回叠加渲染图
         
         Returns:
             UnipixelResult对象
@@ -107,64 +277,93 @@ class UnipixelClient:
         payload = {
             "imageBase64": image_base64,
             "query": query,
-            "sample_frames": sample_frames
+            "sample_frames": sample_frames,
+            "mask_format": mask_format,
+            "include_overlay": include_overlay
         }
         
-        # 重试机制
+        # 重试机制（熔断器打开时快速失败）
         last_error = None
         for attempt in range(self.max_retries):
+            retry_after = 0.0
+            
+            if not self.circuit_breaker.allow_request():
+                last_error = f"Unipixel熔断器已打开（{self.circuit_breaker.retry_after():.0f}秒后探测）"
+                logger.warning(f"⚡ {last_error}，快速失败")
+                break
+            
+            result = None
+            outcome = "failure"  # success / failure / overload / ignored
+            latency = None
             try:
-                logger.info(f"🔍 调用Unipixel生成遮罩图 (尝试 {attempt + 1}/{self.max_retries})")
-                logger.info(f"   查询: {query}")
-                
-                # 更新进度: 开始处理
-                if progress_callback:
-                    progress_callback(20)
-                
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        self.endpoint,
-                        json=payload,
-                        timeout=aiohttp.ClientTimeout(total=self.timeout)
-                    ) as response:
-                        
-                        # 更新进度: 等待响应
-                        if progress_callback:
-                            progress_callback(60)
-                        
-                        if response.status == 200:
-                            result_data = await response.json()
-                            processing_time = time.time() - start_time
-                            
-                            # 更新进度: 解析结果
-                            if progress_callback:
-                                progress_callback(90)
-                            
-                            # 解析响应
-                            mask_base64 = result_data.get('mask', '')
-                            description = result_data.get('description', '未提供描述')
-                            
-                            logger.info(f"✅ Unipixel生成成功 (耗时: {processing_time:.2f}秒)")
+                async with self.concurrency_limiter:
+                    logger.info(f"🔍 调用Unipixel生成遮罩图 (尝试 {attempt + 1}/{self.max_retries})")
+                    logger.info(f"   查询: {query}")
+                    
+                    # 更新进度: 开始处理
+                    if progress_callback:
+                        progress_callback(20)
+                    
+                    attempt_start = time.time()
+                    async with aiohttp.ClientSession() as session:
+                        async with session.post(
+                            self.endpoint,
+                            json=payload,
+                            timeout=aiohttp.ClientTimeout(total=self.timeout)
+                        ) as response:
                             
-                            # 完成进度
+                            # 更新进度: 等待响应
                             if progress_callback:
-                                progress_callback(100)
+                                progress_callback(60)
                             
-                            return UnipixelResult(
-                                mask_base64=mask_base64,
-                                description=description,
-                                success=True,
-                                processing_time=processing_time,
-                                metadata={
-                                    'query': query,
-                                    'sample_frames': sample_frames,
-                                    'attempt': attempt + 1
-                                }
-                            )
-                        else:
-                            error_text = await response.text()
-                            last_error = f"HTTP {response.status}: {error_text}"
-                            logger.warning(f"⚠️ Unipixel返回错误: {last_error}")
+                            if response.status == 200:
+                                result_data = await response.json()
+                                latency = time.time() - attempt_start
+                                processing_time = time.time() - start_time
+                                
+                                # 更新进度: 解析结果
+                                if progress_callback:
+                                    progress_callback(90)
+                                
+                                # 解析响应
+                                mask_base64 = result_data.get('mask', '')
+                                description = result_data.get('description', '未提供描述')
+                                
+                                binary_masks = None
+                                if mask_format != "overlay" and 'masks' in result_data:
+                                    binary_masks = decode_masks(result_data['masks'], mask_format)
+                                
+                                logger.info(f"✅ Unipixel生成成功 (耗时: {processing_time:.2f}秒)")
+                                
+                                result = UnipixelResult(
+                                    mask_base64=mask_base64,
+                                    description=description,
+                                    success=True,
+                                    processing_time=processing_time,
+                                    metadata={
+                                        'query': query,
+                                        'sample_frames': sample_frames,
+                                        'mask_format': mask_format,
+                                        'attempt': attempt + 1
+                                    },
+                                    binary_masks=binary_masks
+                                )
+                                outcome = "success"
+                            else:
+                                error_text = await response.text()
+                                last_error = f"HTTP {response.status}: {error_text}"
+                                logger.warning(f"⚠️ Unipixel返回错误: {last_error}")
+                                
+                                if response.status == 429:
+                                    # 服务端队列已满，按Retry-After退避
+                                    outcome = "overload"
+                                    try:
+                                        retry_after = float(response.headers.get('Retry-After', 0))
+                                    except ValueError:
+                                        retry_after = 0.0
+                                elif response.status < 500:
+                                    # 请求本身有误，不代表服务不健康
+                                    outcome = "ignored"
                             
             except asyncio.TimeoutError:
                 last_error = f"请求超时（{self.timeout}秒）"
@@ -177,25 +376,63 @@ class UnipixelClient:
             except Exception as e:
                 last_error = f"未知错误: {str(e)}"
                 logger.error(f"❌ Unipixel异常: {last_error}")
+                
+            except asyncio.CancelledError:
+                # 被取消不反映服务健康状况，但必须归还半开探测名额
+                outcome = "ignored"
+                raise
+                
+            finally:
+                self._record_outcome(outcome, latency)
             
-            # 如果不是最后一次尝试，等待后重试
-            if attempt < self.max_retries - 1:
-                wait_time = 2 ** attempt  # 指数退避
+            if result is not None:
+                # 完成进度
+                if progress_callback:
+                    progress_callback(100)
+                return result
+            
+            if outcome == "ignored":
+                break
+            
+            # 如果不是最后一次尝试，等待后重试（熔断器已打开则不再等待）
+            if attempt < self.max_retries - 1 and not self.circuit_breaker.is_open():
+                wait_time = max(2 ** attempt, retry_after)  # 指数退避
                 logger.info(f"   等待 {wait_time} 秒后重试...")
                 await asyncio.sleep(wait_time)
         
         # 所有重试都失败
         processing_time = time.time() - start_time
-        logger.error(f"❌ Unipixel生成失败（所有重试均失败）: {last_error}")
+        logger.error(f"❌ Unipixel生成失败: {last_error}")
         
         return UnipixelResult(
             mask_base64="",
             description="",
             success=False,
             error=last_error,
-            processing_time=processing_time
+            processing_time=processing_time,
+            metadata={'circuit_state': self.circuit_breaker.state}
         )
-
+    
+    def _record_outcome(self, outcome: str, latency: Optional[float]):
+        """
+        将一次请求结果反馈给熔断器和并发限制器
+        
+        Args:
+            outcome: success / failure / overload / ignored
+            latency: 成功请求的延迟（秒）
+        """
+        if outcome == "success":
+            self.circuit_breaker.record_success()
+            self.concurrency_limiter.record(latency)
+        elif outcome == "overload":
+            # 过载只收缩并发，不计入熔断
+            self.circuit_breaker.record_ignored()
+            self.concurrency_limiter.record(None, overloaded=True)
+        elif outcome == "ignored":
+            self.circuit_breaker.record_ignored()
+        else:
+            self.circuit_breaker.record_failure()
+            self.concurrency_limiter.record(None, overloaded=True)
     
     async def is_available(self) -> bool:
         """
@@ -207,9 +444,14 @@ class UnipixelClient:
         """
         current_time = time.time()
         
+        # 熔断期间直接返回不可用，不发起健康检查
+        if self.circuit_breaker.is_open():
+            return False
+        
         # 检查缓存
         if self._availability_cache is not None:
-            if current_time - self._cache_timestamp < self._cache_ttl:
+            ttl = self._cache_ttl if self._availability_cache else self._negative_cache_ttl
+            if current_time - self._cache_timestamp < ttl:
                 return self._availability_cache
         
         # 执行健康检查
@@ -229,6 +471,12 @@ class UnipixelClient:
                             self._cache_timestamp = current_time
                             logger.info("✅ Unipixel服务可用 (health端点)")
                             return True
+                        if response.status == 503:
+                            # 服务在运行但分割模型未就绪
+                            self._availability_cache = False
+                            self._cache_timestamp = current_time
+                            logger.warning("⚠️ Unipixel服务运行中但分割模型未就绪 (health端点)")
+                            return False
                 except aiohttp.ClientError:
                     pass  # health端点不存在，尝试主端点
                 
@@ -279,6 +527,43 @@ class UnipixelClient:
         self._cache_timestamp = 0
         logger.info("🧹 清除Unipixel可用性缓存")
     
+    def clear_result_cache(self):
+        """清除遮罩结果缓存"""
+        self._result_cache.clear()
+        logger.info("🧹 清除Unipixel结果缓存")
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        获取结果缓存统计
+        
+        Returns:
+            统计信息字典
+        """
+        lookups = self.cache_hits + self.cache_misses + self.coalesced_requests
+        return {
+            'cache_size': len(self._result_cache),
+            'cache_capacity': self.result_cache_size,
+            'cache_ttl': self.result_cache_ttl,
+            'inflight_requests': len(self._inflight),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'coalesced_requests': self.coalesced_requests,
+            'hit_rate': (self.cache_hits + self.coalesced_requests) / lookups if lookups else 0.0
+        }
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取客户端统计（结果缓存、熔断器、自适应并发）
+        
+        Returns:
+            统计信息字典
+        """
+        return {
+            'cache': self.get_cache_stats(),
+            'circuit_breaker': self.circuit_breaker.get_statistics(),
+            'concurrency': self.concurrency_limiter.get_statistics()
+        }
+    
     def get_endpoint(self) -> str:
         """获取当前端点"""
         return self.endpoint
@@ -292,6 +577,8 @@ class UnipixelClient:
         """
         self.endpoint = endpoint
         self.clear_cache()
+        self.clear_result_cache()
+        self.circuit_breaker.reset()
         logger.info(f"🔄 更新Unipixel端点: {endpoint}")
     
     def set_timeout(self, timeout: int):
@@ -312,6 +599,8 @@ class UnipixelClient:
         """
         批量生成遮罩图
         
+        重复任务（相同图像与查询参数）只分割一次，结果按原顺序分发给每个任务。
+        
         Args:
             tasks: 批量任务列表
             progress_callback: 进度回调函数，接收(已完成数, 总数)
@@ -321,61 +610,73 @@ class UnipixelClient:
         """
         logger.info(f"📦 开始批量处理 {len(tasks)} 个分割任务")
         
-        results: List[BatchSegmentationResult] = []
-        completed = 0
+        # 按请求键去重：相同（图像, 查询参数）的任务只分割一次
+        groups: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, task in enumerate(tasks):
+            key = self._request_key(
+                task.image_base64, task.query, task.sample_frames,
+                task.mask_format, task.include_overlay
+            )
+            groups.setdefault(key, []).append(i)
+        
+        duplicates = len(tasks) - len(groups)
+        if duplicates:
+            logger.info(f"   去除 {duplicates} 个重复任务，实际分割 {len(groups)} 个")
         
-        # 使用信号量限制并发数
-        semaphore = asyncio.Semaphore(self.max_concurrent)
+        completed = 0
         
-        async def process_task(task: BatchSegmentationTask, index: int):
+        async def process_group(indices: List[int]) -> UnipixelResult:
             nonlocal completed
+            task = tasks[indices[0]]
             
-            async with semaphore:
-                logger.info(f"   处理任务 {index + 1}/{len(tasks)}: {task.task_id}")
-                
-                # 执行分割
-                result = await self.generate_mask(
-                    image_base64=task.image_base64,
-                    query=task.query,
-                    sample_frames=task.sample_frames,
-                    progress_callback=task.callback
-                )
-                
-                # 更新完成计数
-                completed += 1
-                if progress_callback:
-                    progress_callback(completed, len(tasks))
-                
-                return BatchSegmentationResult(
-                    task_id=task.task_id,
-                    result=result,
-                    index=index
-                )
-        
-        # 并发执行所有任务
-        tasks_coroutines = [
-            process_task(task, i) for i, task in enumerate(tasks)
-        ]
+            logger.info(f"   处理任务 {indices[0] + 1}/{len(tasks)}: {task.task_id}")
+            
+            # 执行分割（并发由自适应限制器控制，熔断时快速失败）
+            result = await self.generate_mask(
+                image_base64=task.image_base64,
+                query=task.query,
+                sample_frames=task.sample_frames,
+                progress_callback=task.callback,
+                mask_format=task.mask_format,
+                include_overlay=task.include_overlay
+            )
+            
+            # 重复任务直接完成
+            for i in indices[1:]:
+                if tasks[i].callback:
+                    tasks[i].callback(100)
+            
+            # 更新完成计数
+            completed += len(indices)
+            if progress_callback:
+                progress_callback(completed, len(tasks))
+            
+            return result
         
-        results = await asyncio.gather(*tasks_coroutines, return_exceptions=True)
+        # 并发执行所有去重后的任务
+        group_results = await asyncio.gather(
+            *[process_group(indices) for indices in groups.values()],
+            return_exceptions=True
+        )
         
-        # 处理异常
-        final_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"❌ 任务 {i} 失败: {str(result)}")
-                final_results.append(BatchSegmentationResult(
+        # 将结果分发回原任务顺序，并处理异常
+        final_results: List[Optional[BatchSegmentationResult]] = [None] * len(tasks)
+        for indices, result in zip(groups.values(), group_results):
+            if isinstance(result, BaseException):
+                logger.error(f"❌ 任务 {tasks[indices[0]].task_id} 失败: {str(result) or type(result).__name__}")
+                result = UnipixelResult(
+                    mask_base64="",
+                    description="",
+                    success=False,
+                    error=str(result) or type(result).__name__
+                )
+            
+            for i in indices:
+                final_results[i] = BatchSegmentationResult(
                     task_id=tasks[i].task_id,
-                    result=UnipixelResult(
-                        mask_base64="",
-                        description="",
-                        success=False,
-                        error=str(result)
-                    ),
+                    result=result,
                     index=i
-                ))
-            else:
-                final_results.append(result)
+                )
         
         logger.info(f"✅ 批量处理完成: {completed}/{len(tasks)} 成功")
         return final_results
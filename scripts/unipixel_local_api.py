@@ -1,12 +1,20 @@
 import os
 import io
+import sys
+import time
 import base64
+import asyncio
+import hashlib
 import tempfile
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Tuple
 
+import numpy as np
 import torch
 from fastapi import FastAPI, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from PIL import Image
 from transformers import AutoProcessor, AutoModelForCausalLM
 from gradio_client import Client
@@ -22,6 +30,10 @@ from unipixel.utils.io import load_image, load_video
 from unipixel.utils.transforms import get_sam2_transform
 from unipixel.utils.visualizer import draw_mask
 
+# 遮罩编码与客户端解码共用 python/mask_codec.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+from mask_codec import MASK_FORMATS, binarize_mask, encode_masks  # noqa: E402
+
 
 """
 UniPixel 本地综合服务
@@ -35,6 +47,23 @@ UniPixel 本地综合服务
 - MODEL_PATH：本地 UniPixel-3B 文本描述模型路径（默认：~/models/UniPixel-3B）
 - HF_SPACE：Gradio Space 名称（默认：PolyU-ChenLab/UniPixel）
 - HF_TOKEN：Space 为私有时需要
+- UNIPIXEL_BATCH_WINDOW_MS：官方分割请求的微批收集窗口（毫秒，默认：10）
+- UNIPIXEL_MAX_BATCH_SIZE：单批最大请求数（默认：4）
+- UNIPIXEL_MAX_QUEUE_DEPTH：模型/Gradio 各自允许的排队+执行中请求数，超出返回 429（默认：16）
+- UNIPIXEL_GRADIO_WORKERS：Gradio 云端调用的工作线程数（默认：4）
+- UNIPIXEL_MASK_THRESHOLD：浮点遮罩（SAM2 logits）的二值化阈值，rle/bitpack 格式使用（默认：0.0）
+
+官方分割端点可选 mask_format：
+- overlay（默认）：mask 字段为 draw_mask 叠加渲染的 PNG/GIF base64
+- rle：masks 字段为每个目标、每帧的 COCO 风格未压缩 RLE（列优先）{"size": [H, W], "counts": [...]}
+- bitpack：masks 字段为每个目标的 np.packbits 位压缩数组 {"shape": [T, H, W], "bitorder": "big", "data": base64}
+include_overlay=false 时不生成叠加渲染图（mask 字段为空字符串）。
+
+模型推理在专用线程中执行，事件循环只负责收发请求，/health 始终快速响应并报告队列深度。
+
+官方分割端点的图像输入在内存中解码、遮罩在内存中编码，不经过临时文件
+（视频输入仍需写入临时文件供 load_video 抽帧）。
+I/O 基准测试：python unipixel_local_api.py --benchmark-io
 
 运行示例（WSL）：
   pip install fastapi uvicorn transformers pillow gradio_client imageio nncore unipixel
@@ -45,6 +74,12 @@ UniPixel 本地综合服务
 MODEL_PATH = os.path.expanduser(os.environ.get("MODEL_PATH", "~/models/UniPixel-3B"))
 HF_SPACE: str = os.environ.get("HF_SPACE", "PolyU-ChenLab/UniPixel")
 HF_TOKEN: Optional[str] = os.environ.get("HF_TOKEN")
+BATCH_WINDOW_MS: float = float(os.environ.get("UNIPIXEL_BATCH_WINDOW_MS", "10"))
+MAX_BATCH_SIZE: int = int(os.environ.get("UNIPIXEL_MAX_BATCH_SIZE", "4"))
+MAX_QUEUE_DEPTH: int = int(os.environ.get("UNIPIXEL_MAX_QUEUE_DEPTH", "16"))
+GRADIO_WORKERS: int = int(os.environ.get("UNIPIXEL_GRADIO_WORKERS", "4"))
+MASK_THRESHOLD: float = float(os.environ.get("UNIPIXEL_MASK_THRESHOLD", "0.0"))
+RETRY_AFTER_SECONDS = 2
 
 # FastAPI
 app = FastAPI(title="UniPixel-3B Local API")
@@ -71,6 +106,55 @@ uni_model = None
 uni_processor = None
 sam2_transform = None
 
+# 推理执行器：本地模型共用一个线程（GPU 串行），Gradio 云端调用使用独立线程池
+model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="unipixel-model")
+gradio_executor = ThreadPoolExecutor(max_workers=GRADIO_WORKERS, thread_name_prefix="unipixel-gradio")
+
+
+class AdmissionGate:
+    """有界准入：排队+执行中的请求数达到上限时拒绝新请求（仅在事件循环中调用）"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.depth = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.depth >= self.limit:
+            self.rejected += 1
+            return False
+        self.depth += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.depth = max(0, self.depth - 1)
+
+    def rejection(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": f"{self.name} queue full, retry later",
+                "queue_depth": self.depth,
+                "max_queue_depth": self.limit,
+            },
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.limit,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+model_gate = AdmissionGate("model", MAX_QUEUE_DEPTH)
+gradio_gate = AdmissionGate("gradio", MAX_QUEUE_DEPTH)
+
 
 @app.on_event("startup")
 def startup():
@@ -115,6 +199,26 @@ def startup():
         print(f"[UniPixel] Failed to build official UniPixel model: {e}")
 
 
+@app.get("/health")
+async def health():
+    # 在事件循环中直接返回，不受推理占用影响
+    uni_ready = uni_model is not None and uni_processor is not None and sam2_transform is not None
+    return JSONResponse(
+        status_code=200 if uni_ready else 503,
+        content={
+            "status": "ok" if uni_ready else "unavailable",
+            "uni_seg_available": uni_ready,
+            "gradio_seg_available": client is not None,
+            "text_model_loaded": bool(model and processor),
+            "queues": {
+                "model": model_gate.stats(),
+                "gradio": gradio_gate.stats(),
+            },
+            "batch_pending": unipixel_scheduler.stats()["pending"],
+        },
+    )
+
+
 @app.get("/")
 def root():
     return {
@@ -126,66 +230,54 @@ def root():
 
 
 # 本地文本描述端点
+def _describe_image_sync(image: Image.Image) -> Dict[str, Any]:
+    prompt = (
+        "A chat between a curious user and an artificial intelligence assistant. "
+        "The user provides an image and asks questions about it. "
+        "The assistant gives a detailed and long description of the image.\n"
+        "USER: <image>\n"
+        "Please describe this image in detail.\n"
+        "ASSISTANT:"
+    )
+
+    inputs = processor(text=prompt, images=image, return_tensors="pt").to(device, torch.bfloat16)
+
+    generated_ids = model.generate(
+        **inputs,
+        pixel_values=inputs["pixel_values"],
+        max_new_tokens=1024,
+        do_sample=False,
+        num_beams=3,
+        use_cache=True,
+    )
+
+    generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    assistant_response = generated_text.split("ASSISTANT:")[-1].strip()
+
+    return {"description": assistant_response}
+
+
 @app.post("/describe_image/")
 async def describe_image(file: UploadFile = File(...)):
     if not model or not processor:
         return {"error": "Model is not loaded yet. Please wait or check server logs."}
+    if not model_gate.try_acquire():
+        return model_gate.rejection()
     try:
         contents = await file.read()
         image = Image.open(io.BytesIO(contents)).convert("RGB")
-
-        prompt = (
-            "A chat between a curious user and an artificial intelligence assistant. "
-            "The user provides an image and asks questions about it. "
-            "The assistant gives a detailed and long description of the image.\n"
-            "USER: <image>\n"
-            "Please describe this image in detail.\n"
-            "ASSISTANT:"
-        )
-
-        inputs = processor(text=prompt, images=image, return_tensors="pt").to(device, torch.bfloat16)
-
-        generated_ids = model.generate(
-            **inputs,
-            pixel_values=inputs["pixel_values"],
-            max_new_tokens=1024,
-            do_sample=False,
-            num_beams=3,
-            use_cache=True,
-        )
-
-        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        assistant_response = generated_text.split("ASSISTANT:")[-1].strip()
-
-        return {"description": assistant_response}
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(model_executor, _describe_image_sync, image)
     except Exception as e:
         return {"error": str(e)}
-
-
-# 云端 Gradio 分割（multipart）
-@app.post("/infer_seg/")
-async def infer_seg(
-    file: UploadFile = File(...),
-    query: str = Form(...),
-    sample_frames: int = Form(16),
-):
-    if client is None:
-        return {"error": "Gradio Client not initialized. Check HF_SPACE/HF_TOKEN and server logs."}
-
-    suffix = os.path.splitext(file.filename or "image.png")[1] or ".png"
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp_path = tmp.name
-    try:
-        content = await file.read()
-        tmp.write(content)
     finally:
-        try:
-            tmp.close()
-        except:
-            pass
+        model_gate.release()
+
 
+# 云端 Gradio 分割：在 gradio_executor 中调用阻塞的 client.predict
+def _gradio_partial_sync(media_path: str, query: str, sample_frames: int) -> Dict[str, Any]:
     try:
-        res = client.predict("/partial", media=tmp_path, query=query, sample_frames=sample_frames)
+        res = client.predict("/partial", media=media_path, query=query, sample_frames=sample_frames)
         data = getattr(res, "data", None) or res
 
         description = ""
@@ -212,11 +304,38 @@ async def infer_seg(
         return {"error": f"gradio_client error: {e}"}
     finally:
         try:
-            os.remove(tmp_path)
+            os.remove(media_path)
         except:
             pass
 
 
+async def _run_gradio_partial(media: bytes, suffix: str, query: str, sample_frames: int):
+    if not gradio_gate.try_acquire():
+        return gradio_gate.rejection()
+    try:
+        # gradio_client 只能从文件路径上传媒体
+        media_path = _write_temp_media(media, suffix)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(gradio_executor, _gradio_partial_sync, media_path, query, sample_frames)
+    finally:
+        gradio_gate.release()
+
+
+# 云端 Gradio 分割（multipart）
+@app.post("/infer_seg/")
+async def infer_seg(
+    file: UploadFile = File(...),
+    query: str = Form(...),
+    sample_frames: int = Form(16),
+):
+    if client is None:
+        return {"error": "Gradio Client not initialized. Check HF_SPACE/HF_TOKEN and server logs."}
+
+    suffix = os.path.splitext(file.filename or "image.png")[1] or ".png"
+    content = await file.read()
+    return await _run_gradio_partial(content, suffix, query, sample_frames)
+
+
 # 云端 Gradio 分割（JSON，推荐）
 from pydantic import BaseModel
 
@@ -234,74 +353,189 @@ async def infer_seg_base64(payload: SegJsonPayload):
     if not base64_str:
         return {"error": "invalid base64"}
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    tmp_path = tmp.name
     try:
         img_bytes = base64.b64decode(base64_str)
-        tmp.write(img_bytes)
-    finally:
-        try:
-            tmp.close()
-        except:
-            pass
+    except Exception as e:
+        return {"error": f"invalid base64: {e}"}
 
-    try:
-        res = client.predict("/partial", media=tmp_path, query=payload.query, sample_frames=payload.sample_frames)
-        data = getattr(res, "data", None) or res
+    return await _run_gradio_partial(img_bytes, ".png", payload.query, payload.sample_frames)
 
-        description = ""
-        mask_base64 = ""
 
-        if isinstance(data, (list, tuple)) and len(data) >= 2:
-            desc = data[0]
-            description = desc if isinstance(desc, str) else (getattr(desc, "text", "") or getattr(desc, "content", "") or str(desc))
-            m = data[1]
-            if isinstance(m, str):
-                mask_base64 = m
-            else:
-                mask_base64 = getattr(m, "image", "") or getattr(m, "base64", "") or getattr(m, "data", "")
-                path = getattr(m, "path", None)
-                if not mask_base64 and isinstance(path, str) and os.path.exists(path):
-                    try:
-                        with open(path, "rb") as f:
-                            mask_base64 = base64.b64encode(f.read()).decode("utf-8")
-                    except:
-                        pass
+# ---------------------------------------------------------------------------
+# 官方 UniPixel 本地分割：微批调度
+#
+# UniPixel 管线每次 generate 只处理一个样本（分割结果保存在 uni_model.seg 上），
+# 因此调度器在短窗口内收集并发请求，合并完全相同的请求（同一图像+同一查询只推理一次），
+# 然后让模型背靠背地处理整批，再把结果分发回各个请求。
+# ---------------------------------------------------------------------------
 
-        return {"mask": mask_base64, "description": description}
-    except Exception as e:
-        return {"error": f"gradio_client error: {e}"}
-    finally:
-        try:
-            os.remove(tmp_path)
-        except:
-            pass
+@dataclass
+class UniPixelRequest:
+    media: bytes
+    suffix: str
+    query: str
+    sample_frames: int = 16
+    mask_format: str = "overlay"
+    include_overlay: bool = True
+    waiters: List[asyncio.Future] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        digest = hashlib.sha1(self.media).hexdigest()
+        return (
+            f"{digest}:{self.suffix}:{self.sample_frames}:"
+            f"{self.mask_format}:{int(self.include_overlay)}:{self.query}"
+        )
 
 
-# 官方 UniPixel 本地分割（multipart）
-@app.post("/infer_unipixel/")
-async def infer_unipixel(file: UploadFile = File(...), query: str = Form(...)):
-    if not (uni_model and uni_processor and sam2_transform):
-        return {"error": "UniPixel official segmentation model not initialized."}
+class MicroBatchScheduler:
+    """在 window_ms 内收集请求，最多 max_batch_size 个不同请求为一批交给模型执行"""
+
+    def __init__(self, window_ms: float, max_batch_size: int):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: Dict[str, UniPixelRequest] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # 统计
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_items = 0
+
+    async def submit(self, request: UniPixelRequest) -> Dict[str, Any]:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+
+        existing = self._pending.get(request.key)
+        if existing is not None:
+            # 与窗口内已有请求完全相同，共享同一次推理结果
+            existing.waiters.append(future)
+            self.coalesced += 1
+        else:
+            request.waiters.append(future)
+            self._pending[request.key] = request
+            self._wakeup.set()
+            if len(self._pending) >= self.max_batch_size:
+                self._full.set()
+
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # 收集窗口：等待更多请求到达，批已满时提前开始
+            if len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
 
-    suffix = os.path.splitext(file.filename or "media.png")[1] or ".png"
+            keys = list(self._pending.keys())[:self.max_batch_size]
+            batch = [self._pending.pop(k) for k in keys]
+            if len(self._pending) < self.max_batch_size:
+                self._full.clear()
+            if not self._pending:
+                self._wakeup.clear()
+
+            self.batches += 1
+            self.batched_items += len(batch)
+            # 在模型线程中执行，事件循环继续接收请求和健康检查
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(model_executor, _run_unipixel_batch, batch)
+            except Exception as e:
+                results = [{"error": f"unipixel infer error: {e}"}] * len(batch)
+
+            for request, result in zip(batch, results):
+                for waiter in request.waiters:
+                    if not waiter.done():
+                        waiter.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "avg_batch_size": (self.batched_items / self.batches) if self.batches else 0.0,
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+        }
+
+
+unipixel_scheduler = MicroBatchScheduler(BATCH_WINDOW_MS, MAX_BATCH_SIZE)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def _load_image_from_bytes(media: bytes) -> Tuple[np.ndarray, List[Image.Image]]:
+    # 内存解码：frames 供 SAM2 使用 (T, H, W, 3)，PIL 图像供视觉处理器使用
+    image = Image.open(io.BytesIO(media)).convert("RGB")
+    return np.asarray(image)[None], [image]
+
+
+def _encode_masks(imgs) -> str:
+    # 内存编码：多帧为 GIF，单帧为 PNG
+    if len(imgs) > 1:
+        data = iio.imwrite("<bytes>", imgs, extension=".gif", duration=100, loop=0)
+    else:
+        data = iio.imwrite("<bytes>", imgs[0], extension=".png")
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _seg_to_binary(seg) -> List[np.ndarray]:
+    # uni_model.seg：每个分割目标一个掩码，统一为 (T, H, W) 布尔数组
+    # 浮点掩码按 MASK_THRESHOLD 二值化（不从数值范围推断阈值）
+    masks = []
+    for item in seg:
+        if torch.is_tensor(item):
+            item = item.detach().cpu()
+            # numpy 不支持 bfloat16，浮点掩码先转为 float32
+            item = item.float() if item.is_floating_point() else item
+        arr = binarize_mask(np.asarray(item), MASK_THRESHOLD)
+        masks.append(arr.reshape((-1,) + arr.shape[-2:]))
+    return masks
+
+
+def _write_temp_media(media: bytes, suffix: str) -> str:
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    media_path = tmp.name
     try:
-        content = await file.read()
-        tmp.write(content)
+        tmp.write(media)
     finally:
         try:
             tmp.close()
         except:
             pass
+    return tmp.name
+
+
+def _run_unipixel_batch(batch: List[UniPixelRequest]) -> List[Dict[str, Any]]:
+    # 逐个样本推理，单个请求失败不影响同批其他请求
+    results = []
+    for request in batch:
+        try:
+            results.append(_run_unipixel_single(request))
+        except Exception as e:
+            results.append({"error": f"unipixel infer error: {e}"})
+    return results
+
 
+def _run_unipixel_single(request: UniPixelRequest) -> Dict[str, Any]:
+    media_path = None
     try:
-        is_image = any(media_path.lower().endswith(k) for k in (".jpg", ".jpeg", ".png"))
-        if is_image:
-            frames, images = load_image(media_path), [media_path]
+        if request.suffix.lower() in IMAGE_SUFFIXES:
+            frames, images = _load_image_from_bytes(request.media)
         else:
-            frames, images = load_video(media_path, sample_frames=16)
+            media_path = _write_temp_media(request.media, request.suffix)
+            frames, images = load_video(media_path, sample_frames=request.sample_frames)
 
         messages = [{
             'role': 'user',
@@ -312,7 +546,7 @@ async def infer_unipixel(file: UploadFile = File(...), query: str = Form(...)):
                 'max_pixels': 256 * 28 * 28 * int(16 / len(images))
             }, {
                 'type': 'text',
-                'text': query
+                'text': request.query
             }]
         }]
 
@@ -341,44 +575,63 @@ async def infer_unipixel(file: UploadFile = File(...), query: str = Form(...)):
 
         response = uni_processor.decode(output_ids, clean_up_tokenization_spaces=False)
 
-        imgs = draw_mask(frames, uni_model.seg) if len(uni_model.seg) >= 1 else []
-        mask_b64 = ""
-        if len(imgs) > 0:
-            ext = "gif" if len(imgs) > 1 else "png"
-            out_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}")
-            out_path = out_tmp.name
+        seg = uni_model.seg
+        imgs = draw_mask(frames, seg) if request.include_overlay and len(seg) >= 1 else []
+        mask_b64 = _encode_masks(imgs) if len(imgs) > 0 else ""
+
+        result = {"mask": mask_b64, "description": response, "mask_format": request.mask_format}
+        if request.mask_format != "overlay":
+            result["masks"] = encode_masks(_seg_to_binary(seg), request.mask_format)
+        return result
+    finally:
+        if media_path:
             try:
-                out_tmp.close()
+                os.remove(media_path)
             except:
                 pass
 
-            try:
-                if ext == "gif":
-                    iio.imwrite(out_path, imgs, duration=100, loop=0)
-                else:
-                    iio.imwrite(out_path, imgs[0])
-                with open(out_path, "rb") as f:
-                    mask_b64 = base64.b64encode(f.read()).decode("utf-8")
-            finally:
-                try:
-                    os.remove(out_path)
-                except:
-                    pass
 
-        return {"mask": mask_b64, "description": response}
-    except Exception as e:
-        return {"error": f"unipixel infer error: {e}"}
+async def _submit_unipixel(request: UniPixelRequest):
+    if request.mask_format not in MASK_FORMATS:
+        return {"error": f"invalid mask_format: {request.mask_format}, expected one of {list(MASK_FORMATS)}"}
+    if not model_gate.try_acquire():
+        return model_gate.rejection()
+    try:
+        return await unipixel_scheduler.submit(request)
     finally:
-        try:
-            os.remove(media_path)
-        except:
-            pass
+        model_gate.release()
+
+
+@app.get("/batch_stats")
+def batch_stats():
+    return {**unipixel_scheduler.stats(), "queue": model_gate.stats()}
+
+
+# 官方 UniPixel 本地分割（multipart）
+@app.post("/infer_unipixel/")
+async def infer_unipixel(
+    file: UploadFile = File(...),
+    query: str = Form(...),
+    mask_format: str = Form("overlay"),
+    include_overlay: bool = Form(True),
+):
+    if not (uni_model and uni_processor and sam2_transform):
+        return {"error": "UniPixel official segmentation model not initialized."}
+
+    suffix = os.path.splitext(file.filename or "media.png")[1] or ".png"
+    content = await file.read()
+    return await _submit_unipixel(UniPixelRequest(
+        media=content, suffix=suffix, query=query,
+        mask_format=mask_format, include_overlay=include_overlay,
+    ))
 
 
 # 官方 UniPixel 本地分割（JSON，推荐）
 class UniSegJsonPayload(BaseModel):
     imageBase64: str
     query: str
+    mask_format: str = "overlay"
+    include_overlay: bool = True
 
 @app.post("/infer_unipixel_base64/")
 async def infer_unipixel_base64(payload: UniSegJsonPayload):
@@ -389,87 +642,55 @@ async def infer_unipixel_base64(payload: UniSegJsonPayload):
     if not base64_str:
         return {"error": "invalid base64"}
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    media_path = tmp.name
     try:
         img_bytes = base64.b64decode(base64_str)
-        tmp.write(img_bytes)
-    finally:
-        try:
-            tmp.close()
-        except:
-            pass
-
-    try:
-        frames, images = load_image(media_path), [media_path]
-
-        messages = [{
-            'role': 'user',
-            'content': [{
-                'type': 'video',
-                'video': images,
-                'min_pixels': 128 * 28 * 28,
-                'max_pixels': 256 * 28 * 28 * int(16 / len(images))
-            }, {
-                'type': 'text',
-                'text': payload.query
-            }]
-        }]
-
-        text = uni_processor.apply_chat_template(messages, add_generation_prompt=True)
-        images_data, videos_data, kwargs = process_vision_info(messages, return_video_kwargs=True)
-
-        data = uni_processor(text=[text], images=images_data, videos=videos_data, return_tensors='pt', **kwargs)
-        data['frames'] = [sam2_transform(frames).to(uni_model.sam2.dtype)]
-        data['frame_size'] = [frames.shape[1:3]]
+    except Exception as e:
+        return {"error": f"invalid base64: {e}"}
 
-        dev = next(uni_model.parameters()).device
-        output_ids = uni_model.generate(
-            **data.to(dev),
-            do_sample=False,
-            temperature=None,
-            top_k=None,
-            top_p=None,
-            repetition_penalty=None,
-            max_new_tokens=512
-        )
+    return await _submit_unipixel(UniPixelRequest(
+        media=img_bytes, suffix=".png", query=payload.query,
+        mask_format=payload.mask_format, include_overlay=payload.include_overlay,
+    ))
 
-        assert data.input_ids.size(0) == output_ids.size(0) == 1
-        output_ids = output_ids[0, data.input_ids.size(1):]
-        if output_ids[-1] == uni_processor.tokenizer.eos_token_id:
-            output_ids = output_ids[:-1]
 
-        response = uni_processor.decode(output_ids, clean_up_tokenization_spaces=False)
+def benchmark_io(iterations: int = 50, height: int = 720, width: int = 960):
+    """对比临时文件与内存 I/O 路径的单次请求解码+遮罩编码延迟"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    media = iio.imwrite("<bytes>", image, extension=".png")
 
-        imgs = draw_mask(frames, uni_model.seg) if len(uni_model.seg) >= 1 else []
-        mask_b64 = ""
-        if len(imgs) > 0:
+    def disk_round_trip():
+        media_path = _write_temp_media(media, ".png")
+        out_path = None
+        try:
+            frames = load_image(media_path)
             out_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
             out_path = out_tmp.name
-            try:
-                out_tmp.close()
-            except:
-                pass
-
-            try:
-                iio.imwrite(out_path, imgs[0])
-                with open(out_path, "rb") as f:
-                    mask_b64 = base64.b64encode(f.read()).decode("utf-8")
-            finally:
-                try:
-                    os.remove(out_path)
-                except:
-                    pass
-
-        return {"mask": mask_b64, "description": response}
-    except Exception as e:
-        return {"error": f"unipixel infer error: {e}"}
-    finally:
-        try:
-            os.remove(media_path)
-        except:
-            pass
+            out_tmp.close()
+            iio.imwrite(out_path, frames[0])
+            with open(out_path, "rb") as f:
+                base64.b64encode(f.read()).decode("utf-8")
+        finally:
+            for path in (media_path, out_path):
+                if path:
+                    os.remove(path)
+
+    def memory_round_trip():
+        frames, _ = _load_image_from_bytes(media)
+        _encode_masks([frames[0]])
+
+    print(f"[UniPixel] I/O benchmark: {width}x{height} PNG, {iterations} iterations")
+    for name, fn in (("temp-file", disk_round_trip), ("in-memory", memory_round_trip)):
+        fn()  # 预热
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) / iterations * 1000
+        print(f"  {name:<10} {elapsed:8.2f} ms/request")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if "--benchmark-io" in sys.argv:
+        benchmark_io()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file